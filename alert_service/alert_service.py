@@ -1,7 +1,11 @@
 import logging
+import time
 import requests
 import json
+import threading
 import os
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 from flask import Flask, request, jsonify
@@ -27,6 +31,11 @@ gupshup_source_number = os.getenv('GUPSHUP_SOURCE_NUMBER')
 gupshup_destination_numbers = os.getenv('GUPSHUP_DESTINATION_NUMBERS', '').split(',')
 gupshup_template_id = os.getenv('GUPSHUP_TEMPLATE_ID')
 gupshup_language = os.getenv('GUPSHUP_LANGUAGE', 'pt')
+gupshup_api_url = os.getenv('GUPSHUP_API_URL', 'https://api.gupshup.io/wa/api/v1/template/msg')
+
+# Envio aos destinos do WhatsApp em paralelo, numa sessão com conexões reaproveitadas
+WHATSAPP_MAX_CONCURRENCY = int(os.getenv('WHATSAPP_MAX_CONCURRENCY', '8'))
+WHATSAPP_TIMEOUT = float(os.getenv('WHATSAPP_TIMEOUT', '10'))
 
 if not all([gupshup_app_name, gupshup_api_key, gupshup_source_number, gupshup_destination_numbers, gupshup_template_id]):
     logging.error("Variáveis de ambiente para a API Gupshup não definidas.")
@@ -40,9 +49,249 @@ if not all([telegram_bot_token, telegram_chat_id]):
     logging.error("Variáveis de ambiente para o Telegram não definidas.")
     exit(1)
 
-MAX_CLIENTS_IN_MESSAGE = 50
+# Envio ao Telegram: fila por chat, com limite de taxa e agrupamento das mensagens pendentes
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_MAX_LENGTH = 4096
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '20'))  # mensagens por minuto por chat
+TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+TELEGRAM_COALESCE_WINDOW = float(os.getenv('TELEGRAM_COALESCE_WINDOW', '2'))
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '10'))
+# Quanto a rota /alerta/telegram aguarda a entrega; deve ser menor que o ALERT_TIMEOUT do monitor
+TELEGRAM_DELIVERY_TIMEOUT = float(os.getenv('TELEGRAM_DELIVERY_TIMEOUT', '8'))
+
+# Sessão compartilhada: o handshake TLS com a Gupshup é feito uma vez por conexão do pool
+gupshup_session = requests.Session()
+gupshup_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=WHATSAPP_MAX_CONCURRENCY))
+gupshup_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=WHATSAPP_MAX_CONCURRENCY))
+gupshup_session.headers.update({
+    'Content-Type': 'application/x-www-form-urlencoded',
+    'apikey': gupshup_api_key
+})
+executor_whatsapp = ThreadPoolExecutor(max_workers=WHATSAPP_MAX_CONCURRENCY, thread_name_prefix='whatsapp')
+
+# --------------------------------------------------
+# Envio ao Telegram (limite de taxa, agrupamento e divisão)
+# --------------------------------------------------
+
+telegram_session = requests.Session()
+
+class BaldeTokens:
+    """Token bucket de um chat; `bloquear` atende o retry_after de uma resposta 429."""
+
+    def __init__(self, por_minuto, capacidade):
+        self.taxa = por_minuto / 60.0
+        self.capacidade = max(1, capacidade)
+        self.tokens = float(self.capacidade)
+        self.atualizado = time.monotonic()
+        self.bloqueado_ate = 0.0
+
+    def aguardar(self):
+        while True:
+            agora = time.monotonic()
+            self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado) * self.taxa)
+            self.atualizado = agora
+            espera = max(self.bloqueado_ate - agora, (1 - self.tokens) / self.taxa if self.tokens < 1 else 0)
+            if espera <= 0:
+                self.tokens -= 1
+                return
+            time.sleep(espera)
+
+    def bloquear(self, segundos):
+        self.bloqueado_ate = max(self.bloqueado_ate, time.monotonic() + segundos)
+        self.tokens = 0.0
+
+def dividir_mensagem(texto, limite=TELEGRAM_MAX_LENGTH):
+    """Divide o texto em partes de até `limite` caracteres, quebrando entre linhas sempre que possível."""
+    partes, atual = [], ""
+    for linha in texto.split("\n"):
+        while len(linha) > limite:  # linha maior que o limite: corte seco
+            if atual:
+                partes.append(atual)
+                atual = ""
+            partes.append(linha[:limite])
+            linha = linha[limite:]
+        candidato = f"{atual}\n{linha}" if atual else linha
+        if len(candidato) > limite:
+            partes.append(atual)
+            atual = linha
+        else:
+            atual = candidato
+    if atual.strip():
+        partes.append(atual)
+    return partes
+
+def juntar_mensagens(mensagens):
+    if len(mensagens) == 1:
+        return mensagens[0]
+    separador = "\n➖➖➖➖➖\n"
+    return f"📋 *Resumo: {len(mensagens)} alertas*\n" + separador + separador.join(m.strip() for m in mensagens)
+
+class TelegramRejeitou(Exception):
+    """O Telegram recusou a mensagem (4xx exceto 429): reenviar o mesmo texto não adianta."""
+
+def alertas_nao_entregues(texto, mensagens, posicao):
+    """
+    Mensagens do resumo `texto` que terminam depois de `posicao` (o início da parte
+    recusada). Uma mensagem entregue só em parte é reenviada inteira.
+    """
+    restantes, inicio = [], 0
+    for mensagem in mensagens:
+        trecho = mensagem.strip()
+        inicio = texto.find(trecho, inicio) + len(trecho)
+        if inicio > posicao:
+            restantes.append(mensagem)
+    return restantes
+
+class Entrega:
+    """Mensagem enfileirada; `concluida` é sinalizada quando o Telegram a aceita ou ela é descartada."""
+
+    def __init__(self, mensagem):
+        self.mensagem = mensagem
+        self.aceita = None
+        self.concluida = threading.Event()
+
+    def concluir(self, aceita):
+        self.aceita = aceita
+        self.concluida.set()
+
+class FilaTelegram:
+    """
+    Uma fila e uma thread por chat. As mensagens que chegam em até TELEGRAM_COALESCE_WINDOW
+    segundos (ou enquanto a anterior aguarda o limite de taxa) saem juntas num resumo,
+    dividido em partes de até 4096 caracteres, respeitando TELEGRAM_CHAT_RATE e o
+    retry_after das respostas 429. Cada mensagem tem uma `Entrega`, concluída com o
+    resultado do envio.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chats = {}
+
+    def enfileirar(self, chat_id, mensagem):
+        with self.lock:
+            chat = self.chats.get(chat_id)
+            if chat is None:
+                chat = self.chats[chat_id] = {
+                    'pendentes': [],
+                    'condicao': threading.Condition(self.lock),
+                    'balde': BaldeTokens(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST),
+                    'enviando': False,
+                }
+                threading.Thread(target=self._enviar_chat, args=(chat_id, chat), daemon=True).start()
+            entrega = Entrega(mensagem)
+            chat['pendentes'].append(entrega)
+            chat['condicao'].notify()
+            logging.info(f"Mensagem enfileirada para o chat {chat_id} ({len(chat['pendentes'])} pendentes).")
+            return entrega
+
+    def cancelar(self, chat_id, entrega):
+        """Retira da fila uma entrega que ainda não começou a ser enviada; False se já saiu."""
+        with self.lock:
+            pendentes = self.chats[chat_id]['pendentes']
+            if entrega in pendentes:
+                pendentes.remove(entrega)
+                return True
+            return False
+
+    def _enviar_chat(self, chat_id, chat):
+        while True:
+            with self.lock:
+                while not chat['pendentes']:
+                    chat['condicao'].wait()
+            time.sleep(TELEGRAM_COALESCE_WINDOW)
+            with self.lock:
+                entregas, chat['pendentes'] = chat['pendentes'], []
+                chat['enviando'] = bool(entregas)
+            if not entregas:  # Todas canceladas durante a janela de agrupamento
+                continue
+            if len(entregas) > 1:
+                logging.info(f"{len(entregas)} alertas agrupados num resumo para o chat {chat_id}.")
+            aceitas = [False] * len(entregas)
+            try:
+                aceitas = self._enviar_mensagens(chat_id, chat['balde'], [e.mensagem for e in entregas])
+            except Exception as e:
+                logging.error(f"Erro inesperado ao enviar mensagens para o chat {chat_id}: {e}")
+            finally:
+                chat['enviando'] = False
+                for entrega, aceita in zip(entregas, aceitas):
+                    entrega.concluir(aceita)
+
+    def _enviar_mensagens(self, chat_id, balde, mensagens):
+        """
+        Envia as mensagens num resumo, dividido em partes, e retorna para cada uma se o
+        Telegram a aceitou por inteiro. Se o Telegram recusar uma parte do resumo (p.ex.
+        pelo Markdown de um dos alertas), os alertas ainda não entregues são reenviados um
+        a um, para que só o recusado falhe. Se uma parte esgotar as tentativas, ela e as
+        seguintes não são enviadas e os seus alertas contam como não entregues.
+        """
+        texto = juntar_mensagens(mensagens)
+        posicao = 0
+        for parte in dividir_mensagem(texto):
+            posicao = texto.find(parte, posicao)
+            try:
+                aceita = self._enviar_parte(chat_id, balde, parte)
+            except TelegramRejeitou as e:
+                if len(mensagens) == 1:
+                    logging.critical(f"FALHA CRÍTICA: mensagem do Telegram recusada ({e}): {parte}")
+                    return [False]
+                restantes = alertas_nao_entregues(texto, mensagens, posicao)
+                logging.warning(f"Resumo recusado pelo Telegram ({e}); reenviando {len(restantes)} alertas um a um.")
+                entregues = [True] * (len(mensagens) - len(restantes))
+                return entregues + [self._enviar_mensagens(chat_id, balde, [m])[0] for m in restantes]
+            if not aceita:
+                restantes = alertas_nao_entregues(texto, mensagens, posicao)
+                return [True] * (len(mensagens) - len(restantes)) + [False] * len(restantes)
+            posicao += len(parte)
+        return [True] * len(mensagens)
+
+    def esvaziar(self, timeout):
+        """Aguarda até `timeout` segundos que as filas de todos os chats sejam enviadas."""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            with self.lock:
+                ocupados = [c for c in self.chats.values() if c['pendentes'] or c['enviando']]
+            if not ocupados:
+                return True
+            time.sleep(0.2)
+        logging.warning("Encerrando com alertas do Telegram ainda na fila.")
+        return False
+
+    def _enviar_parte(self, chat_id, balde, texto):
+        url = f"{TELEGRAM_API_URL}/bot{telegram_bot_token}/sendMessage"
+        payload = {
+            'chat_id': chat_id,
+            'text': texto,
+            'parse_mode': 'Markdown'
+        }
+        for tentativa in range(1, TELEGRAM_MAX_RETRIES + 1):
+            balde.aguardar()
+            try:
+                logging.info(f"Enviando mensagem para API do Telegram: chat={chat_id}, {len(texto)} caracteres (tentativa {tentativa}).")
+                response = telegram_session.post(url, data=payload, timeout=30)
+                if response.status_code == 429:
+                    retry_after = response.json().get('parameters', {}).get('retry_after', 5)
+                    logging.warning(f"Limite do Telegram atingido (429); aguardando {retry_after}s.")
+                    balde.bloquear(retry_after)
+                    continue
+                if 400 <= response.status_code < 500:
+                    raise TelegramRejeitou(f"{response.status_code} {response.text}")
+                response.raise_for_status()
+                logging.info(f"Alerta enviado com sucesso no Telegram. Status API: {response.status_code}")
+                return True
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logging.error(f"Falha ao enviar mensagem no Telegram: {e}")
+                balde.bloquear(min(60, 2 ** tentativa))
+        logging.error(f"Mensagem do Telegram não enviada após {TELEGRAM_MAX_RETRIES} tentativas ({len(texto)} caracteres).")
+        return False
+
+fila_telegram = FilaTelegram()
 
 def send_telegram_alert(clientes, status, conexao, mensagem_personalizada=None):
+    """
+    Enfileira o alerta no chat e aguarda até TELEGRAM_DELIVERY_TIMEOUT segundos pela
+    entrega. Só retorna sucesso depois que o Telegram aceitou todas as partes; caso
+    contrário retorna 'error' e quem chamou (a fila de alertas do monitor) tenta de novo.
+    """
     total_clientes = len(clientes)
     if total_clientes == 0:
         return {'message': 'Nenhum cliente para alertar'}
@@ -56,78 +305,67 @@ def send_telegram_alert(clientes, status, conexao, mensagem_personalizada=None):
     else:
         mensagem = f"*Alerta: {total_clientes} clientes com status desconhecido na conexão {conexao}.*\n"
     
-    if total_clientes <= MAX_CLIENTS_IN_MESSAGE:
-        for cliente in clientes:
-            login = cliente.get('login', 'N/A')
-            ultima_conexao_final = cliente.get('ultima_conexao_final', 'N/A')
-            mensagem += f"- *Login:* `{login}`\n"
-            mensagem += f"  *Última conexão:* {ultima_conexao_final}\n"
-    else:
-        mensagem += "Listando alguns clientes:\n"
-        for cliente in clientes[:MAX_CLIENTS_IN_MESSAGE]:
-            login = cliente.get('login', 'N/A')
-            ultima_conexao_final = cliente.get('ultima_conexao_final', 'N/A')
-            mensagem += f"- *Login:* `{login}`\n"
-            mensagem += f"  *Última conexão:* {ultima_conexao_final}\n"
-        mensagem += f"... e mais {total_clientes - MAX_CLIENTS_IN_MESSAGE} clientes."
-    
-    url = f"https://api.telegram.org/bot{telegram_bot_token}/sendMessage"
+    # Todos os clientes entram na mensagem; acima de 4096 caracteres ela é dividida entre linhas
+    for cliente in clientes:
+        login = cliente.get('login', 'N/A')
+        ultima_conexao_final = cliente.get('ultima_conexao_final', 'N/A')
+        mensagem += f"- *Login:* `{login}`\n"
+        mensagem += f"  *Última conexão:* {ultima_conexao_final}\n"
+
+    entrega = fila_telegram.enfileirar(telegram_chat_id, mensagem)
+    if not entrega.concluida.wait(TELEGRAM_DELIVERY_TIMEOUT):
+        if fila_telegram.cancelar(telegram_chat_id, entrega):
+            logging.warning(f"Alerta da conexão {conexao} não saiu em {TELEGRAM_DELIVERY_TIMEOUT}s; retirado da fila.")
+            return {'error': 'Fila do Telegram ocupada; alerta não enviado'}
+        # Já está sendo enviado: não há como saber se chegará, e reenviar pode duplicá-lo
+        logging.warning(f"Alerta da conexão {conexao} ainda em envio após {TELEGRAM_DELIVERY_TIMEOUT}s.")
+        return {'error': 'Envio ao Telegram ainda em andamento'}
+    if not entrega.aceita:
+        return {'error': 'Telegram não aceitou o alerta'}
+    logging.info(f"Alerta da conexão {conexao} entregue no Telegram.")
+    return {'message': 'Alerta enviado no Telegram'}
+
+def send_whatsapp_destination(destination_number, template_params):
     payload = {
-        'chat_id': telegram_chat_id,
-        'text': mensagem,
-        'parse_mode': 'Markdown'
+        'source': gupshup_source_number,
+        'destination': destination_number,
+        'template': json.dumps({
+            'id': gupshup_template_id,
+            'params': template_params
+        }),
+        'channel': 'whatsapp',
+        'message': '',
     }
+
     try:
-        logging.info(f"Enviando mensagem para API do Telegram: URL={url}, Payload={json.dumps(payload)}")
-        response = requests.post(url, data=payload)
+        logging.info(f"Payload enviado para WhatsApp: {json.dumps(payload, indent=4)}")
+        inicio = time.monotonic()
+        response = gupshup_session.post(gupshup_api_url, data=payload, timeout=WHATSAPP_TIMEOUT)
+        duracao = round(time.monotonic() - inicio, 3)
+        logging.info(f"Resposta da API WhatsApp: {response.status_code} - {response.text}")
         response.raise_for_status()
-        logging.info(f"Alerta enviado com sucesso no Telegram. Status API: {response.status_code}")
-        return {'message': 'Alerta enviado com sucesso no Telegram'}
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Falha ao enviar mensagem no Telegram: {e}")
-        return {'error': str(e)}, 500
 
-def send_whatsapp_alert(total_clientes, conexao, motivo):
-    url = "https://api.gupshup.io/wa/api/v1/template/msg"
-    headers_whatsapp = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'apikey': gupshup_api_key
-    }
+        data = response.json()
+        if data.get('status') == 'submitted':
+            logging.info(f"✅ WhatsApp enviado para {destination_number}")
+            return {'destination': destination_number, 'message': 'Enviado com sucesso', 'duracao': duracao}
+        logging.error(f"⚠️ Falha para {destination_number}: {data.get('message')}")
+        return {'destination': destination_number, 'error': data.get('message'), 'duracao': duracao}
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error(f"Erro ao enviar mensagem via WhatsApp para {destination_number}: {e}")
+        return {'destination': destination_number, 'error': str(e)}
 
+def send_whatsapp_alert(total_clientes, conexao, motivo):
+    """
+    Envia o template a todos os GUPSHUP_DESTINATION_NUMBERS em paralelo (no máximo
+    WHATSAPP_MAX_CONCURRENCY ao mesmo tempo, cada um com WHATSAPP_TIMEOUT) e retorna o
+    resultado de cada destino, na ordem da configuração.
+    """
     # Passa os parâmetros na ordem correta do template
     template_params = [str(total_clientes), conexao, motivo]
 
-    responses = []
-    for destination_number in gupshup_destination_numbers:
-        payload = {
-            'source': gupshup_source_number,
-            'destination': destination_number,
-            'template': json.dumps({
-                'id': gupshup_template_id,
-                'params': template_params
-            }),
-            'channel': 'whatsapp',
-            'message': '',
-        }
-
-        try:
-            logging.info(f"Payload enviado para WhatsApp: {json.dumps(payload, indent=4)}")
-            response = requests.post(url, data=payload, headers=headers_whatsapp)
-            logging.info(f"Resposta da API WhatsApp: {response.status_code} - {response.text}")
-            response.raise_for_status()
-
-            data = response.json()
-            if data.get('status') == 'submitted':
-                logging.info(f"✅ WhatsApp enviado para {destination_number}")
-                responses.append({'destination': destination_number, 'message': 'Enviado com sucesso'})
-            else:
-                logging.error(f"⚠️ Falha para {destination_number}: {data.get('message')}")
-                responses.append({'destination': destination_number, 'error': data.get('message')})
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Erro ao enviar mensagem via WhatsApp para {destination_number}: {e}")
-            responses.append({'destination': destination_number, 'error': str(e)})
-
-    return responses
+    destinos = [numero.strip() for numero in gupshup_destination_numbers if numero.strip()]
+    return list(executor_whatsapp.map(lambda numero: send_whatsapp_destination(numero, template_params), destinos))
 
 @app.route('/alerta/telegram', methods=['POST'])
 def alerta_telegram():
@@ -138,6 +376,8 @@ def alerta_telegram():
     conexao = data.get('conexao')
     mensagem_personalizada = data.get('mensagem_personalizada')
     result = send_telegram_alert(clientes, status, conexao, mensagem_personalizada)
+    if 'error' in result:
+        return jsonify(result), 502
     return jsonify(result)
 
 @app.route('/alerta/whatsapp', methods=['POST'])
@@ -148,6 +388,9 @@ def alerta_whatsapp():
     motivo = data.get('motivo_final') or data.get('motivo')
     mensagem_personalizada = data.get('mensagem_personalizada')
     result = send_whatsapp_alert(total_clientes, conexao, motivo)
+    # Só responde erro se nenhum destino recebeu: reenviar repetiria a mensagem para os que receberam
+    if result and all('error' in destino for destino in result):
+        return jsonify(result), 502
     return jsonify(result)
 
 if __name__ == '__main__':
@@ -0,0 +1,131 @@
+"""
+Benchmark do envio de alertas ao Telegram contra uma API do Telegram falsa local.
+
+A API falsa aplica o limite de mensagens por chat: acima dele responde 429 com
+parameters.retry_after, como a API real. Compara uma rajada de alertas enviados
+como antes (um requests.post por alerta, sem respeitar o 429) com a fila do
+alert_service (limite de taxa, agrupamento e divisão em 4096 caracteres), chamada
+em paralelo como fazem os workers de alerta do monitor. Uso (a partir do checkout,
+com /app/logs):
+
+    python bench_telegram_sender.py [--alertas 30] [--clientes 120] [--limite 20]
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    limite_por_minuto = 20
+    chamadas = 0
+    recusadas = 0
+    entregues = []
+    envios = deque()
+    lock = threading.Lock()
+
+    def do_POST(self):
+        corpo = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        agora = time.monotonic()
+        with FakeTelegramHandler.lock:
+            FakeTelegramHandler.chamadas += 1
+            while self.envios and agora - self.envios[0] > 60:
+                self.envios.popleft()
+            if len(self.envios) >= self.limite_por_minuto:
+                FakeTelegramHandler.recusadas += 1
+                retry_after = max(1, int(60 - (agora - self.envios[0])) + 1)
+                status, resposta = 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': retry_after}}
+            else:
+                self.envios.append(agora)
+                FakeTelegramHandler.entregues.append(corpo['text'][0])
+                status, resposta = 200, {'ok': True}
+        dados = json.dumps(resposta).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+def reiniciar_api():
+    FakeTelegramHandler.chamadas = 0
+    FakeTelegramHandler.recusadas = 0
+    FakeTelegramHandler.entregues = []
+    FakeTelegramHandler.envios.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--alertas', type=int, default=30, help='Alertas na rajada')
+    parser.add_argument('--clientes', type=int, default=120, help='Clientes por alerta')
+    parser.add_argument('--limite', type=int, default=20, help='Mensagens por minuto aceitas por chat')
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), FakeTelegramHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    FakeTelegramHandler.limite_por_minuto = args.limite
+    api = f'http://127.0.0.1:{servidor.server_port}'
+
+    os.environ.update({
+        'GUPSHUP_APP_NAME': 'bench', 'GUPSHUP_API_KEY': 'bench', 'GUPSHUP_SOURCE_NUMBER': '5500000000000',
+        'GUPSHUP_TEMPLATE_ID': 'bench', 'GUPSHUP_DESTINATION_NUMBERS': '',
+        'TELEGRAM_BOT_TOKEN': 'bench', 'TELEGRAM_CHAT_ID': 'bench', 'TELEGRAM_API_URL': api,
+        'TELEGRAM_COALESCE_WINDOW': '1', 'TELEGRAM_DELIVERY_TIMEOUT': '3600',
+    })
+    import alert_service
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    alertas = [
+        [{'login': f'cliente{a}_{c}@provedor', 'ultima_conexao_final': '2024-05-01 10:00:00'}
+         for c in range(args.clientes)]
+        for a in range(args.alertas)
+    ]
+    print(f"alertas={args.alertas} clientes/alerta={args.clientes} limite={args.limite}/min por chat")
+    print(f"{'modo':>8} {'chamadas':>9} {'429':>5} {'mensagens':>10} {'alertas entregues':>18} {'maior (chars)':>14} {'tempo (s)':>10}")
+
+    # Antes: um POST por alerta, sem fila nem retentativa
+    reiniciar_api()
+    inicio = time.perf_counter()
+    for a, clientes in enumerate(alertas):
+        texto = f"🚨 *Alerta: {len(clientes)} clientes offline detectados na conexão CONEXAO_{a}.*\n" + ''.join(
+            f"- *Login:* `{c['login']}`\n  *Última conexão:* {c['ultima_conexao_final']}\n" for c in clientes)
+        requests.post(f'{api}/botbench/sendMessage', data={'chat_id': 'bench', 'text': texto})
+    duracao = time.perf_counter() - inicio
+    entregues = sum(f'CONEXAO_{a}.' in ''.join(FakeTelegramHandler.entregues) for a in range(args.alertas))
+    maior = max(map(len, FakeTelegramHandler.entregues), default=0)
+    print(f"{'direto':>8} {FakeTelegramHandler.chamadas:>9} {FakeTelegramHandler.recusadas:>5} "
+          f"{len(FakeTelegramHandler.entregues):>10} {entregues:>18} {maior:>14} {duracao:>10.2f}")
+
+    # Depois: fila por chat
+    reiniciar_api()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.alertas) as executor:
+        resultados = list(executor.map(
+            lambda a: alert_service.send_telegram_alert(alertas[a], 'offline', f'CONEXAO_{a}'), range(args.alertas)))
+    duracao = time.perf_counter() - inicio
+    assert all('error' not in resultado for resultado in resultados), resultados
+    entregue = ''.join(FakeTelegramHandler.entregues)
+    entregues = sum(f'CONEXAO_{a}.' in entregue for a in range(args.alertas))
+    maior = max(map(len, FakeTelegramHandler.entregues))
+    assert maior <= alert_service.TELEGRAM_MAX_LENGTH
+    assert all(f'cliente{a}_{c}@provedor' in entregue for a in range(args.alertas) for c in range(args.clientes))
+    print(f"{'fila':>8} {FakeTelegramHandler.chamadas:>9} {FakeTelegramHandler.recusadas:>5} "
+          f"{len(FakeTelegramHandler.entregues):>10} {entregues:>18} {maior:>14} {duracao:>10.2f}")
+
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
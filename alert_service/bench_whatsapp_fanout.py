@@ -0,0 +1,107 @@
+"""
+Benchmark do envio do alerta de WhatsApp para vários destinos contra uma Gupshup falsa local.
+
+A Gupshup falsa simula o custo de abrir uma conexão (handshake TLS) e a latência da
+API. Compara o envio anterior (requests.post sequencial, uma conexão nova por
+destino) com send_whatsapp_alert (sessão compartilhada e envio paralelo) para
+diferentes quantidades de destinos. Uso (a partir do checkout, com /app/logs):
+
+    python bench_whatsapp_fanout.py [--handshake 0.1] [--latencia 0.15] [--concorrencia 8]
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+
+DESTINOS = [1, 5, 10, 20, 40]
+
+
+class FakeGupshupHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    handshake = 0.1
+    latencia = 0.15
+    conexoes = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with FakeGupshupHandler.lock:
+            FakeGupshupHandler.conexoes += 1
+        time.sleep(self.handshake)
+
+    def do_POST(self):
+        corpo = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        time.sleep(self.latencia)
+        resposta = json.dumps({'status': 'submitted', 'messageId': corpo['destination'][0]}).encode()
+        self.send_response(202)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+    def log_message(self, *args):
+        pass
+
+
+def envio_sequencial(url, destinos):
+    """Envio anterior: um requests.post (conexão nova) por destino, em sequência."""
+    resultados = []
+    for numero in destinos:
+        response = requests.post(url, data={'destination': numero, 'template': '{}'}, headers={'apikey': 'bench'})
+        resultados.append(response.json().get('status'))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--handshake', type=float, default=0.1, help='Custo simulado de abrir uma conexão (s)')
+    parser.add_argument('--latencia', type=float, default=0.15, help='Latência simulada da API (s)')
+    parser.add_argument('--concorrencia', type=int, default=8)
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), FakeGupshupHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    FakeGupshupHandler.handshake = args.handshake
+    FakeGupshupHandler.latencia = args.latencia
+    url = f'http://127.0.0.1:{servidor.server_port}/wa/api/v1/template/msg'
+
+    os.environ.update({
+        'GUPSHUP_APP_NAME': 'bench', 'GUPSHUP_API_KEY': 'bench', 'GUPSHUP_SOURCE_NUMBER': '5500000000000',
+        'GUPSHUP_TEMPLATE_ID': 'bench', 'GUPSHUP_API_URL': url, 'GUPSHUP_DESTINATION_NUMBERS': '',
+        'TELEGRAM_BOT_TOKEN': 'bench', 'TELEGRAM_CHAT_ID': 'bench',
+        'WHATSAPP_MAX_CONCURRENCY': str(args.concorrencia),
+    })
+    import alert_service
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"handshake={args.handshake}s latência={args.latencia}s concorrência={args.concorrencia}")
+    print(f"{'destinos':>9} {'sequencial (s)':>15} {'conexões':>9} {'paralelo (s)':>13} {'conexões':>9}")
+    for quantidade in DESTINOS:
+        destinos = [f'55929{i:08d}' for i in range(quantidade)]
+
+        FakeGupshupHandler.conexoes = 0
+        inicio = time.perf_counter()
+        assert envio_sequencial(url, destinos) == ['submitted'] * quantidade
+        sequencial, conexoes_sequencial = time.perf_counter() - inicio, FakeGupshupHandler.conexoes
+
+        alert_service.gupshup_destination_numbers = destinos
+        FakeGupshupHandler.conexoes = 0
+        inicio = time.perf_counter()
+        resultados = alert_service.send_whatsapp_alert(42, 'CONEXAO_BENCH', 'energia')
+        paralelo, conexoes_paralelo = time.perf_counter() - inicio, FakeGupshupHandler.conexoes
+        assert [r['destination'] for r in resultados] == destinos
+        assert all('error' not in r for r in resultados), resultados
+
+        print(f"{quantidade:>9} {sequencial:>15.2f} {conexoes_sequencial:>9} {paralelo:>13.2f} {conexoes_paralelo:>9}")
+
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+# Configuração do gunicorn para o alert_service (produção):
+#   gunicorn -c gunicorn.conf.py alert_service:app
+# Um único worker: a fila do Telegram e o limite de taxa por chat ficam em memória;
+# com mais de um worker o limite seria multiplicado. A concorrência vem das threads.
+import os
+
+bind = "0.0.0.0:5002"
+worker_class = "gthread"
+workers = 1
+threads = int(os.getenv("ALERT_WEB_THREADS", "8"))
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+
+def worker_exit(server, worker):
+    # A fila do Telegram fica em memória: dá a ela o graceful_timeout para esvaziar
+    import alert_service
+    alert_service.fila_telegram.esvaziar(graceful_timeout)
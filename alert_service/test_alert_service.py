@@ -0,0 +1,306 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import json
+import os
+import sys
+
+# Credenciais fictícias: o módulo encerra o processo se não estiverem definidas
+os.environ.setdefault('GUPSHUP_APP_NAME', 'teste')
+os.environ.setdefault('GUPSHUP_API_KEY', 'teste')
+os.environ.setdefault('GUPSHUP_SOURCE_NUMBER', '5500000000000')
+os.environ.setdefault('GUPSHUP_DESTINATION_NUMBERS', '5511111111111,5522222222222')
+os.environ.setdefault('GUPSHUP_TEMPLATE_ID', 'template')
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'token')
+os.environ.setdefault('TELEGRAM_CHAT_ID', '-100')
+
+# Ensure the service module can be imported
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import alert_service
+
+DESTINOS = ['5511111111111', '5522222222222']
+
+
+def resposta_gupshup(status='submitted', mensagem=None):
+    return MagicMock(status_code=200, text='', **{'json.return_value': {'status': status, 'message': mensagem}})
+
+
+class TestWhatsApp(unittest.TestCase):
+
+    def setUp(self):
+        patch.object(alert_service, 'gupshup_destination_numbers', DESTINOS + [' ']).start()
+        self.mock_post = patch.object(alert_service.gupshup_session, 'post').start()
+        self.client = alert_service.app.test_client()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _destino(self, chamada):
+        return chamada.kwargs['data']['destination']
+
+    def test_envia_a_todos_os_destinos_na_ordem(self):
+        self.mock_post.return_value = resposta_gupshup()
+
+        resultado = alert_service.send_whatsapp_alert(5, 'CONEXAO_A', 'energia')
+
+        self.assertEqual([r['destination'] for r in resultado], DESTINOS)
+        self.assertTrue(all('error' not in r for r in resultado))
+        self.assertEqual(sorted(self._destino(c) for c in self.mock_post.call_args_list), DESTINOS)
+        chamada = self.mock_post.call_args
+        self.assertEqual(chamada.kwargs['timeout'], alert_service.WHATSAPP_TIMEOUT)
+        self.assertEqual(json.loads(chamada.kwargs['data']['template'])['params'], ['5', 'CONEXAO_A', 'energia'])
+
+    def test_falha_num_destino_nao_impede_os_demais(self):
+        def responder(url, data, timeout):
+            if data['destination'] == DESTINOS[0]:
+                raise alert_service.requests.ConnectionError("recusado")
+            return resposta_gupshup()
+
+        self.mock_post.side_effect = responder
+
+        resposta = self.client.post('/alerta/whatsapp', json={'total_clientes': 5, 'conexao': 'CONEXAO_A', 'motivo': 'energia'})
+
+        self.assertEqual(resposta.status_code, 200)
+        primeiro, segundo = resposta.get_json()
+        self.assertIn('error', primeiro)
+        self.assertEqual(segundo['message'], 'Enviado com sucesso')
+
+    def test_502_quando_nenhum_destino_recebe(self):
+        self.mock_post.return_value = resposta_gupshup(status='error', mensagem='template inválido')
+
+        resposta = self.client.post('/alerta/whatsapp', json={'total_clientes': 5, 'conexao': 'CONEXAO_A', 'motivo': 'energia'})
+
+        self.assertEqual(resposta.status_code, 502)
+        self.assertEqual([r['error'] for r in resposta.get_json()], ['template inválido'] * 2)
+
+
+
+class RelogioFalso:
+    """time.monotonic e time.sleep sobre um relógio que só avança quando alguém dorme."""
+
+    def __init__(self):
+        self.agora = 1000.0
+        self.esperas = []
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, segundos):
+        self.esperas.append(round(segundos, 6))
+        self.agora += segundos
+
+
+class TestBaldeTokens(unittest.TestCase):
+
+    def setUp(self):
+        self.relogio = RelogioFalso()
+        patch.object(alert_service.time, 'monotonic', self.relogio.monotonic).start()
+        patch.object(alert_service.time, 'sleep', self.relogio.sleep).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_rajada_e_depois_a_taxa(self):
+        balde = alert_service.BaldeTokens(por_minuto=60, capacidade=3)
+
+        for _ in range(3):
+            balde.aguardar()
+        self.assertEqual(self.relogio.esperas, [])
+
+        balde.aguardar()
+        balde.aguardar()
+        self.assertEqual(self.relogio.esperas, [1.0, 1.0])
+
+    def test_tokens_acumulam_ate_a_capacidade(self):
+        balde = alert_service.BaldeTokens(por_minuto=60, capacidade=2)
+        balde.aguardar()
+        balde.aguardar()
+
+        self.relogio.agora += 3600
+        for _ in range(3):
+            balde.aguardar()
+
+        self.assertEqual(self.relogio.esperas, [1.0])
+
+    def test_bloquear_atende_o_retry_after(self):
+        balde = alert_service.BaldeTokens(por_minuto=60, capacidade=3)
+
+        balde.bloquear(5)
+        balde.aguardar()
+
+        self.assertEqual(self.relogio.esperas, [5.0])
+
+
+class TestDivisaoMensagens(unittest.TestCase):
+
+    def test_mensagem_curta_inteira(self):
+        self.assertEqual(alert_service.dividir_mensagem("linha 1\nlinha 2", limite=100), ["linha 1\nlinha 2"])
+
+    def test_quebra_entre_linhas(self):
+        linhas = [f"- cliente{n:02d}" for n in range(10)]
+
+        partes = alert_service.dividir_mensagem("\n".join(linhas), limite=40)
+
+        self.assertTrue(all(len(parte) <= 40 for parte in partes))
+        self.assertEqual("\n".join(partes).split("\n"), linhas)
+
+    def test_linha_maior_que_o_limite_cortada(self):
+        partes = alert_service.dividir_mensagem("inicio\n" + "x" * 25 + "\nfim", limite=10)
+
+        self.assertEqual(partes, ["inicio", "x" * 10, "x" * 10, "xxxxx\nfim"])
+
+    def test_juntar_uma_mensagem(self):
+        self.assertEqual(alert_service.juntar_mensagens(["alerta"]), "alerta")
+
+    def test_juntar_varias_num_resumo(self):
+        resumo = alert_service.juntar_mensagens(["alerta 1\n", "alerta 2"])
+
+        self.assertTrue(resumo.startswith("📋 *Resumo: 2 alertas*"))
+        self.assertEqual(resumo.split("\n➖➖➖➖➖\n")[1:], ["alerta 1", "alerta 2"])
+
+    def test_alertas_nao_entregues_a_partir_da_parte_recusada(self):
+        mensagens = ["alerta 1\n", "alerta 2", "alerta 3"]
+        resumo = alert_service.juntar_mensagens(mensagens)
+
+        self.assertEqual(alert_service.alertas_nao_entregues(resumo, mensagens, 0), mensagens)
+        self.assertEqual(alert_service.alertas_nao_entregues(resumo, mensagens, resumo.index("alerta 2")), mensagens[1:])
+        # Um alerta entregue só em parte volta inteiro
+        self.assertEqual(alert_service.alertas_nao_entregues(resumo, mensagens, resumo.index("erta 3")), mensagens[2:])
+        self.assertEqual(alert_service.alertas_nao_entregues(resumo, mensagens, len(resumo)), [])
+
+
+class TestEnvioTelegram(unittest.TestCase):
+
+    def setUp(self):
+        self.relogio = RelogioFalso()
+        patch.object(alert_service.time, 'monotonic', self.relogio.monotonic).start()
+        patch.object(alert_service.time, 'sleep', self.relogio.sleep).start()
+        patch.object(alert_service, 'TELEGRAM_MAX_RETRIES', 3).start()
+        self.mock_post = patch.object(alert_service.telegram_session, 'post').start()
+        self.balde = alert_service.BaldeTokens(por_minuto=600, capacidade=10)
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_429_aguarda_o_retry_after(self):
+        limite = MagicMock(status_code=429, **{'json.return_value': {'parameters': {'retry_after': 7}}})
+        self.mock_post.side_effect = [limite, MagicMock(status_code=200)]
+
+        enviado = alert_service.FilaTelegram()._enviar_parte('-100', self.balde, "texto")
+
+        self.assertTrue(enviado)
+        self.assertEqual(self.mock_post.call_count, 2)
+        self.assertEqual(self.relogio.esperas, [7.0])
+        self.assertEqual(self.mock_post.call_args.kwargs['data']['text'], "texto")
+
+    def test_descarta_apos_o_maximo_de_tentativas(self):
+        self.mock_post.side_effect = alert_service.requests.ConnectionError("sem rede")
+
+        enviado = alert_service.FilaTelegram()._enviar_parte('-100', self.balde, "texto")
+
+        self.assertFalse(enviado)
+        self.assertEqual(self.mock_post.call_count, 3)
+
+    def test_4xx_nao_e_repetido(self):
+        self.mock_post.return_value = MagicMock(status_code=400, text="can't parse entities")
+
+        with self.assertRaises(alert_service.TelegramRejeitou):
+            alert_service.FilaTelegram()._enviar_parte('-100', self.balde, "texto")
+
+        self.assertEqual(self.mock_post.call_count, 1)
+
+    def test_resumo_recusado_reenvia_os_alertas_um_a_um(self):
+        def responder(url, data, timeout):
+            return MagicMock(status_code=400 if "*ruim" in data['text'] else 200, text="can't parse entities")
+
+        self.mock_post.side_effect = responder
+
+        aceitas = alert_service.FilaTelegram()._enviar_mensagens('-100', self.balde, ["alerta 1", "alerta *ruim", "alerta 3"])
+
+        enviados = [chamada.kwargs['data']['text'] for chamada in self.mock_post.call_args_list]
+        self.assertTrue(enviados[0].startswith("📋 *Resumo: 3 alertas*"))
+        # Só o alerta recusado falha
+        self.assertEqual(enviados[1:], ["alerta 1", "alerta *ruim", "alerta 3"])
+        self.assertEqual(aceitas, [True, False, True])
+
+    def test_parte_sem_resposta_interrompe_o_resumo(self):
+        def responder(url, data, timeout):
+            if "alerta 2" in data['text']:
+                raise alert_service.requests.ConnectionError("sem rede")
+            return MagicMock(status_code=200)
+
+        self.mock_post.side_effect = responder
+        # Partes: cabeçalho e "alerta 1"; a linha longa; "alerta 2" e "alerta 3"
+        mensagens = ["alerta 1\n" + "x" * 4090, "alerta 2", "alerta 3"]
+
+        aceitas = alert_service.FilaTelegram()._enviar_mensagens('-100', self.balde, mensagens)
+
+        self.assertEqual(aceitas, [True, False, False])
+        self.assertEqual(self.mock_post.call_count, 2 + alert_service.TELEGRAM_MAX_RETRIES)
+
+
+class TestRotaTelegram(unittest.TestCase):
+
+    def setUp(self):
+        patch.object(alert_service, 'TELEGRAM_COALESCE_WINDOW', 0).start()
+        patch.object(alert_service, 'TELEGRAM_MAX_RETRIES', 1).start()
+        patch.object(alert_service, 'TELEGRAM_CHAT_BURST', 100).start()
+        patch.object(alert_service, 'fila_telegram', alert_service.FilaTelegram()).start()
+        self.mock_post = patch.object(alert_service.telegram_session, 'post').start()
+        self.mock_post.return_value = MagicMock(status_code=200)
+        self.client = alert_service.app.test_client()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _alertar(self, clientes):
+        return self.client.post('/alerta/telegram', json={'clientes': clientes, 'status': 'offline', 'conexao': 'CONEXAO_A'})
+
+    def test_responde_depois_da_entrega(self):
+        resposta = self._alertar([{'login': 'cliente1', 'ultima_conexao_final': '2024-05-01 10:00:00'}])
+
+        self.assertEqual(resposta.status_code, 200)
+        self.mock_post.assert_called_once()
+        self.assertIn("`cliente1`", self.mock_post.call_args.kwargs['data']['text'])
+
+    def test_502_quando_o_telegram_recusa(self):
+        self.mock_post.return_value = MagicMock(status_code=400, text="can't parse entities")
+
+        resposta = self._alertar([{'login': 'cliente1'}])
+
+        self.assertEqual(resposta.status_code, 502)
+
+    def test_502_quando_as_tentativas_se_esgotam(self):
+        self.mock_post.side_effect = alert_service.requests.ConnectionError("sem rede")
+
+        resposta = self._alertar([{'login': 'cliente1'}])
+
+        self.assertEqual(resposta.status_code, 502)
+
+    def test_alerta_que_nao_sai_a_tempo_e_retirado_da_fila(self):
+        patch.object(alert_service, 'TELEGRAM_COALESCE_WINDOW', 0.5).start()
+        patch.object(alert_service, 'TELEGRAM_DELIVERY_TIMEOUT', 0.05).start()
+
+        resposta = self._alertar([{'login': 'cliente1'}])
+
+        self.assertEqual(resposta.status_code, 502)
+        self.assertEqual(alert_service.fila_telegram.chats['-100']['pendentes'], [])
+        self.assertTrue(alert_service.fila_telegram.esvaziar(timeout=2))
+        self.mock_post.assert_not_called()
+
+    def test_todos_os_clientes_divididos_em_partes(self):
+        clientes = [{'login': f'cliente{n:03d}', 'ultima_conexao_final': '2024-05-01 10:00:00'} for n in range(200)]
+
+        resposta = self._alertar(clientes)
+
+        self.assertEqual(resposta.status_code, 200)
+        partes = [chamada.kwargs['data']['text'] for chamada in self.mock_post.call_args_list]
+        self.assertGreater(len(partes), 1)
+        self.assertTrue(all(len(parte) <= alert_service.TELEGRAM_MAX_LENGTH for parte in partes))
+        texto = "\n".join(partes)
+        self.assertTrue(all(f"`cliente{n:03d}`" in texto for n in range(200)))
+        self.assertNotIn("e mais", texto)
+
+
+if __name__ == '__main__':
+    unittest.main()
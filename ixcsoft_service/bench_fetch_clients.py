@@ -0,0 +1,88 @@
+"""
+Benchmark da paginação de fetch_clients contra um servidor IXC falso local.
+
+Compara o tempo de parede da busca sequencial (1 worker) com a busca paralela
+para diferentes quantidades de páginas. Uso (dentro do container ou com /app/logs):
+
+    python bench_fetch_clients.py [--latencia 0.15] [--workers 8]
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGINAS = [1, 5, 10, 20, 40, 60]
+RP = 1000
+
+
+class FakeIXCHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latencia = 0.15
+    total = 0
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        page, rp = int(payload['page']), int(payload['rp'])
+        inicio = (page - 1) * rp
+        registros = [
+            {
+                'id': str(i), 'id_cliente': str(i), 'login': f'cliente{i}', 'conexao': f'CONEXAO_{i % 40}',
+                'ultima_conexao_final': '2024-01-01 00:00:00', 'id_transmissor': '1',
+                'latitude': '-3.1', 'longitude': '-60.0', 'online': 'S' if i % 10 else 'N', 'ativo': 'S'
+            }
+            for i in range(inicio, min(inicio + rp, self.total))
+        ]
+        time.sleep(self.latencia)
+        corpo = json.dumps({'page': str(page), 'total': str(self.total), 'registros': registros}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latencia', type=float, default=0.15, help='Latência simulada por página (s)')
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), FakeIXCHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    FakeIXCHandler.latencia = args.latencia
+
+    os.environ.update({
+        'IXCSOFT_HOST': f'127.0.0.1:{servidor.server_port}',
+        'IXCSOFT_USUARIO': 'bench',
+        'IXCSOFT_TOKEN': 'bench',
+        'IXCSOFT_SCHEME': 'http',
+        'IXCSOFT_FETCH_WORKERS': str(args.workers),
+    })
+    import ixcsoft_service
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"latência/página={args.latencia}s rp={RP}")
+    print(f"{'páginas':>8} {'sequencial (s)':>15} {f'{args.workers} workers (s)':>15} {'ganho':>7}")
+    for paginas in PAGINAS:
+        FakeIXCHandler.total = paginas * RP
+        tempos = []
+        for workers in (1, args.workers):
+            ixcsoft_service.IXCSOFT_FETCH_WORKERS = workers
+            inicio = time.perf_counter()
+            clientes = ixcsoft_service.fetch_clients('online')
+            tempos.append(time.perf_counter() - inicio)
+            assert len(clientes) == FakeIXCHandler.total
+            assert clientes[-1]['login'] == f'cliente{FakeIXCHandler.total - 1}'
+        print(f"{paginas:>8} {tempos[0]:>15.2f} {tempos[1]:>15.2f} {tempos[0] / tempos[1]:>6.1f}x")
+
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Mede o pico de RSS do ixcsoft_service e do consumidor do monitor_service ao
+transferir o snapshot de clientes em JSON único e em NDJSON (streaming).
+
+Sobe um servidor IXC falso local, o ixcsoft_service num subprocesso e, para cada
+modo, um subprocesso que chama get_snapshot()/get_snapshot_stream() do monitor.
+Uso (a partir do checkout, com /app/logs gravável):
+
+    python bench_streaming_rss.py [--logins 60000]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from bench_fetch_clients import FakeIXCHandler
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+MONITOR_DIR = os.path.join(AQUI, '..', 'monitor_service')
+
+CONSUMIDOR = """
+import sys, resource
+sys.path.insert(0, {monitor_dir!r})
+import monitor_service
+snapshot = monitor_service.{funcao}()
+total = len(snapshot['online']) + len(snapshot['offline'])
+print(total, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+"""
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def pico_rss_processo_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for linha in f:
+            if linha.startswith('VmHWM:'):
+                return int(linha.split()[1]) / 1024
+    return 0.0
+
+
+def medir(funcao, env_ixc, porta_ixc):
+    servico = subprocess.Popen(
+        [sys.executable, '-c', f"import ixcsoft_service as m; m.app.run(port={porta_ixc}, threaded=True)"],
+        cwd=AQUI, env=env_ixc, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', porta_ixc), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        env_monitor = dict(os.environ, IXCSOFT_SERVICE_URL=f'http://127.0.0.1:{porta_ixc}')
+        inicio = time.perf_counter()
+        saida = subprocess.run(
+            [sys.executable, '-c', CONSUMIDOR.format(monitor_dir=MONITOR_DIR, funcao=funcao)],
+            cwd=MONITOR_DIR, env=env_monitor, capture_output=True, text=True, check=True
+        ).stdout.split()
+        duracao = time.perf_counter() - inicio
+        return int(saida[0]), float(saida[1]), pico_rss_processo_mb(servico.pid), duracao
+    finally:
+        servico.terminate()
+        servico.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=60000)
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), FakeIXCHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    FakeIXCHandler.latencia = 0.05
+    FakeIXCHandler.total = args.logins
+
+    env_ixc = dict(
+        os.environ,
+        IXCSOFT_HOST=f'127.0.0.1:{servidor.server_port}',
+        IXCSOFT_USUARIO='bench',
+        IXCSOFT_TOKEN='bench',
+        IXCSOFT_SCHEME='http',
+    )
+
+    print(f"logins={args.logins}")
+    print(f"{'modo':>8} {'RSS ixcsoft (MB)':>17} {'RSS monitor (MB)':>17} {'tempo (s)':>10}")
+    for modo, funcao in (('json', 'get_snapshot'), ('ndjson', 'get_snapshot_stream')):
+        total, rss_monitor, rss_ixc, duracao = medir(funcao, env_ixc, porta_livre())
+        assert total == args.logins, total
+        print(f"{modo:>8} {rss_ixc:>17.1f} {rss_monitor:>17.1f} {duracao:>10.2f}")
+
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+# Configuração do gunicorn para o ixcsoft_service (produção):
+#   gunicorn -c gunicorn.conf.py ixcsoft_service:app
+# Um único worker: o estado do modo delta (cursor e último snapshot) fica em memória;
+# com mais de um worker cada um manteria o seu e consultaria o IXC em dobro. A
+# concorrência vem das threads.
+import os
+
+bind = "0.0.0.0:5001"
+worker_class = "gthread"
+workers = 1
+threads = int(os.getenv("IXCSOFT_WEB_THREADS", "4"))
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
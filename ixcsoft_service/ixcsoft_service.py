@@ -3,10 +3,17 @@ import requests
 import base64
 import json
 import os
+import time
+import uuid
+import threading
+import resource
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import urllib3
+from requests.adapters import HTTPAdapter
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 
 # Carregar variáveis de ambiente e configurar warnings
 load_dotenv()
@@ -41,6 +48,28 @@ headers = {
     'Content-Type': 'application/json'
 }
 
+# Parâmetros da paginação (IXCSOFT_FETCH_WORKERS=1 mantém a busca sequencial)
+IXCSOFT_SCHEME = os.getenv('IXCSOFT_SCHEME', 'https')
+IXCSOFT_PAGE_SIZE = int(os.getenv('IXCSOFT_PAGE_SIZE', 1000))
+IXCSOFT_FETCH_WORKERS = int(os.getenv('IXCSOFT_FETCH_WORKERS', 8))
+IXCSOFT_PAGE_RETRIES = int(os.getenv('IXCSOFT_PAGE_RETRIES', 3))
+IXCSOFT_TIMEOUT = int(os.getenv('IXCSOFT_TIMEOUT', 60))
+
+# Sincronização incremental (/clientes/delta)
+IXCSOFT_FULL_RESYNC_INTERVAL = int(os.getenv('IXCSOFT_FULL_RESYNC_INTERVAL', 1800))
+IXCSOFT_DELTA_MARGIN = int(os.getenv('IXCSOFT_DELTA_MARGIN', 120))
+
+# Sessão compartilhada (keep-alive) entre as threads de paginação
+session = requests.Session()
+session.headers.update(headers)
+session.headers['ixcsoft'] = 'listar'
+session.verify = False
+session.mount(f"{IXCSOFT_SCHEME}://", HTTPAdapter(pool_connections=1, pool_maxsize=max(IXCSOFT_FETCH_WORKERS, 1)))
+
+
+class IXCSoftError(Exception):
+    """Falha ao obter uma página da API IXCSoft após todas as tentativas."""
+
 app = Flask(__name__)
 
 def resume_os(setor):
@@ -63,86 +92,377 @@ def resume_os(setor):
     else:
         return []
 
-def fetch_clients(status):
+def fetch_page(url, grid_param, page, rp=IXCSOFT_PAGE_SIZE):
     """
-    status: 'online' ou 'offline'
+    Busca uma única página de `url`, com retentativa e backoff exponencial.
+    Retorna o JSON da resposta ou levanta IXCSoftError se todas as tentativas falharem.
     """
-    url = f"https://{host}/webservice/v1/radusuarios"
-    headers['ixcsoft'] = 'listar'
-    
-    clients = []
-    page = 1
-    rp = 1000  # registros por página
-    
+    payload = {
+        'grid_param': grid_param,
+        'page': str(page),
+        'rp': str(rp),
+        'sortname': 'radusuarios.id',
+        'sortorder': 'asc'
+    }
+    ultimo_erro = None
+    for tentativa in range(1, IXCSOFT_PAGE_RETRIES + 1):
+        try:
+            response = session.post(url, data=json.dumps(payload), timeout=IXCSOFT_TIMEOUT)
+            response.raise_for_status()
+            data = response.json()
+            if 'type' in data and data['type'] == 'error':
+                raise IXCSoftError(data.get('message', ''))
+            return data
+        except (requests.exceptions.RequestException, ValueError, IXCSoftError) as e:
+            ultimo_erro = e
+            logging.warning(f"Falha na página {page} (tentativa {tentativa}/{IXCSOFT_PAGE_RETRIES}): {e}")
+            if tentativa < IXCSOFT_PAGE_RETRIES:
+                time.sleep(2 ** (tentativa - 1))
+    raise IXCSoftError(f"Página {page} indisponível após {IXCSOFT_PAGE_RETRIES} tentativas: {ultimo_erro}")
+
+def iter_pages(url, grid_param, rp=IXCSOFT_PAGE_SIZE):
+    """
+    Gera os registros de cada página, em ordem, assim que ela fica disponível.
+    Lê o `total` da primeira página e busca as demais em paralelo, com no máximo
+    IXCSOFT_FETCH_WORKERS requisições simultâneas e apenas 2x esse número de páginas
+    adiantadas em memória. A ordem das páginas preserva a ordenação por radusuarios.id.
+    Levanta IXCSoftError se alguma página falhar, em vez de encerrar a lista truncada.
+    """
+    primeira = fetch_page(url, grid_param, 1, rp)
+    registros = primeira.get('registros', [])
+    total_registros = int(primeira.get('total', 0))
+    total_paginas = max(1, -(-total_registros // rp))
+    logging.info(f"Página 1/{total_paginas}: Obtidos {len(registros)} registros.")
+    yield registros
+
+    if total_paginas == 1 or len(registros) == 0:
+        return
+
+    workers = max(IXCSOFT_FETCH_WORKERS, 1)
+    pendentes = deque()
+    proxima = 2
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            while pendentes or proxima <= total_paginas:
+                while proxima <= total_paginas and len(pendentes) < workers * 2:
+                    pendentes.append((proxima, executor.submit(fetch_page, url, grid_param, proxima, rp)))
+                    proxima += 1
+                page, future = pendentes.popleft()
+                pagina = future.result().get('registros', [])
+                logging.info(f"Página {page}/{total_paginas}: Obtidos {len(pagina)} registros.")
+                yield pagina
+        finally:
+            for _, future in pendentes:
+                future.cancel()
+
+def fetch_all_pages(url, grid_param, rp=IXCSOFT_PAGE_SIZE):
+    """Concatena todas as páginas de iter_pages numa única lista."""
+    registros = []
+    for pagina in iter_pages(url, grid_param, rp):
+        registros.extend(pagina)
+    return registros
+
+def client_info(registro):
+    return {
+        'id_cliente': registro.get('id_cliente'),
+        'login': registro.get('login'),
+        'conexao': registro.get('conexao'),
+        'ultima_conexao_final': registro.get('ultima_conexao_final'),
+        'id_transmissor': registro.get('id_transmissor'),
+        'latitude': registro.get('latitude'),
+        'longitude': registro.get('longitude')
+    }
+
+def client_info_status(registro):
+    """client_info acrescido do campo `online` ('S' ou 'N')."""
+    info = client_info(registro)
+    info['online'] = registro.get('online')
+    return info
+
+def grid_param_status(status):
     if status == 'offline':
-        grid_param = json.dumps([
+        return json.dumps([
             {"TB": "radusuarios.ativo", "OP": "=", "P": "S"},
             {"TB": "radusuarios.online", "OP": "=", "P": "N"}
         ])
-    elif status == 'online':
-        grid_param = json.dumps([
+    if status == 'online':
+        return json.dumps([
             {"TB": "radusuarios.ativo", "OP": "=", "P": "S"},
             {"TB": "radusuarios.online", "OP": "=", "P": "S"}
         ])
-    else:
+    if status == 'todos':
+        return json.dumps([
+            {"TB": "radusuarios.ativo", "OP": "=", "P": "S"}
+        ])
+    return None
+
+def fetch_clients(status):
+    """
+    status: 'online' ou 'offline'
+    Levanta IXCSoftError se a API não puder ser consultada por completo.
+    """
+    url = f"{IXCSOFT_SCHEME}://{host}/webservice/v1/radusuarios"
+    grid_param = grid_param_status(status)
+    if status not in ('online', 'offline'):
         return []
-    
-    while True:
-        payload = {
-            'grid_param': grid_param,
-            'page': str(page),
-            'rp': str(rp),
-            'sortname': 'radusuarios.id',
-            'sortorder': 'asc'
-        }
-        
-        try:
-            response = requests.post(url, data=json.dumps(payload), headers=headers, verify=False)
-            response.raise_for_status()
-            data = response.json()
-            
-            if 'type' in data and data['type'] == 'error':
-                logging.error(f"Erro ao obter clientes {status}: {data.get('message', '')}")
-                break
-            
-            registros = data.get('registros', [])
-            total_registros = int(data.get('total', 0))
-            
-            for registro in registros:
-                client_info = {
-                    'id_cliente': registro.get('id_cliente'),
-                    'login': registro.get('login'),
-                    'conexao': registro.get('conexao'),
-                    'ultima_conexao_final': registro.get('ultima_conexao_final'),
-                    'id_transmissor': registro.get('id_transmissor'),
-                    'latitude': registro.get('latitude'),
-                    'longitude': registro.get('longitude')
-                }
-                clients.append(client_info)
-            
-            logging.info(f"Página {page}: Obtidos {len(registros)} registros de clientes {status}.")
-            
-            if len(clients) >= total_registros or len(registros) == 0:
-                break
-            else:
-                page += 1
-                
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Erro na requisição à API IXCSoft: {e}")
-            break
+
+    clients = [client_info(registro) for registro in fetch_all_pages(url, grid_param)]
     logging.info(f"Total de clientes {status} obtidos: {len(clients)}")
     return clients
 
+def fetch_snapshot():
+    """
+    Busca todos os logins ativos numa única passada paginada e os separa pelo
+    campo `online`, garantindo que online e offline venham do mesmo instante.
+    Levanta IXCSoftError se a API não puder ser consultada por completo.
+    """
+    url = f"{IXCSOFT_SCHEME}://{host}/webservice/v1/radusuarios"
+    grid_param = grid_param_status('todos')
+
+    timestamp = time.time()
+    online = []
+    offline = []
+    for registro in fetch_all_pages(url, grid_param):
+        if registro.get('online') == 'S':
+            online.append(client_info(registro))
+        else:
+            offline.append(client_info(registro))
+
+    logging.info(f"Snapshot obtido: {len(online)} clientes online e {len(offline)} offline.")
+    return {'timestamp': timestamp, 'online': online, 'offline': offline}
+
+# --------------------------------------------------
+# Sincronização incremental (delta)
+# --------------------------------------------------
+
+# Campos cuja mudança faz um login aparecer no delta
+CAMPOS_DELTA = ('online', 'conexao', 'id_transmissor', 'ultima_conexao_final')
+
+# Último snapshot conhecido. Cada login guarda a versão em que mudou pela última vez;
+# o cursor devolvido ao cliente é "<geracao>:<versao>". A geração muda a cada
+# reinício do serviço, o que força o cliente a pedir um snapshot completo.
+estado_delta = {
+    'geracao': uuid.uuid4().hex[:8],
+    'versao': 0,
+    'versao_descarte': 0,
+    'clientes': {},
+    'versoes': {},
+    'removidos': {},
+    'ultima_sincronizacao': None,
+    'ultima_resync': None,
+}
+estado_delta_lock = threading.Lock()
+
+def fetch_registros_alterados(desde):
+    """
+    Consulta apenas os logins cuja conexão terminou ou iniciou a partir de `desde`
+    (epoch). Duas consultas são necessárias porque o grid do IXC combina os filtros com E.
+    """
+    url = f"{IXCSOFT_SCHEME}://{host}/webservice/v1/radusuarios"
+    marca = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(desde))
+    registros = {}
+    for campo in ('radusuarios.ultima_conexao_final', 'radusuarios.ultima_conexao_inicial'):
+        grid_param = json.dumps([
+            {"TB": "radusuarios.ativo", "OP": "=", "P": "S"},
+            {"TB": campo, "OP": ">=", "P": marca}
+        ])
+        for registro in fetch_all_pages(url, grid_param):
+            registros[registro.get('login')] = registro
+    return list(registros.values())
+
+def sincronizar_estado():
+    """
+    Atualiza `estado_delta` a partir do IXC. Faz uma ressincronização completa na
+    primeira chamada e a cada IXCSOFT_FULL_RESYNC_INTERVAL segundos; nas demais,
+    consulta apenas os logins alterados desde a última sincronização (com margem
+    de IXCSOFT_DELTA_MARGIN segundos para diferenças de relógio com o ERP).
+    Deve ser chamada com estado_delta_lock adquirido.
+    """
+    agora = time.time()
+    completa = (
+        estado_delta['ultima_resync'] is None or
+        agora - estado_delta['ultima_resync'] >= IXCSOFT_FULL_RESYNC_INTERVAL
+    )
+
+    if completa:
+        url = f"{IXCSOFT_SCHEME}://{host}/webservice/v1/radusuarios"
+        registros = fetch_all_pages(url, grid_param_status('todos'))
+    else:
+        registros = fetch_registros_alterados(estado_delta['ultima_sincronizacao'] - IXCSOFT_DELTA_MARGIN)
+
+    versao = estado_delta['versao'] + 1
+    clientes = estado_delta['clientes']
+    alterados = 0
+    vistos = set()
+    for registro in registros:
+        info = client_info_status(registro)
+        login = info['login']
+        vistos.add(login)
+        anterior = clientes.get(login)
+        if anterior is None or any(anterior.get(c) != info.get(c) for c in CAMPOS_DELTA):
+            alterados += 1
+            estado_delta['versoes'][login] = versao
+            estado_delta['removidos'].pop(login, None)
+        clientes[login] = info
+
+    removidos = 0
+    if completa:
+        # Logins que deixaram de estar ativos só são percebidos na ressincronização completa
+        for login in [l for l in clientes if l not in vistos]:
+            del clientes[login]
+            del estado_delta['versoes'][login]
+            estado_delta['removidos'][login] = versao
+            removidos += 1
+        # Descarta marcas de remoção antigas; cursores anteriores a elas recebem snapshot completo
+        if estado_delta['removidos']:
+            antigos = [l for l, v in estado_delta['removidos'].items() if v < versao]
+            for login in antigos:
+                estado_delta['versao_descarte'] = max(estado_delta['versao_descarte'], estado_delta['removidos'].pop(login))
+        estado_delta['ultima_resync'] = agora
+
+    if alterados or removidos:
+        estado_delta['versao'] = versao
+    estado_delta['ultima_sincronizacao'] = agora
+    logging.info(
+        f"Sincronização {'completa' if completa else 'incremental'}: {len(registros)} registros lidos, "
+        f"{alterados} alterados, {removidos} removidos. Versão {estado_delta['versao']}."
+    )
+
+def calcular_delta(since):
+    """
+    Retorna os logins alterados após o cursor `since`. Se o cursor for de outra
+    geração, estiver ausente ou for anterior às remoções já descartadas, devolve o
+    snapshot completo (completo=True) para que o cliente substitua seu estado.
+    Deve ser chamada com estado_delta_lock adquirido.
+    """
+    versao_cliente = None
+    if since:
+        geracao, _, versao = since.partition(':')
+        if geracao == estado_delta['geracao'] and versao.isdigit():
+            versao_cliente = int(versao)
+    if versao_cliente is not None and (
+        versao_cliente < estado_delta['versao_descarte'] or versao_cliente > estado_delta['versao']
+    ):
+        versao_cliente = None
+
+    if versao_cliente is None:
+        alterados = list(estado_delta['clientes'].values())
+        removidos = []
+    else:
+        alterados = [
+            estado_delta['clientes'][login]
+            for login, versao in estado_delta['versoes'].items() if versao > versao_cliente
+        ]
+        removidos = [login for login, versao in estado_delta['removidos'].items() if versao > versao_cliente]
+
+    return {
+        'cursor': f"{estado_delta['geracao']}:{estado_delta['versao']}",
+        'completo': versao_cliente is None,
+        'timestamp': estado_delta['ultima_sincronizacao'],
+        'alterados': alterados,
+        'removidos': removidos
+    }
+
+# --------------------------------------------------
+# Respostas em streaming (NDJSON)
+# --------------------------------------------------
+
+def pico_rss_mb():
+    """Pico de memória residente do processo, em MB (ru_maxrss é em KB no Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+CAMPOS_STREAM = [
+    'id_cliente', 'login', 'conexao', 'ultima_conexao_final', 'id_transmissor', 'latitude', 'longitude', 'online'
+]
+
+def quer_stream():
+    return (
+        request.args.get('stream') in ('1', 'true') or
+        'application/x-ndjson' in request.headers.get('Accept', '')
+    )
+
+def stream_clientes(status):
+    """
+    Gera a resposta NDJSON de `status` ('online', 'offline' ou 'todos'), uma página do
+    IXC por bloco. A primeira linha é {"tipo": "inicio", "campos": [...], ...} e a
+    última é {"tipo": "fim", "total": N}; as demais são listas com os valores de cada
+    cliente na ordem de `campos` (o que evita repetir as chaves em cada linha).
+    Uma falha no meio do stream é sinalizada com {"tipo": "erro", "error": ...},
+    pois o status HTTP já foi enviado.
+    """
+    url = f"{IXCSOFT_SCHEME}://{host}/webservice/v1/radusuarios"
+    grid_param = grid_param_status(status)
+    total = 0
+    yield json.dumps({'tipo': 'inicio', 'status': status, 'timestamp': time.time(), 'campos': CAMPOS_STREAM}) + "\n"
+    try:
+        for pagina in iter_pages(url, grid_param):
+            total += len(pagina)
+            yield "".join(
+                json.dumps([registro.get(campo) for campo in CAMPOS_STREAM]) + "\n" for registro in pagina
+            )
+    except IXCSoftError as e:
+        logging.error(f"Erro ao transmitir clientes {status}: {e}")
+        yield json.dumps({'tipo': 'erro', 'error': str(e)}) + "\n"
+        return
+    logging.info(f"Stream de clientes {status} concluído: {total} registros. Pico de RSS: {pico_rss_mb():.1f} MB.")
+    yield json.dumps({'tipo': 'fim', 'total': total}) + "\n"
+
+def resposta_stream(status):
+    return Response(stream_with_context(stream_clientes(status)), mimetype='application/x-ndjson')
+
 @app.route('/clientes/offline', methods=['GET'])
 def get_offline_clients():
-    clients = fetch_clients('offline')
+    if quer_stream():
+        return resposta_stream('offline')
+    try:
+        clients = fetch_clients('offline')
+    except IXCSoftError as e:
+        logging.error(f"Erro ao obter clientes offline: {e}")
+        return jsonify({'error': str(e)}), 502
+    logging.info(f"Pico de RSS: {pico_rss_mb():.1f} MB.")
     return jsonify({'clientes': clients})
 
 @app.route('/clientes/online', methods=['GET'])
 def get_online_clients():
-    clients = fetch_clients('online')
+    if quer_stream():
+        return resposta_stream('online')
+    try:
+        clients = fetch_clients('online')
+    except IXCSoftError as e:
+        logging.error(f"Erro ao obter clientes online: {e}")
+        return jsonify({'error': str(e)}), 502
+    logging.info(f"Pico de RSS: {pico_rss_mb():.1f} MB.")
     return jsonify({'clientes': clients})
 
+@app.route('/clientes/snapshot', methods=['GET'])
+def get_snapshot():
+    if quer_stream():
+        return resposta_stream('todos')
+    try:
+        snapshot = fetch_snapshot()
+    except IXCSoftError as e:
+        logging.error(f"Erro ao obter snapshot de clientes: {e}")
+        return jsonify({'error': str(e)}), 502
+    logging.info(f"Pico de RSS: {pico_rss_mb():.1f} MB.")
+    return jsonify(snapshot)
+
+@app.route('/clientes/delta', methods=['GET'])
+def get_delta():
+    """
+    Retorna apenas os logins alterados desde o cursor informado em `since`.
+    Sem cursor (ou com um cursor inválido) retorna o snapshot completo.
+    """
+    since = request.args.get('since')
+    with estado_delta_lock:
+        try:
+            sincronizar_estado()
+        except IXCSoftError as e:
+            logging.error(f"Erro ao sincronizar clientes: {e}")
+            return jsonify({'error': str(e)}), 502
+        delta = calcular_delta(since)
+    logging.info(f"Delta desde {since}: {len(delta['alterados'])} alterados, {len(delta['removidos'])} removidos.")
+    return jsonify(delta)
+
 @app.route('/saida_api', methods=['GET'])
 def salvar_saida_api():
     """
@@ -0,0 +1,135 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+# Credenciais fictícias: o módulo encerra o processo se não estiverem definidas
+os.environ.setdefault('IXCSOFT_HOST', 'ixc.teste')
+os.environ.setdefault('IXCSOFT_USUARIO', 'teste')
+os.environ.setdefault('IXCSOFT_TOKEN', 'teste')
+
+# Ensure the service module can be imported
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import ixcsoft_service
+
+
+def registro(login, online='N', conexao='CONEXAO_A', id_transmissor='1'):
+    return {
+        'id_cliente': login, 'login': login, 'conexao': conexao, 'id_transmissor': id_transmissor,
+        'online': online, 'ultima_conexao_final': '2024-01-01 00:00:00',
+        'latitude': None, 'longitude': None
+    }
+
+
+class TestCursorDelta(unittest.TestCase):
+
+    def setUp(self):
+        ixcsoft_service.estado_delta.update({
+            'geracao': 'g1',
+            'versao': 0,
+            'versao_descarte': 0,
+            'clientes': {},
+            'versoes': {},
+            'removidos': {},
+            'ultima_sincronizacao': None,
+            'ultima_resync': None,
+        })
+        self.agora = 1000.0
+        patch('ixcsoft_service.time.time', side_effect=lambda: self.agora).start()
+        self.mock_completa = patch('ixcsoft_service.fetch_all_pages').start()
+        self.mock_alterados = patch('ixcsoft_service.fetch_registros_alterados').start()
+        self.client = ixcsoft_service.app.test_client()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _delta(self, since=None):
+        resposta = self.client.get('/clientes/delta', query_string={'since': since} if since else None)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.get_json()
+
+    def test_sem_cursor_retorna_snapshot_completo(self):
+        self.mock_completa.return_value = [registro('a'), registro('b', online='S')]
+
+        delta = self._delta()
+
+        self.assertTrue(delta['completo'])
+        self.assertEqual(delta['cursor'], 'g1:1')
+        self.assertEqual({c['login'] for c in delta['alterados']}, {'a', 'b'})
+        self.assertEqual(delta['removidos'], [])
+
+    def test_cursor_retorna_apenas_alterados(self):
+        self.mock_completa.return_value = [registro('a'), registro('b')]
+        cursor = self._delta()['cursor']
+
+        self.agora += 60
+        self.mock_alterados.return_value = [registro('a'), registro('b', online='S')]
+        delta = self._delta(cursor)
+
+        self.assertFalse(delta['completo'])
+        self.assertEqual([c['login'] for c in delta['alterados']], ['b'])
+        self.assertEqual(delta['cursor'], 'g1:2')
+        # A consulta incremental começa na última sincronização menos a margem
+        self.mock_alterados.assert_called_once_with(1000.0 - ixcsoft_service.IXCSOFT_DELTA_MARGIN)
+
+    def test_sem_mudancas_mantem_cursor(self):
+        self.mock_completa.return_value = [registro('a')]
+        cursor = self._delta()['cursor']
+
+        self.agora += 60
+        self.mock_alterados.return_value = [registro('a')]
+        delta = self._delta(cursor)
+
+        self.assertEqual(delta['cursor'], cursor)
+        self.assertEqual(delta['alterados'], [])
+
+    def test_ressincronizacao_completa_informa_removidos(self):
+        self.mock_completa.return_value = [registro('a'), registro('b')]
+        cursor = self._delta()['cursor']
+
+        self.agora += ixcsoft_service.IXCSOFT_FULL_RESYNC_INTERVAL
+        self.mock_completa.return_value = [registro('a')]
+        delta = self._delta(cursor)
+
+        self.assertFalse(delta['completo'])
+        self.assertEqual(delta['removidos'], ['b'])
+        self.assertEqual(delta['alterados'], [])
+        self.mock_alterados.assert_not_called()
+
+    def test_cursor_anterior_ao_descarte_recebe_snapshot_completo(self):
+        self.mock_completa.return_value = [registro('a'), registro('b'), registro('c')]
+        cursor_antigo = self._delta()['cursor']
+
+        # Duas ressincronizações: a marca de remoção de 'b' é descartada na segunda
+        self.agora += ixcsoft_service.IXCSOFT_FULL_RESYNC_INTERVAL
+        self.mock_completa.return_value = [registro('a'), registro('c')]
+        self._delta(cursor_antigo)
+        self.agora += ixcsoft_service.IXCSOFT_FULL_RESYNC_INTERVAL
+        self.mock_completa.return_value = [registro('a')]
+        delta = self._delta(cursor_antigo)
+
+        self.assertTrue(delta['completo'])
+        self.assertEqual([c['login'] for c in delta['alterados']], ['a'])
+
+    def test_cursor_invalido_recebe_snapshot_completo(self):
+        self.mock_completa.return_value = [registro('a')]
+        self._delta()
+
+        for cursor in ('outra:1', 'g1:abc', 'g1:99', 'lixo'):
+            self.agora += 1
+            self.mock_alterados.return_value = []
+            delta = self._delta(cursor)
+            self.assertTrue(delta['completo'], cursor)
+            self.assertEqual([c['login'] for c in delta['alterados']], ['a'])
+
+    def test_erro_na_sincronizacao_retorna_502(self):
+        self.mock_completa.side_effect = ixcsoft_service.IXCSoftError("falha")
+
+        resposta = self.client.get('/clientes/delta')
+
+        self.assertEqual(resposta.status_code, 502)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Benchmark da fila de alertas: latência do ciclo com o alert_service lento ou fora do ar.
+
+Sobe um alert_service falso local e mede o tempo de um ciclo que gera N eventos
+(alerta de Telegram + WhatsApp para cada um) com o envio bloqueante anterior
+(requests.post no próprio loop) e com a fila SQLite. Em seguida, derruba o serviço
+por alguns segundos e confere que todos os alertas são entregues quando ele volta,
+em ordem por evento e sem duplicatas. Uso (dentro do container ou com /app/logs):
+
+    python bench_alert_queue.py [--eventos 10] [--latencia 1]
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIRETORIO = tempfile.mkdtemp(prefix='bench_alertas_')
+os.environ['MONITOR_DB_PATH'] = os.path.join(DIRETORIO, 'monitor.db')
+os.environ.setdefault('ALERT_BACKOFF_BASE', '0.2')
+os.environ.setdefault('ALERT_BACKOFF_MAX', '1')
+
+import requests  # noqa: E402
+
+import monitor_service  # noqa: E402
+
+
+class FakeAlertHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latencia = 0.0
+    fora_do_ar = False
+    recebidos = []
+
+    def do_POST(self):
+        corpo = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.latencia)
+        if self.fora_do_ar:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        FakeAlertHandler.recebidos.append((self.path, corpo))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+def envio_bloqueante(canal, payload):
+    """Envio anterior: requests.post sem timeout, dentro do loop."""
+    requests.post(f"{monitor_service.ALERT_SERVICE_URL}/alerta/{canal}", json=payload).raise_for_status()
+
+
+def ciclo(eventos, enviar):
+    inicio = time.perf_counter()
+    with monitor_service.transacao():
+        for i in range(eventos):
+            chave = f"evento{i}:offline"
+            enviar('telegram', {'clientes': [], 'status': 'offline', 'conexao': f'C{i}'}, f'evento{i}', chave)
+            enviar('whatsapp', {'total_clientes': 10, 'conexao': f'C{i}', 'motivo': 'energia'}, f'evento{i}', chave)
+    monitor_service.alertas_disponiveis.set()
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--eventos', type=int, default=10)
+    parser.add_argument('--latencia', type=float, default=1.0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), FakeAlertHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    monitor_service.ALERT_SERVICE_URL = f'http://127.0.0.1:{servidor.server_port}'
+    monitor_service.init_db()
+
+    FakeAlertHandler.latencia = args.latencia
+    bloqueante = ciclo(args.eventos, lambda canal, payload, *_: envio_bloqueante(canal, payload))
+    fila = ciclo(args.eventos, monitor_service.enfileirar_alerta)
+    print(f"{args.eventos} eventos, alert_service com {args.latencia}s de latência por alerta")
+    print(f"  ciclo com envio bloqueante: {bloqueante:8.2f} s")
+    print(f"  ciclo com fila:             {fila:8.4f} s")
+
+    # Fila acumulada com o serviço fora do ar; entrega ao voltar
+    FakeAlertHandler.latencia = 0
+    FakeAlertHandler.fora_do_ar = True
+    FakeAlertHandler.recebidos = []
+    monitor_service.iniciar_despacho_alertas()
+    time.sleep(3)
+    ciclo(args.eventos, monitor_service.enfileirar_alerta)  # duplicatas: devem ser ignoradas
+    FakeAlertHandler.fora_do_ar = False
+    inicio = time.perf_counter()
+    while len(FakeAlertHandler.recebidos) < 2 * args.eventos and time.perf_counter() - inicio < 30:
+        time.sleep(0.05)
+    time.sleep(0.5)
+    entregues = FakeAlertHandler.recebidos
+    conexoes = [corpo['conexao'] for _, corpo in entregues]
+    print(f"  após 3s fora do ar: {len(entregues)} alertas entregues em {time.perf_counter() - inicio:.2f}s "
+          f"depois da volta ({2 * args.eventos} esperados, sem duplicatas)")
+    assert len(entregues) == 2 * args.eventos
+    assert all(conexoes.count(f'C{i}') == 2 for i in range(args.eventos))
+    for i in range(args.eventos):
+        caminhos = [caminho for caminho, corpo in entregues if corpo['conexao'] == f'C{i}']
+        assert caminhos == ['/alerta/telegram', '/alerta/whatsapp'], caminhos
+
+    servidor.shutdown()
+    shutil.rmtree(DIRETORIO)
+
+
+if __name__ == '__main__':
+    main()
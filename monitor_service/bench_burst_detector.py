@@ -0,0 +1,82 @@
+"""
+Benchmark do DetectorQuedas com dados sintéticos.
+
+1. Custo por evento (queda/retorno) com 1 mil a 20 mil conexões: deve ser constante.
+2. Queda que atravessa dois ciclos: a diferença entre dois snapshots não dispara
+   (nenhum ciclo sozinho atinge o limiar); a janela deslizante dispara.
+Uso (dentro do container ou com /app/logs):
+
+    python bench_burst_detector.py [--eventos 500000] [--conexoes 1000 5000 20000]
+"""
+import argparse
+import logging
+import random
+import time
+
+import monitor_service
+
+
+def custo_por_evento(conexoes, eventos, logins_por_conexao=64):
+    rnd = random.Random(conexoes)
+    detector = monitor_service.DetectorQuedas(janela=600, balde=30, percentual=20, minimo=4)
+    detector.assinantes = {c: logins_por_conexao for c in range(conexoes)}
+    total_logins = conexoes * logins_por_conexao
+    offline = []
+    agora = 0.0
+    disparos = 0
+    inicio = time.perf_counter()
+    for i in range(eventos):
+        agora += 0.01
+        if offline and rnd.random() < 0.45:
+            j = rnd.randrange(len(offline))
+            offline[j], offline[-1] = offline[-1], offline[j]
+            detector.registrar_retorno(offline.pop())
+        else:
+            login_id = rnd.randrange(total_logins)
+            detector.registrar_queda(login_id, login_id // logins_por_conexao, agora)
+            offline.append(login_id)
+        if i % 1000 == 0:  # um "ciclo" (ex.: RADIUS_CYCLE_INTERVAL) a cada mil eventos
+            disparos += len(detector.disparos(agora))
+    duracao = time.perf_counter() - inicio
+    return duracao / eventos * 1e6, disparos
+
+
+def queda_entre_ciclos():
+    """Conexão com 40 assinantes; 12 caem, metade antes e metade depois da virada do ciclo."""
+    limiar = 8
+    ciclo1 = set(range(6))
+    ciclo2 = set(range(12))
+    diferenca = [len(ciclo1 - set()), len(ciclo2 - ciclo1)]
+    dispara_diferenca = any(n >= limiar for n in diferenca)
+
+    detector = monitor_service.DetectorQuedas(janela=600, balde=30, percentual=20, minimo=4)
+    detector.assinantes = {0: 40}
+    for login_id in ciclo1:
+        detector.registrar_queda(login_id, 0, 300)
+    primeiro = detector.disparos(300)
+    for login_id in ciclo2 - ciclo1:
+        detector.registrar_queda(login_id, 0, 600)
+    segundo = detector.disparos(600)
+    return dispara_diferenca, bool(primeiro), len(segundo.get(0, []))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--eventos', type=int, default=500000)
+    parser.add_argument('--conexoes', type=int, nargs='+', default=[1000, 5000, 20000])
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{'conexões':>9} {'µs/evento':>10} {'disparos':>9}")
+    for conexoes in args.conexoes:
+        custo, disparos = custo_por_evento(conexoes, args.eventos)
+        print(f"{conexoes:>9} {custo:>10.2f} {disparos:>9}")
+
+    dispara_diferenca, primeiro, logins = queda_entre_ciclos()
+    print(f"queda de 12/40 logins em dois ciclos (limiar 20% = 8): diferença de snapshots dispara={dispara_diferenca}; "
+          f"janela dispara no 1º ciclo={primeiro}, no 2º com {logins} logins")
+    assert not dispara_diferenca and not primeiro and logins == 12
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark do diagnóstico na OLT fora do loop de monitoramento, com um olt_service falso local.
+
+O olt_service falso demora --latencia segundos por consulta (as consultas SSH da amostra
+de logins). Para um ciclo com --conexoes conexões caindo juntas, compara por quanto tempo o
+loop fica parado com a consulta bloqueando o ciclo (comportamento anterior: um lote com
+todas as conexões, e só então os eventos e o primeiro alerta) e com o diagnóstico agendado
+em --workers threads, além do tempo até o último motivo gravado. Uso (dentro do container
+ou com /app/logs):
+
+    python bench_diagnostico_olt.py [--conexoes 20] [--latencia 6] [--workers 8]
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOLTHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latencia = 6.0
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(self.latencia)  # o olt_service diagnostica as consultas do lote em paralelo
+        resultados = [{'conexao': c['conexao'], 'motivo_final': 'energia'} for c in payload['consultas']]
+        corpo = json.dumps({'resultados': resultados}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def snapshots(monitor_service, conexoes, logins_por_conexao):
+    """Dois snapshots: todos online e, no segundo, todas as conexões offline."""
+    resultado = []
+    for online in (True, False):
+        snapshot = monitor_service.SnapshotClientes()
+        for c in range(conexoes):
+            for i in range(logins_por_conexao):
+                # Um transmissor por conexão: cada queda é uma causa raiz
+                snapshot.adicionar(f'c{c}_{i}@provedor', f'CONEXAO_{c}', str(c), '2024-01-01 00:00:00', online)
+        resultado.append(snapshot)
+    return resultado
+
+
+def medir(monitor_service, modo, conexoes, logins_por_conexao):
+    m = monitor_service
+    for tabela in ('events', 'event_logins', 'event_conexoes', 'alertas'):
+        m.get_db().execute(f"DELETE FROM {tabela}")
+    m.get_db().commit()
+    anterior, atual = snapshots(m, conexoes, logins_por_conexao)
+    eventos, detector, topologia = m.IndiceEventos(), m.DetectorQuedas(), m.Topologia()
+    detector.atualizar_assinantes(atual)
+    topologia.atualizar(atual)
+
+    agendados = []
+    if modo == 'bloqueante':
+        m.agendar_diagnostico = lambda evento, clientes: agendados.append((evento, clientes))
+    inicio = time.perf_counter()
+    m.processar_ciclo(atual, anterior.offline, eventos, detector, topologia, m.HistoricoTransicoes())
+    if modo == 'bloqueante':
+        # Como antes: uma única consulta em lote, e só então o ciclo segue
+        motivos = m.consultar_motivos_olt({evento['conexao']: clientes for evento, clientes in agendados})
+        with m.transacao():
+            for evento, clientes in agendados:
+                m.aplicar_diagnostico(evento, motivos[evento['conexao']], clientes)
+    ciclo = time.perf_counter() - inicio
+
+    db = sqlite3.connect(m.DB_PATH)
+    while db.execute("SELECT COUNT(*) FROM events WHERE motivo = ?", (m.MOTIVO_EM_ANALISE,)).fetchone()[0]:
+        time.sleep(0.01)
+    diagnostico = time.perf_counter() - inicio
+    alertas = db.execute("SELECT COUNT(*) FROM alertas").fetchone()[0]
+    db.close()
+    return ciclo, diagnostico, len(eventos), alertas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--conexoes', type=int, default=20)
+    parser.add_argument('--logins', type=int, default=30, help='Logins por conexão')
+    parser.add_argument('--latencia', type=float, default=6.0, help='Duração de uma consulta à OLT (s)')
+    parser.add_argument('--workers', type=int, default=8, help='OLT_DIAGNOSE_WORKERS')
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), FakeOLTHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    FakeOLTHandler.latencia = args.latencia
+
+    diretorio = tempfile.mkdtemp()
+    os.environ.update({
+        'MONITOR_DB_PATH': os.path.join(diretorio, 'bench.db'),
+        'OLT_SERVICE_URL': f'http://127.0.0.1:{servidor.server_port}',
+        'THRESHOLD_OFFLINE_CLIENTS': '5',
+        'TOPOLOGY_MIN_CONEXOES': '0',
+        'OLT_DIAGNOSE_WORKERS': str(args.workers),
+    })
+    import monitor_service
+    logging.getLogger().setLevel(logging.WARNING)
+    monitor_service.init_db()
+    agendar = monitor_service.agendar_diagnostico
+
+    print(f"conexões={args.conexoes} logins/conexão={args.logins} latência OLT={args.latencia}s workers={args.workers}")
+    print(f"{'modo':>11} {'loop parado (s)':>16} {'diagnóstico (s)':>16} {'eventos':>8} {'alertas':>8}")
+    for modo in ('bloqueante', 'pool'):
+        monitor_service.agendar_diagnostico = agendar
+        ciclo, diagnostico, eventos, alertas = medir(monitor_service, modo, args.conexoes, args.logins)
+        assert eventos == args.conexoes and alertas == 4 * args.conexoes, (eventos, alertas)
+        print(f"{modo:>11} {ciclo:>16.2f} {diagnostico:>16.2f} {eventos:>8} {alertas:>8}")
+
+    servidor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark do tratamento de reconexões e do agrupamento de novos offlines.
+
+Compara o loop anterior (varredura de eventos_ativos para cada login reconectado,
+SELECT no SQLite por conexão, list.remove) com IndiceEventos, usando N eventos
+ativos e M reconexões num único ciclo. Uso (dentro do container ou com /app/logs):
+
+    python bench_event_index.py [--eventos 500] [--reconexoes 50000]
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+DIRETORIO = tempfile.mkdtemp(prefix='bench_indice_')
+os.environ['MONITOR_DB_PATH'] = os.path.join(DIRETORIO, 'monitor.db')
+
+import monitor_service  # noqa: E402
+
+
+def criar_eventos(quantidade, logins_por_evento):
+    eventos = []
+    for i in range(quantidade):
+        logins = {f'cliente{i}_{j}@provedor' for j in range(logins_por_evento)}
+        eventos.append({
+            'id': f'evento{i}', 'conexao': f'OLT{i % 12}-PON{i}', 'timestamp': 1.7e9 + i,
+            'logins_offline': set(logins), 'logins_restantes': set(logins)
+        })
+    return eventos
+
+
+def persistir(eventos):
+    with monitor_service.transacao() as conn:
+        conn.execute("DELETE FROM events")
+        conn.execute("DELETE FROM event_logins")
+        for evento in eventos:
+            monitor_service.save_event(evento, "ativo")
+
+
+def existe_evento_ativo_para_conexao(conexao):
+    c = monitor_service.get_db().execute('''
+        SELECT 1 FROM events WHERE status = 'ativo' AND conexao = ?
+        UNION ALL
+        SELECT 1 FROM event_conexoes c JOIN events e ON e.id = c.event_id
+        WHERE c.conexao = ? AND e.status = 'ativo'
+        LIMIT 1
+    ''', (conexao, conexao))
+    return c.fetchone() is not None
+
+
+def update_event_status(event_id, new_status):
+    with monitor_service.transacao() as conn:
+        conn.execute("UPDATE events SET status = ? WHERE id = ?", (new_status, event_id))
+        monitor_service.registrar_alteracao_eventos(conn)
+
+
+def ciclo_lista(eventos_ativos, reconectados, conexoes):
+    """Versão anterior do loop, com a persistência por login."""
+    for conexao in conexoes:
+        if existe_evento_ativo_para_conexao(conexao):
+            for ev in eventos_ativos:
+                if ev['conexao'] == conexao:
+                    break
+    eventos_para_remover = []
+    for login in reconectados:
+        for evento in eventos_ativos:
+            if login in evento['logins_restantes']:
+                evento['logins_restantes'].remove(login)
+                monitor_service.registrar_reconexoes([(evento['id'], login)])
+                if not evento['logins_restantes']:
+                    update_event_status(evento['id'], "resolvido")
+                    eventos_para_remover.append(evento)
+    for evento in eventos_para_remover:
+        eventos_ativos.remove(evento)
+    return len(eventos_para_remover)
+
+
+def ciclo_indice(indice, reconectados, conexoes):
+    for conexao in conexoes:
+        indice.da_conexao(conexao)
+    resolvidos = indice.reconectar(reconectados)
+    for evento in resolvidos:
+        indice.resolver(evento)
+    return len(resolvidos)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--eventos', type=int, default=500)
+    parser.add_argument('--reconexoes', type=int, default=50000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    monitor_service.init_db()
+
+    logins_por_evento = args.reconexoes // args.eventos
+    eventos = criar_eventos(args.eventos, logins_por_evento)
+    reconectados = [login for evento in eventos for login in sorted(evento['logins_restantes'])]
+    # Reconexões em ordem intercalada entre eventos, como chegam do snapshot
+    reconectados.sort(key=lambda login: login.split('_')[1])
+    conexoes = [evento['conexao'] for evento in eventos]
+
+    print(f"eventos ativos={args.eventos} reconexões={len(reconectados)} conexões verificadas={len(conexoes)}")
+    print(f"{'implementação':>14} {'tempo (s)':>10} {'resolvidos':>11}")
+    for nome in ('lista', 'índice'):
+        eventos = criar_eventos(args.eventos, logins_por_evento)
+        persistir(eventos)
+        inicio = time.perf_counter()
+        with monitor_service.transacao():
+            if nome == 'lista':
+                resolvidos = ciclo_lista(eventos, reconectados, conexoes)
+            else:
+                resolvidos = ciclo_indice(monitor_service.IndiceEventos(eventos), reconectados, conexoes)
+        duracao = time.perf_counter() - inicio
+        assert resolvidos == args.eventos, resolvidos
+        print(f"{nome:>14} {duracao:>10.3f} {resolvidos:>11}")
+
+    shutil.rmtree(DIRETORIO)
+
+
+if __name__ == '__main__':
+    main()
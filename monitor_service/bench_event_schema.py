@@ -0,0 +1,128 @@
+"""
+Benchmark do esquema de eventos com dados sintéticos de histórico.
+
+Cria um banco no esquema antigo (events.logins em JSON) com N eventos, mede a
+migração para event_logins e compara, entre os dois esquemas: busca dos eventos
+de um login, verificação de evento ativo por conexão e registro de uma
+reconexão num evento grande. Uso (dentro do container ou com /app/logs):
+
+    python bench_event_schema.py [--eventos 100000] [--logins-por-evento 20]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+DIRETORIO = tempfile.mkdtemp(prefix='bench_eventos_')
+os.environ['MONITOR_DB_PATH'] = os.path.join(DIRETORIO, 'novo.db')
+
+import monitor_service  # noqa: E402
+
+REPETICOES = 200
+
+
+def existe_evento_ativo_para_conexao(conexao):
+    """Verificação por conexão que o loop fazia antes do índice de eventos em memória."""
+    c = monitor_service.get_db().execute('''
+        SELECT 1 FROM events WHERE status = 'ativo' AND conexao = ?
+        UNION ALL
+        SELECT 1 FROM event_conexoes c JOIN events e ON e.id = c.event_id
+        WHERE c.conexao = ? AND e.status = 'ativo'
+        LIMIT 1
+    ''', (conexao, conexao))
+    return c.fetchone() is not None
+
+
+def criar_banco_antigo(caminho, eventos, logins_por_evento):
+    rnd = random.Random(1)
+    conn = sqlite3.connect(caminho)
+    conn.execute("CREATE TABLE events (id TEXT PRIMARY KEY, conexao TEXT, timestamp REAL, status TEXT, logins TEXT)")
+    linhas = []
+    for i in range(eventos):
+        logins = [f'cliente{rnd.randrange(eventos * 2)}@provedor' for _ in range(logins_por_evento)]
+        status = 'ativo' if i % 500 == 0 else 'resolvido'
+        linhas.append((f'evento{i}', f'OLT{i % 12}-PON{i % 640}', 1.7e9 + i * 60, status, json.dumps(logins)))
+    conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?)", linhas)
+    conn.commit()
+    conn.close()
+
+
+def cronometrar(funcao, repeticoes=REPETICOES):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--eventos', type=int, default=100000)
+    parser.add_argument('--logins-por-evento', type=int, default=20)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    antigo = os.path.join(DIRETORIO, 'antigo.db')
+    criar_banco_antigo(antigo, args.eventos, args.logins_por_evento)
+    shutil.copy(antigo, monitor_service.DB_PATH)
+
+    inicio = time.perf_counter()
+    monitor_service.init_db()
+    migracao = time.perf_counter() - inicio
+
+    conn_antigo = sqlite3.connect(antigo)
+    conn_novo = monitor_service.get_db()
+    login = json.loads(conn_antigo.execute("SELECT logins FROM events WHERE id = ?", (f'evento{args.eventos // 2}',)).fetchone()[0])[0]
+    conexao = 'OLT3-PON63'
+
+    def login_antigo():
+        return [row[0] for row in conn_antigo.execute("SELECT id, logins FROM events") if login in json.loads(row[1])]
+
+    def ativo_antigo():
+        return conn_antigo.execute(
+            "SELECT 1 FROM events WHERE status = 'ativo' AND conexao = ? LIMIT 1", (conexao,)
+        ).fetchone()
+
+    grande = {
+        'id': 'evento0', 'conexao': 'OLT0-PON0', 'timestamp': 1.7e9,
+        'logins_offline': [f'massivo{i}@provedor' for i in range(2000)]
+    }
+    conn_antigo.execute("UPDATE events SET logins = ? WHERE id = 'evento0'", (json.dumps(grande['logins_offline']),))
+    conn_antigo.commit()
+    monitor_service.save_event(grande, 'ativo')
+
+    def reconexao_antiga():
+        logins = json.loads(conn_antigo.execute("SELECT logins FROM events WHERE id = 'evento0'").fetchone()[0])
+        logins.pop()
+        conn_antigo.execute("UPDATE events SET logins = ? WHERE id = 'evento0'", (json.dumps(logins),))
+        conn_antigo.commit()
+
+    def reconexao_nova():
+        monitor_service.registrar_reconexoes([('evento0', 'massivo1999@provedor')])
+
+    assert sorted(login_antigo()) == sorted(ev['id'] for ev in monitor_service.eventos_do_login(login))
+
+    linhas = conn_novo.execute("SELECT COUNT(*) FROM event_logins").fetchone()[0]
+    print(f"eventos={args.eventos} logins/evento={args.logins_por_evento} linhas em event_logins={linhas}")
+    print(f"migração: {migracao:.2f} s")
+    print(f"{'operação':>28} {'antigo (ms)':>12} {'novo (ms)':>10}")
+    resultados = (
+        ('eventos de um login', cronometrar(login_antigo, 3),
+         cronometrar(lambda: monitor_service.eventos_do_login(login))),
+        ('evento ativo por conexão', cronometrar(ativo_antigo),
+         cronometrar(lambda: existe_evento_ativo_para_conexao(conexao))),
+        ('reconexão (evento 2000)', cronometrar(reconexao_antiga), cronometrar(reconexao_nova)),
+    )
+    for nome, tempo_antigo, tempo_novo in resultados:
+        print(f"{nome:>28} {tempo_antigo:>12.3f} {tempo_novo:>10.3f}")
+
+    conn_antigo.close()
+    shutil.rmtree(DIRETORIO)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark de GET /eventos/ativos durante um incidente grande.
+
+Cria um banco temporário com N eventos ativos somando dezenas de milhares de logins
+e mede, pelo cliente de teste do Flask, o custo por chamada da rota anterior
+(consulta ao SQLite e JSON completo a cada chamada) e da rota com o modelo de
+leitura: primeira chamada após uma alteração, consultas repetidas, If-None-Match
+(304) e a projeção resumo. Uso (dentro do container ou com /app/logs):
+
+    python bench_eventos_ativos.py [--eventos 50] [--logins 1000] [--repeticoes 50]
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+DIRETORIO = tempfile.mkdtemp(prefix='bench_ativos_')
+os.environ['MONITOR_DB_PATH'] = os.path.join(DIRETORIO, 'monitor.db')
+
+from flask import jsonify  # noqa: E402
+
+import monitor_service  # noqa: E402
+
+
+def rota_anterior():
+    """GET /eventos/ativos antes do modelo de leitura."""
+    eventos_formatados = []
+    for evento in sorted(monitor_service.carregar_eventos_ativos(), key=lambda ev: ev["timestamp"]):
+        eventos_formatados.append({
+            "id": evento["id"],
+            "conexao": evento["conexao"],
+            "timestamp": evento["timestamp"],
+            "status": evento["status"],
+            "nivel": evento["nivel"],
+            "conexoes": sorted(evento["conexoes"]),
+            "logins": sorted(evento["logins_offline"])
+        })
+    return jsonify({"eventos_ativos": eventos_formatados})
+
+
+def medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--eventos', type=int, default=50)
+    parser.add_argument('--logins', type=int, default=1000, help='Logins por evento')
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    monitor_service.init_db()
+    with monitor_service.transacao():
+        for e in range(args.eventos):
+            monitor_service.save_event({
+                'id': f'evento{e}', 'conexao': f'CONEXAO_{e}', 'timestamp': time.time() - e * 60,
+                'transmissor': str(e % 6), 'conexoes': [f'CONEXAO_{e}'],
+                'logins_offline': [f'cliente{e}_{i}@provedor' for i in range(args.logins)],
+            }, 'ativo')
+
+    cliente = monitor_service.app.test_client()
+    url = '/eventos/ativos'
+    with monitor_service.app.test_request_context(url):
+        anterior, resposta = medir(rota_anterior, args.repeticoes)
+        tamanho_anterior = len(resposta.get_data())
+
+    def primeira():
+        monitor_service.registrar_reconexoes([('evento0', 'cliente0_0@provedor')])
+        return cliente.get(url)
+
+    primeira_chamada, resposta = medir(primeira, max(1, args.repeticoes // 5))
+    etag = resposta.headers['ETag']
+    repetida, resposta = medir(lambda: cliente.get(url), args.repeticoes)
+    assert resposta.json['total'] == args.eventos
+    tamanho = len(resposta.get_data())
+    condicional, resposta = medir(lambda: cliente.get(url, headers={'If-None-Match': etag}), args.repeticoes)
+    assert resposta.status_code == 304
+    resumo, resposta_resumo = medir(lambda: cliente.get(f'{url}?projecao=resumo'), args.repeticoes)
+    pagina, resposta_pagina = medir(lambda: cliente.get(f'{url}?transmissor=1&por_pagina=5'), args.repeticoes)
+    tamanho_pagina = len(resposta_pagina.get_data())
+
+    print(f"eventos={args.eventos} logins={args.eventos * args.logins}")
+    print(f"{'chamada':>32} {'ms/chamada':>11} {'bytes':>10}")
+    print(f"{'anterior':>32} {anterior:>11.2f} {tamanho_anterior:>10}")
+    print(f"{'nova: após alteração (recarrega)':>32} {primeira_chamada:>11.2f} {tamanho:>10}")
+    print(f"{'nova: repetida':>32} {repetida:>11.2f} {tamanho:>10}")
+    print(f"{'nova: If-None-Match (304)':>32} {condicional:>11.2f} {0:>10}")
+    print(f"{'nova: projecao=resumo':>32} {resumo:>11.2f} {len(resposta_resumo.get_data()):>10}")
+    print(f"{'nova: transmissor + paginação':>32} {pagina:>11.2f} {tamanho_pagina:>10}")
+    shutil.rmtree(DIRETORIO, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark do histórico de transições por login (HistoricoTransicoes) com dados sintéticos.
+
+Compara um dict login -> deque(maxlen) de tuplas (timestamp, online) com o buffer
+circular em array: memória para N logins com o histórico cheio, custo por transição
+registrada e tempo do ranking dos mais instáveis (o primeiro ainda descarta os logins
+fora da janela; os seguintes só revisitam os que tiveram transições recentes). Uso (dentro do container ou com /app/logs):
+
+    python bench_flapping.py [--logins 100000] [--ativos 10000]
+"""
+import argparse
+import logging
+import random
+import time
+import tracemalloc
+from collections import deque
+
+import monitor_service
+
+
+class HistoricoDeques:
+    """Representação ingênua, para comparação."""
+
+    def __init__(self, capacidade, janela):
+        self.capacidade, self.janela = capacidade, janela
+        self.transicoes = {}
+
+    def registrar(self, login_id, online, agora):
+        historico = self.transicoes.get(login_id)
+        if historico is None:
+            historico = self.transicoes[login_id] = deque(maxlen=self.capacidade)
+        historico.append((agora, online))
+        return sum(1 for t, o in historico if t >= agora - self.janela and not o)
+
+    def ranking(self, agora, quantidade):
+        linhas = []
+        for login_id, historico in self.transicoes.items():
+            quedas = sum(1 for t, o in historico if t >= agora - self.janela and not o)
+            if quedas > 1:
+                linhas.append((login_id, quedas))
+        linhas.sort(key=lambda linha: -linha[1])
+        return linhas[:quantidade]
+
+
+def transicoes_sinteticas(logins, ativos, capacidade, semente):
+    """Histórico cheio para todos os logins (antigo) e transições recentes para `ativos` deles."""
+    rnd = random.Random(semente)
+    agora = 1_800_000_000
+    eventos = []
+    for login_id in range(logins):
+        for k in range(capacidade):
+            eventos.append((login_id, k % 2 == 1, agora - 86400 + k * 60))
+    for login_id in rnd.sample(range(logins), ativos):
+        for k in range(rnd.randrange(2, capacidade)):
+            eventos.append((login_id, k % 2 == 1, agora - 1800 + k * 60))
+    return eventos, agora
+
+
+def medir(construir, eventos, agora, top):
+    """Memória com o histórico cheio (tracemalloc), custo por transição e dois rankings seguidos."""
+    tracemalloc.start()
+    historico = construir()
+    for login_id, online, instante in eventos:
+        historico.registrar(login_id, online, instante)
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    historico = construir()
+    inicio = time.perf_counter()
+    for login_id, online, instante in eventos:
+        historico.registrar(login_id, online, instante)
+    por_transicao = (time.perf_counter() - inicio) / len(eventos)
+
+    rankings, tempos = [], []
+    for _ in range(2):
+        inicio = time.perf_counter()
+        rankings.append([linha[:2] for linha in historico.ranking(agora, top)])
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    assert rankings[0] == rankings[1]
+    return memoria / 1024 / 1024, por_transicao * 1e6, tempos[0], tempos[1], rankings[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=100000)
+    parser.add_argument('--ativos', type=int, default=10000, help='Logins com transições dentro da janela')
+    parser.add_argument('--capacidade', type=int, default=monitor_service.FLAP_HISTORY)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    eventos, agora = transicoes_sinteticas(args.logins, args.ativos, args.capacidade, 1)
+    print(f"logins={args.logins} ativos={args.ativos} capacidade={args.capacidade} transições={len(eventos)}")
+    print(f"{'formato':>8} {'MB':>8} {'µs/transição':>13} {'1º ranking (ms)':>16} {'ranking (ms)':>13}")
+    resultados = {}
+    for nome, construir in (
+        ('deques', lambda: HistoricoDeques(args.capacidade, 3600)),
+        ('array', lambda: monitor_service.HistoricoTransicoes(args.capacidade, 3600, 0)),
+    ):
+        resultados[nome] = medir(construir, eventos, agora, monitor_service.FLAP_TOP)
+        memoria, por_transicao, primeiro, seguinte, _ = resultados[nome]
+        print(f"{nome:>8} {memoria:>8.1f} {por_transicao:>13.2f} {primeiro:>16.1f} {seguinte:>13.1f}")
+    assert sorted(resultados['deques'][4]) == sorted(resultados['array'][4])
+
+
+if __name__ == '__main__':
+    main()
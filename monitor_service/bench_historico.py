@@ -0,0 +1,106 @@
+"""
+Benchmark das rotas /historico contra consultas diretas às tabelas de eventos.
+
+Gera um banco temporário com alguns anos de eventos resolvidos (passando por
+resolver_evento, que alimenta os agregados) e compara, para "histórico de uma
+conexão no último ano" e "MTTR por transmissor no mês", a consulta direta a
+events/event_logins com a rota que lê historico_*. Uso (dentro do container ou com /app/logs):
+
+    python bench_historico.py [--anos 3] [--eventos-dia 40] [--logins 20]
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+DIRETORIO = tempfile.mkdtemp(prefix='bench_historico_')
+os.environ['MONITOR_DB_PATH'] = os.path.join(DIRETORIO, 'monitor.db')
+
+import monitor_service  # noqa: E402
+
+
+def historico_direto(conexao, inicio, fim):
+    """O que se fazia antes, em SQL sobre os eventos: totais, logins e percentis de uma conexão."""
+    linhas = monitor_service.get_db().execute('''
+        SELECT e.resolvido_em - e.timestamp, e.motivo, (SELECT COUNT(*) FROM event_logins l WHERE l.event_id = e.id)
+        FROM events e
+        WHERE e.status = 'resolvido' AND e.timestamp BETWEEN ? AND ?
+          AND (e.conexao = ? OR e.id IN (SELECT event_id FROM event_conexoes WHERE conexao = ?))
+    ''', (inicio, fim, conexao, conexao)).fetchall()
+    duracoes = sorted(linha[0] for linha in linhas)
+    return len(linhas), sum(linha[2] for linha in linhas), statistics.median(duracoes) if duracoes else None
+
+
+def mttr_direto(inicio, fim):
+    return monitor_service.get_db().execute('''
+        SELECT transmissor, COUNT(*), AVG(resolvido_em - timestamp) FROM events
+        WHERE status = 'resolvido' AND timestamp BETWEEN ? AND ? GROUP BY transmissor
+    ''', (inicio, fim)).fetchall()
+
+
+def medir(funcao, repeticoes=20):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--anos', type=float, default=3)
+    parser.add_argument('--eventos-dia', type=int, default=40)
+    parser.add_argument('--logins', type=int, default=20, help='Logins por evento (média)')
+    parser.add_argument('--conexoes', type=int, default=200)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rnd = random.Random(1)
+    monitor_service.init_db()
+    agora = time.time()
+    dias = int(args.anos * 365)
+    inicio_carga = time.perf_counter()
+    with monitor_service.transacao():
+        for d in range(dias):
+            for n in range(args.eventos_dia):
+                inicio = agora - (dias - d) * 86400 + rnd.uniform(0, 86400)
+                c = rnd.randrange(args.conexoes)
+                evento = {
+                    'id': f'evento{d}_{n}', 'conexao': f'CONEXAO_{c}', 'timestamp': inicio, 'nivel': 'conexao',
+                    'transmissor': str(c % 6), 'motivo': rnd.choice(('energia', 'loss', 'indeterminado')),
+                    'conexoes': {f'CONEXAO_{c}'},
+                    'logins_offline': {f'cliente{c}_{i}' for i in range(rnd.randint(1, 2 * args.logins))},
+                }
+                monitor_service.save_event(evento, 'ativo')
+                monitor_service.resolver_evento(evento, resolvido_em=inicio + rnd.expovariate(1 / 1800))
+    carga = time.perf_counter() - inicio_carga
+    total_eventos = dias * args.eventos_dia
+    print(f"{total_eventos} eventos em {dias} dias ({carga:.0f}s para gerar, "
+          f"{carga / total_eventos * 1000:.2f} ms por evento incluindo os agregados)")
+
+    cliente = monitor_service.app.test_client()
+    hoje = time.strftime('%Y-%m-%d')
+    um_ano = time.strftime('%Y-%m-%d', time.localtime(agora - 365 * 86400))
+    um_mes = time.strftime('%Y-%m-%d', time.localtime(agora - 30 * 86400))
+
+    direto_conexao, (eventos_direto, logins_direto, _) = medir(lambda: historico_direto('CONEXAO_7', agora - 365 * 86400, agora))
+    rota_conexao, resposta = medir(lambda: cliente.get(f'/historico/conexao/CONEXAO_7?desde={um_ano}&ate={hoje}'))
+    direto_mttr, _ = medir(lambda: mttr_direto(agora - 30 * 86400, agora))
+    rota_mttr, resposta_mttr = medir(lambda: cliente.get(f'/historico/transmissor?ordem=mttr&desde={um_mes}&ate={hoje}'))
+    assert resposta_mttr.status_code == 200
+
+    print(f"{'consulta':>36} {'direta (ms)':>12} {'/historico (ms)':>16}")
+    print(f"{'conexão no último ano':>36} {direto_conexao:>12.2f} {rota_conexao:>16.2f}")
+    print(f"{'MTTR por transmissor no mês':>36} {direto_mttr:>12.2f} {rota_mttr:>16.2f}")
+    total = resposta.json['total']
+    # Os agregados contam pelo dia local de início: as bordas do período podem diferir em um dia
+    print(f"conferência (direta / agregados): eventos {eventos_direto} / {total['eventos']}, "
+          f"logins {logins_direto} / {total['logins']}")
+    shutil.rmtree(DIRETORIO, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
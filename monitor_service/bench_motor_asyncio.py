@@ -0,0 +1,149 @@
+"""
+Compara os motores do loop (MONITOR_ENGINE=threads e asyncio) numa queda simulada.
+
+Sobe IXCSoft, OLT e Alert Service falsos locais e roda `monitor_service.py --loop` num
+subprocesso para cada motor. O primeiro snapshot tem todos online; o segundo, --conexoes
+conexões inteiras offline (uma causa raiz por conexão). Mede, a partir do segundo
+snapshot, o tempo até o primeiro alerta, até o último diagnóstico da OLT e até o último
+alerta entregue. Uso (a partir do checkout, com /app/logs gravável):
+
+    python bench_motor_asyncio.py [--conexoes 50] [--latencia-olt 6] [--latencia-alerta 1]
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+
+
+class Cenario:
+    conexoes = 50
+    logins = 10
+    latencia_olt = 6.0
+    latencia_alerta = 1.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshots = 0
+        self.queda = None
+        self.diagnosticos = []
+        self.alertas = []
+
+    def snapshot(self):
+        with self.lock:
+            self.snapshots += 1
+            queda = self.snapshots >= 2
+            if queda and self.queda is None:
+                self.queda = time.perf_counter()
+        online, offline = [], []
+        for c in range(self.conexoes):
+            for i in range(self.logins):
+                cliente = {
+                    'id_cliente': str(c * 1000 + i), 'login': f'c{c}_{i}@provedor', 'conexao': f'CONEXAO_{c}',
+                    'id_transmissor': str(c), 'ultima_conexao_final': '2024-01-01 00:00:00',
+                }
+                (offline if queda else online).append(cliente)
+        return {'timestamp': time.time(), 'online': online, 'offline': offline}
+
+
+class Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # o motor asyncio abre dezenas de conexões de uma vez
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    cenario = None
+
+    def responder(self, dados):
+        corpo = json.dumps(dados).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        self.responder(self.cenario.snapshot())
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.path == '/consulta/olt/lote':
+            time.sleep(self.cenario.latencia_olt)
+            self.cenario.diagnosticos.append(time.perf_counter())
+            self.responder({'resultados': [
+                {'conexao': c['conexao'], 'motivo_final': 'energia'} for c in payload['consultas']
+            ]})
+        else:
+            time.sleep(self.cenario.latencia_alerta)
+            self.cenario.alertas.append(time.perf_counter())
+            self.responder({'message': 'ok'})
+
+    def log_message(self, *args):
+        pass
+
+
+def medir(motor, args):
+    cenario = Cenario()
+    cenario.conexoes, cenario.latencia_olt, cenario.latencia_alerta = args.conexoes, args.latencia_olt, args.latencia_alerta
+    FakeHandler.cenario = cenario
+    servidor = Servidor(('127.0.0.1', 0), FakeHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{servidor.server_port}'
+
+    env = dict(
+        os.environ,
+        MONITOR_ENGINE=motor,
+        MONITOR_DB_PATH=os.path.join(tempfile.mkdtemp(), 'bench.db'),
+        IXCSOFT_SERVICE_URL=url, OLT_SERVICE_URL=url, ALERT_SERVICE_URL=url,
+        CHECK_INTERVAL='1', THRESHOLD_OFFLINE_CLIENTS='5', TOPOLOGY_MIN_CONEXOES='0',
+    )
+    processo = subprocess.Popen([sys.executable, 'monitor_service.py', '--loop'], cwd=AQUI, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    esperados = 4 * args.conexoes  # queda e diagnóstico, no Telegram e no WhatsApp
+    limite = time.perf_counter() + args.limite
+    while len(cenario.alertas) < esperados and time.perf_counter() < limite:
+        time.sleep(0.1)
+    processo.send_signal(signal.SIGTERM)
+    processo.wait()
+    servidor.shutdown()
+
+    if cenario.queda is None or not cenario.alertas:
+        return None
+    return (
+        cenario.alertas[0] - cenario.queda,
+        max(cenario.diagnosticos) - cenario.queda if cenario.diagnosticos else float('nan'),
+        cenario.alertas[-1] - cenario.queda,
+        len(cenario.alertas),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--conexoes', type=int, default=50)
+    parser.add_argument('--latencia-olt', type=float, default=6.0, help='Duração de uma consulta à OLT (s)')
+    parser.add_argument('--latencia-alerta', type=float, default=1.0, help='Duração de um envio de alerta (s)')
+    parser.add_argument('--limite', type=float, default=600, help='Tempo máximo por motor (s)')
+    parser.add_argument('--motores', nargs='+', default=['threads', 'asyncio'])
+    args = parser.parse_args()
+
+    print(f"conexões={args.conexoes} OLT={args.latencia_olt}s/consulta alerta={args.latencia_alerta}s/envio")
+    print(f"{'motor':>8} {'1º alerta (s)':>14} {'diagnósticos (s)':>17} {'último alerta (s)':>18} {'alertas':>8}")
+    for motor in args.motores:
+        resultado = medir(motor, args)
+        if resultado is None:
+            print(f"{motor:>8} sem alertas")
+            continue
+        primeiro, diagnosticos, ultimo, alertas = resultado
+        print(f"{motor:>8} {primeiro:>14.1f} {diagnosticos:>17.1f} {ultimo:>18.1f} {alertas:>8}")
+
+
+if __name__ == '__main__':
+    main()
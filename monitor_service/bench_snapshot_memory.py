@@ -0,0 +1,99 @@
+"""
+Benchmark de memória do snapshot de clientes do monitor com dados sintéticos.
+
+Compara a representação antiga (dict login -> dict do cliente, mais um set de
+logins) com SnapshotClientes: memória alocada por ciclo, tempo da diferença de
+conjuntos entre dois ciclos e pausa de gc.collect() com dois snapshots vivos.
+Uso (dentro do container ou com /app/logs):
+
+    python bench_snapshot_memory.py [--logins 60000 100000]
+"""
+import argparse
+import gc
+import logging
+import random
+import time
+import tracemalloc
+
+import monitor_service
+
+
+def clientes_sinteticos(quantidade, fracao_offline, semente):
+    rnd = random.Random(semente)
+    clientes = []
+    for i in range(quantidade):
+        clientes.append({
+            'id_cliente': str(100000 + i),
+            'login': f'cliente{i}@provedor',
+            'conexao': f'OLT{i % 12}-PON{i % 64}',
+            'ultima_conexao_final': f'2024-05-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00',
+            'id_transmissor': str(1 + i % 6),
+            'latitude': f'-3.{rnd.randrange(10**6)}',
+            'longitude': f'-60.{rnd.randrange(10**6)}',
+            'online': 'N' if rnd.random() < fracao_offline else 'S',
+        })
+    return clientes
+
+
+def snapshot_dicts(clientes):
+    online, offline = {}, {}
+    for cliente in clientes:
+        info = {k: v for k, v in cliente.items() if k != 'online'}
+        (online if cliente['online'] == 'S' else offline)[cliente['login']] = info
+    return offline, set(offline), online, set(online)
+
+
+def snapshot_compacto(clientes):
+    snapshot = monitor_service.SnapshotClientes()
+    for cliente in clientes:
+        snapshot.adicionar_cliente(cliente, online=cliente['online'] == 'S')
+    return snapshot
+
+
+def medir(construir, quantidade, conjunto_offline):
+    """
+    Constrói dois ciclos consecutivos e mede a memória alocada pelo segundo (custo
+    recorrente por ciclo), a diferença de conjuntos e a pausa de GC com ambos vivos.
+    """
+    anterior = construir(clientes_sinteticos(quantidade, 0.10, 1))
+    clientes = clientes_sinteticos(quantidade, 0.12, 2)
+    gc.collect()
+    tracemalloc.start()
+    atual = construir(clientes)
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del clientes
+
+    inicio = time.perf_counter()
+    offline_anterior, offline_atual = conjunto_offline(anterior), conjunto_offline(atual)
+    novos = offline_atual - offline_anterior
+    reconectados = offline_anterior - offline_atual
+    diferenca = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    gc.collect()
+    pausa_gc = time.perf_counter() - inicio
+    return memoria / 1024 / 1024, diferenca * 1000, pausa_gc * 1000, len(novos), len(reconectados)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, nargs='+', default=[60000, 100000])
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{'logins':>8} {'formato':>9} {'MB/ciclo':>12} {'diferença (ms)':>15} {'gc (ms)':>8}")
+    for quantidade in args.logins:
+        resultados = {}
+        for nome, construir, conjunto in (
+            ('dicts', snapshot_dicts, lambda s: s[1]),
+            ('compacto', snapshot_compacto, lambda s: s.offline),
+        ):
+            resultados[nome] = medir(construir, quantidade, conjunto)
+            memoria, diferenca, pausa_gc, _, _ = resultados[nome]
+            print(f"{quantidade:>8} {nome:>9} {memoria:>12.1f} {diferenca:>15.2f} {pausa_gc:>8.1f}")
+        assert resultados['dicts'][3:] == resultados['compacto'][3:]
+
+
+if __name__ == '__main__':
+    main()
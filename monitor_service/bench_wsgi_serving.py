@@ -0,0 +1,131 @@
+"""
+Teste de carga de GET /eventos/ativos: servidor de desenvolvimento do Flask
+(como o serviço rodava antes, com debug=True) contra o gunicorn com gunicorn.conf.py.
+
+Cria um banco temporário com N eventos ativos, sobe cada servidor num subprocesso
+e dispara requisições com C clientes concorrentes durante alguns segundos.
+Uso (a partir do checkout, com /app/logs):
+
+    python bench_wsgi_serving.py [--eventos 200] [--logins 50] [--clientes 8] [--duracao 10]
+"""
+import argparse
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DIRETORIO = tempfile.mkdtemp(prefix='bench_wsgi_')
+os.environ['MONITOR_DB_PATH'] = os.path.join(DIRETORIO, 'monitor.db')
+
+import requests  # noqa: E402
+
+import monitor_service  # noqa: E402
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def aguardar_porta(porta, processo):
+    for _ in range(200):
+        if processo.poll() is not None:
+            raise RuntimeError(f"Servidor encerrou com código {processo.returncode}.")
+        try:
+            socket.create_connection(('127.0.0.1', porta), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Servidor não respondeu na porta {porta}.")
+
+
+def carga(url, clientes, duracao):
+    """C clientes (uma sessão HTTP cada) em laço fechado; retorna req/s, latências (ms) e erros."""
+    latencias, erros = [], [0]
+    lock = threading.Lock()
+    fim = time.perf_counter() + duracao
+
+    def cliente():
+        sessao = requests.Session()
+        locais = []
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            try:
+                sessao.get(url, timeout=30).raise_for_status()
+                locais.append((time.perf_counter() - inicio) * 1000)
+            except requests.exceptions.RequestException:
+                with lock:
+                    erros[0] += 1
+        with lock:
+            latencias.extend(locais)
+
+    threads = [threading.Thread(target=cliente) for _ in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencias.sort()
+    percentil = lambda p: latencias[min(len(latencias) - 1, int(len(latencias) * p))] if latencias else 0.0
+    return len(latencias) / duracao, percentil(0.5), percentil(0.95), percentil(0.99), erros[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--eventos', type=int, default=200)
+    parser.add_argument('--logins', type=int, default=50, help='Logins por evento')
+    parser.add_argument('--clientes', type=int, default=8)
+    parser.add_argument('--duracao', type=float, default=10)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    monitor_service.init_db()
+    with monitor_service.transacao():
+        for e in range(args.eventos):
+            logins = [f'cliente{e}_{i}@provedor' for i in range(args.logins)]
+            monitor_service.save_event({
+                'id': f'evento{e}', 'conexao': f'CONEXAO_{e}', 'timestamp': time.time() - e,
+                'conexoes': [f'CONEXAO_{e}'], 'logins_offline': logins,
+            }, 'ativo')
+
+    servidores = {
+        'flask dev (debug)': lambda porta: [
+            sys.executable, '-c',
+            f"import monitor_service as m; m.app.run(host='127.0.0.1', port={porta}, debug=True, use_reloader=False)"
+        ],
+        'gunicorn': lambda porta: [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{porta}',
+            '--log-level', 'warning', 'monitor_service:app'
+        ],
+    }
+    print(f"eventos ativos={args.eventos} logins/evento={args.logins} clientes={args.clientes} "
+          f"duração={args.duracao}s CPUs={os.cpu_count()}")
+    print(f"{'servidor':>18} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'erros':>6}")
+    try:
+        for nome, comando in servidores.items():
+            porta = porta_livre()
+            processo = subprocess.Popen(comando(porta), cwd=AQUI, env=os.environ.copy(),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                aguardar_porta(porta, processo)
+                url = f'http://127.0.0.1:{porta}/eventos/ativos'
+                total = len(requests.get(url).json()['eventos_ativos'])
+                assert total == args.eventos, total
+                rps, p50, p95, p99, erros = carga(url, args.clientes, args.duracao)
+                print(f"{nome:>18} {rps:>8.1f} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {erros:>6}")
+            finally:
+                processo.terminate()
+                processo.wait()
+    finally:
+        shutil.rmtree(DIRETORIO, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+# Configuração do gunicorn para a API do monitor (produção):
+#   gunicorn -c gunicorn.conf.py monitor_service:app
+# A API só lê o SQLite e grava a caixa de entrada do RADIUS, então aceita vários
+# workers. O loop de monitoramento NÃO roda aqui: ele é um processo à parte
+# (python monitor_service.py --loop), executado uma única vez.
+import os
+
+bind = "0.0.0.0:5010"
+worker_class = "gthread"
+workers = int(os.getenv("MONITOR_WEB_WORKERS", "2"))
+threads = int(os.getenv("MONITOR_WEB_THREADS", "4"))
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+
+def post_worker_init(worker):
+    # Cria/migra o esquema caso a API suba antes do loop (init_db é idempotente)
+    import monitor_service
+    monitor_service.init_db()
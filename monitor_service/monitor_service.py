@@ -1,12 +1,25 @@
 import logging
 import time
+import asyncio
 import json
 import uuid
 import requests
 from dotenv import load_dotenv
 import os
+import sys
 import threading
+import resource
+import random
 import sqlite3
+import signal
+import math
+import zlib
+from array import array
+from collections import Counter, deque
+from itertools import zip_longest
+from operator import itemgetter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify
 
 load_dotenv()
@@ -24,268 +37,1940 @@ logging.basicConfig(
 
 import sqlite3  # já está importado
 
+# --------------------------------------------------
+# Armazenamento (SQLite)
+# --------------------------------------------------
+
+DB_PATH = os.getenv('MONITOR_DB_PATH', 'monitor_events.db')
+
+# Uma conexão por thread, reaproveitada entre chamadas; a profundidade controla
+# transações aninhadas (só a mais externa confirma).
+_db_local = threading.local()
+
+def get_db():
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        # WAL: leitores (API Flask) não bloqueiam o escritor (monitor) e vice-versa
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _db_local.conn = conn
+        _db_local.profundidade = 0
+    return conn
+
+@contextmanager
+def transacao():
+    """
+    Agrupa as escritas feitas dentro do bloco numa única transação. Pode ser aninhada:
+    save_event e afins abrem a sua, mas dentro de um ciclo do monitor só a transação
+    do ciclo confirma (commit) ou desfaz (rollback).
+    """
+    conn = get_db()
+    profundidade = _db_local.profundidade
+    _db_local.profundidade = profundidade + 1
+    try:
+        yield conn
+        if profundidade == 0:
+            conn.commit()
+    except BaseException:
+        if profundidade == 0:
+            conn.rollback()
+        raise
+    finally:
+        _db_local.profundidade = profundidade
+
+# Versão do esquema, guardada em PRAGMA user_version
+#   0: events.logins com a lista JSON de logins
+#   1: logins normalizados em event_logins, com índices
+#   2: events.nivel e event_conexoes (eventos agregados por transmissor)
+#   3: events.transmissor e versao_eventos (cache de /eventos/ativos)
+#   4: events.motivo, events.resolvido_em e as tabelas historico_* (agregados diários)
+SCHEMA_VERSION = 4
+
+# Limites superiores (s) dos baldes de duração de historico_duracao; o último é aberto
+BALDES_DURACAO = (60, 300, 600, 900, 1800, 3600, 7200, 14400, 28800, 86400)
+
 def init_db():
-    conn = sqlite3.connect("monitor_events.db")
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS events (
-            id TEXT PRIMARY KEY,
-            conexao TEXT,
-            timestamp REAL,
-            status TEXT,
-            logins TEXT
+    with transacao() as conn:
+        # O loop e os workers da API podem subir juntos: BEGIN IMMEDIATE serializa a criação e as migrações
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id TEXT PRIMARY KEY,
+                conexao TEXT,
+                timestamp REAL,
+                status TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS event_logins (
+                event_id TEXT NOT NULL REFERENCES events(id),
+                login TEXT NOT NULL,
+                offline_at REAL,
+                online_at REAL,
+                PRIMARY KEY (event_id, login)
+            ) WITHOUT ROWID
+        ''')
+        # Conexões de cada evento; um evento de nível 'transmissor' agrega várias
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS event_conexoes (
+                event_id TEXT NOT NULL REFERENCES events(id),
+                conexao TEXT NOT NULL,
+                PRIMARY KEY (event_id, conexao)
+            ) WITHOUT ROWID
+        ''')
+        # Fila de saída dos alertas (Telegram/WhatsApp), consumida pelos workers de despacho
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS alertas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                canal TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                event_id TEXT,
+                chave TEXT UNIQUE,
+                status TEXT NOT NULL DEFAULT 'pendente',
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                proxima_tentativa REAL NOT NULL,
+                criado_em REAL NOT NULL,
+                erro TEXT
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_alertas_status ON alertas (status, proxima_tentativa)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_alertas_event ON alertas (event_id, id)")
+        # Caixa de entrada dos eventos do radius_service, consumida pelo loop do monitor
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS radius_eventos (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                login TEXT NOT NULL,
+                online INTEGER NOT NULL,
+                timestamp REAL
+            )
+        ''')
+        # Logins mais instáveis, regravados pelo loop; lidos por /logins/flapping
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS logins_instaveis (
+                login TEXT PRIMARY KEY,
+                conexao TEXT,
+                quedas INTEGER NOT NULL,
+                transicoes INTEGER NOT NULL,
+                ultima_transicao REAL NOT NULL,
+                atualizado_em REAL NOT NULL
+            )
+        ''')
+        # Incrementada a cada alteração de eventos; a API a usa para invalidar o seu cache
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS versao_eventos (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                versao INTEGER NOT NULL
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO versao_eventos (id, versao) VALUES (0, 0)")
+        # Agregados por dia (data local do início do evento) e por conexão / transmissor,
+        # acumulados quando o evento é resolvido; as rotas /historico leem só daqui
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS historico_dia (
+                dimensao TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                dia TEXT NOT NULL,
+                eventos INTEGER NOT NULL,
+                logins INTEGER NOT NULL,
+                duracao_total REAL NOT NULL,
+                duracao_max REAL NOT NULL,
+                PRIMARY KEY (dimensao, chave, dia)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_historico_dia_dia ON historico_dia (dimensao, dia)")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS historico_duracao (
+                dimensao TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                dia TEXT NOT NULL,
+                balde INTEGER NOT NULL,
+                quantidade INTEGER NOT NULL,
+                PRIMARY KEY (dimensao, chave, dia, balde)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS historico_motivo (
+                dimensao TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                dia TEXT NOT NULL,
+                motivo TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                PRIMARY KEY (dimensao, chave, dia, motivo)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_status_conexao ON events (status, conexao)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_event_logins_login ON event_logins (login)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_event_conexoes_conexao ON event_conexoes (conexao)")
+        migrar_db(conn)
+
+def migrar_db(conn):
+    """
+    Aplica as migrações pendentes segundo PRAGMA user_version.
+
+    1: events.logins (JSON) passa para event_logins. Os logins de cada evento recebem
+       offline_at = timestamp do evento; online_at fica nulo, pois o momento da
+       reconexão não era registrado.
+    2: events.nivel ('conexao' para os eventos existentes).
+    3: events.transmissor (id_transmissor do IXCSoft); nos eventos de transmissor
+       existentes vem do rótulo "Transmissor X", nos de conexão fica nulo.
+    4: events.motivo e events.resolvido_em. Os eventos já resolvidos entram no
+       histórico com contagem e logins, mas sem duração e com motivo 'desconhecido'.
+    """
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    if versao >= SCHEMA_VERSION:
+        return
+    colunas = [row[1] for row in conn.execute("PRAGMA table_info(events)")]
+    if versao < 1 and 'logins' in colunas:
+        logging.info("Migrando eventos para o esquema normalizado (event_logins).")
+        # O índice por login é recriado depois da carga, que fica bem mais rápida sem ele
+        conn.execute("DROP INDEX IF EXISTS idx_event_logins_login")
+        total = conn.execute('''
+            INSERT OR IGNORE INTO event_logins (event_id, login, offline_at)
+            SELECT e.id, j.value, e.timestamp FROM events e, json_each(COALESCE(e.logins, '[]')) j
+        ''').rowcount
+        conn.execute("CREATE INDEX idx_event_logins_login ON event_logins (login)")
+        conn.execute("ALTER TABLE events DROP COLUMN logins")
+        logging.info(f"Migração concluída: {total} logins movidos para event_logins.")
+    if versao < 2 and 'nivel' not in colunas:
+        conn.execute("ALTER TABLE events ADD COLUMN nivel TEXT NOT NULL DEFAULT 'conexao'")
+    if versao < 3 and 'transmissor' not in colunas:
+        conn.execute("ALTER TABLE events ADD COLUMN transmissor TEXT")
+        conn.execute('''
+            UPDATE events SET transmissor = substr(conexao, length('Transmissor ') + 1)
+            WHERE nivel = 'transmissor' AND conexao LIKE 'Transmissor %'
+        ''')
+    if versao < 4 and 'motivo' not in colunas:
+        conn.execute("ALTER TABLE events ADD COLUMN motivo TEXT")
+        conn.execute("ALTER TABLE events ADD COLUMN resolvido_em REAL")
+        for dimensao, coluna in (('conexao', 'e.conexao'), ('transmissor', 'e.transmissor')):
+            filtro = "e.nivel = 'conexao'" if dimensao == 'conexao' else "e.transmissor IS NOT NULL"
+            conn.execute(f'''
+                INSERT INTO historico_dia (dimensao, chave, dia, eventos, logins, duracao_total, duracao_max)
+                SELECT ?, {coluna}, date(e.timestamp, 'unixepoch', 'localtime'), COUNT(*),
+                       SUM((SELECT COUNT(*) FROM event_logins l WHERE l.event_id = e.id)), 0, 0
+                FROM events e WHERE e.status = 'resolvido' AND {filtro}
+                GROUP BY 2, 3
+            ''', (dimensao,))
+            conn.execute(f'''
+                INSERT INTO historico_motivo (dimensao, chave, dia, motivo, quantidade)
+                SELECT ?, {coluna}, date(e.timestamp, 'unixepoch', 'localtime'), 'desconhecido', COUNT(*)
+                FROM events e WHERE e.status = 'resolvido' AND {filtro}
+                GROUP BY 2, 3
+            ''', (dimensao,))
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def registrar_alteracao_eventos(conn):
+    conn.execute("UPDATE versao_eventos SET versao = versao + 1 WHERE id = 0")
+
+def versao_eventos():
+    return get_db().execute("SELECT versao FROM versao_eventos WHERE id = 0").fetchone()[0]
+
+def save_event(event, status, novos_logins=None):
+    """
+    Grava o evento e os logins em `novos_logins` (por padrão, todos os de
+    logins_offline). Um login que já pertencia ao evento e voltou a cair tem o
+    online_at zerado; os demais logins do evento não são regravados. O motivo só é
+    gravado na criação: depois, quem o altera é o diagnóstico (aplicar_diagnostico).
+    """
+    agora = time.time()
+    with transacao() as conn:
+        conn.execute('''
+            INSERT INTO events (id, conexao, timestamp, status, nivel, transmissor, motivo) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET conexao = excluded.conexao, status = excluded.status,
+                nivel = excluded.nivel, transmissor = excluded.transmissor
+        ''', (
+            event['id'],
+            event.get('conexao', 'Desconhecida'),
+            event.get('timestamp', agora),
+            status,
+            event.get('nivel', 'conexao'),
+            event.get('transmissor'),
+            event.get('motivo')
+        ))
+        if event.get('conexoes'):
+            conn.executemany(
+                "INSERT OR IGNORE INTO event_conexoes (event_id, conexao) VALUES (?, ?)",
+                [(event['id'], conexao) for conexao in event['conexoes']]
+            )
+        logins = event.get('logins_offline', []) if novos_logins is None else novos_logins
+        conn.executemany('''
+            INSERT INTO event_logins (event_id, login, offline_at) VALUES (?, ?, ?)
+            ON CONFLICT(event_id, login) DO UPDATE SET online_at = NULL
+        ''', [(event['id'], login, agora) for login in logins])
+        registrar_alteracao_eventos(conn)
+
+def registrar_reconexoes(reconexoes, online_at=None):
+    """Marca como online os pares (event_id, login) em `reconexoes` num único executemany."""
+    online_at = online_at or time.time()
+    with transacao() as conn:
+        conn.executemany(
+            "UPDATE event_logins SET online_at = ? WHERE event_id = ? AND login = ?",
+            [(online_at, event_id, login) for event_id, login in reconexoes]
         )
-    ''')
-    conn.commit()
-    conn.close()
-
-def save_event(event, status):
-    conn = sqlite3.connect("monitor_events.db")
-    c = conn.cursor()
-    c.execute('''
-        INSERT OR REPLACE INTO events (id, conexao, timestamp, status, logins)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (
-        event['id'],
-        event.get('conexao', 'Desconhecida'),
-        event.get('timestamp', time.time()),
-        status,
-        json.dumps(list(event.get('logins_offline', [])))
-    ))
-    conn.commit()
-    conn.close()
-
-def update_event_status(event_id, new_status):
-    conn = sqlite3.connect("monitor_events.db")
-    c = conn.cursor()
-    c.execute('''
-        UPDATE events SET status = ? WHERE id = ?
-    ''', (new_status, event_id))
-    conn.commit()
-    conn.close()
-
-def existe_evento_ativo_para_conexao(conexao):
-    conn = sqlite3.connect("monitor_events.db")
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM events WHERE conexao = ? AND status = 'ativo'", (conexao,))
-    count = c.fetchone()[0]
-    conn.close()
-    return count > 0
+        registrar_alteracao_eventos(conn)
+
+def resolver_evento(event, logins_por_conexao=None, resolvido_em=None):
+    """
+    Marca o evento como resolvido e o acumula no histórico do dia em que começou,
+    para cada conexão e para o transmissor. `logins_por_conexao` (conexão -> logins)
+    reparte os logins de um evento de transmissor entre as suas conexões.
+    """
+    resolvido_em = resolvido_em or time.time()
+    duracao = max(0.0, resolvido_em - event['timestamp'])
+    dia = dia_historico(event)
+    total_logins = len(event['logins_offline'])
+    chaves = chaves_historico(event)
+    por_conexao = sum(dimensao == 'conexao' for dimensao, _ in chaves) > 1
+    linhas = [
+        (dimensao, chave, (logins_por_conexao or {}).get(chave, 0) if dimensao == 'conexao' and por_conexao else total_logins)
+        for dimensao, chave in chaves
+    ]
+    balde = next((i for i, limite in enumerate(BALDES_DURACAO) if duracao <= limite), len(BALDES_DURACAO))
+
+    with transacao() as conn:
+        conn.execute("UPDATE events SET status = 'resolvido', resolvido_em = ? WHERE id = ?", (resolvido_em, event['id']))
+        # Lido com o banco já travado para escrita: um diagnóstico concluído agora
+        # (aplicar_diagnostico) espera este commit e corrige o histórico
+        motivo = event.get('motivo') or 'indeterminado'
+        conn.executemany('''
+            INSERT INTO historico_dia (dimensao, chave, dia, eventos, logins, duracao_total, duracao_max)
+            VALUES (?, ?, ?, 1, ?, ?, ?)
+            ON CONFLICT(dimensao, chave, dia) DO UPDATE SET
+                eventos = eventos + 1, logins = logins + excluded.logins,
+                duracao_total = duracao_total + excluded.duracao_total,
+                duracao_max = max(duracao_max, excluded.duracao_max)
+        ''', [(dimensao, chave, dia, logins, duracao, duracao) for dimensao, chave, logins in linhas])
+        conn.executemany('''
+            INSERT INTO historico_duracao (dimensao, chave, dia, balde, quantidade) VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT(dimensao, chave, dia, balde) DO UPDATE SET quantidade = quantidade + 1
+        ''', [(dimensao, chave, dia, balde) for dimensao, chave, _ in linhas])
+        conn.executemany('''
+            INSERT INTO historico_motivo (dimensao, chave, dia, motivo, quantidade) VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT(dimensao, chave, dia, motivo) DO UPDATE SET quantidade = quantidade + 1
+        ''', [(dimensao, chave, dia, motivo) for dimensao, chave, _ in linhas])
+        registrar_alteracao_eventos(conn)
+
+def dia_historico(event):
+    """Dia (data local de início) em que o evento é acumulado no histórico."""
+    return time.strftime('%Y-%m-%d', time.localtime(event['timestamp']))
+
+def chaves_historico(event):
+    """(dimensão, chave) do histórico em que o evento entra: cada conexão e o transmissor."""
+    chaves = [('conexao', conexao) for conexao in (event.get('conexoes') or {event['conexao']})]
+    if event.get('transmissor'):
+        chaves.append(('transmissor', event['transmissor']))
+    return chaves
+
+def corrigir_motivo_historico(conn, event, anterior, motivo):
+    """Move o evento já resolvido de `anterior` para `motivo` em historico_motivo."""
+    dia = dia_historico(event)
+    linhas = [(dimensao, chave, dia) for dimensao, chave in chaves_historico(event)]
+    conn.executemany('''
+        UPDATE historico_motivo SET quantidade = quantidade - 1
+        WHERE dimensao = ? AND chave = ? AND dia = ? AND motivo = ?
+    ''', [linha + (anterior,) for linha in linhas])
+    conn.executemany('''
+        DELETE FROM historico_motivo WHERE dimensao = ? AND chave = ? AND dia = ? AND motivo = ? AND quantidade <= 0
+    ''', [linha + (anterior,) for linha in linhas])
+    conn.executemany('''
+        INSERT INTO historico_motivo (dimensao, chave, dia, motivo, quantidade) VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(dimensao, chave, dia, motivo) DO UPDATE SET quantidade = quantidade + 1
+    ''', [linha + (motivo,) for linha in linhas])
 
 def carregar_eventos_ativos():
-    conn = sqlite3.connect("monitor_events.db")
-    c = conn.cursor()
-    c.execute("SELECT id, conexao, timestamp, status, logins FROM events WHERE status = 'ativo'")
-    eventos = []
-    for row in c.fetchall():
-        eventos.append({
+    """
+    Eventos ativos com as suas conexões e logins. As três consultas são feitas numa
+    única transação de leitura: com o loop gravando em paralelo, consultas separadas
+    poderiam ver conexões e logins de um evento criado depois da primeira.
+    """
+    conn = get_db()
+    propria = not conn.in_transaction
+    if propria:
+        conn.execute("BEGIN")
+    try:
+        return _ler_eventos_ativos(conn)
+    finally:
+        if propria:
+            conn.commit()
+
+def _ler_eventos_ativos(conn):
+    eventos = {}
+    c = conn.execute("SELECT id, conexao, timestamp, status, nivel, transmissor, motivo FROM events WHERE status = 'ativo'")
+    for row in c:
+        eventos[row[0]] = {
             "id": row[0],
             "conexao": row[1],
             "timestamp": row[2],
             "status": row[3],
-            "logins_offline": set(json.loads(row[4])),
-            "logins_restantes": set(json.loads(row[4]))
-        })
-    conn.close()
-    return eventos
+            "nivel": row[4],
+            "transmissor": row[5],
+            "motivo": row[6],
+            "conexoes": set(),
+            "logins_offline": set(),
+            "logins_restantes": set()
+        }
+    c = conn.execute('''
+        SELECT c.event_id, c.conexao FROM event_conexoes c
+        JOIN events e ON e.id = c.event_id WHERE e.status = 'ativo'
+    ''')
+    for event_id, conexao in c:
+        eventos[event_id]["conexoes"].add(conexao)
+    for evento in eventos.values():
+        if not evento["conexoes"]:
+            evento["conexoes"].add(evento["conexao"])  # eventos anteriores à versão 2 do esquema
+    c = conn.execute('''
+        SELECT l.event_id, l.login, l.online_at FROM event_logins l
+        JOIN events e ON e.id = l.event_id WHERE e.status = 'ativo'
+    ''')
+    for event_id, login, online_at in c:
+        eventos[event_id]["logins_offline"].add(login)
+        if online_at is None:
+            eventos[event_id]["logins_restantes"].add(login)
+    return list(eventos.values())
+
+def eventos_do_login(login):
+    c = get_db().execute('''
+        SELECT e.id, e.conexao, e.timestamp, e.status, l.offline_at, l.online_at
+        FROM event_logins l JOIN events e ON e.id = l.event_id
+        WHERE l.login = ? ORDER BY e.timestamp DESC
+    ''', (login,))
+    return [
+        {"id": row[0], "conexao": row[1], "timestamp": row[2], "status": row[3],
+         "offline_at": row[4], "online_at": row[5]}
+        for row in c
+    ]
+
+def percentil_baldes(baldes, fracao):
+    """Percentil aproximado pelo limite superior do balde ({balde: quantidade}); None no último balde (aberto)."""
+    total = sum(baldes.values())
+    if not total:
+        return None
+    acumulado = 0
+    for balde in sorted(baldes):
+        acumulado += baldes[balde]
+        if acumulado >= fracao * total:
+            return BALDES_DURACAO[balde] if balde < len(BALDES_DURACAO) else None
+
+def resumo_historico(eventos, logins, duracao_total, duracao_max, baldes, motivos):
+    com_duracao = sum(baldes.values())
+    return {
+        "eventos": eventos,
+        "logins": logins,
+        "mttr": duracao_total / com_duracao if com_duracao else None,
+        "duracao_max": duracao_max if com_duracao else None,
+        "duracao_p50": percentil_baldes(baldes, 0.5),
+        "duracao_p90": percentil_baldes(baldes, 0.9),
+        "motivos": motivos,
+    }
+
+def historico_da_chave(dimensao, chave, desde, ate):
+    """Totais e série diária de uma conexão / transmissor entre os dias `desde` e `ate` (YYYY-MM-DD)."""
+    db = get_db()
+    parametros = (dimensao, chave, desde, ate)
+    dias = db.execute('''
+        SELECT dia, eventos, logins, duracao_total, duracao_max FROM historico_dia
+        WHERE dimensao = ? AND chave = ? AND dia BETWEEN ? AND ? ORDER BY dia
+    ''', parametros).fetchall()
+    baldes = dict(db.execute('''
+        SELECT balde, SUM(quantidade) FROM historico_duracao
+        WHERE dimensao = ? AND chave = ? AND dia BETWEEN ? AND ? GROUP BY balde
+    ''', parametros).fetchall())
+    motivos = dict(db.execute('''
+        SELECT motivo, SUM(quantidade) FROM historico_motivo
+        WHERE dimensao = ? AND chave = ? AND dia BETWEEN ? AND ? GROUP BY motivo
+    ''', parametros).fetchall())
+    total = resumo_historico(
+        sum(d[1] for d in dias), sum(d[2] for d in dias), sum(d[3] for d in dias),
+        max((d[4] for d in dias), default=0), baldes, motivos
+    )
+    return total, [
+        {"dia": dia, "eventos": eventos, "logins": logins, "duracao_max": duracao_max}
+        for dia, eventos, logins, _, duracao_max in dias
+    ]
+
+def ranking_historico(dimensao, desde, ate):
+    """Totais de cada conexão / transmissor com eventos entre `desde` e `ate`."""
+    db = get_db()
+    parametros = (dimensao, desde, ate)
+    chaves = {}
+    for chave, eventos, logins, duracao_total, duracao_max in db.execute('''
+        SELECT chave, SUM(eventos), SUM(logins), SUM(duracao_total), MAX(duracao_max) FROM historico_dia
+        WHERE dimensao = ? AND dia BETWEEN ? AND ? GROUP BY chave
+    ''', parametros):
+        chaves[chave] = [eventos, logins, duracao_total, duracao_max, {}, {}]
+    for chave, balde, quantidade in db.execute('''
+        SELECT chave, balde, SUM(quantidade) FROM historico_duracao
+        WHERE dimensao = ? AND dia BETWEEN ? AND ? GROUP BY chave, balde
+    ''', parametros):
+        chaves[chave][4][balde] = quantidade
+    for chave, motivo, quantidade in db.execute('''
+        SELECT chave, motivo, SUM(quantidade) FROM historico_motivo
+        WHERE dimensao = ? AND dia BETWEEN ? AND ? GROUP BY chave, motivo
+    ''', parametros):
+        chaves[chave][5][motivo] = quantidade
+    return [{"chave": chave, **resumo_historico(*valores)} for chave, valores in chaves.items()]
+
+def salvar_logins_instaveis(logins):
+    """Substitui o ranking de logins instáveis: tuplas (login, conexao, quedas, transicoes, ultima_transicao)."""
+    agora = time.time()
+    with transacao() as conn:
+        conn.execute("DELETE FROM logins_instaveis")
+        conn.executemany(
+            "INSERT INTO logins_instaveis (login, conexao, quedas, transicoes, ultima_transicao, atualizado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [linha + (agora,) for linha in logins]
+        )
+
+def carregar_logins_instaveis(limite, conexao=None):
+    c = get_db().execute('''
+        SELECT login, conexao, quedas, transicoes, ultima_transicao, atualizado_em FROM logins_instaveis
+        WHERE ? IS NULL OR conexao = ?
+        ORDER BY quedas DESC, transicoes DESC, ultima_transicao DESC LIMIT ?
+    ''', (conexao, conexao, limite))
+    return [
+        {"login": row[0], "conexao": row[1], "quedas": row[2], "transicoes": row[3],
+         "ultima_transicao": row[4], "atualizado_em": row[5]}
+        for row in c
+    ]
+
+def enfileirar_eventos_radius(eventos):
+    """Grava na caixa de entrada os eventos (login, online, timestamp) recebidos do radius_service."""
+    with transacao() as conn:
+        conn.executemany("INSERT INTO radius_eventos (login, online, timestamp) VALUES (?, ?, ?)", eventos)
+
+def consumir_eventos_radius():
+    """Retira da caixa de entrada todos os eventos pendentes, na ordem de chegada."""
+    with transacao() as conn:
+        linhas = conn.execute("DELETE FROM radius_eventos RETURNING seq, login, online, timestamp").fetchall()
+    linhas.sort()
+    return [(login, bool(online), timestamp) for _, login, online, timestamp in linhas]
+
+def enfileirar_alerta(canal, payload, event_id=None, chave=None):
+    """
+    Grava um alerta na fila de saída. Um alerta com a mesma `chave` (ex.: "<evento>:offline")
+    já enfileirado é ignorado. Dentro de um ciclo, entra na transação do ciclo: o alerta
+    só é confirmado junto com o evento que o gerou.
+    """
+    agora = time.time()
+    with transacao() as conn:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO alertas (canal, payload, event_id, chave, proxima_tentativa, criado_em)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (canal, json.dumps(payload), event_id, f"{chave}:{canal}" if chave else None, agora, agora))
+    if cursor.rowcount == 0:
+        logging.info(f"Alerta {canal} duplicado ignorado ({chave}).")
+    elif _db_local.profundidade == 0:
+        alertas_disponiveis.set()  # fora de um ciclo, já confirmado; no ciclo, acorda ao final
+    return cursor.rowcount > 0
+
+def reservar_alerta(agora):
+    """
+    Marca como 'enviando' e retorna o próximo alerta pronto, ou None. Um alerta só sai
+    depois dos anteriores do mesmo evento, para a normalização não chegar antes da queda.
+    """
+    with transacao() as conn:
+        return conn.execute('''
+            UPDATE alertas SET status = 'enviando'
+            WHERE id = (
+                SELECT a.id FROM alertas a
+                WHERE a.status = 'pendente' AND a.proxima_tentativa <= ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM alertas b
+                      WHERE b.event_id = a.event_id AND b.id < a.id AND b.status IN ('pendente', 'enviando')
+                  )
+                ORDER BY a.id LIMIT 1
+            )
+            RETURNING id, canal, payload, tentativas
+        ''', (agora,)).fetchone()
+
+def concluir_alerta(alerta_id, status, tentativas, proxima_tentativa=None, erro=None):
+    with transacao() as conn:
+        conn.execute(
+            "UPDATE alertas SET status = ?, tentativas = ?, proxima_tentativa = COALESCE(?, proxima_tentativa), erro = ? WHERE id = ?",
+            (status, tentativas, proxima_tentativa, erro, alerta_id)
+        )
+
+def recuperar_alertas_interrompidos():
+    """Alertas que estavam sendo enviados quando o processo parou voltam para a fila."""
+    with transacao() as conn:
+        total = conn.execute("UPDATE alertas SET status = 'pendente' WHERE status = 'enviando'").rowcount
+    if total:
+        logging.warning(f"{total} alertas interrompidos devolvidos à fila.")
+
+def remover_alertas_antigos(limite):
+    with transacao() as conn:
+        conn.execute("DELETE FROM alertas WHERE status IN ('enviado', 'falhou') AND criado_em < ?", (limite,))
+
+# --------------------------------------------------
+# Índice em memória dos eventos ativos
+# --------------------------------------------------
+
+class IndiceEventos:
+    """
+    Eventos ativos indexados por id, por conexão (todas as de `conexoes`), por
+    transmissor (eventos agregados) e por login pendente (logins_restantes).
+
+    É a fonte de verdade do loop: todas as alterações passam por estes métodos, que
+    também gravam no banco, e as consultas (evento da conexão, evento de um login
+    reconectado) são buscas em dict, sem varrer a lista de eventos nem consultar o SQLite.
+    Cada login pendente pertence a um único evento.
+    """
+
+    def __init__(self, eventos=()):
+        self.por_id = {}
+        self.por_conexao = {}
+        self.por_transmissor = {}
+        self.por_login = {}
+        # Eventos que ficaram sem logins pendentes fora de reconectar() (ver _tomar_logins)
+        self._esvaziados = {}
+        for evento in sorted(eventos, key=lambda ev: ev['timestamp']):
+            self._indexar(evento)
+
+    def _indexar(self, evento):
+        self.por_id[evento['id']] = evento
+        for conexao in evento.get('conexoes') or (evento['conexao'],):
+            self.por_conexao.setdefault(conexao, evento)
+        if evento.get('nivel') == 'transmissor':
+            self.por_transmissor.setdefault(evento['conexao'], evento)
+        for login in evento['logins_restantes']:
+            self.por_login[login] = evento['id']
+
+    def __len__(self):
+        return len(self.por_id)
+
+    def __iter__(self):
+        return iter(list(self.por_id.values()))
+
+    def da_conexao(self, conexao):
+        return self.por_conexao.get(conexao)
+
+    def do_transmissor(self, rotulo):
+        return self.por_transmissor.get(rotulo)
+
+    def adicionar_conexao(self, evento, conexao):
+        """Inclui uma conexão num evento agregado; é gravada junto com os logins (adicionar_logins)."""
+        evento['conexoes'].add(conexao)
+        self.por_conexao.setdefault(conexao, evento)
+
+    def promover(self, evento, rotulo):
+        """Transforma um evento de conexão no evento agregado do transmissor `rotulo`."""
+        evento['nivel'] = 'transmissor'
+        evento['conexao'] = rotulo
+        self.por_transmissor.setdefault(rotulo, evento)
+
+    def criar(self, evento):
+        """Registra e persiste um novo evento ativo."""
+        self._tomar_logins(evento, evento['logins_restantes'])
+        self._indexar(evento)
+        save_event(evento, "ativo")
+
+    def adicionar_logins(self, evento, logins):
+        """Inclui novos logins offline num evento ativo, gravando só esses logins."""
+        self._tomar_logins(evento, logins)
+        evento['logins_offline'].update(logins)
+        evento['logins_restantes'].update(logins)
+        for login in logins:
+            self.por_login[login] = evento['id']
+        save_event(evento, "ativo", logins)
+
+    def _tomar_logins(self, evento, logins):
+        # Um login que caiu de novo esteve online desde o ciclo anterior, mesmo que a
+        # reconexão não tenha sido vista (p.ex. com o monitor parado): no evento
+        # antigo ele é tratado como reconectado.
+        deslocados = [login for login in logins if self.por_login.get(login, evento['id']) != evento['id']]
+        if deslocados:
+            logging.warning(f"{len(deslocados)} logins pendentes em outro evento caíram de novo; reconexão registrada no evento antigo.")
+            self._esvaziados.update(self._remover_pendentes(deslocados))
+
+    def _remover_pendentes(self, logins):
+        reconexoes = []
+        esvaziados = {}
+        for login in logins:
+            event_id = self.por_login.pop(login, None)
+            if event_id is None:
+                continue
+            evento = self.por_id[event_id]
+            evento['logins_restantes'].discard(login)
+            reconexoes.append((event_id, login))
+            if not evento['logins_restantes']:
+                esvaziados[event_id] = evento
+        if reconexoes:
+            registrar_reconexoes(reconexoes)
+        return esvaziados
+
+    def reconectar(self, logins):
+        """
+        Remove os logins reconectados dos eventos em que estavam pendentes, grava as
+        reconexões num único lote e retorna os eventos que ficaram sem logins pendentes
+        (ainda ativos; ver resolver()).
+        """
+        esvaziados = self._esvaziados
+        self._esvaziados = {}
+        esvaziados.update(self._remover_pendentes(logins))
+        return [evento for evento in esvaziados.values() if not evento['logins_restantes']]
+
+    def resolver(self, evento, logins_por_conexao=None):
+        resolver_evento(evento, logins_por_conexao)
+        del self.por_id[evento['id']]
+        for conexao in evento.get('conexoes') or (evento['conexao'],):
+            if self.por_conexao.get(conexao) is evento:
+                del self.por_conexao[conexao]
+                # Outro evento ativo da mesma conexão (bancos antigos) passa a ser o da conexão
+                for outro in sorted(self.por_id.values(), key=lambda ev: ev['timestamp']):
+                    if conexao in (outro.get('conexoes') or (outro['conexao'],)):
+                        self.por_conexao[conexao] = outro
+                        break
+        if self.por_transmissor.get(evento['conexao']) is evento:
+            del self.por_transmissor[evento['conexao']]
+        for login in evento['logins_restantes']:
+            if self.por_login.get(login) == evento['id']:
+                del self.por_login[login]
 
 # Parâmetros de configuração para monitoramento
 THRESHOLD_OFFLINE_CLIENTS = int(os.getenv('THRESHOLD_OFFLINE_CLIENTS', 4))
 MAX_CLIENTS_IN_MESSAGE = int(os.getenv('MAX_CLIENTS_IN_MESSAGE', 50))
 CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', 300))  # 300 segundos = 5 minutos
+# 'snapshot' baixa todos os logins a cada ciclo; 'delta' baixa só o que mudou (/clientes/delta)
+IXCSOFT_SYNC_MODE = os.getenv('IXCSOFT_SYNC_MODE', 'snapshot')
+# Consome /clientes/snapshot em NDJSON, construindo os conjuntos à medida que as linhas chegam
+IXCSOFT_STREAMING = os.getenv('IXCSOFT_STREAMING', 'false').lower() == 'true'
+
+# Detecção de queda em massa por janela deslizante: uma conexão dispara quando os logins que
+# caíram nos últimos OFFLINE_BURST_WINDOW segundos (e seguem offline) atingem o maior entre
+# THRESHOLD_OFFLINE_CLIENTS e OFFLINE_BURST_PERCENT % dos assinantes da conexão (0 desativa o percentual)
+OFFLINE_BURST_WINDOW = int(os.getenv('OFFLINE_BURST_WINDOW', 600))
+OFFLINE_BURST_BUCKET = int(os.getenv('OFFLINE_BURST_BUCKET', 30))
+OFFLINE_BURST_PERCENT = float(os.getenv('OFFLINE_BURST_PERCENT', 0))
+
+# Logins instáveis (flapping): as últimas FLAP_HISTORY transições de cada login ficam num buffer
+# circular; um login com FLAP_MIN_QUEDAS quedas em FLAP_WINDOW segundos não conta para a
+# detecção de queda em massa (0 desativa a exclusão) e aparece em /logins/flapping (FLAP_TOP)
+FLAP_HISTORY = max(2, min(255, int(os.getenv('FLAP_HISTORY', 16))))
+FLAP_WINDOW = int(os.getenv('FLAP_WINDOW', 3600))
+FLAP_MIN_QUEDAS = int(os.getenv('FLAP_MIN_QUEDAS', 4))
+FLAP_TOP = int(os.getenv('FLAP_TOP', 100))
+
+# Despacho assíncrono dos alertas: o loop só enfileira; os workers enviam com retentativa
+ALERT_WORKERS = int(os.getenv('ALERT_WORKERS', 2))
+ALERT_TIMEOUT = float(os.getenv('ALERT_TIMEOUT', 10))
+ALERT_MAX_TENTATIVAS = int(os.getenv('ALERT_MAX_TENTATIVAS', 12))
+ALERT_BACKOFF_BASE = float(os.getenv('ALERT_BACKOFF_BASE', 2))
+ALERT_BACKOFF_MAX = float(os.getenv('ALERT_BACKOFF_MAX', 300))
+ALERT_RETENTION_DAYS = int(os.getenv('ALERT_RETENTION_DAYS', 7))
+
+# Agregação por topologia: conexões do mesmo transmissor (OLT) que disparam juntas, ou dentro
+# de OFFLINE_BURST_WINDOW de um evento já aberto, viram um único evento do transmissor
+# (0 desativa). TOPOLOGY_PON_ENRICH inclui no alerta a contagem por porta PON (olt_service).
+TOPOLOGY_MIN_CONEXOES = int(os.getenv('TOPOLOGY_MIN_CONEXOES', 2))
+TOPOLOGY_PON_ENRICH = os.getenv('TOPOLOGY_PON_ENRICH', 'false').lower() == 'true'
+
+# Eventos de login (Start/Stop) vindos do radius_service; com eles, CHECK_INTERVAL passa a ser
+# o intervalo da reconciliação com o IXCSoft e a detecção ocorre a cada RADIUS_CYCLE_INTERVAL
+RADIUS_INGESTION = os.getenv('RADIUS_INGESTION', 'false').lower() == 'true'
+RADIUS_CYCLE_INTERVAL = float(os.getenv('RADIUS_CYCLE_INTERVAL', 5))
+# Por quanto tempo o estado vindo do RADIUS prevalece sobre o snapshot do IXCSoft
+RADIUS_RECONCILE_GRACE = int(os.getenv('RADIUS_RECONCILE_GRACE', 600))
+
+# Quantidade de logins amostrados por conexão na consulta à OLT (mínimo 3)
+OLT_SAMPLE_LOGINS = max(3, int(os.getenv('OLT_SAMPLE_LOGINS', 3)))
+# 'amostra' consulta OLT_SAMPLE_LOGINS logins um a um; 'porta' envia todos e consulta uma vez por porta PON
+OLT_CONSULT_MODE = os.getenv('OLT_CONSULT_MODE', 'amostra')
+# O diagnóstico na OLT roda em segundo plano, em OLT_DIAGNOSE_WORKERS threads: o evento é
+# criado e alertado na hora com motivo "em análise", e o motivo chega num alerta seguinte
+OLT_DIAGNOSE_WORKERS = int(os.getenv('OLT_DIAGNOSE_WORKERS', 8))
+OLT_CONSULT_TIMEOUT = float(os.getenv('OLT_CONSULT_TIMEOUT', 180))
+MOTIVO_EM_ANALISE = "em análise"
+
+# Motor do loop: 'threads' (padrão; requests, pool de diagnóstico e ALERT_WORKERS threads) ou
+# 'asyncio' (httpx.AsyncClient num event loop, com as concorrências abaixo e timeout por chamada)
+MONITOR_ENGINE = os.getenv('MONITOR_ENGINE', 'threads')
+ASYNC_ALERT_CONCURRENCY = int(os.getenv('ASYNC_ALERT_CONCURRENCY', 32))
+ASYNC_OLT_CONCURRENCY = int(os.getenv('ASYNC_OLT_CONCURRENCY', 32))
+# Timeout (s) das consultas de snapshot e delta ao IXCSoft Service, nos dois motores
+MONITOR_SNAPSHOT_TIMEOUT = float(os.getenv('MONITOR_SNAPSHOT_TIMEOUT', 300))
 
 # URLs dos microserviços (definidos via .env)
 IXCSOFT_SERVICE_URL = os.getenv('IXCSOFT_SERVICE_URL', 'http://localhost:5001')
 ALERT_SERVICE_URL = os.getenv('ALERT_SERVICE_URL', 'http://localhost:5002')
 OLT_SERVICE_URL = os.getenv('OLT_SERVICE_URL', 'http://localhost:5003')
 
-def get_clients(status):
+# --------------------------------------------------
+# Snapshot compacto de clientes
+# --------------------------------------------------
+
+class TabelaIds:
+    """Associa strings (logins, conexões, transmissores) a inteiros densos, estáveis entre ciclos."""
+    __slots__ = ('ids', 'nomes')
+
+    def __init__(self):
+        self.ids = {}
+        self.nomes = []
+
+    def id(self, nome):
+        i = self.ids.get(nome)
+        if i is None:
+            nome = sys.intern(nome)
+            i = len(self.nomes)
+            self.ids[nome] = i
+            self.nomes.append(nome)
+        return i
+
+    def nome(self, i):
+        return self.nomes[i]
+
+LOGINS = TabelaIds()
+CONEXOES = TabelaIds()
+TRANSMISSORES = TabelaIds()
+
+
+class SnapshotClientes:
+    """
+    Snapshot de um ciclo em formato colunar. Os logins são representados pelo id de
+    LOGINS, e as colunas são indexadas diretamente por esse id; `online` e `offline`
+    são conjuntos de ids, de modo que a diferença entre ciclos é feita sobre inteiros.
+    Os dicts de cliente só são materializados (cliente()) para os logins alertados.
+    """
+    __slots__ = ('timestamp', 'online', 'offline', 'conexao', 'transmissor', 'ultima_conexao_final')
+
+    def __init__(self, timestamp=None):
+        self.timestamp = timestamp
+        self.online = set()
+        self.offline = set()
+        self.conexao = array('i')
+        self.transmissor = array('i')
+        self.ultima_conexao_final = []
+
+    def adicionar(self, login, conexao, id_transmissor, ultima_conexao_final, online):
+        login_id = LOGINS.id(login)
+        faltam = login_id + 1 - len(self.conexao)
+        if faltam > 0:
+            self.conexao.extend([-1] * faltam)
+            self.transmissor.extend([-1] * faltam)
+            self.ultima_conexao_final.extend([None] * faltam)
+        self.conexao[login_id] = CONEXOES.id(conexao or 'Desconhecida')
+        self.transmissor[login_id] = TRANSMISSORES.id(str(id_transmissor)) if id_transmissor is not None else -1
+        self.ultima_conexao_final[login_id] = ultima_conexao_final
+        if online:
+            self.offline.discard(login_id)
+            self.online.add(login_id)
+        else:
+            self.online.discard(login_id)
+            self.offline.add(login_id)
+        return login_id
+
+    def adicionar_cliente(self, cliente, online):
+        return self.adicionar(
+            cliente.get('login'), cliente.get('conexao'), cliente.get('id_transmissor'),
+            cliente.get('ultima_conexao_final'), online
+        )
+
+    def remover(self, login):
+        login_id = LOGINS.ids.get(login)
+        if login_id is not None:
+            self.online.discard(login_id)
+            self.offline.discard(login_id)
+
+    def marcar(self, login, online):
+        """
+        Muda o status de um login já presente no snapshot (eventos do RADIUS). Retorna
+        False para logins desconhecidos, que só entram na próxima reconciliação.
+        """
+        login_id = LOGINS.ids.get(login)
+        if login_id is None or (login_id not in self.online and login_id not in self.offline):
+            return False
+        if online:
+            self.offline.discard(login_id)
+            self.online.add(login_id)
+        else:
+            self.online.discard(login_id)
+            self.offline.add(login_id)
+        return True
+
+    def copia(self):
+        """Cópia com conjuntos próprios; as colunas são compartilhadas."""
+        copia = SnapshotClientes(self.timestamp)
+        copia.online = set(self.online)
+        copia.offline = set(self.offline)
+        copia.conexao = self.conexao
+        copia.transmissor = self.transmissor
+        copia.ultima_conexao_final = self.ultima_conexao_final
+        return copia
+
+    def nome_conexao(self, login_id):
+        return CONEXOES.nome(self.conexao[login_id])
+
+    def cliente(self, login_id):
+        transmissor = self.transmissor[login_id]
+        return {
+            'login': LOGINS.nome(login_id),
+            'conexao': self.nome_conexao(login_id),
+            'id_transmissor': TRANSMISSORES.nome(transmissor) if transmissor >= 0 else None,
+            'ultima_conexao_final': self.ultima_conexao_final[login_id]
+        }
+
+    def cliente_por_login(self, login):
+        login_id = LOGINS.ids.get(login)
+        if login_id is None or (login_id not in self.online and login_id not in self.offline):
+            return {'login': login}
+        return self.cliente(login_id)
+
+def pico_rss_mb():
+    """Pico de memória residente do processo, em MB (ru_maxrss é em KB no Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def get_snapshot():
+    """
+    Obtém online e offline numa única consulta consistente ao IXCSoft Service.
+    Retorna None em caso de falha, para que o ciclo seja descartado em vez de
+    interpretar uma lista vazia como reconexão em massa.
+    """
     try:
-        url = f"{IXCSOFT_SERVICE_URL}/clientes/{status}"
-        response = requests.get(url)
+        url = f"{IXCSOFT_SERVICE_URL}/clientes/snapshot"
+        response = requests.get(url, timeout=MONITOR_SNAPSHOT_TIMEOUT)
         response.raise_for_status()
-        data = response.json()
-        return data.get('clientes', [])
+        return snapshot_do_json(response.json())
     except Exception as e:
-        logging.error(f"Erro ao obter clientes {status}: {e}")
-        return []
+        logging.error(f"Erro ao obter snapshot de clientes: {e}")
+        return None
 
-def send_telegram_alert(clientes, status, conexao, mensagem_personalizada=None):
+def snapshot_do_json(data):
+    snapshot = SnapshotClientes(data.get('timestamp'))
+    for cliente in data.get('online', []):
+        snapshot.adicionar_cliente(cliente, online=True)
+    for cliente in data.get('offline', []):
+        snapshot.adicionar_cliente(cliente, online=False)
+    return snapshot
+
+class LeitorSnapshotStream:
+    """
+    Monta o SnapshotClientes a partir das linhas NDJSON de /clientes/snapshot?stream=1,
+    uma por vez. resultado() falha se o stream terminou sem a linha {"tipo": "fim"}.
+    """
+
+    def __init__(self):
+        self.snapshot = SnapshotClientes()
+        self.extrair = None
+        self.concluido = False
+
+    def linha(self, linha):
+        if not linha:
+            return
+        item = json.loads(linha)
+        if isinstance(item, list):
+            # Cada linha de cliente traz só os valores, na ordem de `campos`
+            login, conexao, transmissor, ultima, online = self.extrair(item)
+            self.snapshot.adicionar(login, conexao, transmissor, ultima, online == 'S')
+        elif item.get('tipo') == 'inicio':
+            self.snapshot.timestamp = item.get('timestamp')
+            campos = item.get('campos', [])
+            self.extrair = itemgetter(*(
+                campos.index(campo)
+                for campo in ('login', 'conexao', 'id_transmissor', 'ultima_conexao_final', 'online')
+            ))
+        elif item.get('tipo') == 'fim':
+            self.concluido = True
+        elif item.get('tipo') == 'erro':
+            raise RuntimeError(item.get('error'))
+
+    def resultado(self):
+        if not self.concluido:
+            raise RuntimeError("stream encerrado antes da linha final")
+        return self.snapshot
+
+def get_snapshot_stream():
+    """
+    Mesmo resultado de get_snapshot(), mas consumindo a resposta NDJSON linha a linha,
+    sem manter o corpo inteiro nem a lista decodificada em memória. Um stream sem a
+    linha final {"tipo": "fim"} é tratado como falha.
+    """
     try:
-        url = f"{ALERT_SERVICE_URL}/alerta/telegram"
-        payload = {
-            'clientes': clientes,
-            'status': status,
-            'conexao': conexao,
-            'mensagem_personalizada': mensagem_personalizada
-        }
-        logging.info(f"Enviando alerta para {url} com payload: {json.dumps(payload)}")
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        logging.info(f"Alerta enviado com sucesso para {conexao}. Status: {response.status_code}")
+        url = f"{IXCSOFT_SERVICE_URL}/clientes/snapshot"
+        leitor = LeitorSnapshotStream()
+        with requests.get(url, params={'stream': '1'}, stream=True, timeout=MONITOR_SNAPSHOT_TIMEOUT) as response:
+            response.raise_for_status()
+            for linha in response.iter_lines(chunk_size=65536):
+                leitor.linha(linha)
+        return leitor.resultado()
     except Exception as e:
-        logging.critical(f"FALHA CRÍTICA ao enviar alerta para {ALERT_SERVICE_URL}/alerta/telegram. Erro: {e}. Payload: {json.dumps(payload)}")
-        # TODO: Implementar mecanismo de retentativa ou notificação alternativa em caso de falha no envio do alerta.
+        logging.error(f"Erro ao obter snapshot de clientes (stream): {e}")
+        return None
 
-def send_whatsapp_alert(total_clientes, conexao, motivo):
+def get_delta(cursor):
     try:
-        url = f"{ALERT_SERVICE_URL}/alerta/whatsapp"
-        payload = {
-            'total_clientes': total_clientes,
-            'conexao': conexao,
-            'motivo': motivo
-        }
-        response = requests.post(url, json=payload)
+        url = f"{IXCSOFT_SERVICE_URL}/clientes/delta"
+        response = requests.get(url, params={'since': cursor} if cursor else None, timeout=MONITOR_SNAPSHOT_TIMEOUT)
         response.raise_for_status()
-        logging.info(f"Alerta WhatsApp enviado para conexão {conexao}.")
+        return response.json()
     except Exception as e:
-        logging.error(f"Erro ao enviar alerta WhatsApp: {e}")
+        logging.error(f"Erro ao obter delta de clientes: {e}")
+        return None
 
-def monitor_connections():
-    eventos_ativos = carregar_eventos_ativos()
-    clientes_offline_anterior = set()
-    clientes_info_offline_anterior = {}
+def get_snapshot_delta(estado):
+    """
+    Aplica o delta desde `estado['cursor']` sobre `estado['snapshot']` e devolve uma
+    cópia do snapshot resultante, no mesmo formato de get_snapshot(). Retorna None
+    em caso de falha.
+    """
+    data = get_delta(estado['cursor'])
+    if data is None:
+        return None
+    return aplicar_delta(estado, data)
+
+def aplicar_delta(estado, data):
+    if data.get('completo') or estado['snapshot'] is None:
+        estado['snapshot'] = SnapshotClientes()
+    snapshot = estado['snapshot']
+    for cliente in data.get('alterados', []):
+        snapshot.adicionar_cliente(cliente, online=cliente.get('online') == 'S')
+    for login in data.get('removidos', []):
+        snapshot.remover(login)
+    snapshot.timestamp = data.get('timestamp')
+    estado['cursor'] = data.get('cursor')
+    logging.info(
+        f"Delta aplicado ({'completo' if data.get('completo') else 'incremental'}): "
+        f"{len(data.get('alterados', []))} alterados, {len(data.get('removidos', []))} removidos."
+    )
+    return snapshot.copia()
+
+def send_telegram_alert(clientes, status, conexao, mensagem_personalizada=None, evento_id=None, chave=None):
+    payload = {
+        'clientes': clientes,
+        'status': status,
+        'conexao': conexao,
+        'mensagem_personalizada': mensagem_personalizada
+    }
+    enfileirar_alerta('telegram', payload, evento_id, chave)
+
+def send_whatsapp_alert(total_clientes, conexao, motivo, evento_id=None, chave=None):
+    payload = {
+        'total_clientes': total_clientes,
+        'conexao': conexao,
+        'motivo': motivo
+    }
+    enfileirar_alerta('whatsapp', payload, evento_id, chave)
+
+# --------------------------------------------------
+# Despacho dos alertas (fila SQLite + workers)
+# --------------------------------------------------
+
+alertas_disponiveis = threading.Event()
+
+# Sinalizado no SIGTERM/SIGINT: o loop e os workers de alerta terminam o que estão fazendo e saem
+parada = threading.Event()
+
+def atraso_retentativa(tentativas):
+    """
+    Backoff exponencial com "equal jitter": um valor aleatório entre metade e o total do
+    atraso, o que espalha as retentativas sem permitir uma nova tentativa imediata.
+    """
+    atraso = min(ALERT_BACKOFF_MAX, ALERT_BACKOFF_BASE * (2 ** (tentativas - 1)))
+    return random.uniform(atraso / 2, atraso)
+
+def enviar_alerta(canal, payload):
+    url = f"{ALERT_SERVICE_URL}/alerta/{canal}"
+    response = requests.post(url, json=payload, timeout=ALERT_TIMEOUT)
+    response.raise_for_status()
+    return response
+
+def despachar_alertas():
+    """Worker: envia os alertas da fila até ela esvaziar e então aguarda novos."""
+    ultima_limpeza = 0
+    while not parada.is_set():
+        agora = time.time()
+        if agora - ultima_limpeza > 3600:
+            remover_alertas_antigos(agora - ALERT_RETENTION_DAYS * 86400)
+            ultima_limpeza = agora
+        alerta = reservar_alerta(agora)
+        if alerta is None:
+            alertas_disponiveis.wait(timeout=1)
+            alertas_disponiveis.clear()
+            continue
+
+        _, canal, payload, _ = alerta
+        try:
+            response = enviar_alerta(canal, json.loads(payload))
+            registrar_envio(alerta, response.status_code)
+        except Exception as e:
+            registrar_envio(alerta, erro=e)
+
+def registrar_envio(alerta, status_code=None, erro=None):
+    """Conclui o alerta reservado: enviado, de volta à fila com backoff ou falhou de vez."""
+    alerta_id, canal, payload, tentativas = alerta
+    tentativas += 1
+    if erro is None:
+        concluir_alerta(alerta_id, 'enviado', tentativas)
+        logging.info(f"Alerta {canal} {alerta_id} enviado (tentativa {tentativas}). Status: {status_code}")
+    elif tentativas >= ALERT_MAX_TENTATIVAS:
+        concluir_alerta(alerta_id, 'falhou', tentativas, erro=str(erro))
+        logging.critical(f"FALHA CRÍTICA ao enviar alerta {canal} {alerta_id} após {tentativas} tentativas. Erro: {erro}. Payload: {payload}")
+    else:
+        atraso = atraso_retentativa(tentativas)
+        concluir_alerta(alerta_id, 'pendente', tentativas, time.time() + atraso, str(erro))
+        logging.error(f"Erro ao enviar alerta {canal} {alerta_id} (tentativa {tentativas}); nova tentativa em {atraso:.0f}s. Erro: {erro}")
+
+def iniciar_despacho_alertas():
+    recuperar_alertas_interrompidos()
+    workers = []
+    for i in range(ALERT_WORKERS):
+        worker = threading.Thread(target=despachar_alertas, name=f"alertas-{i}", daemon=True)
+        worker.start()
+        workers.append(worker)
+    return workers
+
+def consultar_motivos_olt(conexoes_clientes):
+    """
+    Consulta a OLT para várias conexões numa única chamada a /consulta/olt/lote,
+    que as diagnostica em paralelo. `conexoes_clientes` mapeia conexão -> lista de
+    dicts de cliente. Retorna conexão -> motivo ("indeterminado" em caso de falha).
+    """
+    consultas, motivos = montar_consultas_olt(conexoes_clientes)
+    if consultas:
+        try:
+            response = requests.post(f"{OLT_SERVICE_URL}/consulta/olt/lote", json={"consultas": consultas},
+                                     timeout=OLT_CONSULT_TIMEOUT)
+            response.raise_for_status()
+            ler_resultados_olt(response.json(), motivos)
+        except Exception as e:
+            logging.error(f"Erro ao consultar OLT: {e}")
+
+    return {conexao: motivos.get(conexao, "indeterminado") for conexao in conexoes_clientes}
+
+def montar_consultas_olt(conexoes_clientes):
+    """Itens do lote de /consulta/olt/lote e os motivos já definidos (conexões sem amostra suficiente)."""
+    motivos = {}
+    consultas = []
+    for conexao, clientes in conexoes_clientes.items():
+        olt_logins = [cliente['login'] for cliente in clientes]
+        if OLT_CONSULT_MODE != 'porta':
+            olt_logins = olt_logins[:OLT_SAMPLE_LOGINS]
+        if len(olt_logins) < 3:
+            logging.error(f"Não há logins suficientes para consulta à OLT na conexão {conexao}.")
+            motivos[conexao] = "indeterminado"
+            continue
+        consultas.append({
+            "conexao": conexao,
+            "logins": olt_logins,
+            "id_transmissor": clientes[0].get('id_transmissor', 'OLT1'),
+            "modo": OLT_CONSULT_MODE
+        })
+    return consultas, motivos
+
+def ler_resultados_olt(data, motivos):
+    for resultado in data.get("resultados", []):
+        if resultado.get("error"):
+            logging.error(f"Erro ao consultar OLT da conexão {resultado.get('conexao')}: {resultado['error']}")
+        motivos[resultado.get("conexao")] = resultado.get("motivo_final", "indeterminado")
+
+# --------------------------------------------------
+# Diagnóstico na OLT em segundo plano
+# --------------------------------------------------
 
+diagnosticos = ThreadPoolExecutor(max_workers=OLT_DIAGNOSE_WORKERS, thread_name_prefix="diagnostico")
+
+def agendar_diagnostico(evento, clientes):
+    """
+    Consulta a OLT sobre o evento num worker do pool, sem bloquear o loop. Deve ser
+    chamado depois do commit que criou o evento. `clientes` são os dicts de cliente
+    amostrados na consulta (ver consultar_motivos_olt). Com MONITOR_ENGINE=asyncio, a
+    consulta é uma tarefa do event loop (MotorAsyncio.agendar).
+    """
+    if motor_asyncio is not None:
+        motor_asyncio.agendar(evento, clientes)
+        return
+    diagnosticos.submit(diagnosticar_evento, evento, evento['conexao'], clientes)
+
+def diagnosticar_evento(evento, chave, clientes):
+    if parada.is_set():
+        return  # Segue "em análise" e é diagnosticado de novo na próxima inicialização
+    inicio = time.time()
+    motivo = consultar_motivos_olt({chave: clientes})[chave]
+    pons = contar_pons(evento['transmissor'], [c['login'] for c in clientes]) if enriquecer_pons(evento) else None
     try:
-        while True:
-            logging.info("Iniciando verificação de clientes.")
-
-            # Obter clientes offline atuais
-            clientes_offline = get_clients('offline')
-            clientes_offline_atual = set()
-            clientes_info_offline_atual = {}
-            for cliente in clientes_offline:
-                login = cliente.get('login')
-                clientes_offline_atual.add(login)
-                clientes_info_offline_atual[login] = cliente
-
-            # Obter clientes online atuais
-            clientes_online = get_clients('online')
-            clientes_online_atual = set()
-            clientes_info_online_atual = {}
-            for cliente in clientes_online:
-                login = cliente.get('login')
-                clientes_online_atual.add(login)
-                clientes_info_online_atual[login] = cliente
-
-            if clientes_offline_anterior:
-                novos_offlines = clientes_offline_atual - clientes_offline_anterior
-                clientes_reconectados = clientes_offline_anterior - clientes_offline_atual
-                conexoes_novos_offlines = {}
-
-                if novos_offlines:
-                    logging.warning(f"Detectados {len(novos_offlines)} novos clientes offline.")
-                    for login in novos_offlines:
-                        cliente = clientes_info_offline_atual[login]
-                        conexao = cliente.get('conexao', 'Desconhecida')
-                        conexoes_novos_offlines.setdefault(conexao, []).append(cliente)
-
-                for conexao, clientes in conexoes_novos_offlines.items():
-                    if len(clientes) >= THRESHOLD_OFFLINE_CLIENTS:
-                        if existe_evento_ativo_para_conexao(conexao):
-                            # Encontrar o evento ativo para a conexão
-                            evento_existente = None
-                            for ev in eventos_ativos:
-                                if ev['conexao'] == conexao:
-                                    evento_existente = ev
-                                    break
-                            
-                            if evento_existente:
-                                novos_logins_nesta_conexao = set(cliente['login'] for cliente in clientes)
-                                logging.info(f"Atualizando evento existente para conexão {conexao} com {len(novos_logins_nesta_conexao)} novos logins.")
-                                
-                                evento_existente['logins_offline'].update(novos_logins_nesta_conexao)
-                                evento_existente['logins_restantes'].update(novos_logins_nesta_conexao)
-                                
-                                save_event(evento_existente, "ativo") # Persistir a atualização no banco de dados
-                                logging.info(f"Evento {evento_existente['id']} atualizado no banco de dados com novos logins.")
-
-                                # Preparar informações para alertas atualizados
-                                # Para o Telegram, idealmente todos os clientes offline do evento
-                                # Recriar a lista de clientes para o alerta do Telegram pode ser complexo aqui
-                                # Vamos enviar detalhes dos *novos* clientes por enquanto, e a contagem total na mensagem
-                                
-                                mensagem_atualizacao_telegram = (
-                                    f"🚨 🔄 *Atualização*: Mais {len(novos_logins_nesta_conexao)} clientes offline detectados na conexão {conexao}. "
-                                    f"Total offline agora: {len(evento_existente['logins_restantes'])}."
-                                )
-                                # Para send_telegram_alert, 'clientes' deve ser uma lista de dicts
-                                # Usaremos os 'clientes' recém detectados para esta conexão específica
-                                send_telegram_alert(clientes, status='offline', conexao=conexao, mensagem_personalizada=mensagem_atualizacao_telegram)
-                                
-                                # Para WhatsApp, apenas a contagem e um motivo genérico
-                                send_whatsapp_alert(len(evento_existente['logins_restantes']), conexao, "Atualização de evento")
-                                continue # Pular para a próxima conexão após atualizar o evento existente
-                            else:
-                                logging.error(f"Evento ativo para conexão {conexao} não encontrado na lista eventos_ativos, embora existe_evento_ativo_para_conexao seja true. Isso não deveria acontecer.")
-                                # Prosseguir para criar um novo evento como fallback, ou adicionar tratamento de erro específico
-
-                        olt_logins = [cliente['login'] for cliente in clientes][:3]
-                        if len(olt_logins) < 3:
-                            logging.error("Não há logins suficientes para consulta à OLT.")
-                            motivo = "indeterminado"
-                        else:
-                            id_transmissor = clientes[0].get('id_transmissor', 'OLT1')
-                            olt_payload = {
-                                "logins": olt_logins,
-                                "id_transmissor": id_transmissor
-                            }
-                            try:
-                                response = requests.post(f"{OLT_SERVICE_URL}/consulta/olt", json=olt_payload)
-                                response.raise_for_status()
-                                motivo = response.json().get("motivo_final", "indeterminado")
-                            except Exception as e:
-                                logging.error(f"Erro ao consultar OLT: {e}")
-                                motivo = "indeterminado"
-
-                        evento = {
-                            'id': str(uuid.uuid4()),
-                            'conexao': conexao,
-                            'logins_offline': set(cliente['login'] for cliente in clientes),
-                            'logins_restantes': set(cliente['login'] for cliente in clientes),
-                            'timestamp': time.time()
-                        }
+        aplicar_diagnostico(evento, motivo, clientes, pons)
+        logging.info(f"Diagnóstico do evento {evento['id']} ({chave}): {motivo} em {time.time() - inicio:.1f}s.")
+    except Exception as e:
+        logging.error(f"Erro ao gravar o diagnóstico do evento {evento['id']} ({chave}): {e}")
+
+def aplicar_diagnostico(evento, motivo, clientes, pons=None):
+    """
+    Grava o motivo do evento e enfileira o alerta de acompanhamento, com a contagem de
+    logins por PON (`pons`, ver contar_pons) se houver. Se o evento já foi resolvido, só
+    corrige o motivo no histórico. A escrita vem primeiro: com o banco travado, o loop
+    não lê nem grava o motivo (resolver_evento) até o commit.
+    """
+    with transacao() as conn:
+        conn.execute("UPDATE events SET motivo = ? WHERE id = ?", (motivo, evento['id']))
+        anterior, evento['motivo'] = evento.get('motivo'), motivo
+        linha = conn.execute("SELECT status FROM events WHERE id = ?", (evento['id'],)).fetchone()
+        if linha is None:
+            return
+        registrar_alteracao_eventos(conn)
+        if linha[0] == 'resolvido':
+            corrigir_motivo_historico(conn, evento, anterior or 'indeterminado', motivo)
+            return
+        chave = f"{evento['id']}:diagnostico"
+        mensagem = (
+            f"🔎 *Diagnóstico da OLT* para {evento['conexao']}: {len(evento['logins_restantes'])} clientes offline.\n"
+            f"Motivo da queda: {motivo.capitalize()}\n"
+        )
+        if pons:
+            mensagem += "PONs: " + ", ".join(f"{fspon} ({n})" for fspon, n in pons.most_common()) + "\n"
+        mensagem += "Logins consultados:"
+        send_telegram_alert(clientes[:OLT_SAMPLE_LOGINS], status='offline', conexao=evento['conexao'],
+                            mensagem_personalizada=mensagem, evento_id=evento['id'], chave=chave)
+        send_whatsapp_alert(len(evento['logins_restantes']), evento['conexao'], motivo,
+                            evento_id=evento['id'], chave=chave)
+    alertas_disponiveis.set()
+
+def retomar_diagnosticos(eventos, snapshot):
+    """
+    Reagenda o diagnóstico dos eventos ativos que ficaram "em análise" na última execução,
+    com os clientes do primeiro snapshot. A OLT é a do evento ou, nos eventos sem
+    transmissor (anteriores ao esquema 3 ou criados com o transmissor desconhecido), a da
+    maioria dos seus logins no snapshot; sem nenhuma das duas, o evento fica como está.
+    """
+    for evento in eventos:
+        if evento.get('motivo') != MOTIVO_EM_ANALISE:
+            continue
+        clientes = [snapshot.cliente_por_login(login) for login in sorted(evento['logins_offline'])]
+        transmissor = evento.get('transmissor')
+        if not transmissor:
+            conhecidos = Counter(c['id_transmissor'] for c in clientes if c.get('id_transmissor'))
+            if not conhecidos:
+                logging.warning(f"Evento {evento['id']} ({evento['conexao']}) segue em análise: OLT desconhecida.")
+                continue
+            transmissor = conhecidos.most_common(1)[0][0]
+        for cliente in clientes:
+            cliente['id_transmissor'] = transmissor
+        logging.info(f"Diagnóstico do evento {evento['id']} ({evento['conexao']}) reagendado.")
+        agendar_diagnostico(evento, clientes)
+
+# --------------------------------------------------
+# Detector de quedas em massa (janela deslizante por conexão)
+# --------------------------------------------------
+
+class JanelaConexao:
+    """Logins de uma conexão que caíram dentro da janela e seguem offline, agrupados por balde de tempo."""
+    __slots__ = ('baldes', 'ordem', 'total')
+
+    def __init__(self):
+        self.baldes = {}       # balde -> set de ids de login
+        self.ordem = deque()   # baldes em ordem crescente
+        self.total = 0
+
+
+class DetectorQuedas:
+    """
+    Contadores por conexão em baldes de OFFLINE_BURST_BUCKET segundos, cobrindo os
+    últimos OFFLINE_BURST_WINDOW segundos. Cada queda e cada retorno custa O(1)
+    (amortizado, contando a expiração dos baldes), e a verificação só visita as
+    conexões alteradas desde a última chamada a disparos(). Quedas que atravessam dois
+    ciclos (ou chegam uma a uma, via RADIUS) somam na mesma janela.
+    """
+
+    def __init__(self, janela=None, balde=None, percentual=None, minimo=None):
+        self.janela = janela if janela is not None else OFFLINE_BURST_WINDOW
+        self.balde = max(1, balde if balde is not None else OFFLINE_BURST_BUCKET)
+        self.percentual = percentual if percentual is not None else OFFLINE_BURST_PERCENT
+        self.minimo = minimo if minimo is not None else THRESHOLD_OFFLINE_CLIENTS
+        self.janelas = {}      # id da conexão -> JanelaConexao
+        self.pendentes = {}    # id de login -> (id da conexão, balde)
+        self.alteradas = set()
+        self.assinantes = {}   # id da conexão -> total de logins (online + offline)
+
+    def atualizar_assinantes(self, snapshot):
+        """Recalcula o total de logins por conexão (base do percentual); feito só na reconciliação."""
+        if not self.percentual:
+            return
+        conexao = snapshot.conexao
+        self.assinantes = Counter(conexao[login_id] for login_id in snapshot.online)
+        self.assinantes.update(conexao[login_id] for login_id in snapshot.offline)
+
+    def limiar(self, conexao_id):
+        if not self.percentual:
+            return self.minimo
+        return max(self.minimo, math.ceil(self.assinantes.get(conexao_id, 0) * self.percentual / 100))
+
+    def registrar_queda(self, login_id, conexao_id, agora):
+        if login_id in self.pendentes:
+            return
+        balde = int(agora // self.balde)
+        janela = self.janelas.get(conexao_id)
+        if janela is None:
+            janela = self.janelas[conexao_id] = JanelaConexao()
+        logins = janela.baldes.get(balde)
+        if logins is None:
+            logins = janela.baldes[balde] = set()
+            janela.ordem.append(balde)
+        logins.add(login_id)
+        janela.total += 1
+        self.pendentes[login_id] = (conexao_id, balde)
+        self.alteradas.add(conexao_id)
+
+    def registrar_retorno(self, login_id):
+        pendente = self.pendentes.pop(login_id, None)
+        if pendente is None:
+            return
+        conexao_id, balde = pendente
+        janela = self.janelas[conexao_id]
+        janela.baldes[balde].discard(login_id)
+        janela.total -= 1
+
+    def _expirar(self, conexao_id, janela, agora):
+        primeiro = int((agora - self.janela) // self.balde)
+        while janela.ordem and janela.ordem[0] < primeiro:
+            for login_id in janela.baldes.pop(janela.ordem.popleft()):
+                del self.pendentes[login_id]
+                janela.total -= 1
+        if not janela.ordem:
+            del self.janelas[conexao_id]
+
+    def disparos(self, agora):
+        """
+        Retorna {id da conexão: [ids de login]} das conexões alteradas que atingiram o
+        limiar. Os logins retornados saem da janela (passam a pertencer a um evento).
+        """
+        disparadas = {}
+        for conexao_id in self.alteradas:
+            janela = self.janelas.get(conexao_id)
+            if janela is None:
+                continue
+            self._expirar(conexao_id, janela, agora)
+            if janela.total and janela.total >= self.limiar(conexao_id):
+                login_ids = [login_id for balde in janela.ordem for login_id in janela.baldes[balde]]
+                for login_id in login_ids:
+                    del self.pendentes[login_id]
+                del self.janelas[conexao_id]
+                disparadas[conexao_id] = login_ids
+        self.alteradas.clear()
+        return disparadas
+
+    def limpar(self, agora):
+        """Expira as janelas de todas as conexões (chamado na reconciliação)."""
+        for conexao_id, janela in list(self.janelas.items()):
+            self._expirar(conexao_id, janela, agora)
+
+# --------------------------------------------------
+# Logins instáveis (flapping)
+# --------------------------------------------------
+
+class HistoricoTransicoes:
+    """
+    Últimas `capacidade` transições (queda/retorno) de cada login, num buffer circular
+    por login dentro de um único array indexado pelo id de LOGINS: cada posição guarda
+    (segundos desde `base` << 1) | 1 se foi um retorno, e 0 numa posição vazia. `base`
+    é o instante da primeira transição registrada; com o epoch absoluto, o array de 32
+    bits estouraria em 2038, e assim cobre 68 anos de loop. A memória é fixa por login
+    (4 bytes por posição: 6,4 MB para 100 mil logins com 16 posições, mais 4 bytes para a
+    conexão da última transição), e só os logins com transições na janela são revisitados
+    no ranking. Como o buffer guarda no máximo
+    `capacidade` transições, min_quedas acima de capacidade / 2 nunca é atingido.
+    """
+
+    def __init__(self, capacidade=None, janela=None, min_quedas=None):
+        self.capacidade = capacidade or FLAP_HISTORY
+        self.janela = janela if janela is not None else FLAP_WINDOW
+        self.min_quedas = min_quedas if min_quedas is not None else FLAP_MIN_QUEDAS
+        self.base = None
+        self.transicoes = array('I')
+        self.proxima = array('B')   # posição de escrita de cada login no seu buffer
+        self.conexao = array('i')   # id (CONEXOES) da conexão do login na última transição, -1 se desconhecida
+        self.recentes = set()       # ids de login com transições ainda dentro da janela
+
+    def _relativo(self, instante):
+        """Segundos desde `base`, a partir de 1 (o 0 marca posição vazia)."""
+        return max(1, int(instante) - self.base)
+
+    def registrar(self, login_id, online, agora, conexao_id=-1):
+        """Registra a transição; numa queda, retorna quantas o login teve na janela (incluindo esta)."""
+        if self.base is None:
+            self.base = int(agora) - 1
+        faltam = login_id + 1 - len(self.proxima)
+        if faltam > 0:
+            self.proxima.extend([0] * faltam)
+            self.conexao.extend([-1] * faltam)
+            self.transicoes.extend([0] * (faltam * self.capacidade))
+        if conexao_id >= 0:
+            self.conexao[login_id] = conexao_id
+        posicao = self.proxima[login_id]
+        self.transicoes[login_id * self.capacidade + posicao] = (self._relativo(agora) << 1) | online
+        self.proxima[login_id] = (posicao + 1) % self.capacidade
+        self.recentes.add(login_id)
+        return 0 if online else self.contar(login_id, agora)[0]
+
+    def contar(self, login_id, agora):
+        """(quedas, transições, última transição em epoch) do login dentro da janela."""
+        if login_id >= len(self.proxima):
+            return 0, 0, 0
+        inicio = login_id * self.capacidade
+        limite = self._relativo(agora - self.janela) << 1
+        quedas = transicoes = ultima = 0
+        for valor in self.transicoes[inicio:inicio + self.capacidade]:
+            if valor >= limite:
+                transicoes += 1
+                quedas += not valor & 1
+                ultima = max(ultima, (valor >> 1) + self.base)
+        return quedas, transicoes, ultima
 
-                        eventos_ativos.append(evento)
-                        save_event(evento, "ativo")
-                        logging.info(f"Criado novo evento {evento['id']} para conexão {conexao} com {len(clientes)} logins offline.")
-
-                        mensagem_alerta = (
-                            f"🚨 *Alerta: {len(clientes)} clientes offline detectados na conexão {conexao}.*\n"
-                            f"Motivo da queda: {motivo.capitalize()}"
-                        )
-                        send_telegram_alert(clientes, status='offline', conexao=conexao, mensagem_personalizada=mensagem_alerta)
-                        send_whatsapp_alert(len(clientes), conexao, motivo)
-                    else:
-                        logging.info(f"Offline insuficiente para alerta na conexão {conexao} ({len(clientes)}).")
-
-                if clientes_reconectados:
-                    logging.info(f"{len(clientes_reconectados)} clientes voltaram a ficar online.")
-                    eventos_para_remover = []
-                    for login in clientes_reconectados:
-                        for evento in eventos_ativos:
-                            if login in evento['logins_restantes']:
-                                evento['logins_restantes'].remove(login)
-                                if not evento['logins_restantes']:
-                                    clientes_evento = [clientes_info_online_atual.get(l, {'login': l}) for l in evento['logins_offline']]
-                                    send_telegram_alert(clientes_evento, status='online', conexao=evento['conexao'])
-                                    update_event_status(evento['id'], "resolvido")
-                                    eventos_para_remover.append(evento)
-                    for evento in eventos_para_remover:
-                        eventos_ativos.remove(evento)
+    def ranking(self, agora, quantidade):
+        """Os `quantidade` logins com mais quedas na janela: [(login_id, quedas, transições, última)]."""
+        linhas = []
+        for login_id in list(self.recentes):
+            quedas, transicoes, ultima = self.contar(login_id, agora)
+            if not transicoes:
+                self.recentes.discard(login_id)
+            elif quedas > 1:
+                linhas.append((login_id, quedas, transicoes, ultima))
+        linhas.sort(key=lambda linha: (-linha[1], -linha[2], -linha[3]))
+        return linhas[:quantidade]
 
+# --------------------------------------------------
+# Topologia: transmissor -> conexão -> login
+# --------------------------------------------------
+
+class Topologia:
+    """
+    Transmissor (OLT) de cada conexão, a partir das colunas id_transmissor e conexao do
+    snapshot: cada conexão fica com o transmissor da maioria dos seus logins.
+    Recalculada a cada reconciliação.
+    """
+
+    def __init__(self):
+        self.transmissor_da_conexao = {}   # id da conexão -> id do transmissor
+        self.conexoes_do_transmissor = {}  # id do transmissor -> set de ids de conexão
+
+    def atualizar(self, snapshot):
+        conexao, transmissor = snapshot.conexao, snapshot.transmissor
+        pares = Counter((conexao[login_id], transmissor[login_id]) for login_id in snapshot.online)
+        pares.update((conexao[login_id], transmissor[login_id]) for login_id in snapshot.offline)
+        maiorias = {}
+        for (conexao_id, transmissor_id), total in pares.items():
+            if transmissor_id >= 0 and total > maiorias.get(conexao_id, (0, -1))[0]:
+                maiorias[conexao_id] = (total, transmissor_id)
+        self.transmissor_da_conexao = {c: t for c, (_, t) in maiorias.items()}
+        self.conexoes_do_transmissor = {}
+        for conexao_id, transmissor_id in self.transmissor_da_conexao.items():
+            self.conexoes_do_transmissor.setdefault(transmissor_id, set()).add(conexao_id)
+
+    def transmissor(self, conexao_id, snapshot, login_ids):
+        """Transmissor da conexão; para conexões novas, o do primeiro login (-1 se desconhecido)."""
+        transmissor_id = self.transmissor_da_conexao.get(conexao_id)
+        if transmissor_id is None:
+            transmissor_id = snapshot.transmissor[login_ids[0]]
+        return transmissor_id
+
+def rotulo_transmissor(transmissor_id):
+    return f"Transmissor {TRANSMISSORES.nome(transmissor_id)}"
+
+def intercalar(listas):
+    """Intercala as listas (um item de cada por vez), para a amostra da OLT cobrir todas as conexões."""
+    return [item for grupo in zip_longest(*listas) for item in grupo if item is not None]
+
+def enriquecer_pons(evento):
+    """Se o diagnóstico do evento inclui a contagem por PON (eventos de transmissor com TOPOLOGY_PON_ENRICH)."""
+    return TOPOLOGY_PON_ENRICH and evento.get('nivel') == 'transmissor' and bool(evento.get('transmissor'))
+
+def contar_pons(id_transmissor, logins):
+    """Logins por porta PON (F/S/P) segundo o inventário do olt_service; {} em caso de falha."""
+    try:
+        response = requests.post(
+            f"{OLT_SERVICE_URL}/inventario/localizar",
+            json={"logins": list(logins), "id_transmissor": id_transmissor}, timeout=30
+        )
+        response.raise_for_status()
+        return pons_do_inventario(response.json())
+    except Exception as e:
+        logging.error(f"Erro ao localizar as PONs no olt_service: {e}")
+        return {}
+
+def pons_do_inventario(data):
+    localizacoes = data.get("localizacoes", {})
+    return Counter(locais[0]["fspon"] for locais in localizacoes.values() if locais)
+
+def obter_snapshot(estado_delta):
+    # Obter online e offline do mesmo instante
+    if IXCSOFT_SYNC_MODE == 'delta':
+        return get_snapshot_delta(estado_delta)
+    if IXCSOFT_STREAMING:
+        return get_snapshot_stream()
+    return get_snapshot()
+
+def aplicar_eventos_radius(snapshot, eventos_radius, recentes):
+    """
+    Aplica ao snapshot os eventos (login, online, timestamp) do RADIUS, guardando o
+    estado de cada login em `recentes` (login -> (online, recebido_em)) para
+    sobrepô-lo ao snapshot do IXCSoft na reconciliação. Retorna quantos foram aplicados.
+    """
+    agora = time.time()
+    aplicados = 0
+    for login, online, _ in eventos_radius:
+        recentes[login] = (online, agora)
+        if snapshot.marcar(login, online):
+            aplicados += 1
+    return aplicados
+
+def reconciliar_radius(snapshot, recentes):
+    """
+    O IXCSoft recebe o accounting com atraso: por RADIUS_RECONCILE_GRACE segundos, o
+    estado vindo do RADIUS prevalece sobre o snapshot. Depois disso vale o IXCSoft,
+    que corrige pacotes de accounting perdidos.
+    """
+    limite = time.time() - RADIUS_RECONCILE_GRACE
+    for login in [login for login, (_, recebido_em) in recentes.items() if recebido_em < limite]:
+        del recentes[login]
+    for login, (online, _) in recentes.items():
+        snapshot.marcar(login, online)
+
+def processar_ciclo(snapshot, clientes_offline_anterior, eventos, detector, topologia, instabilidade):
+    """
+    Compara os offline do snapshot com os do ciclo anterior (conjuntos de ids de login,
+    ver SnapshotClientes), alimenta o detector de quedas (exceto com logins instáveis,
+    ver HistoricoTransicoes) e cria, atualiza e resolve eventos.
+    """
+    clientes_offline_atual = snapshot.offline
+    novos_eventos = []
+
+    # Todas as alterações de eventos do ciclo são gravadas numa única transação
+    with transacao():
+        novos_offlines = clientes_offline_atual - clientes_offline_anterior
+        clientes_reconectados = clientes_offline_anterior - clientes_offline_atual
+
+        agora = time.time()
+        if novos_offlines:
+            logging.warning(f"Detectados {len(novos_offlines)} novos clientes offline.")
+            instaveis = 0
+            for login_id in novos_offlines:
+                quedas = instabilidade.registrar(login_id, False, agora, snapshot.conexao[login_id])
+                if instabilidade.min_quedas and quedas >= instabilidade.min_quedas:
+                    instaveis += 1
+                    continue
+                detector.registrar_queda(login_id, snapshot.conexao[login_id], agora)
+            if instaveis:
+                logging.info(f"{instaveis} quedas de logins instáveis (flapping) fora da contagem de queda em massa.")
+        for login_id in clientes_reconectados:
+            instabilidade.registrar(login_id, True, agora, snapshot.conexao[login_id])
+            detector.registrar_retorno(login_id)
+
+        # Conexões que atingiram o limiar na janela: as que já têm evento (próprio ou do
+        # transmissor) o atualizam; as demais são agrupadas por transmissor
+        novas_por_transmissor = {}
+        for conexao_id, login_ids in detector.disparos(agora).items():
+            conexao = CONEXOES.nome(conexao_id)
+            clientes = [snapshot.cliente(login_id) for login_id in login_ids]
+            transmissor_id = topologia.transmissor(conexao_id, snapshot, login_ids)
+            evento_existente = eventos.da_conexao(conexao)
+            if evento_existente is None and TOPOLOGY_MIN_CONEXOES and transmissor_id >= 0:
+                evento_existente = agregar_no_transmissor(eventos, topologia, conexao, transmissor_id, agora)
+            if evento_existente:
+                atualizar_evento(eventos, evento_existente, conexao, clientes)
+            else:
+                novas_por_transmissor.setdefault(transmissor_id, {})[conexao] = clientes
+
+        # Causas raiz: um transmissor com TOPOLOGY_MIN_CONEXOES conexões disparadas é um evento só
+        raizes = {}
+        for transmissor_id, conexoes in novas_por_transmissor.items():
+            if TOPOLOGY_MIN_CONEXOES and transmissor_id >= 0 and len(conexoes) >= TOPOLOGY_MIN_CONEXOES:
+                raizes[rotulo_transmissor(transmissor_id)] = (transmissor_id, 'transmissor', conexoes)
             else:
-                logging.info("Primeira execução: inicializando estados.")
+                for conexao, clientes in conexoes.items():
+                    raizes[conexao] = (transmissor_id, 'conexao', {conexao: clientes})
+
+        # O evento sai na hora, "em análise"; a consulta à OLT de cada causa raiz é agendada após o commit
+        for chave, (transmissor_id, nivel, conexoes) in raizes.items():
+            evento = criar_evento(eventos, topologia, chave, transmissor_id, nivel, conexoes, MOTIVO_EM_ANALISE)
+            novos_eventos.append((evento, intercalar(list(conexoes.values()))))
+
+        if clientes_reconectados:
+            logging.info(f"{len(clientes_reconectados)} clientes voltaram a ficar online.")
+        # Também resolve eventos esvaziados por logins que passaram a outro evento
+        for evento in eventos.reconectar(LOGINS.nome(login_id) for login_id in clientes_reconectados):
+            clientes_evento = [snapshot.cliente_por_login(l) for l in evento['logins_offline']]
+            send_telegram_alert(clientes_evento, status='online', conexao=evento['conexao'],
+                                evento_id=evento['id'], chave=f"{evento['id']}:online")
+            eventos.resolver(evento, Counter(cliente.get('conexao') for cliente in clientes_evento))
+
+    # Regravado enquanto houver transições na janela, para que logins que estabilizaram saiam do ranking
+    if instabilidade.recentes:
+        salvar_logins_instaveis([
+            (LOGINS.nome(login_id), conexao_instavel(snapshot, instabilidade, login_id), quedas, transicoes, ultima)
+            for login_id, quedas, transicoes, ultima in instabilidade.ranking(time.time(), FLAP_TOP)
+        ])
+
+    # Alertas do ciclo confirmados: acorda os workers de despacho
+    alertas_disponiveis.set()
+    for evento, clientes in novos_eventos:
+        agendar_diagnostico(evento, clientes)
+
+def conexao_instavel(snapshot, instabilidade, login_id):
+    """
+    Conexão de um login do ranking de instáveis: a do snapshot se ele ainda estiver nele
+    (a coluna não vale para logins removidos ou vindos só do RADIUS); senão, a registrada
+    na sua última transição.
+    """
+    if login_id in snapshot.online or login_id in snapshot.offline:
+        conexao_id = snapshot.conexao[login_id]
+    else:
+        conexao_id = instabilidade.conexao[login_id]
+    return CONEXOES.nome(conexao_id) if conexao_id >= 0 else 'Desconhecida'
+
+def agregar_no_transmissor(eventos, topologia, conexao, transmissor_id, agora):
+    """
+    Evento ativo ao qual a conexão deve ser agregada: o evento do transmissor ou, se
+    ainda não houver, um evento de outra conexão do mesmo transmissor aberto há menos de
+    OFFLINE_BURST_WINDOW segundos, que é promovido a evento do transmissor.
+    """
+    rotulo = rotulo_transmissor(transmissor_id)
+    evento = eventos.do_transmissor(rotulo)
+    if evento is None:
+        for outro in eventos:
+            outro_id = CONEXOES.ids.get(outro['conexao'])
+            if (outro.get('nivel', 'conexao') == 'conexao' and agora - outro['timestamp'] < OFFLINE_BURST_WINDOW
+                    and topologia.transmissor_da_conexao.get(outro_id) == transmissor_id):
+                logging.info(f"Evento {outro['id']} da conexão {outro['conexao']} promovido a evento do {rotulo}.")
+                outro.setdefault('conexoes', {outro['conexao']})
+                outro['transmissor'] = TRANSMISSORES.nome(transmissor_id)
+                eventos.promover(outro, rotulo)
+                evento = outro
+                break
+    if evento is not None:
+        eventos.adicionar_conexao(evento, conexao)
+    return evento
+
+def atualizar_evento(eventos, evento_existente, conexao, clientes):
+    novos_logins_nesta_conexao = set(cliente['login'] for cliente in clientes)
+    logging.info(f"Atualizando evento existente para conexão {conexao} com {len(novos_logins_nesta_conexao)} novos logins.")
 
-            clientes_offline_anterior = clientes_offline_atual
-            clientes_info_offline_anterior = clientes_info_offline_atual
+    eventos.adicionar_logins(evento_existente, novos_logins_nesta_conexao)
+    logging.info(f"Evento {evento_existente['id']} atualizado no banco de dados com novos logins.")
 
-            logging.info(f"Aguardando {CHECK_INTERVAL} segundos para a próxima verificação.")
-            time.sleep(CHECK_INTERVAL)
+    # Preparar informações para alertas atualizados
+    # Para o Telegram, idealmente todos os clientes offline do evento
+    # Recriar a lista de clientes para o alerta do Telegram pode ser complexo aqui
+    # Vamos enviar detalhes dos *novos* clientes por enquanto, e a contagem total na mensagem
+
+    mensagem_atualizacao_telegram = (
+        f"🚨 🔄 *Atualização*: Mais {len(novos_logins_nesta_conexao)} clientes offline detectados na conexão {conexao}. "
+        f"Total offline agora: {len(evento_existente['logins_restantes'])}."
+    )
+    if evento_existente.get('nivel') == 'transmissor':
+        mensagem_atualizacao_telegram += (
+            f"\nEvento do {evento_existente['conexao']}: {len(evento_existente['conexoes'])} conexões afetadas."
+        )
+    # Para send_telegram_alert, 'clientes' deve ser uma lista de dicts
+    # Usaremos os 'clientes' recém detectados para esta conexão específica
+    chave = f"{evento_existente['id']}:atualizacao:{len(evento_existente['logins_offline'])}"
+    send_telegram_alert(clientes, status='offline', conexao=conexao, mensagem_personalizada=mensagem_atualizacao_telegram,
+                        evento_id=evento_existente['id'], chave=chave)
+
+    # Para WhatsApp, apenas a contagem e um motivo genérico
+    send_whatsapp_alert(len(evento_existente['logins_restantes']), evento_existente['conexao'], "Atualização de evento",
+                        evento_id=evento_existente['id'], chave=chave)
+
+def criar_evento(eventos, topologia, chave, transmissor_id, nivel, conexoes, motivo):
+    """
+    Cria o evento de uma causa raiz: uma conexão (nivel 'conexao') ou várias do mesmo
+    transmissor (nivel 'transmissor'). transmissor_id é -1 se o transmissor for desconhecido.
+    """
+    clientes = [cliente for clientes_conexao in conexoes.values() for cliente in clientes_conexao]
+    logins = set(cliente['login'] for cliente in clientes)
+    evento = {
+        'id': str(uuid.uuid4()),
+        'conexao': chave,
+        'nivel': nivel,
+        'transmissor': TRANSMISSORES.nome(transmissor_id) if transmissor_id >= 0 else None,
+        'motivo': motivo,
+        'conexoes': set(conexoes),
+        'logins_offline': set(logins),
+        'logins_restantes': set(logins),
+        'timestamp': time.time()
+    }
+
+    eventos.criar(evento)
+    logging.info(f"Criado novo evento {evento['id']} para {chave} com {len(clientes)} logins offline.")
+
+    if nivel == 'conexao':
+        mensagem_alerta = f"🚨 *Alerta: {len(clientes)} clientes offline detectados na conexão {chave}.*\n"
+    else:
+        total_conexoes = len(topologia.conexoes_do_transmissor.get(transmissor_id, ())) or len(conexoes)
+        mensagem_alerta = (
+            f"🚨 *Alerta: {len(clientes)} clientes offline em {len(conexoes)} de {total_conexoes} "
+            f"conexões do {chave}.*\n"
+        )
+        for conexao, clientes_conexao in sorted(conexoes.items(), key=lambda item: -len(item[1])):
+            mensagem_alerta += f"• {conexao}: {len(clientes_conexao)}\n"
+    mensagem_alerta += f"Motivo da queda: {motivo.capitalize()}"
+    if motivo == MOTIVO_EM_ANALISE:
+        mensagem_alerta += " (o diagnóstico da OLT segue em outro alerta)"
+    send_telegram_alert(clientes, status='offline', conexao=chave, mensagem_personalizada=mensagem_alerta,
+                        evento_id=evento['id'], chave=f"{evento['id']}:offline")
+    send_whatsapp_alert(len(clientes), chave, motivo, evento_id=evento['id'], chave=f"{evento['id']}:offline")
+    return evento
+
+class CicloMonitor:
+    """
+    Estado do loop de monitoramento entre um ciclo e outro. A obtenção do snapshot e a
+    espera ficam com quem o executa: monitor_connections (threads) ou MotorAsyncio.
+    """
+
+    def __init__(self):
+        self.eventos = IndiceEventos(carregar_eventos_ativos())
+        self.detector = DetectorQuedas()
+        self.topologia = Topologia()
+        self.instabilidade = HistoricoTransicoes()
+        salvar_logins_instaveis([])  # O histórico de transições recomeça vazio a cada início do loop
+        self.snapshot_anterior = None
+        self.estado_delta = {'cursor': None, 'snapshot': None}
+        self.radius_recentes = {}
+        self.proxima_reconciliacao = 0
+        self.intervalo = RADIUS_CYCLE_INTERVAL if RADIUS_INGESTION else CHECK_INTERVAL
+
+    def iniciar_reconciliacao(self):
+        """True (e agenda a próxima) se este ciclo deve obter um snapshot novo do IXCSoft."""
+        if self.snapshot_anterior is not None and time.time() < self.proxima_reconciliacao:
+            return False
+        logging.info("Iniciando verificação de clientes.")
+        self.proxima_reconciliacao = time.time() + CHECK_INTERVAL
+        return True
+
+    def reconciliar(self, snapshot):
+        """
+        Processa o snapshot do IXCSoft (None se indisponível). Retorna a espera até o
+        próximo ciclo, ou None para seguir direto com os eventos do RADIUS.
+        """
+        if snapshot is None:
+            logging.warning(f"Snapshot indisponível; ciclo ignorado. Nova tentativa em {CHECK_INTERVAL} segundos.")
+            return CHECK_INTERVAL if self.snapshot_anterior is None or not RADIUS_INGESTION else None
+        if RADIUS_INGESTION:
+            reconciliar_radius(snapshot, self.radius_recentes)
+            aplicar_eventos_radius(snapshot, consumir_eventos_radius(), self.radius_recentes)
+        self.detector.atualizar_assinantes(snapshot)
+        self.topologia.atualizar(snapshot)
+        self.detector.limpar(time.time())
+        logging.info(
+            f"Snapshot: {len(snapshot.online)} online, {len(snapshot.offline)} offline. "
+            f"Pico de RSS: {pico_rss_mb():.1f} MB."
+        )
+        return self.processar(snapshot)
+
+    def aplicar_radius(self):
+        """Entre reconciliações, só os eventos do RADIUS sobre o último estado."""
+        eventos_radius = consumir_eventos_radius()
+        if not eventos_radius:
+            return self.intervalo
+        snapshot = self.snapshot_anterior.copia()
+        aplicados = aplicar_eventos_radius(snapshot, eventos_radius, self.radius_recentes)
+        logging.info(f"{len(eventos_radius)} eventos do RADIUS recebidos ({aplicados} de logins conhecidos).")
+        return self.processar(snapshot)
+
+    def processar(self, snapshot):
+        if self.snapshot_anterior is not None:
+            processar_ciclo(snapshot, self.snapshot_anterior.offline, self.eventos, self.detector,
+                            self.topologia, self.instabilidade)
+        else:
+            logging.info("Primeira execução: inicializando estados.")
+            retomar_diagnosticos(self.eventos, snapshot)
+        self.snapshot_anterior = snapshot
+        logging.info(f"Aguardando {self.intervalo} segundos para a próxima verificação.")
+        return self.intervalo
+
+def monitor_connections():
+    ciclo = CicloMonitor()
+    try:
+        while not parada.is_set():
+            if ciclo.iniciar_reconciliacao():
+                espera = ciclo.reconciliar(obter_snapshot(ciclo.estado_delta))
+            else:
+                espera = ciclo.aplicar_radius()
+            if espera is not None:
+                parada.wait(espera)
 
     except KeyboardInterrupt:
         logging.info("Monitoramento interrompido manualmente.")
 
+# --------------------------------------------------
+# Motor asyncio (MONITOR_ENGINE=asyncio)
+# --------------------------------------------------
+
+# Ativo no processo do loop quando MONITOR_ENGINE=asyncio; agendar_diagnostico o usa no lugar do pool
+motor_asyncio = None
+
+class MotorAsyncio:
+    """
+    Executa o loop de monitoramento num event loop: o snapshot, as consultas à OLT e o
+    envio dos alertas usam um único httpx.AsyncClient, com timeout por chamada e
+    concorrência limitada por ASYNC_OLT_CONCURRENCY e ASYNC_ALERT_CONCURRENCY. Tudo o
+    que usa o SQLite (o processamento do ciclo, a fila de alertas e a gravação dos
+    diagnósticos) roda em asyncio.to_thread, para a espera pelo banco não parar o event loop.
+    """
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.loop = asyncio.get_running_loop()
+        self.alertas = asyncio.Event()
+        self.acordar = asyncio.Event()
+        self.consultas_olt = asyncio.Semaphore(ASYNC_OLT_CONCURRENCY)
+        # Alertas reservados por reservar_alertas, à espera de um despachante livre
+        self.fila = asyncio.Queue(maxsize=1)
+        self.tarefas = set()
+
+    def parar(self):
+        """Chamado do tratador de sinal: acorda o loop e os despachantes para que saiam."""
+        self.loop.call_soon_threadsafe(self.acordar.set)
+        self.loop.call_soon_threadsafe(self.alertas.set)
+
+    async def aguardar(self, segundos):
+        try:
+            await asyncio.wait_for(self.acordar.wait(), segundos)
+        except asyncio.TimeoutError:
+            pass
+
+    async def obter_snapshot(self, estado_delta):
+        url = f"{IXCSOFT_SERVICE_URL}/clientes"
+        try:
+            if IXCSOFT_SYNC_MODE == 'delta':
+                cursor = estado_delta['cursor']
+                response = await self.cliente.get(f"{url}/delta", params={'since': cursor} if cursor else None,
+                                                  timeout=MONITOR_SNAPSHOT_TIMEOUT)
+                response.raise_for_status()
+                return aplicar_delta(estado_delta, response.json())
+            if IXCSOFT_STREAMING:
+                leitor = LeitorSnapshotStream()
+                async with self.cliente.stream('GET', f"{url}/snapshot", params={'stream': '1'},
+                                               timeout=MONITOR_SNAPSHOT_TIMEOUT) as response:
+                    response.raise_for_status()
+                    async for linha in response.aiter_lines():
+                        leitor.linha(linha)
+                return leitor.resultado()
+            response = await self.cliente.get(f"{url}/snapshot", timeout=MONITOR_SNAPSHOT_TIMEOUT)
+            response.raise_for_status()
+            return snapshot_do_json(response.json())
+        except Exception as e:
+            logging.error(f"Erro ao obter snapshot de clientes: {e!r}")
+            return None
+
+    def agendar(self, evento, clientes):
+        """Agenda o diagnóstico como tarefa do event loop. Chamado da thread do ciclo (to_thread)."""
+        self.loop.call_soon_threadsafe(self._criar_diagnostico, evento, clientes)
+
+    def _criar_diagnostico(self, evento, clientes):
+        tarefa = self.loop.create_task(self.diagnosticar(evento, evento['conexao'], clientes))
+        self.tarefas.add(tarefa)
+        tarefa.add_done_callback(self.tarefas.discard)
+
+    async def diagnosticar(self, evento, chave, clientes):
+        inicio = time.time()
+        consultas, motivos = montar_consultas_olt({chave: clientes})
+        if consultas:
+            try:
+                async with self.consultas_olt:
+                    response = await self.cliente.post(f"{OLT_SERVICE_URL}/consulta/olt/lote",
+                                                       json={"consultas": consultas}, timeout=OLT_CONSULT_TIMEOUT)
+                response.raise_for_status()
+                ler_resultados_olt(response.json(), motivos)
+            except Exception as e:
+                logging.error(f"Erro ao consultar OLT: {e!r}")
+        motivo = motivos.get(chave, "indeterminado")
+        pons = None
+        if enriquecer_pons(evento):
+            pons = await self.contar_pons(evento['transmissor'], [c['login'] for c in clientes])
+        try:
+            await asyncio.to_thread(aplicar_diagnostico, evento, motivo, clientes, pons)
+            logging.info(f"Diagnóstico do evento {evento['id']} ({chave}): {motivo} em {time.time() - inicio:.1f}s.")
+        except Exception as e:
+            logging.error(f"Erro ao gravar o diagnóstico do evento {evento['id']} ({chave}): {e}")
+        self.alertas.set()
+
+    async def contar_pons(self, id_transmissor, logins):
+        """Como contar_pons, pelo cliente httpx."""
+        try:
+            async with self.consultas_olt:
+                response = await self.cliente.post(f"{OLT_SERVICE_URL}/inventario/localizar",
+                                                   json={"logins": logins, "id_transmissor": id_transmissor}, timeout=30)
+            response.raise_for_status()
+            return pons_do_inventario(response.json())
+        except Exception as e:
+            logging.error(f"Erro ao localizar as PONs no olt_service: {e!r}")
+            return {}
+
+    async def reservar_alertas(self):
+        """
+        Único leitor da fila de alertas do SQLite: reserva os alertas prontos e os
+        entrega aos despachantes pela fila em memória. Também remove os alertas antigos.
+        """
+        ultima_limpeza = 0
+        while not parada.is_set():
+            agora = time.time()
+            # Limpo antes da consulta: um alerta enfileirado durante ela acorda a próxima
+            self.alertas.clear()
+            try:
+                if agora - ultima_limpeza > 3600:
+                    await asyncio.to_thread(remover_alertas_antigos, agora - ALERT_RETENTION_DAYS * 86400)
+                    ultima_limpeza = agora
+                alerta = await asyncio.to_thread(reservar_alerta, agora)
+            except sqlite3.Error as e:
+                logging.error(f"Erro ao reservar alerta: {e}")
+                alerta = None
+            if alerta is None:
+                try:
+                    await asyncio.wait_for(self.alertas.wait(), 1)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.fila.put(alerta)
+
+    async def despachar_alertas(self):
+        """Despachante: envia os alertas reservados por reservar_alertas, um por vez."""
+        while True:
+            alerta = await self.fila.get()
+            _, canal, payload, _ = alerta
+            try:
+                response = await self.cliente.post(f"{ALERT_SERVICE_URL}/alerta/{canal}", json=json.loads(payload),
+                                                   timeout=ALERT_TIMEOUT)
+                response.raise_for_status()
+                await asyncio.to_thread(registrar_envio, alerta, response.status_code)
+            except Exception as e:
+                await asyncio.to_thread(registrar_envio, alerta, erro=repr(e))
+            finally:
+                self.fila.task_done()
+            self.alertas.set()  # O próximo alerta do mesmo evento já pode sair
+
+    async def executar(self):
+        await asyncio.to_thread(recuperar_alertas_interrompidos)
+        reservas = asyncio.create_task(self.reservar_alertas())
+        despachantes = [asyncio.create_task(self.despachar_alertas()) for _ in range(ASYNC_ALERT_CONCURRENCY)]
+        ciclo = await asyncio.to_thread(CicloMonitor)
+        while not parada.is_set():
+            if ciclo.iniciar_reconciliacao():
+                snapshot = await self.obter_snapshot(ciclo.estado_delta)
+                espera = await asyncio.to_thread(ciclo.reconciliar, snapshot)
+            else:
+                espera = await asyncio.to_thread(ciclo.aplicar_radius)
+            self.alertas.set()
+            if espera is not None:
+                await self.aguardar(espera)
+
+        # Os alertas já reservados terminam (ou voltam para a fila) antes de sair; os que
+        # sobrarem como 'enviando' e os diagnósticos interrompidos ("em análise") são
+        # retomados na próxima inicialização
+        await reservas
+        try:
+            await asyncio.wait_for(self.fila.join(), ALERT_TIMEOUT + 5)
+        except asyncio.TimeoutError:
+            pass
+        for tarefa in list(self.tarefas) + despachantes:
+            tarefa.cancel()
+
+async def executar_motor_asyncio():
+    global motor_asyncio
+    import httpx  # Só necessário com MONITOR_ENGINE=asyncio
+    limites = httpx.Limits(max_connections=ASYNC_ALERT_CONCURRENCY + ASYNC_OLT_CONCURRENCY + 1)
+    async with httpx.AsyncClient(limits=limites) as cliente:
+        motor_asyncio = MotorAsyncio(cliente)
+        try:
+            await motor_asyncio.executar()
+        finally:
+            motor_asyncio = None
 
 # --------------------------------------------------
 # API REST para consultar eventos ativos
@@ -293,25 +1978,202 @@ def monitor_connections():
 
 app = Flask(__name__)
 
+class LeituraEventosAtivos:
+    """
+    Modelo de leitura de /eventos/ativos, um por processo da API: os eventos ativos já
+    formatados e ordenados, recarregados do banco só quando versao_eventos muda. As
+    respostas serializadas ficam guardadas pelo ETag (versão + consulta + eventos
+    selecionados), de modo que consultas repetidas não voltam a gerar o JSON.
+    """
+
+    def __init__(self, max_respostas=64):
+        self.lock = threading.Lock()
+        self.versao = None
+        self.eventos = []
+        self.respostas = {}
+        self.max_respostas = max_respostas
+
+    def atual(self):
+        versao = versao_eventos()
+        if versao != self.versao:
+            with self.lock:
+                if versao != self.versao:
+                    self.eventos = [
+                        {
+                            "id": evento["id"],
+                            "conexao": evento["conexao"],
+                            "transmissor": evento["transmissor"],
+                            "timestamp": evento["timestamp"],
+                            "status": evento["status"],
+                            "nivel": evento["nivel"],
+                            "motivo": evento["motivo"],
+                            "conexoes": sorted(evento["conexoes"]),
+                            "logins": sorted(evento["logins_offline"]),
+                            "logins_pendentes": len(evento["logins_restantes"]),
+                        }
+                        for evento in sorted(carregar_eventos_ativos(), key=lambda ev: ev["timestamp"])
+                    ]
+                    self.respostas = {}
+                    self.versao = versao
+        return self.versao, self.eventos
+
+    def resposta(self, etag, gerar):
+        corpo = self.respostas.get(etag)
+        if corpo is None:
+            corpo = gerar()
+            with self.lock:
+                if len(self.respostas) >= self.max_respostas:
+                    self.respostas.pop(next(iter(self.respostas)))
+                self.respostas[etag] = corpo
+        return corpo
+
+leitura_eventos_ativos = LeituraEventosAtivos()
+
+def resumo_evento(evento):
+    return {
+        "id": evento["id"],
+        "conexao": evento["conexao"],
+        "transmissor": evento["transmissor"],
+        "timestamp": evento["timestamp"],
+        "status": evento["status"],
+        "nivel": evento["nivel"],
+        "motivo": evento["motivo"],
+        "total_conexoes": len(evento["conexoes"]),
+        "total_logins": len(evento["logins"]),
+        "logins_pendentes": evento["logins_pendentes"],
+    }
+
 @app.route('/eventos/ativos', methods=['GET'])
 def get_eventos_ativos():
-    conn = sqlite3.connect("monitor_events.db")
-    c = conn.cursor()
-    c.execute("SELECT id, conexao, timestamp, status, logins FROM events WHERE status = 'ativo'")
-    eventos = c.fetchall()
-    conn.close()
+    """
+    Eventos ativos, do mais antigo ao mais recente. Parâmetros opcionais:
+      - conexao / transmissor: só os eventos que envolvem a conexão / o id_transmissor
+      - idade_min / idade_max: idade do evento, em segundos
+      - projecao=resumo: contagens no lugar das listas de logins e conexões
+      - pagina / por_pagina: paginação (por_pagina=0, o padrão, retorna todos)
+    Responde com ETag; um If-None-Match com o mesmo ETag recebe 304 sem corpo.
+    """
+    try:
+        idade_min = float(request.args.get('idade_min', 0))
+        idade_max = float(request.args['idade_max']) if 'idade_max' in request.args else None
+        pagina = max(1, int(request.args.get('pagina', 1)))
+        por_pagina = max(0, int(request.args.get('por_pagina', 0)))
+    except ValueError:
+        return jsonify({"error": "idade_min, idade_max, pagina e por_pagina devem ser numéricos."}), 400
+    conexao = request.args.get('conexao')
+    transmissor = request.args.get('transmissor')
+    resumo = request.args.get('projecao') == 'resumo'
 
-    eventos_formatados = []
-    for evento in eventos:
-        eventos_formatados.append({
-            "id": evento[0],
-            "conexao": evento[1],
-            "timestamp": evento[2],
-            "status": evento[3],
-            "logins": json.loads(evento[4])
-        })
+    versao, eventos = leitura_eventos_ativos.atual()
+    agora = time.time()
+    selecionados = [
+        evento for evento in eventos
+        if (conexao is None or conexao in evento["conexoes"])
+        and (transmissor is None or evento["transmissor"] == transmissor)
+        and agora - evento["timestamp"] >= idade_min
+        and (idade_max is None or agora - evento["timestamp"] <= idade_max)
+    ]
+    total = len(selecionados)
+    logins_offline = sum(len(evento["logins"]) for evento in selecionados) if resumo else None
+    if por_pagina:
+        selecionados = selecionados[(pagina - 1) * por_pagina:pagina * por_pagina]
 
-    return jsonify({"eventos_ativos": eventos_formatados})
+    # Os filtros de idade dependem do relógio: o ETag inclui os eventos selecionados
+    chave = (conexao, transmissor, resumo, pagina, por_pagina, total, tuple(evento["id"] for evento in selecionados))
+    etag = f"{versao}-{zlib.crc32(repr(chave).encode()):08x}"
+    if request.if_none_match.contains(etag):
+        resposta = app.response_class(status=304)
+    else:
+        def gerar():
+            dados = {
+                "versao": versao,
+                "total": total,
+                "eventos_ativos": [resumo_evento(evento) for evento in selecionados] if resumo else selecionados,
+            }
+            if por_pagina:
+                dados.update({"pagina": pagina, "por_pagina": por_pagina})
+            if resumo:
+                dados["logins_offline"] = logins_offline
+            return json.dumps(dados, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        resposta = app.response_class(leitura_eventos_ativos.resposta(etag, gerar), mimetype='application/json')
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+@app.route('/radius/eventos', methods=['POST'])
+def receber_eventos_radius():
+    """
+    Recebe do radius_service {"eventos": [{"login", "status": "online"|"offline", "timestamp"}]}
+    e os grava na caixa de entrada; o loop os aplica no próximo ciclo curto.
+    """
+    if not RADIUS_INGESTION:
+        return jsonify({"error": "Ingestão de eventos RADIUS desativada (RADIUS_INGESTION)."}), 503
+    data = request.get_json(silent=True) or {}
+    eventos = [
+        (evento['login'], evento.get('status') == 'online', evento.get('timestamp') or time.time())
+        for evento in data.get('eventos', []) if evento.get('login')
+    ]
+    enfileirar_eventos_radius(eventos)
+    return jsonify({"recebidos": len(eventos)}), 202
+
+@app.route('/eventos/login/<login>', methods=['GET'])
+def get_eventos_do_login(login):
+    return jsonify({"login": login, "eventos": eventos_do_login(login)})
+
+@app.route('/logins/flapping', methods=['GET'])
+def get_logins_flapping():
+    """
+    Logins com mais quedas nos últimos FLAP_WINDOW segundos, segundo o último ciclo do
+    loop. `suprimido` indica que as quedas do login não contam para queda em massa.
+    Parâmetros opcionais: conexao e limite (padrão 50).
+    """
+    try:
+        limite = min(int(request.args.get('limite', 50)), FLAP_TOP)
+    except ValueError:
+        return jsonify({"error": "limite deve ser numérico."}), 400
+    logins = carregar_logins_instaveis(limite, request.args.get('conexao'))
+    for login in logins:
+        login["suprimido"] = bool(FLAP_MIN_QUEDAS) and login["quedas"] >= FLAP_MIN_QUEDAS
+    return jsonify({"janela": FLAP_WINDOW, "min_quedas": FLAP_MIN_QUEDAS, "logins": logins})
+
+def periodo_historico():
+    """Dias `desde` e `ate` (YYYY-MM-DD) da consulta; por padrão, os últimos 30 dias."""
+    ate = request.args.get('ate') or time.strftime('%Y-%m-%d')
+    desde = request.args.get('desde') or time.strftime('%Y-%m-%d', time.localtime(time.mktime(time.strptime(ate, '%Y-%m-%d')) - 29 * 86400))
+    for dia in (desde, ate):
+        time.strptime(dia, '%Y-%m-%d')
+    return desde, ate
+
+@app.route('/historico/<dimensao>', methods=['GET'])
+def get_ranking_historico(dimensao):
+    """
+    Conexões ou transmissores com eventos resolvidos no período, ordenados por `ordem`
+    (eventos, logins ou mttr; decrescente) e limitados a `limite` (padrão 20).
+    """
+    if dimensao not in ('conexao', 'transmissor'):
+        return jsonify({"error": "Dimensão deve ser 'conexao' ou 'transmissor'."}), 404
+    ordem = request.args.get('ordem', 'eventos')
+    if ordem not in ('eventos', 'logins', 'mttr'):
+        return jsonify({"error": "ordem deve ser eventos, logins ou mttr."}), 400
+    try:
+        desde, ate = periodo_historico()
+        limite = int(request.args.get('limite', 20))
+    except ValueError:
+        return jsonify({"error": "Use datas YYYY-MM-DD em desde/ate e um número em limite."}), 400
+    ranking = sorted(ranking_historico(dimensao, desde, ate), key=lambda item: item[ordem] or 0, reverse=True)
+    return jsonify({"dimensao": dimensao, "desde": desde, "ate": ate, "ordem": ordem, "ranking": ranking[:limite]})
+
+@app.route('/historico/<dimensao>/<path:chave>', methods=['GET'])
+def get_historico(dimensao, chave):
+    """Totais (eventos, logins, MTTR, percentis de duração, motivos) e série diária de uma conexão ou transmissor."""
+    if dimensao not in ('conexao', 'transmissor'):
+        return jsonify({"error": "Dimensão deve ser 'conexao' ou 'transmissor'."}), 404
+    try:
+        desde, ate = periodo_historico()
+    except ValueError:
+        return jsonify({"error": "Use datas YYYY-MM-DD em desde/ate."}), 400
+    total, dias = historico_da_chave(dimensao, chave, desde, ate)
+    return jsonify({"dimensao": dimensao, "chave": chave, "desde": desde, "ate": ate, "total": total, "dias": dias})
 
 
 # --------------------------------------------------
@@ -319,15 +2181,49 @@ def get_eventos_ativos():
 # --------------------------------------------------
 
 def start_monitoring():
+    if MONITOR_ENGINE == 'asyncio':
+        asyncio.run(executar_motor_asyncio())
+        return
+    iniciar_despacho_alertas()
     monitor_connections()
 
+def executar_loop():
+    """
+    Processo dedicado ao loop de monitoramento e ao despacho de alertas (`--loop`).
+    Em produção a API roda à parte no gunicorn, com quantos workers for preciso,
+    e este processo é o único que detecta quedas e envia alertas.
+    """
+    def parar(signum, frame):
+        logging.info(f"Sinal {signal.Signals(signum).name} recebido; encerrando após o ciclo atual.")
+        parada.set()
+        alertas_disponiveis.set()
+        if motor_asyncio is not None:
+            motor_asyncio.parar()
+
+    signal.signal(signal.SIGTERM, parar)
+    signal.signal(signal.SIGINT, parar)
+    init_db()
+    logging.info(f"Iniciando o loop de monitoramento de conexões (motor {MONITOR_ENGINE}).")
+    if MONITOR_ENGINE == 'asyncio':
+        asyncio.run(executar_motor_asyncio())
+        logging.info("Loop de monitoramento encerrado.")
+        return
+    workers = iniciar_despacho_alertas()
+    monitor_connections()
+    # Um alerta em envio termina (ou volta para a fila) antes de o processo sair
+    for worker in workers:
+        worker.join(timeout=ALERT_TIMEOUT + 5)
+    # Diagnósticos não iniciados ficam "em análise" e são retomados na próxima inicialização
+    diagnosticos.shutdown(wait=False, cancel_futures=True)
+    logging.info("Loop de monitoramento encerrado.")
+
 if __name__ == '__main__':
+    if '--loop' in sys.argv:
+        executar_loop()
+        sys.exit(0)
+
+    # Desenvolvimento: loop numa thread e a API no servidor do Flask, num único processo
     init_db()
     logging.info("Iniciando o serviço de monitoramento de conexões.")
-    
-    # Garante que monitor_connections só roda no processo principal
-    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-        monitor_thread = threading.Thread(target=start_monitoring, daemon=True)
-        monitor_thread.start()
-    
-    app.run(host='0.0.0.0', port=5010, debug=True)
+    threading.Thread(target=start_monitoring, daemon=True).start()
+    app.run(host='0.0.0.0', port=5010)
@@ -1,419 +1,1443 @@
 import unittest
-from unittest.mock import patch, MagicMock, call, ANY
-import time
-import uuid
+from unittest.mock import MagicMock, patch
+import asyncio
+from collections import Counter
 import json
-import sys
 import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import httpx
 
 # Ensure the service module can be imported
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import monitor_service
 
-from monitor_service import monitor_service
 
-class TestMonitorService(unittest.TestCase):
+class BancoTemporario(unittest.TestCase):
+    """Cada teste usa um banco SQLite novo, num diretório temporário."""
+
+    iniciar_banco = True
 
     def setUp(self):
-        # Reset global states or configurations if necessary
-        monitor_service.eventos_ativos = []
-        monitor_service.THRESHOLD_OFFLINE_CLIENTS = 2 # Lower for easier testing
-        
-        # Mock external services and time
-        self.mock_requests_get = patch('requests.get').start()
-        self.mock_requests_post = patch('requests.post').start()
-        self.mock_time = patch('time.time').start()
-        self.mock_uuid = patch('uuid.uuid4').start()
-        self.mock_sleep = patch('time.sleep').start() # To prevent actual sleeping
-
-        # Mock database
-        self.mock_sqlite_connect = patch('sqlite3.connect').start()
-        self.mock_conn = MagicMock()
-        self.mock_cursor = MagicMock()
-        self.mock_sqlite_connect.return_value = self.mock_conn
-        self.mock_conn.cursor.return_value = self.mock_cursor
-        
-        # Default mock values
-        self.mock_time.return_value = 1000.0
-        self.mock_uuid.return_value = uuid.UUID('12345678-1234-5678-1234-567812345678')
-        self.mock_requests_get.return_value.json.return_value = {'clientes': []} # Default to no clients
-        self.mock_requests_post.return_value.json.return_value = {"motivo_final": "mock_olt_reason"}
-        self.mock_requests_post.return_value.raise_for_status = MagicMock()
-
-        # Initialize DB (in-memory for tests if not already handled by mocks)
-        # monitor_service.init_db() # This would use the mocked connect
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.fechar_conexao()
+        patch.object(monitor_service, 'DB_PATH', os.path.join(self.diretorio.name, 'monitor.db')).start()
+        if self.iniciar_banco:
+            monitor_service.init_db()
 
     def tearDown(self):
         patch.stopall()
+        self.fechar_conexao()
+        self.diretorio.cleanup()
 
-    def _run_monitor_cycle(self, num_cycles=1):
-        """Helper to run the monitor_connections loop a few times."""
-        # This is tricky because of the while True loop.
-        # We'll make time.sleep raise an exception after N calls to break the loop.
-        side_effects = [None] * num_cycles + [KeyboardInterrupt] 
-        self.mock_sleep.side_effect = side_effects
-        try:
-            monitor_service.monitor_connections()
-        except KeyboardInterrupt:
-            pass # Expected way to stop the loop in this test setup
+    def fechar_conexao(self):
+        conn = getattr(monitor_service._db_local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        monitor_service._db_local.conn = None
 
-    def _get_mock_clients(self, logins, conexao_name="CONEXAO_A", id_transmissor="OLT1"):
-        return [{'login': l, 'conexao': conexao_name, 'id_transmissor': id_transmissor} for l in logins]
+    def consultar(self, sql, parametros=()):
+        return monitor_service.get_db().execute(sql, parametros).fetchall()
 
-    # 1. New Event Creation
-    def test_new_event_creation(self):
-        self.mock_time.return_value = 1000.0
-        event_id = uuid.UUID('11111111-1111-1111-1111-111111111111')
-        self.mock_uuid.return_value = event_id
-
-        offline_clients_data = self._get_mock_clients(['client1', 'client2', 'client3'], conexao_name="CONEXAO_NEW")
-        
-        # First cycle: no clients (initial state)
-        # Second cycle: clients go offline
-        self.mock_requests_get.side_effect = [
-            MagicMock(json=MagicMock(return_value={'clientes': []})), # online clients (empty)
-            MagicMock(json=MagicMock(return_value={'clientes': []})), # offline clients (empty) - initial state
-            MagicMock(json=MagicMock(return_value={'clientes': []})), # online clients (empty) 
-            MagicMock(json=MagicMock(return_value={'clientes': offline_clients_data})), # offline clients
-        ]
+    def alertas(self, canal=None):
+        """Alertas enfileirados: [(canal, chave, payload)] na ordem de inserção."""
+        linhas = self.consultar("SELECT canal, chave, payload FROM alertas ORDER BY id")
+        return [(c, chave, json.loads(payload)) for c, chave, payload in linhas if canal in (None, c)]
 
-        self._run_monitor_cycle(num_cycles=2)
 
-        # Verify save_event call for the new event
-        expected_event_data = {
-            'id': str(event_id),
-            'conexao': 'CONEXAO_NEW',
-            'logins_offline': {'client1', 'client2', 'client3'},
-            'logins_restantes': {'client1', 'client2', 'client3'},
-            'timestamp': 1000.0 
-        }
-        # The actual call to save_event includes the event object and status
-        # We need to ensure the first argument to save_event matches our expected_event_data structure
-        args, kwargs = self.mock_cursor.execute.call_args_list[-1] # Assuming last execute is the save
-        
-        # Example: INSERT OR REPLACE INTO events (id, conexao, timestamp, status, logins) VALUES (?, ?, ?, ?, ?)
-        # args[1] would be the tuple of values
-        saved_values = args[1]
-        self.assertEqual(saved_values[0], str(event_id))
-        self.assertEqual(saved_values[1], 'CONEXAO_NEW')
-        self.assertEqual(saved_values[2], 1000.0) # Timestamp
-        self.assertEqual(saved_values[3], "ativo") # Status
-        self.assertEqual(set(json.loads(saved_values[4])), {'client1', 'client2', 'client3'})
-
-
-        # Verify alerts
-        self.mock_requests_post.assert_any_call(
-            f"{monitor_service.ALERT_SERVICE_URL}/alerta/telegram",
-            json={
-                'clientes': offline_clients_data, 
-                'status': 'offline', 
-                'conexao': 'CONEXAO_NEW',
-                'mensagem_personalizada': ANY # Check for specific message if important
-            }
+class TestMonitorService(BancoTemporario):
+
+    def setUp(self):
+        super().setUp()
+        patch.object(monitor_service, 'THRESHOLD_OFFLINE_CLIENTS', 2).start()  # Lower for easier testing
+        patch.object(monitor_service, 'CHECK_INTERVAL', 0).start()  # Every cycle is a reconciliation
+        patch.object(monitor_service, 'RADIUS_INGESTION', False).start()
+        self.mock_get_snapshot = patch.object(monitor_service, 'get_snapshot').start()
+        self.mock_wait = patch.object(monitor_service.parada, 'wait').start()
+        self.mock_agendar_diagnostico = patch.object(monitor_service, 'agendar_diagnostico').start()
+
+    def _run_monitor_cycle(self, *snapshots):
+        """Runs monitor_connections over the given snapshots; the wait after the last one stops the loop."""
+        self.mock_get_snapshot.side_effect = list(snapshots)
+        self.mock_wait.side_effect = [None] * (len(snapshots) - 1) + [KeyboardInterrupt]
+        monitor_service.monitor_connections()
+
+    def _snapshot(self, offline=(), online=(), conexao_name="CONEXAO_A", id_transmissor="OLT1"):
+        snapshot = monitor_service.SnapshotClientes()
+        for logins, status in ((offline, False), (online, True)):
+            for login in logins:
+                snapshot.adicionar(login, conexao_name, id_transmissor, None, status)
+        return snapshot
+
+    def _eventos(self, status='ativo'):
+        linhas = self.consultar(
+            "SELECT id, conexao, timestamp FROM events WHERE status = ? ORDER BY timestamp", (status,)
         )
-        self.mock_requests_post.assert_any_call(
-            f"{monitor_service.ALERT_SERVICE_URL}/alerta/whatsapp",
-            json={
-                'total_clientes': 3, 
-                'conexao': 'CONEXAO_NEW', 
-                'motivo': 'mock_olt_reason'
-            }
+        return [(event_id, conexao, timestamp, self._logins_do_evento(event_id)) for event_id, conexao, timestamp in linhas]
+
+    def _logins_do_evento(self, event_id):
+        return {login for (login,) in self.consultar("SELECT login FROM event_logins WHERE event_id = ?", (event_id,))}
+
+    def _alertas_telegram(self):
+        return [payload for _, _, payload in self.alertas('telegram')]
+
+    # 1. New Event Creation
+    def test_new_event_creation(self):
+        logins = ['client1', 'client2', 'client3']
+
+        # The loop only compares cycles once it has seen an offline client
+        self._run_monitor_cycle(
+            self._snapshot(offline=['offline_antes'], online=logins, conexao_name="CONEXAO_NEW"),
+            self._snapshot(offline=['offline_antes'] + logins, conexao_name="CONEXAO_NEW"),
         )
-        self.assertEqual(len(monitor_service.eventos_ativos), 1)
-        self.assertEqual(monitor_service.eventos_ativos[0]['id'], str(event_id))
 
+        (event_id, conexao, _, logins_evento), = self._eventos()
+        self.assertEqual(conexao, "CONEXAO_NEW")
+        self.assertEqual(logins_evento, set(logins))
+
+        self.assertEqual(self.consultar("SELECT motivo FROM events"), [(monitor_service.MOTIVO_EM_ANALISE,)])
+
+        # Alerts go out right away; the OLT diagnosis is scheduled after the commit
+        (_, chave, telegram), = self.alertas('telegram')
+        self.assertEqual(chave, f"{event_id}:offline:telegram")
+        self.assertEqual(telegram['status'], 'offline')
+        self.assertEqual(telegram['conexao'], 'CONEXAO_NEW')
+        self.assertEqual({c['login'] for c in telegram['clientes']}, set(logins))
+        self.assertIn("Motivo da queda: Em análise", telegram['mensagem_personalizada'])
+        (_, _, whatsapp), = self.alertas('whatsapp')
+        self.assertEqual(whatsapp, {'total_clientes': 3, 'conexao': 'CONEXAO_NEW', 'motivo': monitor_service.MOTIVO_EM_ANALISE})
+        evento, clientes = self.mock_agendar_diagnostico.call_args.args
+        self.assertEqual(evento['id'], event_id)
+        self.assertEqual({c['login'] for c in clientes}, set(logins))
 
     # 2. Adding Clients to Existing Event & 3. Event Timestamp Preservation
     def test_adding_clients_to_existing_event_and_timestamp_preservation(self):
-        initial_timestamp = 1000.0
-        self.mock_time.return_value = initial_timestamp # Initial event creation time
-        
-        existing_event_id = uuid.UUID('22222222-2222-2222-2222-222222222222')
-        self.mock_uuid.return_value = existing_event_id
-
-        initial_offline_clients = self._get_mock_clients(['clientA', 'clientB'], conexao_name="CONEXAO_EXISTING")
-        
-        # Simulate initial event creation in DB and memory
-        monitor_service.eventos_ativos = [{
-            'id': str(existing_event_id),
-            'conexao': 'CONEXAO_EXISTING',
-            'logins_offline': {'clientA', 'clientB'},
-            'logins_restantes': {'clientA', 'clientB'},
-            'timestamp': initial_timestamp
-        }]
-        # Mock DB to show this event as active
-        self.mock_cursor.fetchone.return_value = (1,) # For existe_evento_ativo_para_conexao
-        # Mock carregar_eventos_ativos to load this event (though we set it directly for simplicity here)
-        self.mock_cursor.fetchall.return_value = [
-            (str(existing_event_id), "CONEXAO_EXISTING", initial_timestamp, "ativo", json.dumps(['clientA', 'clientB']))
-        ]
+        todos = ['clientA', 'clientB', 'clientC', 'clientD']
+        self._run_monitor_cycle(
+            self._snapshot(offline=['offline_antes'], online=todos, conexao_name="CONEXAO_EXISTING"),
+            self._snapshot(offline=['offline_antes'] + todos[:2], online=todos[2:], conexao_name="CONEXAO_EXISTING"),
+        )
+        (event_id, _, initial_timestamp, _), = self._eventos()
 
+        # The loop restarts (the event is loaded from the database) and two more clients go offline
+        self._run_monitor_cycle(
+            self._snapshot(offline=todos[:2], online=todos[2:], conexao_name="CONEXAO_EXISTING"),
+            self._snapshot(offline=todos, conexao_name="CONEXAO_EXISTING"),
+        )
 
-        # New clients going offline for the SAME connection
-        newly_offline_clients_data = self._get_mock_clients(['clientC', 'clientD'], conexao_name="CONEXAO_EXISTING")
-
-        # Simulate time passing for the update
-        update_time = 1500.0
-        self.mock_time.return_value = update_time
-
-        # API calls:
-        # 1. Initial load (empty previous state)
-        #    - get_clients('offline') -> []
-        #    - get_clients('online') -> []
-        # 2. Cycle where new clients appear
-        #    - get_clients('offline') -> initial_offline_clients + newly_offline_clients_data
-        #    - get_clients('online') -> []
-        
-        # We need to adjust mock_requests_get for the sequence of calls in monitor_connections
-        # Setup initial state (clientes_offline_anterior)
-        monitor_service.clientes_offline_anterior = {'clientA', 'clientB'}
-        monitor_service.clientes_info_offline_anterior = {
-            'clientA': initial_offline_clients[0],
-            'clientB': initial_offline_clients[1]
-        }
-        
-        all_offline_now = initial_offline_clients + newly_offline_clients_data
-        self.mock_requests_get.side_effect = [
-            MagicMock(json=MagicMock(return_value={'clientes': all_offline_now })), # offline clients
-            MagicMock(json=MagicMock(return_value={'clientes': []})), # online clients
-        ]
-        
-        # We also need existe_evento_ativo_para_conexao to return True for "CONEXAO_EXISTING"
-        # This is tricky because existe_evento_ativo_para_conexao is called with its own DB connection
-        # For now, let's assume the global `eventos_ativos` is primarily used after initial load,
-        # or we mock `existe_evento_ativo_para_conexao` directly.
-        with patch('monitor_service.monitor_service.existe_evento_ativo_para_conexao') as mock_existe_evento:
-            mock_existe_evento.return_value = True # For "CONEXAO_EXISTING"
-
-            self._run_monitor_cycle(num_cycles=1) # Run one cycle for the update
-
-            # Verify save_event was called with existing ID, updated logins, ORIGINAL timestamp
-            # The last call to execute on the cursor should be the save_event for the update
-            args, _ = self.mock_cursor.execute.call_args_list[-1]
-            saved_values = args[1] # Tuple of values from INSERT OR REPLACE
-
-            self.assertEqual(saved_values[0], str(existing_event_id)) # Existing ID
-            self.assertEqual(saved_values[1], "CONEXAO_EXISTING")
-            self.assertEqual(saved_values[2], initial_timestamp) # CRUCIAL: Original timestamp
-            self.assertEqual(saved_values[3], "ativo") # Status
-            self.assertEqual(set(json.loads(saved_values[4])), {'clientA', 'clientB', 'clientC', 'clientD'}) # Updated logins
-
-            # Verify in-memory event is updated
-            self.assertEqual(len(monitor_service.eventos_ativos), 1)
-            updated_event_in_memory = monitor_service.eventos_ativos[0]
-            self.assertEqual(updated_event_in_memory['id'], str(existing_event_id))
-            self.assertEqual(updated_event_in_memory['logins_offline'], {'clientA', 'clientB', 'clientC', 'clientD'})
-            self.assertEqual(updated_event_in_memory['logins_restantes'], {'clientA', 'clientB', 'clientC', 'clientD'})
-            self.assertEqual(updated_event_in_memory['timestamp'], initial_timestamp)
-
-            # Verify alerts for update
-            expected_telegram_message = (
-                f"เพิ่มเติม {len(newly_offline_clients_data)} clientes offline detectados na conexão CONEXAO_EXISTING. "
-                f"Total offline agora: {len(updated_event_in_memory['logins_restantes'])}."
-            )
-            self.mock_requests_post.assert_any_call(
-                f"{monitor_service.ALERT_SERVICE_URL}/alerta/telegram",
-                json={
-                    'clientes': newly_offline_clients_data, # Only new clients in this alert
-                    'status': 'offline', 
-                    'conexao': 'CONEXAO_EXISTING',
-                    'mensagem_personalizada': expected_telegram_message
-                }
-            )
-            self.mock_requests_post.assert_any_call(
-                f"{monitor_service.ALERT_SERVICE_URL}/alerta/whatsapp",
-                json={
-                    'total_clientes': 4, 
-                    'conexao': 'CONEXAO_EXISTING', 
-                    'motivo': "Atualização de evento"
-                }
-            )
+        (updated_id, _, timestamp, logins_evento), = self._eventos()
+        self.assertEqual(updated_id, event_id)
+        self.assertEqual(timestamp, initial_timestamp)  # CRUCIAL: Original timestamp
+        self.assertEqual(logins_evento, set(todos))
+
+        _, (_, chave, atualizacao) = self.alertas('telegram')
+        self.assertEqual(chave, f"{event_id}:atualizacao:4:telegram")
+        self.assertEqual({c['login'] for c in atualizacao['clientes']}, {'clientC', 'clientD'})  # Only new clients
+        self.assertIn("Mais 2 clientes offline", atualizacao['mensagem_personalizada'])
+        self.assertIn("Total offline agora: 4", atualizacao['mensagem_personalizada'])
+        _, (_, _, whatsapp) = self.alertas('whatsapp')
+        self.assertEqual(whatsapp, {'total_clientes': 4, 'conexao': 'CONEXAO_EXISTING', 'motivo': "Atualização de evento"})
 
     # 4. Event Resolution with Incremental Additions
-    @patch('monitor_service.monitor_service.update_event_status') # Mock this specific DB function
-    def test_event_resolution_after_incremental_additions(self, mock_update_event_status):
-        initial_timestamp = 2000.0
-        self.mock_time.return_value = initial_timestamp
-        event_id = uuid.UUID('33333333-3333-3333-3333-333333333333')
-        self.mock_uuid.return_value = event_id
-        conexao_name = "CONEXAO_RESOLVE"
-
-        # Phase 1: Initial clients go offline
-        clients_batch1_data = self._get_mock_clients(['user1', 'user2'], conexao_name=conexao_name)
-        monitor_service.clientes_offline_anterior = set()
-        monitor_service.clientes_info_offline_anterior = {}
-        
-        self.mock_requests_get.side_effect = [
-            MagicMock(json=MagicMock(return_value={'clientes': clients_batch1_data})), # offline
-            MagicMock(json=MagicMock(return_value={'clientes': []})), # online
-        ]
-        with patch('monitor_service.monitor_service.existe_evento_ativo_para_conexao', return_value=False):
-             self._run_monitor_cycle(num_cycles=1)
-        
-        self.assertEqual(len(monitor_service.eventos_ativos), 1)
-        created_event = monitor_service.eventos_ativos[0]
-        self.assertEqual(created_event['logins_offline'], {'user1', 'user2'})
-
-        # Phase 2: More clients go offline on the same connection
-        clients_batch2_data = self._get_mock_clients(['user3'], conexao_name=conexao_name)
-        monitor_service.clientes_offline_anterior = {'user1', 'user2'} # State after phase 1
-        monitor_service.clientes_info_offline_anterior = {
-            'user1': clients_batch1_data[0], 'user2': clients_batch1_data[1]
-        }
-        
-        all_currently_offline = clients_batch1_data + clients_batch2_data
-        self.mock_requests_get.side_effect = [
-            MagicMock(json=MagicMock(return_value={'clientes': all_currently_offline})), # offline
-            MagicMock(json=MagicMock(return_value={'clientes': []})), # online
-        ]
-        with patch('monitor_service.monitor_service.existe_evento_ativo_para_conexao', return_value=True):
-            self._run_monitor_cycle(num_cycles=1)
-
-        self.assertEqual(len(monitor_service.eventos_ativos), 1)
-        updated_event = monitor_service.eventos_ativos[0]
-        self.assertEqual(updated_event['logins_offline'], {'user1', 'user2', 'user3'})
-        self.assertEqual(updated_event['logins_restantes'], {'user1', 'user2', 'user3'})
-
-        # Phase 3: All clients come back online
-        monitor_service.clientes_offline_anterior = {'user1', 'user2', 'user3'}
-        monitor_service.clientes_info_offline_anterior = { # Simulate info for all of them
-             'user1': all_currently_offline[0], 'user2': all_currently_offline[1], 'user3': all_currently_offline[2]
-        }
-        # Now, offline clients are empty, online clients contain the resolved ones
-        self.mock_requests_get.side_effect = [
-            MagicMock(json=MagicMock(return_value={'clientes': []})), # offline (all resolved)
-            MagicMock(json=MagicMock(return_value={'clientes': all_currently_offline})), # online
+    def test_event_resolution_after_incremental_additions(self):
+        todos = ['user1', 'user2', 'user3', 'user4']
+
+        self._run_monitor_cycle(
+            self._snapshot(offline=['offline_antes'], online=todos, conexao_name="CONEXAO_RESOLVE"),
+            self._snapshot(offline=['offline_antes'] + todos[:2], online=todos[2:], conexao_name="CONEXAO_RESOLVE"),
+            self._snapshot(offline=['offline_antes'] + todos, conexao_name="CONEXAO_RESOLVE"),
+            self._snapshot(offline=['offline_antes'], online=todos, conexao_name="CONEXAO_RESOLVE"),
+        )
+
+        self.assertEqual(self._eventos(), [])
+        (event_id, _, _, logins_evento), = self._eventos('resolvido')
+        self.assertEqual(logins_evento, set(todos))
+        # Every login of the resolved event has its reconnection time recorded
+        self.assertEqual(
+            self.consultar("SELECT COUNT(*) FROM event_logins WHERE event_id = ? AND online_at IS NULL", (event_id,)),
+            [(0,)]
+        )
+
+        # The "online" alert lists every client of the event
+        _, chave, online = self.alertas('telegram')[-1]
+        self.assertEqual(chave, f"{event_id}:online:telegram")
+        self.assertEqual(online['status'], 'online')
+        self.assertEqual(online['conexao'], 'CONEXAO_RESOLVE')
+        self.assertEqual({c['login'] for c in online['clientes']}, set(todos))
+
+    # 4b. A failed snapshot is skipped, not read as a mass reconnection
+    def test_failed_snapshot_is_skipped(self):
+        logins = ['down1', 'down2']
+
+        self._run_monitor_cycle(
+            self._snapshot(online=logins, offline=['offline_antes'], conexao_name="CONEXAO_SKIP"),
+            self._snapshot(offline=['offline_antes'] + logins, conexao_name="CONEXAO_SKIP"),
+            None,
+            self._snapshot(offline=['offline_antes'] + logins, conexao_name="CONEXAO_SKIP"),
+        )
+
+        (_, _, _, logins_evento), = self._eventos()
+        self.assertEqual(logins_evento, set(logins))
+        self.assertEqual([alerta['status'] for alerta in self._alertas_telegram()], ['offline'])
+
+    # 4c. Delta sync keeps a local copy of the clients and sends the cursor back
+    def test_delta_sync_applies_changes_to_the_local_copy(self):
+        patch.object(monitor_service, 'IXCSOFT_SYNC_MODE', 'delta').start()
+        mock_get_delta = patch.object(monitor_service, 'get_delta').start()
+
+        def cliente(login, online):
+            return {'login': login, 'conexao': 'CONEXAO_DELTA', 'id_transmissor': 'OLT1', 'online': online}
+
+        mock_get_delta.side_effect = [
+            {'cursor': 'g1:1', 'completo': True, 'removidos': [],
+             'alterados': [cliente('offline_antes', 'N'), cliente('d1', 'S'), cliente('d2', 'S')]},
+            {'cursor': 'g1:2', 'completo': False, 'removidos': [],
+             'alterados': [cliente('d1', 'N'), cliente('d2', 'N')]},
         ]
-        self._run_monitor_cycle(num_cycles=1)
-
-        # Verify event is resolved and removed
-        self.assertEqual(len(monitor_service.eventos_ativos), 0)
-        mock_update_event_status.assert_called_once_with(str(event_id), "resolvido")
-
-        # Verify "online" alert
-        self.mock_requests_post.assert_any_call(
-            f"{monitor_service.ALERT_SERVICE_URL}/alerta/telegram",
-            json={
-                'clientes': ANY, # Should be a list of dicts for user1, user2, user3
-                'status': 'online', 
-                'conexao': conexao_name,
-                'mensagem_personalizada': None
-            }
+        self.mock_wait.side_effect = [None, KeyboardInterrupt]
+
+        monitor_service.monitor_connections()
+
+        self.assertEqual([chamada.args[0] for chamada in mock_get_delta.call_args_list], [None, 'g1:1'])
+        (_, conexao, _, logins_evento), = self._eventos()
+        self.assertEqual(conexao, 'CONEXAO_DELTA')
+        self.assertEqual(logins_evento, {'d1', 'd2'})
+
+    # 4d. Outage on several connections of the same transmissor
+    def test_transmissor_rollup_creates_a_single_event(self):
+        patch.object(monitor_service, 'TOPOLOGY_PON_ENRICH', True).start()
+        mock_contar_pons = patch.object(monitor_service, 'contar_pons').start()
+        online = self._snapshot(online=['t1', 't2'], conexao_name="CONEXAO_T1", id_transmissor="7")
+        offline = self._snapshot(offline=['t1', 't2'], conexao_name="CONEXAO_T1", id_transmissor="7")
+        for snapshot, status in ((online, True), (offline, False)):
+            for login in ('t3', 't4'):
+                snapshot.adicionar(login, "CONEXAO_T2", "7", None, status)
+
+        self._run_monitor_cycle(online, offline)
+
+        (event_id, conexao, _, logins_evento), = self._eventos()
+        self.assertEqual(conexao, "Transmissor 7")
+        self.assertEqual(logins_evento, {'t1', 't2', 't3', 't4'})
+        self.assertEqual(self.consultar("SELECT nivel FROM events"), [('transmissor',)])
+        self.assertEqual(
+            {c for (c,) in self.consultar("SELECT conexao FROM event_conexoes WHERE event_id = ?", (event_id,))},
+            {'CONEXAO_T1', 'CONEXAO_T2'}
         )
-        # Check that the 'clientes' field in the online alert contains all original offline clients
-        found_online_alert = False
-        for call_args in self.mock_requests_post.call_args_list:
-            url = call_args[0][0]
-            if url.endswith("/alerta/telegram"):
-                payload = call_args[1]['json']
-                if payload['status'] == 'online' and payload['conexao'] == conexao_name:
-                    found_online_alert = True
-                    alerted_logins = {c['login'] for c in payload['clientes']}
-                    self.assertEqual(alerted_logins, {'user1', 'user2', 'user3'})
-                    break
-        self.assertTrue(found_online_alert, "Online alert for resolved event not found or incorrect.")
+        # One OLT diagnosis for the root cause, with clients from both connections
+        evento, clientes = self.mock_agendar_diagnostico.call_args.args
+        self.assertEqual(evento['conexao'], "Transmissor 7")
+        self.assertEqual({c['conexao'] for c in clientes}, {'CONEXAO_T1', 'CONEXAO_T2'})
+        self.assertEqual(evento['transmissor'], '7')
+        mock_contar_pons.assert_not_called()  # the PON lookup belongs to the diagnosis job
+        (alerta,) = self._alertas_telegram()
+        self.assertIn("2 de 2 conexões do Transmissor 7", alerta['mensagem_personalizada'])
+
+    # 4e. A connection of the same transmissor that drops later joins the transmissor event
+    def test_later_connection_joins_the_transmissor_event(self):
+        primeiro = self._snapshot(online=['j1', 'j2'], conexao_name="CONEXAO_J1", id_transmissor="8")
+        segundo = self._snapshot(offline=['j1', 'j2'], conexao_name="CONEXAO_J1", id_transmissor="8")
+        terceiro = self._snapshot(offline=['j1', 'j2'], conexao_name="CONEXAO_J1", id_transmissor="8")
+        for snapshot, status in ((primeiro, True), (segundo, True), (terceiro, False)):
+            for login in ('j3', 'j4'):
+                snapshot.adicionar(login, "CONEXAO_J2", "8", None, status)
+
+        self._run_monitor_cycle(primeiro, segundo, terceiro)
+
+        (event_id, conexao, _, logins_evento), = self._eventos()
+        self.assertEqual(conexao, "Transmissor 8")
+        self.assertEqual(logins_evento, {'j1', 'j2', 'j3', 'j4'})
+        self.assertEqual(self.consultar("SELECT nivel FROM events"), [('transmissor',)])
+        self.assertEqual(len(self._alertas_telegram()), 2)
+
+    # 4f. SIGTERM sets `parada`: the loop finishes the current cycle and returns
+    def test_parada_ends_the_loop_after_the_cycle(self):
+        logins = ['stop1', 'stop2']
+        self.mock_get_snapshot.side_effect = [
+            self._snapshot(online=logins, conexao_name="CONEXAO_STOP"),
+            self._snapshot(offline=logins, conexao_name="CONEXAO_STOP"),
+        ]
+        self.addCleanup(monitor_service.parada.clear)
 
+        def esperar(segundos):
+            if self.mock_wait.call_count == 2:
+                monitor_service.parada.set()  # what the SIGTERM handler does
+
+        self.mock_wait.side_effect = esperar
+
+        monitor_service.monitor_connections()
+
+        self.assertEqual(len(self._eventos()), 1)
+        self.assertEqual(self.mock_get_snapshot.call_count, 2)
 
     # 5. No Action for Insufficient Clients (New Event)
     def test_no_action_insufficient_clients_new_event(self):
-        monitor_service.THRESHOLD_OFFLINE_CLIENTS = 3 # Set higher for this test
-        offline_clients_data = self._get_mock_clients(['clientX'], conexao_name="CONEXAO_FEW") # Only 1 client
-
-        monitor_service.clientes_offline_anterior = set()
-        monitor_service.clientes_info_offline_anterior = {}
-        self.mock_requests_get.side_effect = [
-            MagicMock(json=MagicMock(return_value={'clientes': offline_clients_data})), # offline
-            MagicMock(json=MagicMock(return_value={'clientes': []})), # online
-        ]
-        
-        # Mock `existe_evento_ativo_para_conexao` to always return False as no event should exist yet.
-        with patch('monitor_service.monitor_service.existe_evento_ativo_para_conexao', return_value=False):
-            self._run_monitor_cycle(num_cycles=1)
-
-        self.assertEqual(len(monitor_service.eventos_ativos), 0) # No event created
-        
-        # Check that save_event was NOT called (or at least not for this scenario)
-        # This is a bit tricky as save_event might be called by other tests if run in same suite instance
-        # A more precise way is to count calls before/after or check specific args
-        # For simplicity, we check that no new event was added to eventos_ativos.
-        # We also check that no alerts for "CONEXAO_FEW" were sent.
-        for call_item in self.mock_requests_post.call_args_list:
-            payload = call_item[1].get('json', {})
-            self.assertNotEqual(payload.get('conexao'), "CONEXAO_FEW", "Alert sent for insufficient clients")
-
-
-    # 5b. Adding Insufficient New Clients to Existing Event (Still adds them)
+        monitor_service.THRESHOLD_OFFLINE_CLIENTS = 3  # Set higher for this test (restored by patch.stopall)
+
+        self._run_monitor_cycle(
+            self._snapshot(offline=['offline_antes'], online=['clientX', 'clientY'], conexao_name="CONEXAO_FEW"),
+            self._snapshot(offline=['offline_antes', 'clientX'], online=['clientY'], conexao_name="CONEXAO_FEW"),
+        )
+
+        self.assertEqual(self._eventos(), [])
+        self.assertEqual(self.alertas(), [])
+        self.mock_agendar_diagnostico.assert_not_called()
+
+    # 5b. Insufficient New Clients on a Connection with an Active Event wait in the sliding window
     def test_add_insufficient_new_clients_to_existing_event(self):
-        monitor_service.THRESHOLD_OFFLINE_CLIENTS = 3 # For new event creation
-        initial_timestamp = 3000.0
-        self.mock_time.return_value = initial_timestamp
-        
-        existing_event_id = uuid.UUID('44444444-4444-4444-4444-444444444444')
-        # Initial event (already above threshold)
-        initial_event_clients = self._get_mock_clients(['BigClient1', 'BigClient2', 'BigClient3'], conexao_name="CONEXAO_ADD_FEW")
-        
-        monitor_service.eventos_ativos = [{
-            'id': str(existing_event_id),
-            'conexao': 'CONEXAO_ADD_FEW',
-            'logins_offline': {'BigClient1', 'BigClient2', 'BigClient3'},
-            'logins_restantes': {'BigClient1', 'BigClient2', 'BigClient3'},
-            'timestamp': initial_timestamp
-        }]
-        monitor_service.clientes_offline_anterior = {'BigClient1', 'BigClient2', 'BigClient3'}
-        monitor_service.clientes_info_offline_anterior = {c['login']: c for c in initial_event_clients}
-
-        # New clients go offline for the SAME connection, but this new batch is small (1 client)
-        # This batch ITSELF is below threshold, but should still be added to the existing event.
-        newly_offline_clients_data = self._get_mock_clients(['SmallClient1'], conexao_name="CONEXAO_ADD_FEW")
-
-        update_time = 3500.0
-        self.mock_time.return_value = update_time
-
-        all_offline_now = initial_event_clients + newly_offline_clients_data
-        self.mock_requests_get.side_effect = [
-            MagicMock(json=MagicMock(return_value={'clientes': all_offline_now})), # offline clients
-            MagicMock(json=MagicMock(return_value={'clientes': []})), # online clients
-        ]
-        
-        with patch('monitor_service.monitor_service.existe_evento_ativo_para_conexao', return_value=True):
-            self._run_monitor_cycle(num_cycles=1)
-
-            self.assertEqual(len(monitor_service.eventos_ativos), 1)
-            updated_event_in_memory = monitor_service.eventos_ativos[0]
-            self.assertEqual(updated_event_in_memory['logins_offline'], {'BigClient1', 'BigClient2', 'BigClient3', 'SmallClient1'})
-            self.assertEqual(updated_event_in_memory['logins_restantes'], {'BigClient1', 'BigClient2', 'BigClient3', 'SmallClient1'})
-            
-            # Verify save_event was called for the update
-            args, _ = self.mock_cursor.execute.call_args_list[-1]
-            saved_values = args[1]
-            self.assertEqual(saved_values[0], str(existing_event_id))
-            self.assertEqual(set(json.loads(saved_values[4])), {'BigClient1', 'BigClient2', 'BigClient3', 'SmallClient1'})
-
-            # Verify alerts for update (even if the new batch was small)
-            expected_telegram_message = (
-                f"เพิ่มเติม {len(newly_offline_clients_data)} clientes offline detectados na conexão CONEXAO_ADD_FEW. "
-                f"Total offline agora: {len(updated_event_in_memory['logins_restantes'])}."
-            )
-            self.mock_requests_post.assert_any_call(
-                f"{monitor_service.ALERT_SERVICE_URL}/alerta/telegram",
-                json={
-                    'clientes': newly_offline_clients_data,
-                    'status': 'offline', 
-                    'conexao': 'CONEXAO_ADD_FEW',
-                    'mensagem_personalizada': expected_telegram_message
-                }
-            )
+        monitor_service.THRESHOLD_OFFLINE_CLIENTS = 3
+        grandes = ['BigClient1', 'BigClient2', 'BigClient3']
+        pequenos = ['SmallClient1', 'SmallClient2', 'SmallClient3']
+
+        self._run_monitor_cycle(
+            self._snapshot(online=grandes + pequenos, conexao_name="CONEXAO_ADD_FEW"),
+            self._snapshot(offline=grandes, online=pequenos, conexao_name="CONEXAO_ADD_FEW"),
+            # One client, below the threshold: it is not added yet...
+            self._snapshot(offline=grandes + pequenos[:1], online=pequenos[1:], conexao_name="CONEXAO_ADD_FEW"),
+            # ...but counts towards the window, and joins the event with the next drops
+            self._snapshot(offline=grandes + pequenos, conexao_name="CONEXAO_ADD_FEW"),
+        )
+
+        (_, _, _, logins_evento), = self._eventos()
+        self.assertEqual(logins_evento, set(grandes + pequenos))
+        criacao, atualizacao = self._alertas_telegram()
+        self.assertEqual({c['login'] for c in criacao['clientes']}, set(grandes))
+        self.assertEqual({c['login'] for c in atualizacao['clientes']}, set(pequenos))
+
+
+    # 5c. Drops of a flapping login do not count towards a mass outage
+    def test_flapping_login_is_left_out_of_the_threshold(self):
+        patch.object(monitor_service, 'FLAP_MIN_QUEDAS', 2).start()
+        conexao = "CONEXAO_FLAP"
+
+        self._run_monitor_cycle(
+            self._snapshot(online=['flap1', 'estavel1'], conexao_name=conexao),
+            self._snapshot(offline=['flap1'], online=['estavel1'], conexao_name=conexao),
+            self._snapshot(online=['flap1', 'estavel1'], conexao_name=conexao),
+            # Second drop of flap1 in the window: only estavel1 counts, below the threshold
+            self._snapshot(offline=['flap1', 'estavel1'], conexao_name=conexao),
+        )
+
+        self.assertEqual(self._eventos(), [])
+        resposta = monitor_service.app.test_client().get('/logins/flapping')
+        (login,) = resposta.get_json()['logins']
+        self.assertEqual(
+            (login['login'], login['conexao'], login['quedas'], login['transicoes'], login['suprimido']),
+            ('flap1', conexao, 2, 3, True)
+        )
+
+
+class TestTransacao(BancoTemporario):
+
+    def _evento(self, event_id):
+        return {'id': event_id, 'conexao': 'CONEXAO_A', 'logins_offline': {'a'}, 'timestamp': 1000.0}
+
+    def test_transacao_aninhada_confirma_so_no_fim(self):
+        with monitor_service.transacao():
+            monitor_service.save_event(self._evento('e1'), 'ativo')
+            # Outra conexão ainda não vê a escrita: só a transação externa confirma
+            with sqlite3.connect(monitor_service.DB_PATH) as outra:
+                self.assertEqual(outra.execute("SELECT COUNT(*) FROM events").fetchone()[0], 0)
+
+        self.assertEqual([e['id'] for e in monitor_service.carregar_eventos_ativos()], ['e1'])
+
+    def test_erro_desfaz_todas_as_escritas_do_bloco(self):
+        with self.assertRaises(RuntimeError):
+            with monitor_service.transacao():
+                monitor_service.save_event(self._evento('e1'), 'ativo')
+                monitor_service.save_event(self._evento('e2'), 'ativo')
+                raise RuntimeError("falha no ciclo")
+
+        self.assertEqual(monitor_service.carregar_eventos_ativos(), [])
+
+
+class TestEventosRadius(BancoTemporario):
+
+    INICIO = 1700000000.0
+
+    def setUp(self):
+        super().setUp()
+        patch.object(monitor_service, 'RADIUS_INGESTION', True).start()
+        patch.object(monitor_service, 'RADIUS_RECONCILE_GRACE', 600).start()
+        self.agora = self.INICIO
+        patch.object(monitor_service.time, 'time', side_effect=lambda: self.agora).start()
+        self.client = monitor_service.app.test_client()
+
+    def _snapshot(self, offline=(), online=()):
+        snapshot = monitor_service.SnapshotClientes()
+        for logins, status in ((offline, False), (online, True)):
+            for login in logins:
+                snapshot.adicionar(login, 'CONEXAO_R', 'OLT1', None, status)
+        return snapshot
+
+    def _offline(self, snapshot):
+        return {monitor_service.LOGINS.nome(login_id) for login_id in snapshot.offline}
+
+    def test_endpoint_grava_na_caixa_de_entrada(self):
+        resposta = self.client.post('/radius/eventos', json={'eventos': [
+            {'login': 'r1', 'status': 'offline', 'timestamp': 10},
+            {'login': 'r2', 'status': 'online'},
+            {'status': 'offline'},
+        ]})
+
+        self.assertEqual(resposta.status_code, 202)
+        self.assertEqual(resposta.get_json(), {'recebidos': 2})
+        self.assertEqual(monitor_service.consumir_eventos_radius(), [('r1', False, 10), ('r2', True, self.INICIO)])
+        self.assertEqual(monitor_service.consumir_eventos_radius(), [])
+
+    def test_endpoint_desativado(self):
+        with patch.object(monitor_service, 'RADIUS_INGESTION', False):
+            resposta = self.client.post('/radius/eventos', json={'eventos': [{'login': 'r1', 'status': 'offline'}]})
+
+        self.assertEqual(resposta.status_code, 503)
+        self.assertEqual(monitor_service.consumir_eventos_radius(), [])
+
+    def test_aplicar_so_marca_logins_conhecidos(self):
+        snapshot = self._snapshot(online=['r1', 'r2'])
+        recentes = {}
+
+        aplicados = monitor_service.aplicar_eventos_radius(
+            snapshot, [('r1', False, 1), ('desconhecido_r', False, 1)], recentes
+        )
+
+        self.assertEqual(aplicados, 1)
+        self.assertEqual(self._offline(snapshot), {'r1'})
+        # O login desconhecido fica guardado e vale quando entrar numa reconciliação
+        self.assertEqual(recentes, {'r1': (False, self.INICIO), 'desconhecido_r': (False, self.INICIO)})
+
+    def test_radius_prevalece_sobre_o_ixcsoft_durante_a_carencia(self):
+        recentes = {}
+        monitor_service.aplicar_eventos_radius(self._snapshot(online=['r1', 'r2']), [('r1', False, 1)], recentes)
+
+        # O IXCSoft ainda não recebeu o accounting e informa r1 online
+        self.agora += 599
+        snapshot = self._snapshot(online=['r1', 'r2'])
+        monitor_service.reconciliar_radius(snapshot, recentes)
+        self.assertEqual(self._offline(snapshot), {'r1'})
+
+        # Depois da carência vale o IXCSoft, que corrige um Start perdido
+        self.agora += 2
+        snapshot = self._snapshot(online=['r1', 'r2'])
+        monitor_service.reconciliar_radius(snapshot, recentes)
+        self.assertEqual(self._offline(snapshot), set())
+        self.assertEqual(recentes, {})
+
+    def test_loop_detecta_queda_entre_reconciliacoes(self):
+        patch.object(monitor_service, 'THRESHOLD_OFFLINE_CLIENTS', 2).start()
+        patch.object(monitor_service, 'CHECK_INTERVAL', 300).start()
+        patch.object(monitor_service, 'get_snapshot', return_value=self._snapshot(online=['r1', 'r2', 'r3'])).start()
+        patch.object(monitor_service, 'agendar_diagnostico').start()
+
+        def esperar(segundos):
+            if mock_wait.call_count > 1:
+                raise KeyboardInterrupt
+            # Quedas recebidas do RADIUS antes da próxima reconciliação com o IXCSoft
+            monitor_service.enfileirar_eventos_radius([('r1', False, 1), ('r2', False, 1)])
+            self.agora += segundos
+
+        mock_wait = patch.object(monitor_service.parada, 'wait', side_effect=esperar).start()
+        monitor_service.monitor_connections()
+
+        self.assertEqual(monitor_service.get_snapshot.call_count, 1)
+        ((conexao,),) = self.consultar("SELECT conexao FROM events WHERE status = 'ativo'")
+        self.assertEqual(conexao, 'CONEXAO_R')
+        (_, _, telegram), = self.alertas('telegram')
+        self.assertEqual(telegram['conexao'], 'CONEXAO_R')
+
+
+class TestMigracoes(BancoTemporario):
+
+    iniciar_banco = False
+
+    def _banco_antigo(self, sql, versao, *inserts):
+        conn = sqlite3.connect(monitor_service.DB_PATH)
+        conn.executescript(sql)
+        for insert, linhas in inserts:
+            conn.executemany(insert, linhas)
+        conn.execute(f"PRAGMA user_version = {versao}")
+        conn.commit()
+        conn.close()
+
+    def test_migra_logins_json_para_event_logins(self):
+        self._banco_antigo(
+            "CREATE TABLE events (id TEXT PRIMARY KEY, conexao TEXT, timestamp REAL, status TEXT, logins TEXT)", 0,
+            ("INSERT INTO events VALUES (?, ?, ?, ?, ?)", [
+                ('e1', 'CONEXAO_A', 86400.0, 'ativo', json.dumps(['a', 'b'])),
+                ('e2', 'CONEXAO_B', 86400.0, 'resolvido', json.dumps(['c'])),
+                ('e3', 'CONEXAO_B', 86400.0, 'resolvido', None),
+            ])
+        )
+
+        monitor_service.init_db()
+
+        self.assertEqual(self.consultar("PRAGMA user_version"), [(monitor_service.SCHEMA_VERSION,)])
+        colunas = {row[1] for row in self.consultar("PRAGMA table_info(events)")}
+        self.assertNotIn('logins', colunas)
+        self.assertEqual(
+            self.consultar("SELECT event_id, login, offline_at, online_at FROM event_logins ORDER BY login"),
+            [('e1', 'a', 86400.0, None), ('e1', 'b', 86400.0, None), ('e2', 'c', 86400.0, None)]
+        )
+        self.assertEqual(self.consultar("SELECT DISTINCT nivel FROM events"), [('conexao',)])
+        # Os eventos já resolvidos entram no histórico sem duração
+        dia = time.strftime('%Y-%m-%d', time.localtime(86400.0))
+        self.assertEqual(
+            self.consultar("SELECT dimensao, chave, dia, eventos, logins, duracao_total FROM historico_dia"),
+            [('conexao', 'CONEXAO_B', dia, 2, 1, 0.0)]
+        )
+        self.assertEqual(self.consultar("SELECT motivo, quantidade FROM historico_motivo"), [('desconhecido', 2)])
+
+        (evento,) = monitor_service.carregar_eventos_ativos()
+        self.assertEqual(evento['conexoes'], {'CONEXAO_A'})
+        self.assertEqual(evento['logins_restantes'], {'a', 'b'})
+
+    def test_preenche_transmissor_dos_eventos_agregados(self):
+        self._banco_antigo(
+            "CREATE TABLE events (id TEXT PRIMARY KEY, conexao TEXT, timestamp REAL, status TEXT, nivel TEXT NOT NULL DEFAULT 'conexao')", 2,
+            ("INSERT INTO events VALUES (?, ?, ?, ?, ?)", [
+                ('e1', 'Transmissor 7', 0.0, 'ativo', 'transmissor'),
+                ('e2', 'CONEXAO_A', 0.0, 'ativo', 'conexao'),
+            ])
+        )
+
+        monitor_service.init_db()
+
+        self.assertEqual(
+            self.consultar("SELECT id, transmissor FROM events ORDER BY id"), [('e1', '7'), ('e2', None)]
+        )
+
+    def test_init_db_e_idempotente(self):
+        monitor_service.init_db()
+        monitor_service.save_event({'id': 'e1', 'conexao': 'CONEXAO_A', 'timestamp': 0.0, 'logins_offline': {'a'}}, 'ativo')
+
+        monitor_service.init_db()
+
+        self.assertEqual(self.consultar("PRAGMA user_version"), [(monitor_service.SCHEMA_VERSION,)])
+        self.assertEqual(self.consultar("SELECT event_id, login FROM event_logins"), [('e1', 'a')])
+
+    def test_historico_do_login(self):
+        monitor_service.init_db()
+        monitor_service.save_event({'id': 'e1', 'conexao': 'CONEXAO_A', 'timestamp': 10.0, 'logins_offline': {'a', 'b'}}, 'ativo')
+        monitor_service.registrar_reconexoes([('e1', 'a')], online_at=20.0)
+
+        resposta = monitor_service.app.test_client().get('/eventos/login/a')
+
+        (evento,) = resposta.get_json()['eventos']
+        self.assertEqual((evento['id'], evento['online_at']), ('e1', 20.0))
+        (ativo,) = monitor_service.carregar_eventos_ativos()
+        self.assertEqual(ativo['logins_offline'], {'a', 'b'})
+        self.assertEqual(ativo['logins_restantes'], {'b'})
+
+
+class TestIndiceEventos(BancoTemporario):
+
+    def _evento(self, event_id, conexao, logins, timestamp=0.0):
+        return {
+            'id': event_id, 'conexao': conexao, 'nivel': 'conexao',
+            'conexoes': {conexao}, 'logins_offline': set(logins), 'logins_restantes': set(logins),
+            'timestamp': timestamp
+        }
+
+    def _online_at(self, event_id):
+        return dict(self.consultar("SELECT login, online_at FROM event_logins WHERE event_id = ?", (event_id,)))
+
+    def test_criar_indexa_por_conexao_e_login(self):
+        eventos = monitor_service.IndiceEventos()
+        evento = self._evento('e1', 'CONEXAO_A', ['a', 'b'])
+
+        eventos.criar(evento)
+
+        self.assertIs(eventos.da_conexao('CONEXAO_A'), evento)
+        self.assertIsNone(eventos.da_conexao('CONEXAO_B'))
+        self.assertEqual(eventos.por_login, {'a': 'e1', 'b': 'e1'})
+        self.assertEqual(self._online_at('e1'), {'a': None, 'b': None})
+
+    def test_reconectar_retorna_eventos_esvaziados(self):
+        eventos = monitor_service.IndiceEventos()
+        eventos.criar(self._evento('e1', 'CONEXAO_A', ['a', 'b']))
+        eventos.criar(self._evento('e2', 'CONEXAO_B', ['c']))
+
+        self.assertEqual(eventos.reconectar(['a', 'desconhecido']), [])
+        (esvaziado,) = eventos.reconectar(['b'])
+
+        self.assertEqual(esvaziado['id'], 'e1')
+        self.assertEqual(esvaziado['logins_restantes'], set())
+        self.assertEqual(esvaziado['logins_offline'], {'a', 'b'})
+        self.assertNotIn(None, self._online_at('e1').values())
+        self.assertEqual(eventos.por_login, {'c': 'e2'})
+
+    def test_login_que_cai_em_outro_evento_sai_do_antigo(self):
+        eventos = monitor_service.IndiceEventos()
+        antigo = self._evento('e1', 'CONEXAO_A', ['a'])
+        eventos.criar(antigo)
+        novo = self._evento('e2', 'CONEXAO_B', ['b'])
+        eventos.criar(novo)
+
+        eventos.adicionar_logins(novo, {'a'})
+
+        self.assertEqual(eventos.por_login, {'a': 'e2', 'b': 'e2'})
+        self.assertIsNotNone(self._online_at('e1')['a'])
+        self.assertEqual(self._online_at('e2'), {'a': None, 'b': None})
+        # O evento antigo ficou sem logins pendentes e sai na próxima reconexão
+        self.assertEqual([evento['id'] for evento in eventos.reconectar([])], ['e1'])
+
+    def test_resolver_passa_a_conexao_ao_evento_seguinte(self):
+        primeiro = self._evento('e1', 'CONEXAO_A', ['a'], timestamp=1.0)
+        segundo = self._evento('e2', 'CONEXAO_A', ['b'], timestamp=2.0)
+        eventos = monitor_service.IndiceEventos([segundo, primeiro])
+        self.assertIs(eventos.da_conexao('CONEXAO_A'), primeiro)
+
+        eventos.resolver(primeiro)
+
+        self.assertIs(eventos.da_conexao('CONEXAO_A'), segundo)
+        self.assertEqual(len(eventos), 1)
+        self.assertNotIn('a', eventos.por_login)
+
+    def test_promover_a_evento_do_transmissor(self):
+        eventos = monitor_service.IndiceEventos()
+        evento = self._evento('e1', 'CONEXAO_A', ['a'])
+        eventos.criar(evento)
+
+        eventos.promover(evento, 'Transmissor 7')
+        eventos.adicionar_conexao(evento, 'CONEXAO_B')
+        eventos.adicionar_logins(evento, {'b'})
+
+        self.assertIs(eventos.do_transmissor('Transmissor 7'), evento)
+        self.assertIs(eventos.da_conexao('CONEXAO_B'), evento)
+        self.assertEqual(self.consultar("SELECT conexao, nivel FROM events"), [('Transmissor 7', 'transmissor')])
+        self.assertEqual(
+            {conexao for (conexao,) in self.consultar("SELECT conexao FROM event_conexoes")}, {'CONEXAO_A', 'CONEXAO_B'}
+        )
+
+        eventos.resolver(evento)
+        self.assertIsNone(eventos.do_transmissor('Transmissor 7'))
+        self.assertIsNone(eventos.da_conexao('CONEXAO_B'))
+
+    def test_recarregado_do_banco(self):
+        eventos = monitor_service.IndiceEventos()
+        eventos.criar(self._evento('e1', 'CONEXAO_A', ['a', 'b']))
+        eventos.reconectar(['a'])
+
+        recarregado = monitor_service.IndiceEventos(monitor_service.carregar_eventos_ativos())
+
+        evento = recarregado.da_conexao('CONEXAO_A')
+        self.assertEqual(evento['logins_offline'], {'a', 'b'})
+        self.assertEqual(evento['logins_restantes'], {'b'})
+        self.assertEqual(recarregado.por_login, {'b': 'e1'})
+
+    def test_carregar_eventos_ativos_le_um_unico_estado(self):
+        monitor_service.IndiceEventos().criar(self._evento('e1', 'CONEXAO_A', ['a']))
+        escritor = sqlite3.connect(monitor_service.DB_PATH)
+        self.addCleanup(escritor.close)
+
+        def gravar_entre_consultas(sql):
+            # Um evento criado pelo loop depois da consulta aos eventos e antes da consulta às conexões
+            if 'event_conexoes' in sql and not escritor.in_transaction:
+                escritor.execute("INSERT INTO events (id, conexao, timestamp, status) VALUES ('e2', 'CONEXAO_B', 0, 'ativo')")
+                escritor.execute("INSERT INTO event_conexoes VALUES ('e2', 'CONEXAO_B')")
+                escritor.execute("INSERT INTO event_logins (event_id, login) VALUES ('e2', 'b')")
+                escritor.commit()
+
+        monitor_service.get_db().set_trace_callback(gravar_entre_consultas)
+        try:
+            (evento,) = monitor_service.carregar_eventos_ativos()
+        finally:
+            monitor_service.get_db().set_trace_callback(None)
+
+        self.assertEqual(evento['id'], 'e1')
+        self.assertEqual(len(monitor_service.carregar_eventos_ativos()), 2)
+
+
+class TestEventosAtivos(BancoTemporario):
+
+    def setUp(self):
+        super().setUp()
+        patch.object(monitor_service, 'leitura_eventos_ativos', monitor_service.LeituraEventosAtivos()).start()
+        patch.object(monitor_service.time, 'time', return_value=1000.0).start()
+        self.client = monitor_service.app.test_client()
+        monitor_service.save_event({
+            'id': 'e1', 'conexao': 'CONEXAO_A', 'nivel': 'conexao', 'timestamp': 100.0,
+            'conexoes': {'CONEXAO_A'}, 'logins_offline': {'a', 'b'}
+        }, 'ativo')
+        monitor_service.save_event({
+            'id': 'e2', 'conexao': 'Transmissor 7', 'nivel': 'transmissor', 'transmissor': '7', 'timestamp': 900.0,
+            'conexoes': {'CONEXAO_B', 'CONEXAO_C'}, 'logins_offline': {'c', 'd', 'e'}
+        }, 'ativo')
+        monitor_service.save_event({'id': 'e3', 'conexao': 'CONEXAO_D', 'timestamp': 50.0, 'logins_offline': {'f'}}, 'resolvido')
+
+    def _ids(self, resposta):
+        return [evento['id'] for evento in resposta.get_json()['eventos_ativos']]
+
+    def test_eventos_ativos_do_mais_antigo_ao_mais_recente(self):
+        resposta = self.client.get('/eventos/ativos')
+
+        dados = resposta.get_json()
+        self.assertEqual(self._ids(resposta), ['e1', 'e2'])
+        self.assertEqual(dados['total'], 2)
+        self.assertEqual(dados['eventos_ativos'][1]['conexoes'], ['CONEXAO_B', 'CONEXAO_C'])
+        self.assertEqual(dados['eventos_ativos'][1]['logins'], ['c', 'd', 'e'])
+        self.assertEqual(dados['eventos_ativos'][1]['transmissor'], '7')
+
+    def test_if_none_match_recebe_304(self):
+        etag = self.client.get('/eventos/ativos').headers['ETag']
+
+        resposta = self.client.get('/eventos/ativos', headers={'If-None-Match': etag})
+
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta.data, b'')
+        self.assertEqual(resposta.headers['ETag'], etag)
+
+    def test_etag_muda_quando_os_eventos_mudam(self):
+        antes = self.client.get('/eventos/ativos')
+        versao = monitor_service.versao_eventos()
+
+        monitor_service.registrar_reconexoes([('e1', 'a')], online_at=950.0)
+
+        self.assertEqual(monitor_service.versao_eventos(), versao + 1)
+        resposta = self.client.get('/eventos/ativos', headers={'If-None-Match': antes.headers['ETag']})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta.headers['ETag'], antes.headers['ETag'])
+        self.assertEqual(resposta.get_json()['eventos_ativos'][0]['logins_pendentes'], 1)
+
+        monitor_service.resolver_evento(next(ev for ev in monitor_service.carregar_eventos_ativos() if ev['id'] == 'e1'))
+        self.assertEqual(self._ids(self.client.get('/eventos/ativos')), ['e2'])
+
+    def test_filtros(self):
+        self.assertEqual(self._ids(self.client.get('/eventos/ativos?conexao=CONEXAO_C')), ['e2'])
+        self.assertEqual(self._ids(self.client.get('/eventos/ativos?transmissor=7')), ['e2'])
+        self.assertEqual(self._ids(self.client.get('/eventos/ativos?idade_min=500')), ['e1'])
+        self.assertEqual(self._ids(self.client.get('/eventos/ativos?idade_max=500')), ['e2'])
+        self.assertEqual(self.client.get('/eventos/ativos?idade_min=x').status_code, 400)
+
+        filtrado = self.client.get('/eventos/ativos?conexao=CONEXAO_A')
+        self.assertNotEqual(filtrado.headers['ETag'], self.client.get('/eventos/ativos').headers['ETag'])
+
+    def test_paginacao(self):
+        resposta = self.client.get('/eventos/ativos?por_pagina=1&pagina=2')
+
+        dados = resposta.get_json()
+        self.assertEqual(self._ids(resposta), ['e2'])
+        self.assertEqual((dados['total'], dados['pagina'], dados['por_pagina']), (2, 2, 1))
+        self.assertEqual(self._ids(self.client.get('/eventos/ativos?por_pagina=1&pagina=3')), [])
+
+    def test_projecao_resumo(self):
+        dados = self.client.get('/eventos/ativos?projecao=resumo').get_json()
+
+        self.assertEqual(dados['logins_offline'], 5)
+        resumo = dados['eventos_ativos'][1]
+        self.assertNotIn('logins', resumo)
+        self.assertEqual((resumo['total_conexoes'], resumo['total_logins'], resumo['logins_pendentes']), (2, 3, 3))
+
+
+class TestHistorico(BancoTemporario):
+
+    # 10/03/2024 10:00 no fuso local: o dia do histórico é a data local do início
+    INICIO = time.mktime((2024, 3, 10, 10, 0, 0, 0, 0, -1))
+
+    def setUp(self):
+        super().setUp()
+        self.client = monitor_service.app.test_client()
+        self.eventos = monitor_service.IndiceEventos()
+
+    def _resolver(self, event_id, conexoes, logins, duracao, transmissor=None, motivo='energia', logins_por_conexao=None):
+        evento = {
+            'id': event_id, 'conexao': f'Transmissor {transmissor}' if transmissor else conexoes[0],
+            'nivel': 'transmissor' if transmissor else 'conexao', 'transmissor': transmissor, 'motivo': motivo,
+            'conexoes': set(conexoes), 'logins_offline': set(logins), 'logins_restantes': set(logins),
+            'timestamp': self.INICIO
+        }
+        self.eventos.criar(evento)
+        with patch.object(monitor_service.time, 'time', return_value=self.INICIO + duracao):
+            self.eventos.resolver(evento, logins_por_conexao)
+
+    def _periodo(self):
+        return 'desde=2024-03-01&ate=2024-03-31'
+
+    def test_resolver_acumula_os_agregados_do_dia(self):
+        self._resolver('e1', ['CONEXAO_A'], ['a', 'b'], 400, transmissor='7')
+
+        self.assertEqual(self.consultar("SELECT status, resolvido_em FROM events"), [('resolvido', self.INICIO + 400)])
+        self.assertEqual(
+            self.consultar("SELECT dimensao, chave, dia, eventos, logins, duracao_total, duracao_max FROM historico_dia ORDER BY 1"),
+            [('conexao', 'CONEXAO_A', '2024-03-10', 1, 2, 400.0, 400.0), ('transmissor', '7', '2024-03-10', 1, 2, 400.0, 400.0)]
+        )
+        # 400s cai no balde de até 600s
+        self.assertEqual(self.consultar("SELECT DISTINCT balde, quantidade FROM historico_duracao"), [(2, 1)])
+        self.assertEqual(self.consultar("SELECT DISTINCT motivo, quantidade FROM historico_motivo"), [('energia', 1)])
+
+    def test_evento_de_transmissor_reparte_os_logins_entre_as_conexoes(self):
+        self._resolver('e1', ['CONEXAO_A', 'CONEXAO_B'], ['a', 'b', 'c'], 5000, transmissor='7',
+                       logins_por_conexao=Counter({'CONEXAO_A': 2, 'CONEXAO_B': 1}))
+
+        self.assertEqual(
+            self.consultar("SELECT dimensao, chave, logins FROM historico_dia ORDER BY 1, 2"),
+            [('conexao', 'CONEXAO_A', 2), ('conexao', 'CONEXAO_B', 1), ('transmissor', '7', 3)]
+        )
+
+    def test_baldes_de_duracao(self):
+        for event_id, duracao in (('e1', 60), ('e2', 61), ('e3', 86400), ('e4', 86401)):
+            self._resolver(event_id, ['CONEXAO_A'], [event_id], duracao)
+
+        self.assertEqual(
+            self.consultar("SELECT balde, quantidade FROM historico_duracao ORDER BY balde"),
+            [(0, 1), (1, 1), (len(monitor_service.BALDES_DURACAO) - 1, 1), (len(monitor_service.BALDES_DURACAO), 1)]
+        )
+        self.assertIsNone(monitor_service.percentil_baldes({len(monitor_service.BALDES_DURACAO): 1}, 0.5))
+        self.assertIsNone(monitor_service.percentil_baldes({}, 0.5))
+
+    def test_rota_da_conexao(self):
+        self._resolver('e1', ['CONEXAO_A'], ['a', 'b'], 100, motivo='energia')
+        self._resolver('e2', ['CONEXAO_A'], ['c'], 3000, motivo='rompimento')
+
+        dados = self.client.get(f'/historico/conexao/CONEXAO_A?{self._periodo()}').get_json()
+
+        self.assertEqual((dados['desde'], dados['ate']), ('2024-03-01', '2024-03-31'))
+        total = dados['total']
+        self.assertEqual((total['eventos'], total['logins'], total['mttr'], total['duracao_max']), (2, 3, 1550.0, 3000.0))
+        self.assertEqual((total['duracao_p50'], total['duracao_p90']), (300, 3600))
+        self.assertEqual(total['motivos'], {'energia': 1, 'rompimento': 1})
+        self.assertEqual(dados['dias'], [{'dia': '2024-03-10', 'eventos': 2, 'logins': 3, 'duracao_max': 3000.0}])
+
+        fora = self.client.get('/historico/conexao/CONEXAO_A?desde=2024-04-01&ate=2024-04-30').get_json()
+        self.assertEqual((fora['total']['eventos'], fora['total']['mttr'], fora['dias']), (0, None, []))
+
+    def test_rota_do_ranking(self):
+        self._resolver('e1', ['CONEXAO_A'], ['a'], 100, transmissor='7')
+        self._resolver('e2', ['CONEXAO_A'], ['b'], 100, transmissor='7')
+        self._resolver('e3', ['CONEXAO_B'], ['c'], 5000, transmissor='8')
+
+        por_eventos = self.client.get(f'/historico/transmissor?{self._periodo()}').get_json()['ranking']
+        por_mttr = self.client.get(f'/historico/transmissor?{self._periodo()}&ordem=mttr&limite=1').get_json()['ranking']
+
+        self.assertEqual([(item['chave'], item['eventos']) for item in por_eventos], [('7', 2), ('8', 1)])
+        self.assertEqual([item['chave'] for item in por_mttr], ['8'])
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get('/historico/olt').status_code, 404)
+        self.assertEqual(self.client.get('/historico/olt/1').status_code, 404)
+        self.assertEqual(self.client.get('/historico/conexao?ordem=nome').status_code, 400)
+        self.assertEqual(self.client.get('/historico/conexao/CONEXAO_A?desde=10/03/2024').status_code, 400)
+
+
+class TestHistoricoTransicoes(unittest.TestCase):
+
+    def test_conta_quedas_na_janela(self):
+        historico = monitor_service.HistoricoTransicoes(capacidade=8, janela=3600, min_quedas=3)
+        inicio = 1_700_000_000
+        for i, online in enumerate((False, True, False, True, False)):
+            quedas = historico.registrar(5, online, inicio + i * 60)
+
+        self.assertEqual(quedas, 3)
+        self.assertEqual(historico.contar(5, inicio + 240), (3, 5, inicio + 240))
+        # Uma hora depois da segunda queda, só a terceira segue na janela
+        self.assertEqual(historico.contar(5, inicio + 120 + 3601), (1, 2, inicio + 240))
+        self.assertEqual(historico.contar(4, inicio), (0, 0, 0))  # login sem transições
+        self.assertEqual(historico.contar(99, inicio), (0, 0, 0))  # fora do array
+
+    def test_buffer_circular_guarda_as_ultimas_transicoes(self):
+        historico = monitor_service.HistoricoTransicoes(capacidade=4, janela=3600, min_quedas=0)
+        inicio = 1_700_000_000
+        for i in range(10):
+            historico.registrar(0, i % 2 == 1, inicio + i)
+
+        self.assertEqual(historico.contar(0, inicio + 9), (2, 4, inicio + 9))
+
+    def test_instantes_depois_de_2038(self):
+        historico = monitor_service.HistoricoTransicoes(capacidade=4, janela=3600, min_quedas=0)
+        depois_de_2038 = 2 ** 31 + 1000
+
+        historico.registrar(0, False, depois_de_2038)
+        historico.registrar(0, True, depois_de_2038 + 10)
+
+        self.assertEqual(historico.contar(0, depois_de_2038 + 10), (1, 2, depois_de_2038 + 10))
+
+    def test_janela_anterior_a_primeira_transicao(self):
+        historico = monitor_service.HistoricoTransicoes(capacidade=4, janela=3600, min_quedas=0)
+
+        historico.registrar(0, False, 1000)
+
+        # As posições vazias não contam, mesmo com a janela começando antes do epoch
+        self.assertEqual(historico.contar(0, 1000), (1, 1, 1000))
+
+    def test_ranking_descarta_logins_fora_da_janela(self):
+        historico = monitor_service.HistoricoTransicoes(capacidade=8, janela=100, min_quedas=0)
+        for login_id, quedas in ((1, 3), (2, 2), (3, 1)):
+            for i in range(quedas):
+                historico.registrar(login_id, False, 1000 + i)
+                historico.registrar(login_id, True, 1000 + i)
+
+        self.assertEqual(historico.ranking(1010, 10), [(1, 3, 6, 1002), (2, 2, 4, 1001)])
+        self.assertEqual(historico.ranking(1010, 1), [(1, 3, 6, 1002)])
+        self.assertEqual(historico.ranking(1200, 10), [])
+        self.assertEqual(historico.recentes, set())
+
+    def test_conexao_de_login_fora_do_snapshot(self):
+        historico = monitor_service.HistoricoTransicoes(capacidade=4, janela=3600, min_quedas=0)
+        anterior = monitor_service.SnapshotClientes()
+        login_id = anterior.adicionar('instavel_removido', 'CONEXAO_B', None, None, False)
+        historico.registrar(login_id, False, 1000, anterior.conexao[login_id])
+        sem_conexao = monitor_service.LOGINS.id('instavel_sem_conexao')
+        historico.registrar(sem_conexao, False, 1000)
+
+        # O login saiu do snapshot (delta): a coluna do snapshot novo nem chega ao seu id
+        atual = monitor_service.SnapshotClientes()
+        self.assertEqual(monitor_service.conexao_instavel(atual, historico, login_id), 'CONEXAO_B')
+        self.assertEqual(monitor_service.conexao_instavel(atual, historico, sem_conexao), 'Desconhecida')
+
+        atual.adicionar('instavel_removido', 'CONEXAO_C', None, None, True)
+        self.assertEqual(monitor_service.conexao_instavel(atual, historico, login_id), 'CONEXAO_C')
+
+
+class TestDetectorQuedas(unittest.TestCase):
+
+    def _detector(self, **kwargs):
+        parametros = dict(janela=600, balde=30, percentual=0, minimo=3)
+        parametros.update(kwargs)
+        return monitor_service.DetectorQuedas(**parametros)
+
+    def test_quedas_em_ciclos_diferentes_somam_na_janela(self):
+        detector = self._detector()
+        detector.registrar_queda(1, 10, 1000)
+        detector.registrar_queda(2, 10, 1100)
+        self.assertEqual(detector.disparos(1100), {})
+
+        detector.registrar_queda(3, 10, 1500)
+
+        self.assertEqual({10: sorted(detector.disparos(1500)[10])}, {10: [1, 2, 3]})
+        # Os logins disparados saem da janela
+        self.assertEqual(detector.janelas, {})
+        self.assertEqual(detector.pendentes, {})
+
+    def test_conexoes_contadas_separadamente(self):
+        detector = self._detector()
+        for login_id, conexao_id in ((1, 10), (2, 10), (3, 20), (4, 20), (5, 20)):
+            detector.registrar_queda(login_id, conexao_id, 1000)
+
+        self.assertEqual(list(detector.disparos(1000)), [20])
+        self.assertEqual(detector.janelas[10].total, 2)
+
+    def test_baldes_fora_da_janela_expiram(self):
+        detector = self._detector()
+        detector.registrar_queda(1, 10, 1000)
+        detector.registrar_queda(2, 10, 1010)
+        # 630s depois o balde da primeira queda (t=990..1019) já saiu da janela de 600s
+        detector.registrar_queda(3, 10, 1640)
+
+        self.assertEqual(detector.disparos(1640), {})
+        self.assertEqual(detector.janelas[10].total, 1)
+        self.assertEqual(set(detector.pendentes), {3})
+
+    def test_limpar_remove_janelas_expiradas(self):
+        detector = self._detector()
+        detector.registrar_queda(1, 10, 1000)
+        detector.registrar_queda(2, 20, 1500)
+
+        detector.limpar(1700)
+
+        self.assertEqual(list(detector.janelas), [20])
+        self.assertEqual(set(detector.pendentes), {2})
+
+    def test_retorno_sai_da_contagem(self):
+        detector = self._detector()
+        for login_id in (1, 2, 3):
+            detector.registrar_queda(login_id, 10, 1000)
+        detector.registrar_retorno(2)
+        detector.registrar_retorno(99)  # login fora da janela: ignorado
+
+        self.assertEqual(detector.disparos(1000), {})
+        self.assertEqual(detector.janelas[10].total, 2)
+
+        # O login que voltou pode cair de novo e contar outra vez
+        detector.registrar_queda(2, 10, 1060)
+        self.assertEqual(sorted(detector.disparos(1060)[10]), [1, 2, 3])
+
+    def test_queda_repetida_conta_uma_vez(self):
+        detector = self._detector()
+        for agora in (1000, 1030, 1060):
+            detector.registrar_queda(1, 10, agora)
+
+        self.assertEqual(detector.janelas[10].total, 1)
+        self.assertEqual(detector.disparos(1060), {})
+
+    def test_limiar_percentual_sobre_os_assinantes(self):
+        snapshot = monitor_service.SnapshotClientes()
+        for i in range(20):
+            snapshot.adicionar(f"detector_pct_{i}", 'CONEXAO_PCT', '1', None, online=i >= 5)
+        conexao_id = monitor_service.CONEXOES.ids['CONEXAO_PCT']
+        detector = self._detector(percentual=25, minimo=2)
+
+        detector.atualizar_assinantes(snapshot)
+
+        self.assertEqual(detector.limiar(conexao_id), 5)  # 25% de 20
+        self.assertEqual(detector.limiar(-1), 2)  # conexão sem assinantes conhecidos: o mínimo
+        login_ids = sorted(snapshot.offline)
+        for login_id in login_ids[:4]:
+            detector.registrar_queda(login_id, conexao_id, 1000)
+        self.assertEqual(detector.disparos(1000), {})
+        detector.registrar_queda(login_ids[4], conexao_id, 1000)
+        self.assertEqual(sorted(detector.disparos(1000)[conexao_id]), login_ids)
+
+    def test_sem_percentual_usa_o_minimo(self):
+        detector = self._detector(minimo=4)
+        detector.atualizar_assinantes(monitor_service.SnapshotClientes())
+
+        self.assertEqual(detector.assinantes, {})
+        self.assertEqual(detector.limiar(10), 4)
+
+
+class TestFilaAlertas(BancoTemporario):
+
+    def setUp(self):
+        super().setUp()
+        patch.object(monitor_service, 'ALERT_BACKOFF_BASE', 2).start()
+        patch.object(monitor_service, 'ALERT_BACKOFF_MAX', 300).start()
+        patch.object(monitor_service, 'ALERT_MAX_TENTATIVAS', 3).start()
+        self.mock_enviar = patch.object(monitor_service, 'enviar_alerta').start()
+
+    def _enfileirar(self, event_id, chave):
+        monitor_service.enfileirar_alerta('telegram', {'chave': chave}, event_id, f"{event_id}:{chave}")
+
+    def _reservar(self, agora=None):
+        alerta = monitor_service.reservar_alerta(time.time() if agora is None else agora)
+        return alerta and (alerta[0], json.loads(alerta[2])['chave'])
+
+    def _status(self):
+        return self.consultar("SELECT id, status, tentativas FROM alertas ORDER BY id")
+
+    def _despachar(self):
+        """Roda o worker até a fila não ter mais alertas prontos."""
+        with patch.object(monitor_service, 'alertas_disponiveis') as aguardar:
+            aguardar.wait.side_effect = KeyboardInterrupt
+            with self.assertRaises(KeyboardInterrupt):
+                monitor_service.despachar_alertas()
+
+    def test_alertas_do_mesmo_evento_saem_em_ordem(self):
+        self._enfileirar('e1', 'offline')
+        self._enfileirar('e1', 'online')
+        self._enfileirar('e2', 'offline')
+
+        self.assertEqual(self._reservar(), (1, 'offline'))
+        # O 'online' de e1 espera o 'offline' em envio; o de outro evento segue
+        self.assertEqual(self._reservar(), (3, 'offline'))
+        self.assertIsNone(self._reservar())
+
+        monitor_service.concluir_alerta(1, 'enviado', 1)
+        self.assertEqual(self._reservar(), (2, 'online'))
+
+    def test_chave_duplicada_ignorada(self):
+        self.assertTrue(monitor_service.enfileirar_alerta('telegram', {}, 'e1', 'e1:offline'))
+        self.assertFalse(monitor_service.enfileirar_alerta('telegram', {}, 'e1', 'e1:offline'))
+        self.assertTrue(monitor_service.enfileirar_alerta('whatsapp', {}, 'e1', 'e1:offline'))
+        self.assertEqual(len(self._status()), 2)
+
+    def test_worker_envia_e_conclui(self):
+        self._enfileirar('e1', 'offline')
+        self._enfileirar('e1', 'online')
+
+        self._despachar()
+
+        self.assertEqual(self._status(), [(1, 'enviado', 1), (2, 'enviado', 1)])
+        self.assertEqual(
+            [chamada.args for chamada in self.mock_enviar.call_args_list],
+            [('telegram', {'chave': 'offline'}), ('telegram', {'chave': 'online'})]
+        )
+
+    def test_falha_volta_para_a_fila_com_backoff(self):
+        self._enfileirar('e1', 'offline')
+        self._enfileirar('e1', 'online')
+        self.mock_enviar.side_effect = RuntimeError("timeout")
+
+        antes = time.time()
+        self._despachar()
+
+        self.assertEqual(self._status(), [(1, 'pendente', 1), (2, 'pendente', 0)])
+        (proxima, erro), = self.consultar("SELECT proxima_tentativa, erro FROM alertas WHERE id = 1")
+        self.assertEqual(erro, "timeout")
+        self.assertGreaterEqual(proxima, antes + 1)  # atraso de 1 a 2s na primeira falha
+        self.assertLessEqual(proxima, time.time() + 2)
+        # Durante o backoff, nem ele nem os seguintes do evento saem
+        self.assertIsNone(self._reservar())
+        self.assertEqual(self._reservar(proxima), (1, 'offline'))
+
+    def test_falhou_apos_maximo_de_tentativas(self):
+        self._enfileirar('e1', 'offline')
+        self._enfileirar('e1', 'online')
+        self.mock_enviar.side_effect = [RuntimeError(f"erro {tentativa}") for tentativa in range(3)] + [MagicMock(status_code=200)]
+
+        # Sem esperar o backoff entre as tentativas
+        with patch.object(monitor_service, 'atraso_retentativa', return_value=0):
+            self._despachar()
+
+        self.assertEqual(self._status(), [(1, 'falhou', 3), (2, 'enviado', 1)])
+        self.assertEqual(self.consultar("SELECT erro FROM alertas WHERE id = 1"), [("erro 2",)])
+
+    def test_atraso_retentativa_exponencial_e_limitado(self):
+        for tentativas, minimo, maximo in ((1, 1, 2), (2, 2, 4), (5, 16, 32), (20, 150, 300)):
+            for _ in range(20):
+                atraso = monitor_service.atraso_retentativa(tentativas)
+                self.assertGreaterEqual(atraso, minimo)
+                self.assertLessEqual(atraso, maximo)
+
+    def test_alertas_interrompidos_voltam_para_a_fila(self):
+        self._enfileirar('e1', 'offline')
+        monitor_service.reservar_alerta(time.time())
+
+        monitor_service.recuperar_alertas_interrompidos()
+
+        self.assertEqual(self._status(), [(1, 'pendente', 0)])
+        self.assertEqual(self._reservar(), (1, 'offline'))
+
+    def test_remove_so_alertas_concluidos_antigos(self):
+        for chave in ('enviado', 'falhou', 'pendente'):
+            self._enfileirar(chave, chave)
+        monitor_service.concluir_alerta(1, 'enviado', 1)
+        monitor_service.concluir_alerta(2, 'falhou', 3)
+
+        monitor_service.remover_alertas_antigos(time.time() + 1)
+
+        self.assertEqual(self._status(), [(3, 'pendente', 0)])
+
+
+class TestConsultaOLT(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_post = patch.object(monitor_service.requests, 'post').start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _clientes(self, *logins, id_transmissor='1'):
+        return [{'login': login, 'id_transmissor': id_transmissor} for login in logins]
+
+    def test_conexoes_consultadas_num_unico_lote(self):
+        self.mock_post.return_value.json.return_value = {'resultados': [
+            {'conexao': 'CONEXAO_A', 'motivo_final': 'energia'},
+            {'conexao': 'CONEXAO_B', 'error': 'ID da OLT desconhecido: 9.'},
+        ]}
+
+        motivos = monitor_service.consultar_motivos_olt({
+            'CONEXAO_A': self._clientes('a1', 'a2', 'a3', 'a4'),
+            'CONEXAO_B': self._clientes('b1', 'b2', 'b3', id_transmissor='9'),
+            'CONEXAO_C': self._clientes('c1', 'c2'),
+        })
+
+        self.assertEqual(motivos, {'CONEXAO_A': 'energia', 'CONEXAO_B': 'indeterminado', 'CONEXAO_C': 'indeterminado'})
+        self.mock_post.assert_called_once()
+        consultas = self.mock_post.call_args.kwargs['json']['consultas']
+        # Conexões com menos de 3 logins não são consultadas
+        self.assertEqual([c['conexao'] for c in consultas], ['CONEXAO_A', 'CONEXAO_B'])
+        self.assertEqual(consultas[0]['logins'], ['a1', 'a2', 'a3'])
+
+    def test_modo_porta_envia_todos_os_logins(self):
+        patch.object(monitor_service, 'OLT_CONSULT_MODE', 'porta').start()
+        self.mock_post.return_value.json.return_value = {'resultados': [{'conexao': 'CONEXAO_A', 'motivo_final': 'loss'}]}
+
+        motivos = monitor_service.consultar_motivos_olt({'CONEXAO_A': self._clientes('a1', 'a2', 'a3', 'a4', 'a5')})
+
+        self.assertEqual(motivos, {'CONEXAO_A': 'loss'})
+        (consulta,) = self.mock_post.call_args.kwargs['json']['consultas']
+        self.assertEqual((consulta['logins'], consulta['modo']), (['a1', 'a2', 'a3', 'a4', 'a5'], 'porta'))
+
+    def test_falha_na_consulta_e_indeterminado(self):
+        self.mock_post.side_effect = monitor_service.requests.ConnectionError("recusada")
+
+        motivos = monitor_service.consultar_motivos_olt({'CONEXAO_A': self._clientes('a1', 'a2', 'a3')})
+
+        self.assertEqual(motivos, {'CONEXAO_A': 'indeterminado'})
+
+
+class TestSnapshotClientes(unittest.TestCase):
+
+    def test_ids_estaveis_entre_snapshots(self):
+        primeiro = monitor_service.SnapshotClientes()
+        login_id = primeiro.adicionar('snap_a', 'CONEXAO_SNAP', 7, None, online=False)
+        segundo = monitor_service.SnapshotClientes()
+
+        self.assertEqual(segundo.adicionar('snap_a', 'CONEXAO_SNAP', 7, None, online=True), login_id)
+        self.assertEqual(primeiro.offline, {login_id})
+        self.assertEqual(segundo.online, {login_id})
+        self.assertEqual(segundo.cliente(login_id)['id_transmissor'], '7')
+
+    def test_mudanca_de_status_move_o_login(self):
+        snapshot = monitor_service.SnapshotClientes()
+        login_id = snapshot.adicionar('snap_b', None, None, None, online=False)
+
+        snapshot.adicionar('snap_b', None, None, None, online=True)
+
+        self.assertEqual((snapshot.online, snapshot.offline), ({login_id}, set()))
+        self.assertEqual(snapshot.nome_conexao(login_id), 'Desconhecida')
+
+    def test_copia_tem_conjuntos_proprios(self):
+        snapshot = monitor_service.SnapshotClientes()
+        snapshot.adicionar('snap_c', 'CONEXAO_SNAP', None, None, online=True)
+        copia = snapshot.copia()
+
+        snapshot.remover('snap_c')
+
+        self.assertEqual(snapshot.online, set())
+        self.assertEqual(len(copia.online), 1)
+
+    def test_cliente_por_login_fora_do_snapshot(self):
+        snapshot = monitor_service.SnapshotClientes()
+        snapshot.adicionar('snap_d', 'CONEXAO_SNAP', None, None, online=True)
+        snapshot.remover('snap_d')
+
+        self.assertEqual(snapshot.cliente_por_login('snap_d'), {'login': 'snap_d'})
+        self.assertEqual(snapshot.cliente_por_login('nunca_visto'), {'login': 'nunca_visto'})
+
+
+class TestSnapshotStream(unittest.TestCase):
+
+    CAMPOS = ['login', 'conexao', 'id_transmissor', 'ultima_conexao_final', 'online']
+
+    def _stream(self, *linhas):
+        resposta = MagicMock()
+        resposta.__enter__.return_value = resposta
+        resposta.iter_lines.return_value = [json.dumps(linha).encode() for linha in linhas]
+        return patch.object(monitor_service.requests, 'get', return_value=resposta).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_separa_online_e_offline_linha_a_linha(self):
+        campos = ['id_cliente', 'login', 'conexao', 'id_transmissor', 'online', 'ultima_conexao_final']
+        mock_get = self._stream(
+            {'tipo': 'inicio', 'timestamp': 1000, 'campos': campos},
+            ['1', 'stream_a', 'CONEXAO_A', '7', 'S', '2024-01-01 00:00:00'],
+            ['2', 'stream_b', 'CONEXAO_A', None, 'N', None],
+            {'tipo': 'fim', 'total': 2},
+        )
+
+        snapshot = monitor_service.get_snapshot_stream()
+
+        self.assertEqual(mock_get.call_args.kwargs,
+                         {'params': {'stream': '1'}, 'stream': True, 'timeout': monitor_service.MONITOR_SNAPSHOT_TIMEOUT})
+        self.assertEqual(snapshot.timestamp, 1000)
+        (online,), (offline,) = snapshot.online, snapshot.offline
+        self.assertEqual(snapshot.cliente(online), {
+            'login': 'stream_a', 'conexao': 'CONEXAO_A', 'id_transmissor': '7', 'ultima_conexao_final': '2024-01-01 00:00:00'
+        })
+        self.assertEqual(snapshot.cliente(offline)['login'], 'stream_b')
+        self.assertIsNone(snapshot.cliente(offline)['id_transmissor'])
+
+    def test_stream_truncado_e_falha(self):
+        self._stream({'tipo': 'inicio', 'timestamp': 1000, 'campos': self.CAMPOS}, ['stream_a', 'CONEXAO_A', '7', None, 'S'])
+
+        self.assertIsNone(monitor_service.get_snapshot_stream())
+
+    def test_linha_de_erro_e_falha(self):
+        self._stream({'tipo': 'inicio', 'timestamp': 1000, 'campos': self.CAMPOS}, {'tipo': 'erro', 'error': 'IXC 502'})
+
+        self.assertIsNone(monitor_service.get_snapshot_stream())
+
+    def test_snapshot_e_delta_com_timeout(self):
+        patch.object(monitor_service, 'MONITOR_SNAPSHOT_TIMEOUT', 42).start()
+        mock_get = patch.object(monitor_service.requests, 'get').start()
+        mock_get.return_value.json.return_value = {'timestamp': 1000, 'online': [], 'offline': []}
+
+        monitor_service.get_snapshot()
+        monitor_service.get_delta('g1:1')
+
+        self.assertEqual([chamada.kwargs['timeout'] for chamada in mock_get.call_args_list], [42, 42])
+
+    def test_timeout_descarta_o_ciclo(self):
+        patch.object(monitor_service.requests, 'get', side_effect=monitor_service.requests.Timeout("lento")).start()
+
+        self.assertIsNone(monitor_service.get_snapshot())
+        self.assertIsNone(monitor_service.get_delta(None))
+
+
+class TestDiagnostico(BancoTemporario):
+
+    def setUp(self):
+        super().setUp()
+        patch.object(monitor_service, 'TOPOLOGY_PON_ENRICH', True).start()
+        self.mock_motivos = patch.object(monitor_service, 'consultar_motivos_olt').start()
+        self.mock_motivos.side_effect = lambda conexoes: {chave: 'rompimento de fibra' for chave in conexoes}
+        self.mock_contar_pons = patch.object(monitor_service, 'contar_pons').start()
+        self.mock_contar_pons.return_value = Counter({'0/1/2': 3, '0/1/5': 1})
+
+    def _criar(self, event_id='e1', nivel='conexao', conexao='CONEXAO_A', transmissor=None, motivo=None):
+        evento = {
+            'id': event_id, 'conexao': conexao, 'nivel': nivel, 'transmissor': transmissor,
+            'motivo': motivo or monitor_service.MOTIVO_EM_ANALISE, 'conexoes': {'CONEXAO_A'},
+            'logins_offline': {'a', 'b', 'c', 'd'}, 'logins_restantes': {'a', 'b', 'c', 'd'}, 'timestamp': 0.0
+        }
+        monitor_service.IndiceEventos().criar(evento)
+        return evento, [{'login': login} for login in sorted(evento['logins_offline'])]
+
+    def test_diagnostico_grava_o_motivo_e_alerta(self):
+        evento, clientes = self._criar()
+
+        monitor_service.diagnosticar_evento(evento, evento['conexao'], clientes)
+
+        self.mock_motivos.assert_called_once_with({'CONEXAO_A': clientes})
+        self.assertEqual(self.consultar("SELECT motivo FROM events"), [('rompimento de fibra',)])
+        self.assertEqual(evento['motivo'], 'rompimento de fibra')
+        (_, chave, telegram), = self.alertas('telegram')
+        self.assertEqual(chave, "e1:diagnostico:telegram")
+        self.assertIn("Motivo da queda: Rompimento de fibra", telegram['mensagem_personalizada'])
+        (_, _, whatsapp), = self.alertas('whatsapp')
+        self.assertEqual(whatsapp['motivo'], 'rompimento de fibra')
+        self.mock_contar_pons.assert_not_called()
+        self.assertNotIn("PONs", telegram['mensagem_personalizada'])
+
+    def test_diagnostico_do_transmissor_inclui_pons(self):
+        evento, clientes = self._criar(nivel='transmissor', conexao='Transmissor 7', transmissor='7')
+
+        monitor_service.diagnosticar_evento(evento, evento['conexao'], clientes)
+
+        self.mock_contar_pons.assert_called_once_with('7', ['a', 'b', 'c', 'd'])
+        (_, _, telegram), = self.alertas('telegram')
+        self.assertIn("Motivo da queda: Rompimento de fibra\nPONs: 0/1/2 (3), 0/1/5 (1)\n", telegram['mensagem_personalizada'])
+
+    def test_evento_resolvido_so_corrige_o_historico(self):
+        evento, clientes = self._criar()
+        monitor_service.resolver_evento(evento)
+
+        monitor_service.diagnosticar_evento(evento, evento['conexao'], clientes)
+
+        self.assertEqual(self.alertas(), [])
+        self.assertEqual(
+            self.consultar("SELECT dimensao, chave, motivo, quantidade FROM historico_motivo"),
+            [('conexao', 'CONEXAO_A', 'rompimento de fibra', 1)]
+        )
+
+    def test_parada_deixa_o_evento_em_analise(self):
+        evento, clientes = self._criar()
+        monitor_service.parada.set()
+        self.addCleanup(monitor_service.parada.clear)
+
+        monitor_service.diagnosticar_evento(evento, evento['conexao'], clientes)
+
+        self.mock_motivos.assert_not_called()
+        self.assertEqual(self.consultar("SELECT motivo FROM events"), [(monitor_service.MOTIVO_EM_ANALISE,)])
+
+    def test_retomar_reagenda_os_eventos_em_analise(self):
+        mock_agendar = patch.object(monitor_service, 'agendar_diagnostico').start()
+        self._criar('e1', 'transmissor', 'Transmissor 7', '7')
+        self._criar('e2', motivo='energia')
+
+        monitor_service.retomar_diagnosticos(monitor_service.carregar_eventos_ativos(), monitor_service.SnapshotClientes())
+
+        evento, clientes = mock_agendar.call_args.args
+        self.assertEqual(evento['id'], 'e1')
+        self.assertEqual(clientes, [{'login': login, 'id_transmissor': '7'} for login in ('a', 'b', 'c', 'd')])
+        mock_agendar.assert_called_once()
+
+    def test_retomar_evento_sem_transmissor_usa_a_olt_dos_logins(self):
+        mock_agendar = patch.object(monitor_service, 'agendar_diagnostico').start()
+        self._criar()  # Como uma linha anterior ao esquema 3: transmissor nulo
+        snapshot = monitor_service.SnapshotClientes()
+        for login, transmissor in (('a', '5'), ('b', '5'), ('c', None), ('d', '6')):
+            snapshot.adicionar(login, 'CONEXAO_A', transmissor, None, False)
+
+        monitor_service.retomar_diagnosticos(monitor_service.carregar_eventos_ativos(), snapshot)
+
+        evento, clientes = mock_agendar.call_args.args
+        self.assertEqual(evento['id'], 'e1')
+        self.assertEqual([(c['login'], c['id_transmissor']) for c in clientes], [(l, '5') for l in 'abcd'])
+
+    def test_retomar_sem_olt_conhecida_deixa_o_evento_em_analise(self):
+        mock_agendar = patch.object(monitor_service, 'agendar_diagnostico').start()
+        self._criar()
+
+        monitor_service.retomar_diagnosticos(monitor_service.carregar_eventos_ativos(), monitor_service.SnapshotClientes())
+
+        mock_agendar.assert_not_called()
+        self.assertEqual(self.consultar("SELECT motivo FROM events"), [(monitor_service.MOTIVO_EM_ANALISE,)])
+
+    def test_loop_retoma_no_primeiro_snapshot(self):
+        mock_retomar = patch.object(monitor_service, 'retomar_diagnosticos').start()
+        ciclo = monitor_service.CicloMonitor()
+        mock_retomar.assert_not_called()
+
+        snapshot = monitor_service.SnapshotClientes()
+        ciclo.reconciliar(snapshot)
+        ciclo.reconciliar(monitor_service.SnapshotClientes())
+
+        mock_retomar.assert_called_once_with(ciclo.eventos, snapshot)
+
+
+class TestMotorAsyncio(BancoTemporario):
+
+    def setUp(self):
+        super().setUp()
+        patch.object(monitor_service, 'THRESHOLD_OFFLINE_CLIENTS', 2).start()
+        patch.object(monitor_service, 'CHECK_INTERVAL', 0).start()
+        patch.object(monitor_service, 'RADIUS_INGESTION', False).start()
+        patch.object(monitor_service, 'TOPOLOGY_PON_ENRICH', False).start()
+        patch.object(monitor_service, 'IXCSOFT_SYNC_MODE', 'snapshot').start()
+        patch.object(monitor_service, 'IXCSOFT_STREAMING', False).start()
+        patch.object(monitor_service, 'ASYNC_ALERT_CONCURRENCY', 2).start()
+        patch.object(monitor_service, 'MONITOR_SNAPSHOT_TIMEOUT', 42).start()
+        self.addCleanup(monitor_service.parada.clear)
+        self.requisicoes = []
+        self.snapshots = []
+        self.timeouts_snapshot = []
+        transporte = httpx.MockTransport(self._responder)
+        cliente_original = httpx.AsyncClient
+        patch.object(httpx, 'AsyncClient', lambda **kwargs: cliente_original(transport=transporte, **kwargs)).start()
+
+    def _responder(self, requisicao):
+        caminho = requisicao.url.path
+        self.requisicoes.append((requisicao.method, caminho))
+        if caminho == '/clientes/snapshot':
+            self.timeouts_snapshot.append(requisicao.extensions['timeout']['read'])
+            return httpx.Response(200, json=self.snapshots.pop(0) if len(self.snapshots) > 1 else self.snapshots[0])
+        if caminho == '/consulta/olt/lote':
+            consultas = json.loads(requisicao.content)['consultas']
+            return httpx.Response(200, json={'resultados': [
+                {'conexao': consulta['conexao'], 'motivo_final': 'energia'} for consulta in consultas
+            ]})
+        return httpx.Response(200, json={'message': 'ok'})
+
+    def _snapshot(self, offline=(), online=()):
+        clientes = lambda logins: [{'login': login, 'conexao': 'CONEXAO_ASYNC', 'id_transmissor': 'OLT1'} for login in logins]
+        return {'timestamp': time.time(), 'online': clientes(online), 'offline': clientes(offline)}
+
+    def _executar(self, ciclos):
+        """Roda o motor por `ciclos` ciclos; depois do último, espera o diagnóstico e os alertas e para."""
+        esperas = []
+        pendentes = "SELECT COUNT(*) FROM alertas WHERE status != 'enviado'"
+
+        async def aguardar(motor, segundos):
+            esperas.append(segundos)
+            if len(esperas) < ciclos:
+                return
+            for _ in range(500):
+                if not motor.tarefas and self.consultar(pendentes) == [(0,)]:
+                    break
+                await asyncio.sleep(0.01)
+            monitor_service.parada.set()
+            motor.alertas.set()
+
+        patch.object(monitor_service.MotorAsyncio, 'aguardar', aguardar).start()
+        asyncio.run(monitor_service.executar_motor_asyncio())
+        self.assertIsNone(monitor_service.motor_asyncio)
+
+    def test_ciclo_diagnostico_e_alertas(self):
+        logins = ['async1', 'async2', 'async3']
+        self.snapshots = [self._snapshot(online=logins), self._snapshot(offline=logins)]
+
+        self._executar(ciclos=2)
+
+        self.assertEqual(self.consultar("SELECT conexao, motivo FROM events"), [('CONEXAO_ASYNC', 'energia')])
+        self.assertEqual(self.timeouts_snapshot, [42, 42])
+        self.assertEqual(self.requisicoes.count(('POST', '/consulta/olt/lote')), 1)
+        # Alerta da criação e o do diagnóstico, nos dois canais, todos enviados pelos despachantes
+        self.assertEqual(
+            sorted(chave.split(':', 1)[1] for _, chave, _ in self.alertas()),
+            ['diagnostico:telegram', 'diagnostico:whatsapp', 'offline:telegram', 'offline:whatsapp']
+        )
+        self.assertEqual(self.consultar("SELECT DISTINCT status FROM alertas"), [('enviado',)])
+        self.assertEqual(
+            sorted(caminho for metodo, caminho in self.requisicoes if caminho.startswith('/alerta/')),
+            ['/alerta/telegram', '/alerta/telegram', '/alerta/whatsapp', '/alerta/whatsapp']
+        )
+
 
 if __name__ == '__main__':
-    # Important: Ensure the CWD is the root of the project for imports to work correctly if run directly
-    # For example, if test_monitor_service.py is in monitor_service/tests/
-    # and monitor_service.py is in monitor_service/
-    # you might need to run from the directory containing the monitor_service package.
-    # The sys.path modification at the top helps, but running with `python -m unittest discover`
-    # from the project root is generally more robust.
-    
-    # If you place this test file inside the 'monitor_service' directory alongside 'monitor_service.py':
-    # And run from the parent directory of 'monitor_service':
-    # python -m unittest monitor_service.test_monitor_service
     unittest.main()
-
-```
@@ -0,0 +1,198 @@
+"""
+Teste de carga de POST /consulta/olt: servidor de desenvolvimento do Flask contra
+o gunicorn com gunicorn.conf.py, usando uma OLT falsa local (servidor SSH do
+paramiko que imita a CLI Huawei com latência por comando).
+
+Cada consulta leva 3 logins; o inventário da OLT falsa localiza todos eles, então
+cada login custa um "display ont info". Uso (a partir do checkout, com /app/logs):
+
+    python bench_wsgi_serving.py [--latencia 0.2] [--clientes 8] [--duracao 10]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import paramiko
+import requests
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+LOGINS = 300
+
+APLICACAO = """
+import olt_service
+olt_service.OLT_IP_MAPPING['1'] = '127.0.0.1'
+app = olt_service.app
+"""
+
+
+class FakeOLTServer(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        return True
+
+
+def saida_comando(comando):
+    if comando == 'display ont info 0 all':
+        linhas = ["  F/S/P   ONT-ID  Description"]
+        linhas += [f"  0/ 1/{i % 16:2d}  {i // 16:6d}  cliente{i}" for i in range(LOGINS)]
+        return "\n".join(linhas)
+    if comando.startswith('display ont info '):
+        return "  Run state               : offline\n  Last down cause         : dying-gasp"
+    return ""
+
+
+def atender_sessao(conexao, chave, latencia):
+    transporte = paramiko.Transport(conexao)
+    transporte.add_server_key(chave)
+    transporte.start_server(server=FakeOLTServer())
+    canal = transporte.accept(10)
+    if canal is None:
+        return
+    canal.send("MA5800>")
+    buffer = ""
+    try:
+        while True:
+            dados = canal.recv(4096)
+            if not dados:
+                break
+            buffer += dados.decode()
+            while "\n" in buffer:
+                comando, buffer = buffer.split("\n", 1)
+                comando = comando.strip()
+                if comando.startswith('display'):
+                    time.sleep(latencia)
+                canal.send(f"{saida_comando(comando)}\nMA5800(config)#")
+    except (OSError, EOFError, paramiko.SSHException):
+        pass  # o olt_service encerrou a sessão
+    finally:
+        transporte.close()
+
+
+def iniciar_olt_falsa(latencia):
+    chave = paramiko.RSAKey.generate(2048)
+    servidor = socket.socket()
+    servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    servidor.bind(('127.0.0.1', 0))
+    servidor.listen(16)
+
+    def aceitar():
+        while True:
+            conexao, _ = servidor.accept()
+            threading.Thread(target=atender_sessao, args=(conexao, chave, latencia), daemon=True).start()
+
+    threading.Thread(target=aceitar, daemon=True).start()
+    return servidor.getsockname()[1]
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def aguardar_porta(porta, processo):
+    for _ in range(200):
+        if processo.poll() is not None:
+            raise RuntimeError(f"Servidor encerrou com código {processo.returncode}.")
+        try:
+            socket.create_connection(('127.0.0.1', porta), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Servidor não respondeu na porta {porta}.")
+
+
+def carga(url, clientes, duracao):
+    """C clientes em laço fechado, cada um consultando 3 logins distintos; retorna req/s, latências (ms) e erros."""
+    latencias, erros = [], [0]
+    lock = threading.Lock()
+    fim = time.perf_counter() + duracao
+
+    def cliente(n):
+        sessao = requests.Session()
+        locais = []
+        i = n
+        while time.perf_counter() < fim:
+            logins = [f'cliente{(i * 3 + k) % LOGINS}' for k in range(3)]
+            i += clientes
+            inicio = time.perf_counter()
+            try:
+                resposta = sessao.post(url, json={'logins': logins, 'id_transmissor': '1'}, timeout=120)
+                resposta.raise_for_status()
+                assert resposta.json()['motivo_final'] == 'energia', resposta.text
+                locais.append((time.perf_counter() - inicio) * 1000)
+            except (requests.exceptions.RequestException, AssertionError):
+                with lock:
+                    erros[0] += 1
+        with lock:
+            latencias.extend(locais)
+
+    threads = [threading.Thread(target=cliente, args=(n,)) for n in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencias.sort()
+    percentil = lambda p: latencias[min(len(latencias) - 1, int(len(latencias) * p))] if latencias else 0.0
+    return len(latencias) / duracao, percentil(0.5), percentil(0.95), percentil(0.99), erros[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latencia', type=float, default=0.2, help='Latência simulada por comando na OLT (s)')
+    parser.add_argument('--clientes', type=int, default=8)
+    parser.add_argument('--duracao', type=float, default=10)
+    args = parser.parse_args()
+
+    porta_ssh = iniciar_olt_falsa(args.latencia)
+    diretorio = tempfile.mkdtemp(prefix='bench_olt_')
+    with open(os.path.join(diretorio, 'bench_olt_app.py'), 'w') as f:
+        f.write(APLICACAO)
+    env = dict(os.environ, OLT_SSH_PORT=str(porta_ssh), OLT_USERNAME='bench', OLT_PASSWORD='bench',
+               PYTHONPATH=os.pathsep.join([diretorio, AQUI]))
+
+    servidores = {
+        'flask dev': lambda porta: [
+            sys.executable, '-c', f"from bench_olt_app import app; app.run(host='127.0.0.1', port={porta})"
+        ],
+        'gunicorn': lambda porta: [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{porta}',
+            '--log-level', 'warning', 'bench_olt_app:app'
+        ],
+    }
+    print(f"latência/comando={args.latencia}s clientes={args.clientes} duração={args.duracao}s "
+          f"OLT_MAX_SESSIONS={os.getenv('OLT_MAX_SESSIONS', '2')}")
+    print(f"{'servidor':>10} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'erros':>6}")
+    for nome, comando in servidores.items():
+        porta = porta_livre()
+        processo = subprocess.Popen(comando(porta), cwd=AQUI, env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            aguardar_porta(porta, processo)
+            url = f'http://127.0.0.1:{porta}/consulta/olt'
+            requests.post(url, json={'logins': ['cliente0'], 'id_transmissor': '1'}, timeout=120)  # aquece o inventário
+            rps, p50, p95, p99, erros = carga(url, args.clientes, args.duracao)
+            print(f"{nome:>10} {rps:>8.1f} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {erros:>6}")
+        finally:
+            processo.terminate()
+            processo.wait()
+
+
+if __name__ == '__main__':
+    main()
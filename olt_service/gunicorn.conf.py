@@ -0,0 +1,20 @@
+# Configuração do gunicorn para o olt_service (produção):
+#   gunicorn -c gunicorn.conf.py olt_service:app
+# Um único worker: o pool de sessões SSH (OLT_MAX_SESSIONS por OLT) e o inventário de
+# ONTs ficam em memória; com mais de um worker o limite de sessões VTY da OLT seria
+# multiplicado. A concorrência vem das threads.
+import os
+
+bind = "0.0.0.0:5003"
+worker_class = "gthread"
+workers = 1
+threads = int(os.getenv("OLT_WEB_THREADS", "16"))
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("OLT_WEB_GRACEFUL_TIMEOUT", "90"))
+keepalive = 5
+
+
+def worker_exit(server, worker):
+    # Depois das requisições em andamento (graceful_timeout), encerra as sessões SSH abertas
+    import olt_service
+    olt_service.encerrar_sessoes()
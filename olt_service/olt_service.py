@@ -1,7 +1,11 @@
 import os
 import re
 import time
+import codecs
 import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import paramiko
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
@@ -32,6 +36,35 @@ if not all([OLT_USERNAME, OLT_PASSWORD]):
     logging.error("Variáveis de ambiente para a conexão SSH com a OLT não estão definidas.")
     exit(1)
 
+# Pool de sessões SSH por OLT
+OLT_MAX_SESSIONS = int(os.getenv("OLT_MAX_SESSIONS", "2"))  # Huawei limita as sessões VTY
+OLT_SESSION_IDLE_TIMEOUT = int(os.getenv("OLT_SESSION_IDLE_TIMEOUT", "300"))
+OLT_SESSION_ACQUIRE_TIMEOUT = int(os.getenv("OLT_SESSION_ACQUIRE_TIMEOUT", "60"))
+
+# Leitura da CLI: lê até o prompt em vez de aguardar um tempo fixo
+OLT_COMMAND_TIMEOUT = float(os.getenv("OLT_COMMAND_TIMEOUT", "30"))
+OLT_PROMPT_REGEX = re.compile(os.getenv("OLT_PROMPT_REGEX", r"[\w.\-]+(\([\w.\-]+\))?[>#]\s*$"))
+# "---- More ( Press 'Q' to break ) ----" e o pedido de parâmetros "{ <cr>||<K> }:" das Huawei
+OLT_PAGER_REGEX = re.compile(r"-+\s*More[^\n]*?-+\s*$")
+OLT_PARAM_REGEX = re.compile(r"\{\s*<cr>[^}]*\}\s*:\s*$")
+ANSI_REGEX = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+RECV_BUFFER = 65536
+
+# Consultas concorrentes (a concorrência por OLT continua limitada por OLT_MAX_SESSIONS)
+OLT_CONSULT_WORKERS = int(os.getenv("OLT_CONSULT_WORKERS", "16"))
+OLT_BATCH_WORKERS = int(os.getenv("OLT_BATCH_WORKERS", "8"))
+# Logins concordantes que decidem o motivo, como na regra original (2), qualquer que seja a amostra
+OLT_QUORUM = int(os.getenv("OLT_QUORUM", "2"))
+
+# Inventário de ONTs (descrição -> F/S/P + ONT-ID), evitando o "display ont info by-desc" por login
+OLT_INVENTORY_COMMAND = os.getenv("OLT_INVENTORY_COMMAND", "display ont info 0 all")
+OLT_INVENTORY_TTL = int(os.getenv("OLT_INVENTORY_TTL", "3600"))
+OLT_INVENTORY_MIN_REFRESH = int(os.getenv("OLT_INVENTORY_MIN_REFRESH", "120"))
+OLT_INVENTORY_TIMEOUT = float(os.getenv("OLT_INVENTORY_TIMEOUT", "300"))
+
+# Consulta por porta PON: um comando lista a última causa de queda de todas as ONTs da porta
+OLT_PORT_SUMMARY_COMMAND = os.getenv("OLT_PORT_SUMMARY_COMMAND", "display ont info summary {fspon}")
+
 # Mapeamento de id_transmissor para IP da OLT
 OLT_IP_MAPPING = {
     "1": "10.1.10.14",
@@ -39,14 +72,305 @@ OLT_IP_MAPPING = {
     "6": "10.200.10.10"
 }
 
-def query_olt_single_login(login, olt_ip):
+# --------------------------------------------------
+# Sessões SSH persistentes
+# --------------------------------------------------
+
+class ConsultaCancelada(Exception):
+    """A consulta deixou de ser necessária (o motivo final já foi decidido)."""
+
+
+class SessaoOLT:
+    """Shell SSH autenticado numa OLT, já em modo config (enable -> config)."""
+
+    def __init__(self, olt_ip):
+        self.olt_ip = olt_ip
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            self.client.connect(
+                olt_ip,
+                port=OLT_SSH_PORT,
+                username=OLT_USERNAME,
+                password=OLT_PASSWORD,
+                timeout=10,
+                look_for_keys=False,
+                allow_agent=False
+            )
+            self.channel = self.client.invoke_shell(width=512, height=0)
+            self.ultimo_uso = time.time()
+            self.ler_ate_prompt(OLT_COMMAND_TIMEOUT)
+            for cmd in ("enable", "config"):
+                self.executar(cmd)
+        except BaseException:
+            # A sessão nunca chega ao pool: sem isto o socket e a thread do transporte vazariam
+            self.client.close()
+            raise
+        logging.info(f"Nova sessão SSH aberta na OLT {olt_ip}.")
+
+    def executar(self, cmd, timeout=OLT_COMMAND_TIMEOUT):
+        """Envia um comando e retorna a saída recebida até o prompt seguinte."""
+        logging.info(f"Enviando comando: {cmd}")
+        self.channel.send(cmd + "\n")
+        output = self.ler_ate_prompt(timeout)
+        self.ultimo_uso = time.time()
+        return output
+
+    def ler_ate_prompt(self, timeout):
+        """
+        Lê o canal até que a saída termine no prompt da CLI, respondendo ao paginador
+        "---- More ----" (espaço) e ao pedido de parâmetros "{ <cr>... }:" (enter).
+        Levanta TimeoutError se o prompt não aparecer em `timeout` segundos; a sessão
+        é então descartada pelo pool, pois pode ter ficado com saída pendente.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        output = ""
+        limite = time.monotonic() + timeout
+        while True:
+            if self.channel.recv_ready():
+                output += ANSI_REGEX.sub("", decoder.decode(self.channel.recv(RECV_BUFFER)))
+                cauda = output[-200:]
+                if OLT_PAGER_REGEX.search(cauda):
+                    output = OLT_PAGER_REGEX.sub("", output)
+                    self.channel.send(" ")
+                elif OLT_PARAM_REGEX.search(cauda):
+                    self.channel.send("\n")
+                elif OLT_PROMPT_REGEX.search(cauda):
+                    return output
+                continue
+            if self.channel.closed:
+                raise ConnectionError(f"Canal SSH da OLT {self.olt_ip} encerrado.")
+            if time.monotonic() > limite:
+                raise TimeoutError(f"Prompt da OLT {self.olt_ip} não recebido em {timeout}s.")
+            time.sleep(0.02)
+
+    def ativa(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active() and not self.channel.closed
+
+    def ociosa_ha(self):
+        return time.time() - self.ultimo_uso
+
+    def fechar(self):
+        try:
+            self.client.close()
+        except Exception as e:
+            logging.warning(f"Erro ao fechar sessão SSH da OLT {self.olt_ip}: {e}")
+
+
+class PoolSessoesOLT:
+    """
+    Sessões SSH reaproveitáveis de uma OLT, limitadas a OLT_MAX_SESSIONS simultâneas.
+    Sessões ociosas há mais de OLT_SESSION_IDLE_TIMEOUT segundos ou com o transporte
+    encerrado são descartadas em vez de reutilizadas.
+    """
+
+    def __init__(self, olt_ip, max_sessoes=OLT_MAX_SESSIONS):
+        self.olt_ip = olt_ip
+        self.vagas = threading.BoundedSemaphore(max_sessoes)
+        self.ociosas = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def sessao(self, cancelado=None):
+        """
+        Empresta uma sessão do pool. Se `cancelado` (threading.Event) for sinalizado
+        enquanto se espera por uma vaga, levanta ConsultaCancelada.
+        """
+        limite = time.monotonic() + OLT_SESSION_ACQUIRE_TIMEOUT
+        while not self.vagas.acquire(timeout=0.5):
+            if cancelado is not None and cancelado.is_set():
+                raise ConsultaCancelada()
+            if time.monotonic() > limite:
+                raise TimeoutError(f"Nenhuma sessão SSH livre na OLT {self.olt_ip} após {OLT_SESSION_ACQUIRE_TIMEOUT}s.")
+        sessao = None
+        try:
+            sessao = self._obter()
+            yield sessao
+        except Exception:
+            # Uma sessão que falhou no meio de um comando pode ter ficado num estado desconhecido
+            if sessao is not None:
+                sessao.fechar()
+                sessao = None
+            raise
+        finally:
+            if sessao is not None:
+                with self.lock:
+                    self.ociosas.append(sessao)
+            self.vagas.release()
+
+    def _obter(self):
+        while True:
+            with self.lock:
+                sessao = self.ociosas.pop() if self.ociosas else None
+            if sessao is None:
+                return SessaoOLT(self.olt_ip)
+            if sessao.ativa() and sessao.ociosa_ha() < OLT_SESSION_IDLE_TIMEOUT:
+                return sessao
+            logging.info(f"Descartando sessão SSH inativa da OLT {self.olt_ip}.")
+            sessao.fechar()
+
+    def remover_ociosas(self, todas=False):
+        with self.lock:
+            expiradas = [s for s in self.ociosas if todas or not s.ativa() or s.ociosa_ha() >= OLT_SESSION_IDLE_TIMEOUT]
+            self.ociosas = [s for s in self.ociosas if s not in expiradas]
+        for sessao in expiradas:
+            logging.info(f"Encerrando sessão SSH ociosa da OLT {self.olt_ip}.")
+            sessao.fechar()
+
+
+pools_olt = {}
+pools_olt_lock = threading.Lock()
+
+def pool_da_olt(olt_ip):
+    with pools_olt_lock:
+        if olt_ip not in pools_olt:
+            pools_olt[olt_ip] = PoolSessoesOLT(olt_ip)
+        return pools_olt[olt_ip]
+
+def remover_sessoes_ociosas():
+    """Laço em segundo plano que encerra as sessões ociosas de todas as OLTs."""
+    while True:
+        time.sleep(max(OLT_SESSION_IDLE_TIMEOUT // 2, 1))
+        with pools_olt_lock:
+            pools = list(pools_olt.values())
+        for pool in pools:
+            pool.remover_ociosas()
+
+threading.Thread(target=remover_sessoes_ociosas, daemon=True).start()
+
+def encerrar_sessoes():
+    """Fecha todas as sessões ociosas ao encerrar o serviço, liberando as vagas VTY da OLT."""
+    with pools_olt_lock:
+        pools = list(pools_olt.values())
+    for pool in pools:
+        pool.remover_ociosas(todas=True)
+
+
+# --------------------------------------------------
+# Inventário de ONTs
+# --------------------------------------------------
+
+def parse_inventario(saida):
+    """
+    Extrai da saída de OLT_INVENTORY_COMMAND o mapa descrição -> [(F/S/P, ONT-ID)].
+    Nas Huawei a listagem tem duas tabelas; só a que tem o cabeçalho "Description"
+    associa a descrição (o login) à ONT.
+    """
+    por_descricao = {}
+    na_tabela_descricao = False
+    for linha in saida.splitlines():
+        if "F/S/P" in linha:
+            na_tabela_descricao = "Description" in linha
+            continue
+        if not na_tabela_descricao:
+            continue
+        match = re.match(r"^\s*(\d+)\s*/\s*(\d+)\s*/\s*(\d+)\s+(\d+)\s+(\S.*?)\s*$", linha)
+        if match:
+            frame, slot, pon, ont_id, descricao = match.groups()
+            por_descricao.setdefault(descricao, []).append((f"{frame}/{slot}/{pon}", ont_id))
+    return por_descricao
+
+
+class InventarioONT:
     """
-    Consulta a OLT para um único login.
-    1. SSH -> enable -> config -> display ont info by-desc <login>
-    2. Extrai F/S/P + ONT-ID
-    3. Para cada par, executa display ont info <frame> <slot> <pon> <ont_id>
+    Cache do inventário de ONTs de uma OLT, renovado quando passa de OLT_INVENTORY_TTL
+    segundos ou quando um login não é encontrado (no máximo uma vez a cada
+    OLT_INVENTORY_MIN_REFRESH segundos, para que logins inexistentes não forcem
+    releituras seguidas).
+    """
+
+    def __init__(self, olt_ip):
+        self.olt_ip = olt_ip
+        self.por_descricao = {}
+        self.atualizado_em = None
+        self.lock = threading.Lock()
+
+    def idade(self):
+        return float("inf") if self.atualizado_em is None else time.time() - self.atualizado_em
+
+    def atualizar(self, idade_minima=0):
+        """Relê o inventário, a menos que outra thread o tenha feito há menos de `idade_minima` segundos."""
+        with self.lock:
+            if self.idade() < idade_minima:
+                return
+            inicio = time.time()
+            with pool_da_olt(self.olt_ip).sessao() as sessao:
+                saida = sessao.executar(OLT_INVENTORY_COMMAND, timeout=OLT_INVENTORY_TIMEOUT)
+            self.por_descricao = parse_inventario(saida)
+            self.atualizado_em = time.time()
+            logging.info(
+                f"Inventário da OLT {self.olt_ip} atualizado: {len(self.por_descricao)} ONTs "
+                f"em {self.atualizado_em - inicio:.1f}s."
+            )
+
+    def localizar_varios(self, logins):
+        """
+        Retorna login -> [(F/S/P, ONT-ID)] para os logins encontrados. Se o inventário
+        não puder ser lido, retorna {} e o chamador recorre ao "by-desc".
+        """
+        try:
+            if self.idade() >= OLT_INVENTORY_TTL:
+                self.atualizar(idade_minima=OLT_INVENTORY_TTL)
+            if any(login not in self.por_descricao for login in logins) and self.idade() >= OLT_INVENTORY_MIN_REFRESH:
+                self.atualizar(idade_minima=OLT_INVENTORY_MIN_REFRESH)
+        except Exception as e:
+            logging.error(f"Erro ao atualizar inventário da OLT {self.olt_ip}: {e}")
+        por_descricao = self.por_descricao
+        return {login: por_descricao[login] for login in logins if login in por_descricao}
+
+    def localizar(self, login):
+        return self.localizar_varios([login]).get(login)
+
+
+inventarios_olt = {}
+inventarios_olt_lock = threading.Lock()
+
+def inventario_da_olt(olt_ip):
+    with inventarios_olt_lock:
+        if olt_ip not in inventarios_olt:
+            inventarios_olt[olt_ip] = InventarioONT(olt_ip)
+        return inventarios_olt[olt_ip]
+
+def renovar_inventarios():
+    """Laço em segundo plano que renova os inventários já usados ao expirarem."""
+    while True:
+        time.sleep(max(OLT_INVENTORY_TTL // 4, 1))
+        with inventarios_olt_lock:
+            inventarios = list(inventarios_olt.values())
+        for inventario in inventarios:
+            if inventario.idade() >= OLT_INVENTORY_TTL:
+                try:
+                    inventario.atualizar(idade_minima=OLT_INVENTORY_TTL)
+                except Exception as e:
+                    logging.error(f"Erro ao renovar inventário da OLT {inventario.olt_ip}: {e}")
+
+threading.Thread(target=renovar_inventarios, daemon=True).start()
+
+
+def motivo_por_causas(causas):
+    """
+    Agrega as "Last down cause" das ONTs de um login:
+    - Se houver "dying-gasp" => "energia"
+    - Se houver "LOSi/LOBi" ou "LOFi" => "loss"
+    - Caso contrário => "indeterminado"
+    """
+    if any("dying-gasp" in causa.lower() for causa in causas):
+        return "energia"
+    if any(x in causa.upper() for causa in causas for x in ["LOSI/LOBI", "LOFI"]):
+        return "loss"
+    return "indeterminado"
+
+def query_olt_single_login(login, olt_ip, cancelado=None):
+    """
+    Consulta a OLT para um único login, usando uma sessão do pool da OLT
+    (já autenticada e em modo config). Se `cancelado` for sinalizado antes de
+    um comando, a consulta é interrompida e retorna ("cancelado", []).
+    1. Localiza F/S/P + ONT-ID no inventário da OLT (InventarioONT); se o login
+       não estiver no inventário, usa display ont info by-desc <login>
+    2. Para cada par, executa display ont info <frame> <slot> <pon> <ont_id>
        e extrai "Last down cause".
-    4. Determina o 'motivo' para esse login:
+    3. Determina o 'motivo' para esse login:
        - Se houver "dying-gasp", motivo = "energia"
        - Se houver "LOSi/LOBi" ou "LOFi", motivo = "loss"
        - Caso contrário, "indeterminado"
@@ -58,140 +382,230 @@ def query_olt_single_login(login, olt_ip):
         "last_down_cause": "...",
       }
     """
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
-        client.connect(
-            olt_ip,
-            port=OLT_SSH_PORT,
-            username=OLT_USERNAME,
-            password=OLT_PASSWORD,
-            timeout=10,
-            look_for_keys=False,
-            allow_agent=False
-        )
-        channel = client.invoke_shell()
-        time.sleep(1)
-
-        # Enviar comandos iniciais
-        comandos_iniciais = [
-            "enable",
-            "config",
-            f"{OLT_COMMAND} {login}"
-        ]
-        full_output = ""
-        for cmd in comandos_iniciais:
-            logging.info(f"Enviando comando: {cmd}")
-            channel.send(cmd + "\n")
-            time.sleep(2)
-            while channel.recv_ready():
-                full_output += channel.recv(1024).decode("utf-8")
-
-        logging.info(f"Saída do comando '{OLT_COMMAND} {login}':\n{full_output}")
-
-        # Extrair F/S/P e ONT-ID (com tolerância a espaços)
-        matches = re.findall(
-            r"(?m)^\s*(\d+\s*/\s*\d+\s*/\s*\d+)\s+(\d+)\s+",
-            full_output
-        )
-        if not matches:
-            logging.error("Não foi possível extrair F/S/P e ONT-ID da saída.")
-            return ("indeterminado", [])
-
-        # Remove duplicados
-        unique_matches = list({(fspon_raw.replace(" ", ""), ont_id) for fspon_raw, ont_id in matches})
-
-        # Agora, para cada par, obtemos o "Last down cause"
-        details = []
-        for fspon, ont_id in unique_matches:
-            partes = fspon.split("/")
-            if len(partes) != 3:
-                logging.error(f"Formato inválido de F/S/P: {fspon}")
-                continue
-            frame, slot, pon = partes
-            cmd_quarto = f"display ont info {frame} {slot} {pon} {ont_id}"
-            logging.info(f"Enviando comando: {cmd_quarto}")
-            channel.send(cmd_quarto + "\n")
-            time.sleep(2)
-
-            output_cmd4 = ""
-            while channel.recv_ready():
-                output_cmd4 += channel.recv(1024).decode("utf-8")
-
-            logging.info("Saída do quarto comando obtida.")
-            cause_match = re.search(r"Last down cause\s*:\s*(.+)", output_cmd4)
-            if cause_match:
-                last_down_cause = cause_match.group(1).strip()
-            else:
-                last_down_cause = "indeterminado"
-
-            details.append({
-                "fspon": fspon,
-                "ont_id": ont_id,
-                "last_down_cause": last_down_cause
-            })
-
-        # Agregar o motivo para ESTE login
-        # Se houver "dying-gasp" => "energia"
-        # Se houver "LOSi/LOBi" ou "LOFi" => "loss"
-        # Caso contrário => "indeterminado"
-        has_energia = any("dying-gasp" in d["last_down_cause"].lower() for d in details)
-        has_loss = any(x in d["last_down_cause"].upper() for d in details for x in ["LOSI/LOBI", "LOFI"])
-
-        if has_energia:
-            final_motivo = "energia"
-        elif has_loss:
-            final_motivo = "loss"
-        else:
-            final_motivo = "indeterminado"
-
-        return (final_motivo, details)
+        # Fora da sessão: a releitura do inventário usa uma sessão própria do pool
+        unique_matches = inventario_da_olt(olt_ip).localizar(login)
+        with pool_da_olt(olt_ip).sessao(cancelado) as sessao:
+            if unique_matches is None:
+                full_output = sessao.executar(f"{OLT_COMMAND} {login}")
 
+                logging.info(f"Saída do comando '{OLT_COMMAND} {login}':\n{full_output}")
+
+                # Extrair F/S/P e ONT-ID (com tolerância a espaços)
+                matches = re.findall(
+                    r"(?m)^\s*(\d+\s*/\s*\d+\s*/\s*\d+)\s+(\d+)\s+",
+                    full_output
+                )
+                if not matches:
+                    logging.error("Não foi possível extrair F/S/P e ONT-ID da saída.")
+                    return ("indeterminado", [])
+
+                # Remove duplicados
+                unique_matches = list({(fspon_raw.replace(" ", ""), ont_id) for fspon_raw, ont_id in matches})
+
+            # Agora, para cada par, obtemos o "Last down cause"
+            details = []
+            for fspon, ont_id in unique_matches:
+                partes = fspon.split("/")
+                if len(partes) != 3:
+                    logging.error(f"Formato inválido de F/S/P: {fspon}")
+                    continue
+                frame, slot, pon = partes
+                if cancelado is not None and cancelado.is_set():
+                    return ("cancelado", details)
+                output_cmd4 = sessao.executar(f"display ont info {frame} {slot} {pon} {ont_id}")
+
+                logging.info("Saída do quarto comando obtida.")
+                cause_match = re.search(r"Last down cause\s*:\s*(.+)", output_cmd4)
+                if cause_match:
+                    last_down_cause = cause_match.group(1).strip()
+                else:
+                    last_down_cause = "indeterminado"
+
+                details.append({
+                    "fspon": fspon,
+                    "ont_id": ont_id,
+                    "last_down_cause": last_down_cause
+                })
+
+        return (motivo_por_causas([d["last_down_cause"] for d in details]), details)
+
+    except ConsultaCancelada:
+        return ("cancelado", [])
     except Exception as e:
         logging.error(f"Erro na consulta à OLT: {e}")
         return ("indeterminado", [])
-    finally:
-        client.close()
+
+executor_consultas = ThreadPoolExecutor(max_workers=OLT_CONSULT_WORKERS)
+executor_lotes = ThreadPoolExecutor(max_workers=OLT_BATCH_WORKERS)
 
 def consult_olt_multiple_logins(logins, olt_ip):
     """
-    Para cada login na lista:
-      - Chama query_olt_single_login(login, olt_ip)
-      - Soma contagem de energia e loss
-    Retorna o motivo final (por maioria) e os detalhes de cada login.
+    Consulta todos os logins em paralelo (limitado por OLT_MAX_SESSIONS na OLT) e
+    soma a contagem de energia e loss. Assim que um motivo atinge OLT_QUORUM logins,
+    as consultas restantes são canceladas, pois o resultado não pode mais mudar.
+    Retorna o motivo final e os detalhes de cada login.
     """
-    energy_count = 0
-    loss_count = 0
-    all_details = []
+    necessario = OLT_QUORUM
+    contagem = {"energia": 0, "loss": 0}
+    resultados = {}
+    cancelado = threading.Event()
 
+    futures = {
+        executor_consultas.submit(query_olt_single_login, login, olt_ip, cancelado): login
+        for login in logins
+    }
+    for future in as_completed(futures):
+        login = futures[future]
+        motivo_login, details = future.result()
+        resultados[login] = (motivo_login, details)
+        if motivo_login in contagem:
+            contagem[motivo_login] += 1
+            if contagem[motivo_login] >= necessario and not cancelado.is_set():
+                logging.info(f"Motivo '{motivo_login}' decidido na OLT {olt_ip}; cancelando consultas restantes.")
+                cancelado.set()
+                for pendente in futures:
+                    pendente.cancel()
+                break
+
+    all_details = []
     for login in logins:
-        motivo_login, details = query_olt_single_login(login, olt_ip)
+        motivo_login, details = resultados.get(login, ("cancelado", []))
         all_details.append({
             "login": login,
             "motivo": motivo_login,
             "details": details
         })
-        if motivo_login == "energia":
-            energy_count += 1
-        elif motivo_login == "loss":
-            loss_count += 1
 
-    # Decisão por maioria (2 ou mais)
-    if energy_count >= 2:
+    # Decisão por maioria
+    if contagem["energia"] >= necessario:
         final = "energia"
-    elif loss_count >= 2:
+    elif contagem["loss"] >= necessario:
         final = "loss"
     else:
         final = "indeterminado"
 
     return final, all_details
 
+# --------------------------------------------------
+# Consulta por porta PON (quedas em massa)
+# --------------------------------------------------
+
+DATA_HORA_REGEX = re.compile(r"\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}(?:[+-]\d{2}:\d{2})?")
+
+def parse_resumo_porta(saida):
+    """
+    Extrai da saída de OLT_PORT_SUMMARY_COMMAND o mapa ONT-ID -> última causa de queda.
+    Nas Huawei a primeira tabela tem as colunas ONT ID, Run State, Last UpTime,
+    Last DownTime e Last DownCause; a segunda (SN, tipo, potência...) é ignorada.
+    """
+    causas = {}
+    na_tabela = False
+    for linha in saida.splitlines():
+        if "DownCause" in linha:
+            na_tabela = True
+            continue
+        if na_tabela and "SN" in linha:
+            break
+        match = re.match(r"^\s*(\d+)\s+(\S+)\s+(.*?)\s*$", linha) if na_tabela else None
+        if not match:
+            continue
+        ont_id, _, resto = match.groups()
+        # Remove as datas de subida/queda (ou os "-" no lugar delas); o que sobra é a causa
+        tokens = DATA_HORA_REGEX.sub(" ", resto).split()
+        while len(tokens) > 1 and tokens[0] == "-":
+            tokens.pop(0)
+        causas[ont_id] = " ".join(tokens) if tokens and tokens != ["-"] else "indeterminado"
+    return causas
+
+def consultar_porta(olt_ip, fspon):
+    """Executa o resumo de uma porta PON e retorna ONT-ID -> causa (ou {} em caso de erro)."""
+    try:
+        with pool_da_olt(olt_ip).sessao() as sessao:
+            saida = sessao.executar(OLT_PORT_SUMMARY_COMMAND.format(fspon=fspon))
+        return parse_resumo_porta(saida)
+    except Exception as e:
+        logging.error(f"Erro ao consultar a porta {fspon} da OLT {olt_ip}: {e}")
+        return {}
+
+def consult_olt_por_porta(logins, olt_ip):
+    """
+    Agrupa os logins por F/S/P usando o inventário e executa um único comando por
+    porta PON, em vez de um "display ont info" por ONT. Retorna o motivo final
+    (maioria absoluta entre os logins localizados), a contagem de motivos e de
+    causas, os detalhes por porta e os logins fora do inventário.
+    """
+    localizacoes = inventario_da_olt(olt_ip).localizar_varios(logins)
+    portas = {}
+    for login, locais in localizacoes.items():
+        for fspon, ont_id in locais:
+            portas.setdefault(fspon, []).append((login, ont_id))
+
+    causas_por_porta = dict(zip(portas, executor_consultas.map(lambda fspon: consultar_porta(olt_ip, fspon), portas)))
+
+    contagem_motivos = {"energia": 0, "loss": 0, "indeterminado": 0}
+    contagem_causas = {}
+    detalhes = []
+    for fspon, onts in portas.items():
+        causas = causas_por_porta[fspon]
+        causas_porta = {}
+        onts_afetadas = []
+        for login, ont_id in onts:
+            causa = causas.get(ont_id, "indeterminado")
+            causas_porta[causa] = causas_porta.get(causa, 0) + 1
+            contagem_causas[causa] = contagem_causas.get(causa, 0) + 1
+            onts_afetadas.append({"login": login, "ont_id": ont_id, "last_down_cause": causa})
+        detalhes.append({
+            "fspon": fspon,
+            "onts_na_porta": len(causas),
+            "onts_afetadas": len(onts),
+            "causas": causas_porta,
+            "onts": onts_afetadas
+        })
+
+    for login, locais in localizacoes.items():
+        causas = [causas_por_porta[fspon].get(ont_id, "indeterminado") for fspon, ont_id in locais]
+        contagem_motivos[motivo_por_causas(causas)] += 1
+
+    necessario = OLT_QUORUM
+    if contagem_motivos["energia"] >= necessario:
+        final = "energia"
+    elif contagem_motivos["loss"] >= necessario:
+        final = "loss"
+    else:
+        final = "indeterminado"
+
+    return {
+        "motivo_final": final,
+        "contagem_motivos": contagem_motivos,
+        "contagem_causas": contagem_causas,
+        "detalhes": detalhes,
+        "nao_localizados": [login for login in logins if login not in localizacoes]
+    }
+
+def consultar_conexao(consulta):
+    """Executa uma consulta do lote e devolve o resultado ou o erro de validação."""
+    logins = consulta.get("logins", [])
+    id_transmissor = consulta.get("id_transmissor")
+    resultado = {"conexao": consulta.get("conexao"), "id_transmissor": id_transmissor}
+    olt_ip = OLT_IP_MAPPING.get(str(id_transmissor)) if id_transmissor else None
+    if not logins:
+        resultado["error"] = "Ao menos um login é necessário."
+    elif not olt_ip:
+        resultado["error"] = f"ID da OLT desconhecido: {id_transmissor}."
+    elif consulta.get("modo") == "porta":
+        resultado.update(consult_olt_por_porta(logins, olt_ip))
+    else:
+        resultado["motivo_final"], resultado["detalhes"] = consult_olt_multiple_logins(logins, olt_ip)
+    return resultado
+
 @app.route('/consulta/olt', methods=['POST'])
 def consulta_olt_endpoint():
     """
     Endpoint que recebe um JSON com:
       - "logins": lista de logins (3 ou mais)
       - "id_transmissor": qual OLT consultar
+      - "modo" (opcional): "porta" para consultar por porta PON (consult_olt_por_porta)
     Faz a consulta para cada login e decide o motivo final por maioria.
     """
     data = request.get_json()
@@ -204,11 +618,13 @@ def consulta_olt_endpoint():
     if not id_transmissor:
         return jsonify({"error": "O campo id_transmissor é obrigatório."}), 400
 
-    olt_ip = OLT_IP_MAPPING.get(id_transmissor)
+    olt_ip = OLT_IP_MAPPING.get(str(id_transmissor))
     if not olt_ip:
         return jsonify({"error": f"ID da OLT desconhecido: {id_transmissor}."}), 400
 
     logging.info(f"Iniciando consulta na OLT {olt_ip} para os logins: {logins}")
+    if data.get("modo") == "porta":
+        return jsonify(consult_olt_por_porta(logins, olt_ip))
     final_motivo, all_details = consult_olt_multiple_logins(logins, olt_ip)
 
     return jsonify({
@@ -216,5 +632,45 @@ def consulta_olt_endpoint():
         "detalhes": all_details
     })
 
+@app.route('/inventario/localizar', methods=['POST'])
+def inventario_localizar_endpoint():
+    """
+    Endpoint que recebe um JSON com:
+      - "logins": lista de logins
+      - "id_transmissor": qual OLT consultar
+    Retorna o F/S/P e o ONT-ID de cada login encontrado no inventário da OLT.
+    """
+    data = request.get_json()
+    logins = data.get("logins", [])
+    id_transmissor = data.get("id_transmissor")
+    olt_ip = OLT_IP_MAPPING.get(str(id_transmissor)) if id_transmissor else None
+    if not olt_ip:
+        return jsonify({"error": f"ID da OLT desconhecido: {id_transmissor}."}), 400
+
+    localizacoes = inventario_da_olt(olt_ip).localizar_varios(logins)
+    return jsonify({
+        "localizacoes": {
+            login: [{"fspon": fspon, "ont_id": ont_id} for fspon, ont_id in locais]
+            for login, locais in localizacoes.items()
+        }
+    })
+
+@app.route('/consulta/olt/lote', methods=['POST'])
+def consulta_olt_lote_endpoint():
+    """
+    Endpoint que recebe um JSON com:
+      - "consultas": lista de {"conexao", "logins", "id_transmissor", "modo" (opcional)}
+    Executa todas as consultas em paralelo (ex.: várias conexões/OLTs afetadas
+    por uma queda regional) e retorna um resultado por consulta, na mesma ordem.
+    """
+    data = request.get_json()
+    consultas = data.get("consultas", [])
+    logging.info(f"Lote recebido no OLT Service: {len(consultas)} consultas.")
+    if not consultas:
+        return jsonify({"error": "Ao menos uma consulta é necessária."}), 400
+
+    resultados = list(executor_lotes.map(consultar_conexao, consultas))
+    return jsonify({"resultados": resultados})
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5003)
\ No newline at end of file
@@ -0,0 +1,579 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+import sys
+import threading
+
+# Credenciais fictícias: o módulo encerra o processo se não estiverem definidas
+os.environ.setdefault('OLT_USERNAME', 'teste')
+os.environ.setdefault('OLT_PASSWORD', 'teste')
+
+# Ensure the service module can be imported
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import olt_service
+
+
+class SessaoFalsa:
+    """Substitui SessaoOLT: responde aos comandos com as saídas de `respostas`."""
+
+    criadas = []
+
+    def __init__(self, olt_ip, respostas=None):
+        self.olt_ip = olt_ip
+        self.respostas = respostas or {}
+        self.comandos = []
+        self.aberta = True
+        self.ociosa = 0
+        SessaoFalsa.criadas.append(self)
+
+    def executar(self, cmd, timeout=None):
+        self.comandos.append(cmd)
+        resposta = self.respostas.get(cmd, "")
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+
+    def ativa(self):
+        return self.aberta
+
+    def ociosa_ha(self):
+        return self.ociosa
+
+    def fechar(self):
+        self.aberta = False
+
+
+class CanalFalso:
+    """Canal SSH que entrega `blocos` um a um e registra o que é enviado."""
+
+    def __init__(self, *blocos, fechar_no_fim=False):
+        self.blocos = [bloco.encode() if isinstance(bloco, str) else bloco for bloco in blocos]
+        self.enviados = []
+        self.fechar_no_fim = fechar_no_fim
+
+    @property
+    def closed(self):
+        return self.fechar_no_fim and not self.blocos
+
+    def recv_ready(self):
+        return bool(self.blocos)
+
+    def recv(self, tamanho):
+        return self.blocos.pop(0)
+
+    def send(self, dados):
+        self.enviados.append(dados)
+
+
+class TestLeituraAtePrompt(unittest.TestCase):
+
+    def _sessao(self, canal):
+        sessao = object.__new__(olt_service.SessaoOLT)
+        sessao.olt_ip = '10.0.0.1'
+        sessao.channel = canal
+        return sessao
+
+    def test_para_no_prompt(self):
+        canal = CanalFalso("display ont info 0 1 2 5\r\n", "  Run state : offline\r\n", "OLT-01(config)#")
+
+        saida = self._sessao(canal).ler_ate_prompt(1)
+
+        self.assertIn("Run state : offline", saida)
+        self.assertTrue(saida.endswith("OLT-01(config)#"))
+        self.assertEqual(canal.enviados, [])
+
+    def test_prompt_no_meio_da_saida_nao_encerra(self):
+        canal = CanalFalso("OLT-01(config)#display ont info 0 1 2 5\r\n  Last down cause : dying-gasp\r\n", "OLT-01(config)#")
+
+        saida = self._sessao(canal).ler_ate_prompt(1)
+
+        self.assertIn("dying-gasp", saida)
+        self.assertEqual(canal.blocos, [])
+
+    def test_paginador_recebe_espaco_e_sai_da_saida(self):
+        canal = CanalFalso(
+            "linha 1\r\n  ---- More ( Press 'Q' to break ) ----",
+            "\x1b[37Dlinha 2\r\nOLT-01(config)#",
+        )
+
+        saida = self._sessao(canal).ler_ate_prompt(1)
+
+        self.assertEqual(canal.enviados, [" "])
+        self.assertNotIn("More", saida)
+        self.assertNotIn("\x1b", saida)
+        self.assertIn("linha 2", saida)
+
+    def test_pedido_de_parametros_recebe_enter(self):
+        canal = CanalFalso("display ont info by-desc cliente1\r\n{ <cr>||<K> }:", "\r\n  0/ 1/2  5\r\nOLT-01(config)#")
+
+        saida = self._sessao(canal).ler_ate_prompt(1)
+
+        self.assertEqual(canal.enviados, ["\n"])
+        self.assertIn("0/ 1/2  5", saida)
+
+    def test_caractere_dividido_entre_leituras(self):
+        texto = "Descrição: manutenção\r\nOLT-01(config)#".encode()
+        corte = texto.index("ç".encode()) + 1
+        canal = CanalFalso(texto[:corte], texto[corte:])
+
+        self.assertIn("Descrição: manutenção", self._sessao(canal).ler_ate_prompt(1))
+
+    def test_sem_prompt_estoura_o_tempo(self):
+        canal = CanalFalso("saída sem prompt\r\n")
+
+        with self.assertRaises(TimeoutError):
+            self._sessao(canal).ler_ate_prompt(0.05)
+
+    def test_canal_encerrado(self):
+        canal = CanalFalso("saída parcial\r\n", fechar_no_fim=True)
+
+        with self.assertRaises(ConnectionError):
+            self._sessao(canal).ler_ate_prompt(1)
+
+    def test_falha_ao_abrir_sessao_fecha_o_cliente(self):
+        cliente = MagicMock()
+        cliente.invoke_shell.return_value = CanalFalso("banner sem prompt\r\n", fechar_no_fim=True)
+
+        with patch.object(olt_service.paramiko, 'SSHClient', return_value=cliente):
+            with self.assertRaises(ConnectionError):
+                olt_service.SessaoOLT('10.0.0.1')
+
+        cliente.close.assert_called_once()
+
+
+class TestPoolSessoesOLT(unittest.TestCase):
+
+    def setUp(self):
+        SessaoFalsa.criadas = []
+        patch.object(olt_service, 'SessaoOLT', SessaoFalsa).start()
+        patch.object(olt_service, 'OLT_SESSION_ACQUIRE_TIMEOUT', 0.05).start()
+        patch.object(olt_service, 'OLT_SESSION_IDLE_TIMEOUT', 300).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_sessao_reaproveitada(self):
+        pool = olt_service.PoolSessoesOLT('10.0.0.1', max_sessoes=2)
+
+        with pool.sessao() as primeira:
+            pass
+        with pool.sessao() as segunda:
+            pass
+
+        self.assertIs(primeira, segunda)
+        self.assertEqual(len(SessaoFalsa.criadas), 1)
+
+    def test_limite_de_sessoes_simultaneas(self):
+        pool = olt_service.PoolSessoesOLT('10.0.0.1', max_sessoes=1)
+
+        with pool.sessao():
+            with self.assertRaises(TimeoutError):
+                with pool.sessao():
+                    pass
+
+        # A vaga volta ao sair do bloco
+        with pool.sessao():
+            pass
+
+    def test_sessoes_em_paralelo_ate_o_limite(self):
+        pool = olt_service.PoolSessoesOLT('10.0.0.1', max_sessoes=2)
+        dentro = threading.Barrier(2, timeout=1)
+
+        def usar():
+            with pool.sessao():
+                dentro.wait()
+
+        threads = [threading.Thread(target=usar) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse(dentro.broken)
+        self.assertEqual(len(SessaoFalsa.criadas), 2)
+        self.assertEqual(len(pool.ociosas), 2)
+
+    def test_sessao_descartada_apos_erro(self):
+        pool = olt_service.PoolSessoesOLT('10.0.0.1', max_sessoes=1)
+
+        with self.assertRaises(RuntimeError):
+            with pool.sessao() as sessao:
+                raise RuntimeError("canal encerrado no meio do comando")
+
+        self.assertFalse(sessao.aberta)
+        self.assertEqual(pool.ociosas, [])
+        with pool.sessao() as nova:
+            self.assertIsNot(nova, sessao)
+
+    def test_sessao_ociosa_ou_inativa_nao_e_reutilizada(self):
+        pool = olt_service.PoolSessoesOLT('10.0.0.1', max_sessoes=2)
+        with pool.sessao() as ociosa:
+            pass
+        ociosa.ociosa = olt_service.OLT_SESSION_IDLE_TIMEOUT
+        with pool.sessao() as nova:
+            pass
+        nova.aberta = False
+
+        with pool.sessao() as terceira:
+            pass
+
+        self.assertFalse(ociosa.aberta)
+        self.assertNotIn(terceira, (ociosa, nova))
+        self.assertEqual(len(SessaoFalsa.criadas), 3)
+
+    def test_espera_por_vaga_cancelada(self):
+        patch.object(olt_service, 'OLT_SESSION_ACQUIRE_TIMEOUT', 5).start()
+        pool = olt_service.PoolSessoesOLT('10.0.0.1', max_sessoes=1)
+        cancelado = threading.Event()
+        cancelado.set()
+
+        with pool.sessao():
+            with self.assertRaises(olt_service.ConsultaCancelada):
+                with pool.sessao(cancelado):
+                    pass
+
+    def test_remover_ociosas(self):
+        pool = olt_service.PoolSessoesOLT('10.0.0.1', max_sessoes=2)
+        with pool.sessao() as expirada:
+            with pool.sessao() as recente:
+                pass
+        expirada.ociosa = olt_service.OLT_SESSION_IDLE_TIMEOUT + 1
+
+        pool.remover_ociosas()
+
+        self.assertEqual(pool.ociosas, [recente])
+        self.assertFalse(expirada.aberta)
+        self.assertTrue(recente.aberta)
+
+    def test_encerrar_sessoes_fecha_todas_as_ociosas(self):
+        pool = olt_service.PoolSessoesOLT('10.0.0.1', max_sessoes=2)
+        with pool.sessao() as primeira:
+            with pool.sessao() as segunda:
+                pass
+
+        with patch.dict(olt_service.pools_olt, {'10.0.0.1': pool}, clear=True):
+            olt_service.encerrar_sessoes()
+
+        self.assertEqual(pool.ociosas, [])
+        self.assertFalse(primeira.aberta)
+        self.assertFalse(segunda.aberta)
+
+
+INVENTARIO = """\
+  -----------------------------------------------------------------------------
+  F/S/P   ONT         SN         Control     Run      Config   Match    Protect
+          ID                     flag        state    state    state    side
+  -----------------------------------------------------------------------------
+  0/ 1/0    0  485754431A2B3C4D  active      online   normal   match    no
+  0/ 1/0    1  485754431A2B3C4E  active      offline  normal   match    no
+  -----------------------------------------------------------------------------
+  F/S/P   ONT-ID   Description
+  -----------------------------------------------------------------------------
+  0/ 1/0    0      cliente1@provedor
+  0/ 1/0    1      cliente2@provedor
+  0/ 2/3   17      cliente2@provedor
+  0/ 2/3   18      Loja Centro 2
+  -----------------------------------------------------------------------------
+  In port 0/ 1/0 , the total of ONTs are: 2, online: 1
+"""
+
+
+class TestInventarioONT(unittest.TestCase):
+
+    def setUp(self):
+        self.respostas = {olt_service.OLT_INVENTORY_COMMAND: INVENTARIO}
+        SessaoFalsa.criadas = []
+        patch.object(olt_service, 'SessaoOLT', lambda olt_ip: SessaoFalsa(olt_ip, self.respostas)).start()
+        patch.dict(olt_service.pools_olt, clear=True).start()
+        patch.dict(olt_service.inventarios_olt, clear=True).start()
+        self.inventario = olt_service.InventarioONT('10.0.0.1')
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _leituras(self):
+        return sum(sessao.comandos.count(olt_service.OLT_INVENTORY_COMMAND) for sessao in SessaoFalsa.criadas)
+
+    def _envelhecer(self, segundos):
+        self.inventario.atualizado_em -= segundos
+
+    def test_parse_inventario_usa_a_tabela_de_descricao(self):
+        self.assertEqual(olt_service.parse_inventario(INVENTARIO), {
+            'cliente1@provedor': [('0/1/0', '0')],
+            'cliente2@provedor': [('0/1/0', '1'), ('0/2/3', '17')],
+            'Loja Centro 2': [('0/2/3', '18')],
+        })
+
+    def test_parse_inventario_sem_tabela_de_descricao(self):
+        self.assertEqual(olt_service.parse_inventario(INVENTARIO.split("  F/S/P   ONT-ID")[0]), {})
+
+    def test_inventario_lido_uma_vez(self):
+        self.assertEqual(self.inventario.localizar('cliente1@provedor'), [('0/1/0', '0')])
+        self.assertEqual(
+            self.inventario.localizar_varios(['cliente1@provedor', 'Loja Centro 2']),
+            {'cliente1@provedor': [('0/1/0', '0')], 'Loja Centro 2': [('0/2/3', '18')]}
+        )
+
+        self.assertEqual(self._leituras(), 1)
+
+    def test_inventario_expirado_e_relido(self):
+        self.inventario.localizar('cliente1@provedor')
+        self._envelhecer(olt_service.OLT_INVENTORY_TTL)
+
+        self.inventario.localizar('cliente1@provedor')
+
+        self.assertEqual(self._leituras(), 2)
+
+    def test_login_ausente_rele_no_maximo_a_cada_min_refresh(self):
+        self.inventario.localizar('cliente1@provedor')
+
+        self.assertIsNone(self.inventario.localizar('cliente9@provedor'))
+        self.assertEqual(self._leituras(), 1)
+
+        self._envelhecer(olt_service.OLT_INVENTORY_MIN_REFRESH)
+        self.respostas[olt_service.OLT_INVENTORY_COMMAND] = INVENTARIO.replace('Loja Centro 2', 'cliente9@provedor')
+        self.assertEqual(self.inventario.localizar('cliente9@provedor'), [('0/2/3', '18')])
+        self.assertEqual(self._leituras(), 2)
+
+    def test_falha_na_leitura_retorna_vazio(self):
+        self.respostas[olt_service.OLT_INVENTORY_COMMAND] = TimeoutError("sem prompt")
+
+        self.assertEqual(self.inventario.localizar_varios(['cliente1@provedor']), {})
+        self.assertIsNone(self.inventario.atualizado_em)
+
+    def test_endpoint_localizar(self):
+        resposta = olt_service.app.test_client().post(
+            '/inventario/localizar', json={'logins': ['cliente2@provedor', 'cliente9@provedor'], 'id_transmissor': 1}
+        )
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.get_json(), {'localizacoes': {'cliente2@provedor': [
+            {'fspon': '0/1/0', 'ont_id': '1'}, {'fspon': '0/2/3', 'ont_id': '17'}
+        ]}})
+
+
+class TestConsultaLogin(unittest.TestCase):
+
+    BY_DESC = (
+        "  F/S/P   ONT-ID   SN                Control flag   Run state\n"
+        "  0/ 1/2  5        48575443ABCDEF01  active         offline\n"
+    )
+
+    def setUp(self):
+        self.respostas = {}
+        SessaoFalsa.criadas = []
+        patch.object(olt_service, 'SessaoOLT', lambda olt_ip: SessaoFalsa(olt_ip, self.respostas)).start()
+        patch.dict(olt_service.pools_olt, clear=True).start()
+        patch.dict(olt_service.inventarios_olt, clear=True).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _responder(self, login, causa):
+        self.respostas[f"{olt_service.OLT_COMMAND} {login}"] = self.BY_DESC
+        self.respostas["display ont info 0 1 2 5"] = f"  Last down cause       : {causa}\n"
+
+    def test_dying_gasp_e_energia(self):
+        self._responder('cliente1', 'dying-gasp')
+
+        motivo, detalhes = olt_service.query_olt_single_login('cliente1', '10.0.0.1')
+
+        self.assertEqual(motivo, 'energia')
+        self.assertEqual(detalhes, [{'fspon': '0/1/2', 'ont_id': '5', 'last_down_cause': 'dying-gasp'}])
+
+    def test_losi_e_loss(self):
+        self._responder('cliente1', 'LOSi/LOBi')
+
+        self.assertEqual(olt_service.query_olt_single_login('cliente1', '10.0.0.1')[0], 'loss')
+
+    def test_login_nao_encontrado(self):
+        self.assertEqual(olt_service.query_olt_single_login('cliente1', '10.0.0.1'), ('indeterminado', []))
+
+    def test_login_localizado_pelo_inventario(self):
+        self.respostas[olt_service.OLT_INVENTORY_COMMAND] = INVENTARIO
+        self.respostas["display ont info 0 1 0 1"] = "  Last down cause       : LOFi\n"
+
+        motivo, detalhes = olt_service.query_olt_single_login('cliente2@provedor', '10.0.0.1')
+
+        self.assertEqual(motivo, 'loss')
+        self.assertEqual([d['fspon'] for d in detalhes], ['0/1/0', '0/2/3'])
+        comandos = [cmd for sessao in SessaoFalsa.criadas for cmd in sessao.comandos]
+        self.assertNotIn(f"{olt_service.OLT_COMMAND} cliente2@provedor", comandos)
+
+    def test_logins_compartilham_a_sessao(self):
+        for login in ('cliente1', 'cliente2', 'cliente3'):
+            self._responder(login, 'dying-gasp')
+
+        motivo, detalhes = olt_service.consult_olt_multiple_logins(['cliente1', 'cliente2', 'cliente3'], '10.0.0.1')
+
+        self.assertEqual(motivo, 'energia')
+        self.assertEqual([d['login'] for d in detalhes], ['cliente1', 'cliente2', 'cliente3'])
+        self.assertLessEqual(len(SessaoFalsa.criadas), olt_service.OLT_MAX_SESSIONS)
+
+
+
+class TestConsultaConcorrente(unittest.TestCase):
+
+    def setUp(self):
+        self.cancelamentos = []
+        self.motivos = {}
+        patch.object(olt_service, 'query_olt_single_login', self._consultar).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def _consultar(self, login, olt_ip, cancelado):
+        motivo = self.motivos[login]
+        if motivo == 'lento':
+            # Só termina quando as demais consultas decidirem o motivo
+            self.cancelamentos.append(cancelado)
+            return ('cancelado', []) if cancelado.wait(2) else ('indeterminado', [])
+        return (motivo, [])
+
+    def test_quorum_fixo_em_amostras_maiores(self):
+        self.motivos = {'a': 'energia', 'b': 'loss', 'c': 'energia', 'd': 'lento', 'e': 'lento', 'f': 'lento'}
+
+        final, detalhes = olt_service.consult_olt_multiple_logins(list('abcdef'), '10.0.0.1')
+
+        # 2 de 6 bastam: os lentos são cancelados
+        self.assertEqual(final, 'energia')
+        self.assertEqual([d['motivo'] for d in detalhes].count('cancelado'), 3)
+
+    def test_cancela_restantes_ao_atingir_quorum(self):
+        self.motivos = {'a': 'energia', 'b': 'lento', 'c': 'energia'}
+
+        final, detalhes = olt_service.consult_olt_multiple_logins(['a', 'b', 'c'], '10.0.0.1')
+
+        self.assertEqual(final, 'energia')
+        self.assertEqual([(d['login'], d['motivo']) for d in detalhes], [('a', 'energia'), ('b', 'cancelado'), ('c', 'energia')])
+        (cancelado,) = self.cancelamentos
+        self.assertTrue(cancelado.is_set())
+
+    def test_sem_quorum_e_indeterminado(self):
+        self.motivos = {'a': 'energia', 'b': 'loss', 'c': 'indeterminado'}
+
+        final, detalhes = olt_service.consult_olt_multiple_logins(['a', 'b', 'c'], '10.0.0.1')
+
+        self.assertEqual(final, 'indeterminado')
+        self.assertEqual([d['motivo'] for d in detalhes], ['energia', 'loss', 'indeterminado'])
+
+
+class TestConsultaLote(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_consultar = patch.object(olt_service, 'consult_olt_multiple_logins', return_value=('loss', [])).start()
+        self.client = olt_service.app.test_client()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_um_resultado_por_consulta_na_ordem(self):
+        resposta = self.client.post('/consulta/olt/lote', json={'consultas': [
+            {'conexao': 'CONEXAO_A', 'logins': ['a1', 'a2', 'a3'], 'id_transmissor': '1'},
+            {'conexao': 'CONEXAO_B', 'logins': ['b1'], 'id_transmissor': 99},
+            {'conexao': 'CONEXAO_C', 'logins': [], 'id_transmissor': '5'},
+            {'conexao': 'CONEXAO_D', 'logins': ['d1'], 'id_transmissor': 6},
+        ]})
+
+        self.assertEqual(resposta.status_code, 200)
+        resultados = resposta.get_json()['resultados']
+        self.assertEqual([r['conexao'] for r in resultados], ['CONEXAO_A', 'CONEXAO_B', 'CONEXAO_C', 'CONEXAO_D'])
+        self.assertEqual(resultados[0]['motivo_final'], 'loss')
+        self.assertEqual(resultados[1]['error'], "ID da OLT desconhecido: 99.")
+        self.assertEqual(resultados[2]['error'], "Ao menos um login é necessário.")
+        self.assertEqual(resultados[3]['motivo_final'], 'loss')  # id_transmissor numérico
+        self.assertEqual(
+            sorted(chamada.args for chamada in self.mock_consultar.call_args_list),
+            [(['a1', 'a2', 'a3'], '10.1.10.14'), (['d1'], '10.200.10.10')]
+        )
+
+    def test_lote_vazio(self):
+        self.assertEqual(self.client.post('/consulta/olt/lote', json={'consultas': []}).status_code, 400)
+
+    def test_consulta_unica_com_id_numerico(self):
+        resposta = self.client.post('/consulta/olt', json={'logins': ['a1', 'a2'], 'id_transmissor': 5})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.get_json()['motivo_final'], 'loss')
+        self.mock_consultar.assert_called_once_with(['a1', 'a2'], '10.200.10.14')
+
+
+
+RESUMO_PORTA = """\
+  ----------------------------------------------------------------------------
+  In port 0/1/0, the total of ONTs are: 3, online: 1
+  ----------------------------------------------------------------------------
+  ONT  Run     Last                Last                Last
+  ID   State   UpTime              DownTime            DownCause
+  ----------------------------------------------------------------------------
+  0    online  2024-05-01 10:00:00 2024-04-30 22:10:05 dying-gasp
+  1    offline 2024-05-01 09:00:00 2024-05-02 03:12:44 LOSi/LOBi
+  2    offline -                   -                   -
+  ----------------------------------------------------------------------------
+  ONT        SN        Type          Distance Rx/Tx power  Description
+  ID                                    (m)      (dBm)
+  ----------------------------------------------------------------------------
+  0   485754431A2B3C4D  HG8245H      1520     -20.10/2.05   cliente1@provedor
+"""
+
+
+class TestConsultaPorPorta(unittest.TestCase):
+
+    def setUp(self):
+        self.respostas = {
+            olt_service.OLT_INVENTORY_COMMAND: INVENTARIO,
+            "display ont info summary 0/1/0": RESUMO_PORTA,
+            "display ont info summary 0/2/3": (
+                "  ONT ID  Run State  Last UpTime  Last DownTime  Last DownCause\n"
+                "  17  offline  2024-05-01 09:00:00  2024-05-02 03:12:40  LOFi\n"
+                "  18  offline  2024-05-01 09:00:00  2024-05-02 03:12:41  dying-gasp\n"
+            ),
+        }
+        SessaoFalsa.criadas = []
+        patch.object(olt_service, 'SessaoOLT', lambda olt_ip: SessaoFalsa(olt_ip, self.respostas)).start()
+        patch.dict(olt_service.pools_olt, clear=True).start()
+        patch.dict(olt_service.inventarios_olt, clear=True).start()
+
+    def tearDown(self):
+        patch.stopall()
+
+    def test_parse_resumo_porta(self):
+        self.assertEqual(
+            olt_service.parse_resumo_porta(RESUMO_PORTA),
+            {'0': 'dying-gasp', '1': 'LOSi/LOBi', '2': 'indeterminado'}
+        )
+
+    def test_causa_com_espacos_e_sem_datas(self):
+        saida = "  ONT ID  Run State  Last UpTime  Last DownTime  Last DownCause\n  3  offline  -  -  ONT deactivated\n"
+
+        self.assertEqual(olt_service.parse_resumo_porta(saida), {'3': 'ONT deactivated'})
+
+    def test_um_comando_por_porta(self):
+        resultado = olt_service.consult_olt_por_porta(
+            ['cliente1@provedor', 'cliente2@provedor', 'Loja Centro 2', 'cliente9@provedor'], '10.0.0.1'
+        )
+
+        self.assertEqual(resultado['motivo_final'], 'energia')
+        self.assertEqual(resultado['contagem_motivos'], {'energia': 2, 'loss': 1, 'indeterminado': 0})
+        self.assertEqual(resultado['contagem_causas'], {'dying-gasp': 2, 'LOSi/LOBi': 1, 'LOFi': 1})
+        self.assertEqual(resultado['nao_localizados'], ['cliente9@provedor'])
+        porta = next(d for d in resultado['detalhes'] if d['fspon'] == '0/1/0')
+        self.assertEqual((porta['onts_na_porta'], porta['onts_afetadas']), (3, 2))
+        comandos = [cmd for sessao in SessaoFalsa.criadas for cmd in sessao.comandos]
+        self.assertEqual(
+            sorted(cmd for cmd in comandos if cmd != olt_service.OLT_INVENTORY_COMMAND),
+            ["display ont info summary 0/1/0", "display ont info summary 0/2/3"]
+        )
+
+    def test_modo_porta_no_lote(self):
+        resposta = olt_service.app.test_client().post('/consulta/olt/lote', json={'consultas': [
+            {'conexao': 'CONEXAO_A', 'logins': ['cliente1@provedor'], 'id_transmissor': '1', 'modo': 'porta'}
+        ]})
+
+        (resultado,) = resposta.get_json()['resultados']
+        self.assertEqual(resultado['contagem_causas'], {'dying-gasp': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
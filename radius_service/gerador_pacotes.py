@@ -0,0 +1,69 @@
+"""
+Gerador de pacotes RADIUS Accounting para testar o radius_service localmente.
+
+Envia Accounting-Request (Start, Stop ou Interim-Update) autenticados com o
+RADIUS_SECRET para uma lista de logins e confere os Accounting-Response. Simula
+uma queda em massa com --status stop. Uso:
+
+    python gerador_pacotes.py --secret teste --logins cliente{}@provedor --quantidade 500 --status stop
+"""
+import argparse
+import hashlib
+import os
+import socket
+import struct
+import time
+
+STATUS = {'start': 1, 'stop': 2, 'interim': 3, 'on': 7, 'off': 8}
+
+
+def atributo(tipo, valor):
+    return struct.pack('!BB', tipo, len(valor) + 2) + valor
+
+
+def accounting_request(identificador, secret, login, status, sessao):
+    atributos = (
+        atributo(1, login.encode())
+        + atributo(40, struct.pack('!I', STATUS[status]))
+        + atributo(44, sessao.encode())
+        + atributo(55, struct.pack('!I', int(time.time())))
+    )
+    tamanho = 20 + len(atributos)
+    cabecalho = struct.pack('!BBH', 4, identificador, tamanho)
+    autenticador = hashlib.md5(cabecalho + b'\x00' * 16 + atributos + secret).digest()
+    return cabecalho + autenticador + atributos
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=1813)
+    parser.add_argument('--secret', default=os.getenv('RADIUS_SECRET', ''))
+    parser.add_argument('--logins', default='cliente{}', help='Modelo do login; {} recebe o número')
+    parser.add_argument('--inicio', type=int, default=0)
+    parser.add_argument('--quantidade', type=int, default=10)
+    parser.add_argument('--status', choices=sorted(STATUS), default='stop')
+    args = parser.parse_args()
+
+    secret = args.secret.encode()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(2)
+    respostas = 0
+    inicio = time.perf_counter()
+    for n in range(args.inicio, args.inicio + args.quantidade):
+        identificador = n % 256
+        pacote = accounting_request(identificador, secret, args.logins.format(n), args.status, f'sessao{n}')
+        sock.sendto(pacote, (args.host, args.porta))
+        try:
+            resposta = sock.recv(4096)
+        except socket.timeout:
+            continue
+        esperado = hashlib.md5(resposta[:4] + pacote[4:20] + secret).digest()
+        if resposta[0] == 5 and resposta[1] == identificador and resposta[4:20] == esperado:
+            respostas += 1
+    duracao = time.perf_counter() - inicio
+    print(f"{args.quantidade} pacotes {args.status} enviados em {duracao:.2f} s; {respostas} respostas válidas.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import os
+import re
+import time
+import socket
+import struct
+import hashlib
+import logging
+import threading
+import requests
+from flask import Flask, jsonify
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+os.makedirs("logs", exist_ok=True)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    handlers=[
+        logging.FileHandler("/app/logs/radius_service.log"),  # Log em arquivo
+        logging.StreamHandler()                 # Log no terminal (stdout)
+    ]
+)
+
+app = Flask(__name__)
+
+# Recepção de RADIUS Accounting (RFC 2866) por UDP; porta 0 desativa
+RADIUS_ACCT_HOST = os.getenv("RADIUS_ACCT_HOST", "0.0.0.0")
+RADIUS_ACCT_PORT = int(os.getenv("RADIUS_ACCT_PORT", "1813"))
+RADIUS_SECRET = os.getenv("RADIUS_SECRET", "").encode()
+
+# Alternativa (ou complemento): seguir um arquivo de accounting
+#   detail: arquivo "detail" do FreeRADIUS (blocos de "Atributo = valor" separados por linha em branco)
+#   regex:  um evento por linha (syslog), com os grupos nomeados "login" e "status"
+RADIUS_LOG_PATH = os.getenv("RADIUS_LOG_PATH")
+RADIUS_LOG_FORMAT = os.getenv("RADIUS_LOG_FORMAT", "detail")
+RADIUS_LOG_REGEX = re.compile(
+    os.getenv("RADIUS_LOG_REGEX")
+    or r"Acct-Status-Type[=: ]+(?P<status>Start|Stop|Interim-Update).*?User-Name[=: ]+\"?(?P<login>[^\",\s]+)"
+)
+
+# Envio ao monitor_service
+MONITOR_SERVICE_URL = os.getenv("MONITOR_SERVICE_URL", "http://localhost:5010")
+RADIUS_PUSH_INTERVAL = float(os.getenv("RADIUS_PUSH_INTERVAL", "1"))
+RADIUS_MAX_PENDENTES = int(os.getenv("RADIUS_MAX_PENDENTES", "200000"))
+
+if RADIUS_ACCT_PORT and not RADIUS_SECRET:
+    logging.error("RADIUS_SECRET não definido; não é possível validar os pacotes de accounting.")
+    exit(1)
+
+# Códigos e atributos RADIUS usados
+ACCOUNTING_REQUEST = 4
+ACCOUNTING_RESPONSE = 5
+ATTR_USER_NAME = 1
+ATTR_ACCT_STATUS_TYPE = 40
+ATTR_ACCT_DELAY_TIME = 41
+ATTR_EVENT_TIMESTAMP = 55
+
+# Acct-Status-Type -> online (True) / offline (False); Accounting-On/Off são só registrados
+STATUS_ONLINE = {1: True, 2: False, 3: True}
+STATUS_NOMES = {"start": True, "stop": False, "interim-update": True, "alive": True,
+                "online": True, "offline": False}
+
+contadores = {"pacotes": 0, "invalidos": 0, "eventos": 0, "enviados": 0, "falhas_envio": 0, "descartados": 0}
+
+# --------------------------------------------------
+# Eventos pendentes de envio
+# --------------------------------------------------
+
+# login -> (online, timestamp); só o estado mais recente de cada login é enviado
+pendentes = {}
+# Protege `pendentes` e `contadores`, atualizados pelas threads de ingestão e de envio
+pendentes_lock = threading.Lock()
+
+def contar(nome, quantidade=1):
+    with pendentes_lock:
+        contadores[nome] += quantidade
+
+def registrar_evento(login, online, timestamp=None):
+    if not login:
+        return
+    with pendentes_lock:
+        pendentes.pop(login, None)  # reinsere no fim, mantendo a ordem de chegada
+        pendentes[login] = (online, timestamp or time.time())
+        contadores["eventos"] += 1
+
+def enviar_pendentes():
+    """Envia ao monitor_service, num único POST, o estado mais recente de cada login alterado."""
+    global pendentes
+    with pendentes_lock:
+        lote, pendentes = pendentes, {}
+    if not lote:
+        return
+    eventos = [
+        {"login": login, "status": "online" if online else "offline", "timestamp": timestamp}
+        for login, (online, timestamp) in lote.items()
+    ]
+    try:
+        response = requests.post(f"{MONITOR_SERVICE_URL}/radius/eventos", json={"eventos": eventos}, timeout=10)
+        response.raise_for_status()
+        contar("enviados", len(eventos))
+    except Exception as e:
+        logging.error(f"Erro ao enviar {len(eventos)} eventos ao monitor_service: {e}")
+        with pendentes_lock:
+            contadores["falhas_envio"] += 1
+            # Eventos que chegaram durante o envio são mais recentes e prevalecem
+            for login, estado in lote.items():
+                pendentes.setdefault(login, estado)
+            excesso = len(pendentes) - RADIUS_MAX_PENDENTES
+            if excesso > 0:
+                for login in list(pendentes)[:excesso]:
+                    del pendentes[login]
+                contadores["descartados"] += excesso
+                logging.warning(f"{excesso} eventos antigos descartados (RADIUS_MAX_PENDENTES={RADIUS_MAX_PENDENTES}).")
+
+def loop_envio():
+    while True:
+        time.sleep(RADIUS_PUSH_INTERVAL)
+        enviar_pendentes()
+
+# --------------------------------------------------
+# RADIUS Accounting por UDP
+# --------------------------------------------------
+
+def parse_atributos(dados):
+    atributos = {}
+    i = 0
+    while i + 2 <= len(dados):
+        tipo, tamanho = dados[i], dados[i + 1]
+        if tamanho < 2 or i + tamanho > len(dados):
+            raise ValueError("atributo malformado")
+        atributos.setdefault(tipo, dados[i + 2:i + tamanho])
+        i += tamanho
+    return atributos
+
+def autenticador_valido(pacote):
+    # Request Authenticator = MD5(Code + Identifier + Length + 16 zeros + Atributos + Secret)
+    esperado = hashlib.md5(pacote[:4] + b"\x00" * 16 + pacote[20:] + RADIUS_SECRET).digest()
+    return esperado == pacote[4:20]
+
+def resposta_accounting(pacote):
+    identificador, autenticador = pacote[1], pacote[4:20]
+    cabecalho = struct.pack("!BBH", ACCOUNTING_RESPONSE, identificador, 20)
+    return cabecalho + hashlib.md5(cabecalho + autenticador + RADIUS_SECRET).digest()
+
+def processar_pacote(pacote, origem):
+    """Valida um Accounting-Request e registra o evento. Retorna a resposta a enviar, ou None."""
+    contar("pacotes")
+    try:
+        codigo, _, tamanho = struct.unpack("!BBH", pacote[:4])
+        if codigo != ACCOUNTING_REQUEST or tamanho < 20 or tamanho > len(pacote):
+            raise ValueError(f"código {codigo} / tamanho {tamanho} inesperados")
+        pacote = pacote[:tamanho]
+        if not autenticador_valido(pacote):
+            raise ValueError("autenticador inválido (RADIUS_SECRET diferente do NAS?)")
+        atributos = parse_atributos(pacote[20:])
+    except (struct.error, ValueError) as e:
+        contar("invalidos")
+        logging.warning(f"Pacote RADIUS descartado de {origem[0]}: {e}")
+        return None
+
+    status_type = int.from_bytes(atributos.get(ATTR_ACCT_STATUS_TYPE, b"\x00"), "big")
+    login = atributos.get(ATTR_USER_NAME, b"").decode("utf-8", "replace")
+    if status_type in STATUS_ONLINE:
+        if ATTR_EVENT_TIMESTAMP in atributos:
+            timestamp = int.from_bytes(atributos[ATTR_EVENT_TIMESTAMP], "big")
+        else:
+            # Sem Event-Timestamp vale a chegada, descontado o tempo que o NAS levou para enviar
+            # (RFC 2866: Acct-Delay-Time é relativo ao envio, não ao Event-Timestamp)
+            timestamp = time.time() - int.from_bytes(atributos.get(ATTR_ACCT_DELAY_TIME, b"\x00"), "big")
+        registrar_evento(login, STATUS_ONLINE[status_type], timestamp)
+    elif status_type in (7, 8):
+        logging.warning(f"Accounting-{'On' if status_type == 7 else 'Off'} recebido de {origem[0]}; "
+                        f"as sessões do NAS serão reconciliadas pela consulta ao IXCSoft.")
+    # O NAS retransmite até receber a resposta, mesmo para pacotes ignorados
+    return resposta_accounting(pacote)
+
+def loop_udp():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind((RADIUS_ACCT_HOST, RADIUS_ACCT_PORT))
+    logging.info(f"Recebendo RADIUS Accounting em {RADIUS_ACCT_HOST}:{RADIUS_ACCT_PORT}/udp.")
+    while True:
+        pacote, origem = sock.recvfrom(4096)
+        resposta = processar_pacote(pacote, origem)
+        if resposta:
+            sock.sendto(resposta, origem)
+
+# --------------------------------------------------
+# Arquivo de accounting (detail do FreeRADIUS ou syslog)
+# --------------------------------------------------
+
+def seguir_arquivo(caminho):
+    """Gera as linhas novas do arquivo, reabrindo-o quando for rotacionado ou truncado."""
+    arquivo, inode, do_inicio, parcial = None, None, False, ""
+    while True:
+        if arquivo is None:
+            try:
+                arquivo = open(caminho, "r", encoding="utf-8", errors="replace")
+            except OSError as e:
+                logging.error(f"Não foi possível abrir {caminho}: {e}")
+                time.sleep(5)
+                continue
+            inode = os.fstat(arquivo.fileno()).st_ino
+            if not do_inicio:
+                arquivo.seek(0, os.SEEK_END)  # Na inicialização, só o que for escrito a partir de agora
+            logging.info(f"Seguindo o arquivo de accounting {caminho} ({RADIUS_LOG_FORMAT}).")
+        linha = arquivo.readline()
+        if linha.endswith("\n"):
+            yield parcial + linha
+            parcial = ""
+            continue
+        parcial += linha  # Linha ainda sendo escrita
+        time.sleep(0.5)
+        try:
+            estado = os.stat(caminho)
+            if estado.st_ino != inode or estado.st_size < arquivo.tell():
+                # Rotacionado ou truncado: o arquivo novo é lido desde o início
+                arquivo.close()
+                arquivo, do_inicio, parcial = None, True, ""
+        except OSError:
+            pass
+
+def processar_bloco_detail(bloco):
+    atributos = {}
+    for linha in bloco:
+        nome, separador, valor = linha.partition("=")
+        if separador:
+            atributos[nome.strip().lower()] = valor.strip().strip('"')
+    online = STATUS_NOMES.get(atributos.get("acct-status-type", "").lower())
+    if online is None:
+        return
+    timestamp = None
+    if atributos.get("event-timestamp", "").isdigit():
+        timestamp = int(atributos["event-timestamp"])
+    registrar_evento(atributos.get("user-name"), online, timestamp)
+
+def loop_arquivo():
+    bloco = []
+    for linha in seguir_arquivo(RADIUS_LOG_PATH):
+        if RADIUS_LOG_FORMAT == "regex":
+            m = RADIUS_LOG_REGEX.search(linha)
+            if m and m.group("status").lower() in STATUS_NOMES:
+                registrar_evento(m.group("login"), STATUS_NOMES[m.group("status").lower()])
+        elif linha.strip():
+            bloco.append(linha)
+        elif bloco:
+            processar_bloco_detail(bloco)
+            bloco = []
+
+# --------------------------------------------------
+# API
+# --------------------------------------------------
+
+@app.route('/status', methods=['GET'])
+def status():
+    with pendentes_lock:
+        resposta = {**contadores, "pendentes": len(pendentes)}
+    return jsonify(resposta)
+
+def iniciar_ingestao():
+    if RADIUS_ACCT_PORT:
+        threading.Thread(target=loop_udp, daemon=True).start()
+    if RADIUS_LOG_PATH:
+        threading.Thread(target=loop_arquivo, daemon=True).start()
+    threading.Thread(target=loop_envio, daemon=True).start()
+
+if __name__ == '__main__':
+    iniciar_ingestao()
+    app.run(host='0.0.0.0', port=5004)
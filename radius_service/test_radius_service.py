@@ -0,0 +1,217 @@
+import unittest
+from unittest.mock import patch
+import hashlib
+import os
+import struct
+import sys
+import threading
+
+# O serviço encerra o processo se a porta UDP estiver ativa sem RADIUS_SECRET
+os.environ.setdefault('RADIUS_SECRET', 'segredo')
+
+# Ensure the service module can be imported
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import radius_service
+
+ORIGEM = ('192.0.2.1', 1813)
+
+
+def atributo(tipo, valor):
+    return struct.pack('!BB', tipo, len(valor) + 2) + valor
+
+
+def accounting_request(login, status_type, event_timestamp=None, delay=None, identificador=7, secret=None, codigo=4):
+    atributos = atributo(1, login.encode()) + atributo(40, struct.pack('!I', status_type))
+    if event_timestamp is not None:
+        atributos += atributo(55, struct.pack('!I', event_timestamp))
+    if delay is not None:
+        atributos += atributo(41, struct.pack('!I', delay))
+    cabecalho = struct.pack('!BBH', codigo, identificador, 20 + len(atributos))
+    secret = radius_service.RADIUS_SECRET if secret is None else secret
+    return cabecalho + hashlib.md5(cabecalho + b'\x00' * 16 + atributos + secret).digest() + atributos
+
+
+class ServicoRadius(unittest.TestCase):
+
+    def setUp(self):
+        patch.object(radius_service, 'pendentes', {}).start()
+        patch.dict(radius_service.contadores).start()
+        for nome in radius_service.contadores:
+            radius_service.contadores[nome] = 0
+
+    def tearDown(self):
+        patch.stopall()
+
+
+class TestAtributos(unittest.TestCase):
+
+    def test_primeira_ocorrencia_de_cada_atributo(self):
+        dados = atributo(1, b'cliente1') + atributo(40, b'\x00\x00\x00\x02') + atributo(1, b'outro')
+
+        self.assertEqual(radius_service.parse_atributos(dados), {1: b'cliente1', 40: b'\x00\x00\x00\x02'})
+
+    def test_atributo_malformado(self):
+        for dados in (b'\x01\x01', b'\x01\x09abc'):
+            with self.assertRaises(ValueError):
+                radius_service.parse_atributos(dados)
+
+
+class TestPacotesAccounting(ServicoRadius):
+
+    def test_stop_registra_offline_e_responde(self):
+        pacote = accounting_request('cliente1', 2, event_timestamp=1700000000)
+
+        resposta = radius_service.processar_pacote(pacote, ORIGEM)
+
+        self.assertEqual(radius_service.pendentes, {'cliente1': (False, 1700000000)})
+        codigo, identificador, tamanho = struct.unpack('!BBH', resposta[:4])
+        self.assertEqual((codigo, identificador, tamanho), (radius_service.ACCOUNTING_RESPONSE, 7, 20))
+        # Response Authenticator = MD5(Code + Identifier + Length + Request Authenticator + Secret)
+        self.assertEqual(resposta[4:], hashlib.md5(resposta[:4] + pacote[4:20] + radius_service.RADIUS_SECRET).digest())
+
+    def test_start_e_interim_registram_online(self):
+        radius_service.processar_pacote(accounting_request('cliente1', 1, event_timestamp=10), ORIGEM)
+        radius_service.processar_pacote(accounting_request('cliente2', 3, event_timestamp=20), ORIGEM)
+
+        self.assertEqual(radius_service.pendentes, {'cliente1': (True, 10), 'cliente2': (True, 20)})
+
+    def test_sem_event_timestamp_desconta_o_atraso_da_chegada(self):
+        with patch.object(radius_service.time, 'time', return_value=1000.0):
+            radius_service.processar_pacote(accounting_request('cliente1', 2, delay=30), ORIGEM)
+
+        self.assertEqual(radius_service.pendentes, {'cliente1': (False, 970.0)})
+
+    def test_event_timestamp_nao_desconta_o_atraso(self):
+        radius_service.processar_pacote(accounting_request('cliente1', 2, event_timestamp=1700000000, delay=30), ORIGEM)
+
+        self.assertEqual(radius_service.pendentes, {'cliente1': (False, 1700000000)})
+
+    def test_autenticador_invalido_descartado(self):
+        pacote = accounting_request('cliente1', 2, event_timestamp=10, secret=b'outro')
+
+        self.assertIsNone(radius_service.processar_pacote(pacote, ORIGEM))
+        self.assertEqual(radius_service.pendentes, {})
+        self.assertEqual(radius_service.contadores['invalidos'], 1)
+
+    def test_pacote_que_nao_e_accounting_request_descartado(self):
+        for pacote in (accounting_request('cliente1', 2, codigo=1), b'\x04\x01\x00'):
+            self.assertIsNone(radius_service.processar_pacote(pacote, ORIGEM))
+        self.assertEqual(radius_service.contadores['invalidos'], 2)
+
+    def test_accounting_on_so_responde(self):
+        resposta = radius_service.processar_pacote(accounting_request('', 7), ORIGEM)
+
+        self.assertEqual(resposta[0], radius_service.ACCOUNTING_RESPONSE)
+        self.assertEqual(radius_service.pendentes, {})
+
+
+class TestArquivoAccounting(ServicoRadius):
+
+    DETAIL = [
+        'Mon Jan  1 00:00:00 2024\n',
+        '\tAcct-Status-Type = Stop\n',
+        '\tUser-Name = "cliente1"\n',
+        '\tEvent-Timestamp = 1700000000\n',
+        '\n',
+        'Mon Jan  1 00:00:01 2024\n',
+        '\tAcct-Status-Type = Accounting-On\n',
+        '\n',
+        'Mon Jan  1 00:00:02 2024\n',
+        '\tAcct-Status-Type = Start\n',
+        '\tUser-Name = "cliente2"\n',
+        '\tEvent-Timestamp = "Jan  1 2024 00:00:02 UTC"\n',
+        '\n',
+    ]
+
+    def _seguir(self, formato, linhas):
+        patch.object(radius_service, 'RADIUS_LOG_FORMAT', formato).start()
+        patch.object(radius_service, 'seguir_arquivo', return_value=iter(linhas)).start()
+        with patch.object(radius_service.time, 'time', return_value=1000.0):
+            radius_service.loop_arquivo()
+
+    def test_blocos_detail(self):
+        self._seguir('detail', self.DETAIL)
+
+        # Event-Timestamp fora do formato numérico: vale o instante da leitura
+        self.assertEqual(radius_service.pendentes, {'cliente1': (False, 1700000000), 'cliente2': (True, 1000.0)})
+
+    def test_linhas_regex(self):
+        self._seguir('regex', [
+            'radiusd: Acct-Status-Type=Stop, User-Name="cliente1", NAS-IP=10.0.0.1\n',
+            'radiusd: Acct-Status-Type=Accounting-On\n',
+            'radiusd: Acct-Status-Type: Start User-Name: cliente2\n',
+        ])
+
+        self.assertEqual(radius_service.pendentes, {'cliente1': (False, 1000.0), 'cliente2': (True, 1000.0)})
+
+
+class TestEnvioPendentes(ServicoRadius):
+
+    def setUp(self):
+        super().setUp()
+        self.mock_post = patch.object(radius_service.requests, 'post').start()
+
+    def _eventos_enviados(self):
+        return [(e['login'], e['status'], e['timestamp']) for e in self.mock_post.call_args.kwargs['json']['eventos']]
+
+    def test_so_o_estado_mais_recente_de_cada_login(self):
+        radius_service.registrar_evento('a', False, 1)
+        radius_service.registrar_evento('b', False, 2)
+        radius_service.registrar_evento('a', True, 3)
+
+        radius_service.enviar_pendentes()
+
+        self.assertEqual(self._eventos_enviados(), [('b', 'offline', 2), ('a', 'online', 3)])
+        self.assertEqual(radius_service.pendentes, {})
+        self.assertEqual(radius_service.contadores['enviados'], 2)
+
+    def test_contadores_de_varias_threads(self):
+        def receber():
+            for _ in range(2000):
+                radius_service.processar_pacote(b'\x04', ORIGEM)
+
+        threads = [threading.Thread(target=receber) for _ in range(4)]
+        with patch.object(radius_service, 'logging'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual((radius_service.contadores['pacotes'], radius_service.contadores['invalidos']), (8000, 8000))
+        self.assertEqual(radius_service.app.test_client().get('/status').get_json()['pacotes'], 8000)
+
+    def test_nada_a_enviar(self):
+        radius_service.enviar_pendentes()
+
+        self.mock_post.assert_not_called()
+
+    def test_falha_devolve_o_lote_sem_sobrescrever_eventos_novos(self):
+        radius_service.registrar_evento('a', False, 1)
+        radius_service.registrar_evento('b', False, 2)
+
+        def falhar(*args, **kwargs):
+            # 'a' volta durante o envio: o estado novo prevalece sobre o do lote
+            radius_service.registrar_evento('a', True, 5)
+            raise radius_service.requests.ConnectionError("monitor indisponível")
+
+        self.mock_post.side_effect = falhar
+        radius_service.enviar_pendentes()
+
+        self.assertEqual(radius_service.pendentes, {'a': (True, 5), 'b': (False, 2)})
+        self.assertEqual(radius_service.contadores['falhas_envio'], 1)
+
+    def test_falha_descarta_os_mais_antigos_acima_do_limite(self):
+        patch.object(radius_service, 'RADIUS_MAX_PENDENTES', 2).start()
+        for n, login in enumerate(['a', 'b', 'c']):
+            radius_service.registrar_evento(login, False, n + 1)
+        self.mock_post.side_effect = radius_service.requests.ConnectionError("monitor indisponível")
+
+        radius_service.enviar_pendentes()
+
+        self.assertEqual(list(radius_service.pendentes), ['b', 'c'])
+        self.assertEqual(radius_service.contadores['descartados'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
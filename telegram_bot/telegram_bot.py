@@ -19,7 +19,7 @@ logging.basicConfig(
 # Comando /listar_eventos
 async def listar_eventos(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        response = requests.get(f"{MONITOR_SERVICE_URL}/eventos/ativos")
+        response = requests.get(f"{MONITOR_SERVICE_URL}/eventos/ativos", params={"projecao": "resumo"})
         response.raise_for_status()
         data = response.json()
         eventos = data.get("eventos_ativos", [])
@@ -35,7 +35,7 @@ async def listar_eventos(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"🆔 *ID:* `{evento['id'][:8]}...`\n"
                 f"🔌 *Conexão:* {evento['conexao']}\n"
                 f"⏱ *Horário:* {horario}\n"
-                f"👥 *Clientes Offline:* {len(evento['logins'])}\n\n"
+                f"👥 *Clientes Offline:* {evento['total_logins']}\n\n"
             )
 
         await update.message.reply_text(mensagem, parse_mode="Markdown")